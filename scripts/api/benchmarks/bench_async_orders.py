@@ -0,0 +1,103 @@
+"""
+Order throughput of sending one transaction at a time and waiting for it (what the
+scripts do) against AsyncTexClient with many transactions in flight.
+
+Against the in-process fake node, mining a block every --block-time seconds:
+
+user> python ./benchmarks/bench_async_orders.py --fake-rpc --orders 100 --block-time 0.05
+
+Against ganache with the contracts deployed (scripts/run_ganache.sh and the truffle
+migrations), sending from the first unlocked account, which needs base token balance:
+
+user> python ./benchmarks/bench_async_orders.py --dex-address 0x... --base-token 0x... --secondary-token 0x...
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tex_client import RPCSession  # noqa: E402
+from tex_client.aio import AsyncTexClient, NodeSigner  # noqa: E402
+from tex_client.fake_rpc import FakeRPCServer, FakeTransactions  # noqa: E402
+
+FAKE_ACCOUNT = '0x' + '33' * 20
+FAKE_TOKEN = '0x' + '11' * 20
+FAKE_SECONDARY = '0x' + '22' * 20
+FAKE_DEX = '0x' + '44' * 20
+
+
+def order_prices(options):
+    return [options.price + i * 0.01 for i in range(options.orders)]
+
+
+async def serial(client, options):
+    for price in order_prices(options):
+        await client.insert_buy_limit_order(
+            options.base_token, options.secondary_token, options.amount, price, options.lifespan)
+
+
+async def concurrent(client, options):
+    await asyncio.gather(*[
+        client.insert_buy_limit_order(
+            options.base_token, options.secondary_token, options.amount, price, options.lifespan)
+        for price in order_prices(options)])
+
+
+async def run(rpc_url, account, options):
+    async with AsyncTexClient(rpc_url, options.dex_address, NodeSigner(account),
+                              pool_size=options.pool_size, poll_interval=options.poll_interval) as client:
+        if options.approve:
+            # both runs, with room for the commission
+            await client.approve(options.base_token, 2 * options.orders * options.amount * 1.1)
+        results = []
+        for name, fn in (('serial', serial), ('concurrent', concurrent)):
+            start = time.perf_counter()
+            await fn(client, options)
+            elapsed = time.perf_counter() - start
+            print('{0:<11} orders={1:<5} elapsed={2:8.3f}s  orders/s={3:8.1f}'.format(
+                name, options.orders, elapsed, options.orders / elapsed))
+            results.append(elapsed)
+        print('speedup: {0:.1f}x'.format(results[0] / results[1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--fake-rpc', action='store_true', help='use the in-process fake node')
+    parser.add_argument('--block-time', type=float, default=0.05, help='seconds between blocks (fake rpc)')
+    parser.add_argument('--latency', type=float, default=0.002, help='simulated seconds per round trip (fake rpc)')
+    parser.add_argument('--rpc-url', default='http://127.0.0.1:8545')
+    parser.add_argument('--dex-address')
+    parser.add_argument('--base-token')
+    parser.add_argument('--secondary-token')
+    parser.add_argument('--orders', type=int, default=100)
+    parser.add_argument('--amount', type=float, default=1, help='base token amount of every order')
+    parser.add_argument('--price', type=float, default=1)
+    parser.add_argument('--lifespan', type=int, default=100)
+    parser.add_argument('--pool-size', type=int, default=10)
+    parser.add_argument('--poll-interval', type=float, default=0.05, help='seconds between receipt polls')
+    options = parser.parse_args()
+
+    if options.fake_rpc:
+        options.dex_address, options.base_token, options.secondary_token = FAKE_DEX, FAKE_TOKEN, FAKE_SECONDARY
+        options.approve = False
+        with FakeRPCServer(latency=options.latency) as server:
+            transactions = FakeTransactions(server).start_mining(options.block_time)
+            asyncio.run(run(server.url, FAKE_ACCOUNT, options))
+            transactions.stop_mining()
+        return
+
+    if not (options.dex_address and options.base_token and options.secondary_token):
+        parser.error('--dex-address, --base-token and --secondary-token are needed without --fake-rpc')
+    options.approve = True
+    rpc = RPCSession(options.rpc_url)
+    account = rpc.call('eth_accounts')[0]
+    rpc.close()
+    asyncio.run(run(options.rpc_url, account, options))
+
+
+if __name__ == '__main__':
+    main()
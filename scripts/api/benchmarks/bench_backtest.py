@@ -0,0 +1,101 @@
+"""
+Times the backtest replay (tex_client.backtest) on a synthetic order flow.
+
+user> python ./benchmarks/bench_backtest.py --ticks 20000 --orders-per-tick 6
+user> python ./benchmarks/bench_backtest.py --ticks 20000 --pairs 4 --spreads 0.002,0.005,0.01 --processes 4
+
+The flow has orders-per-tick limit orders around a random walk price, with lifespans
+of 1 to 10 ticks and some cancelations; SpreadQuoter quotes around the price. The ticks
+per second are extrapolated to a year of ticks (--tick-seconds apart) for every pair
+and spread of the grid, run in a process pool.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tex_client.backtest import Backtest, OrderFlow, SpreadQuoter, run_grid  # noqa: E402
+from tex_client.commissions import CommissionRates  # noqa: E402
+from tex_client.constants import RATE_PRECISION  # noqa: E402
+from tex_client.wad import as_int_array  # noqa: E402
+
+YEAR_SECONDS = 365 * 24 * 3600
+
+
+def synthetic_flow(rng, ticks, orders_per_tick, pair_index=0):
+    """ OrderFlow of ticks 1..ticks: the orders of a tick are logged before its TickStart """
+    count = ticks * orders_per_tick
+    order_ticks = np.repeat(np.arange(1, ticks + 1), orders_per_tick)
+    mid = 10000 * np.exp(np.cumsum(rng.normal(0, 0.002, ticks)))
+    is_buy = rng.rand(count) < 0.5
+    offsets = rng.normal(0, 0.003, count) * np.where(is_buy, -1, 1)
+    prices = mid[order_ticks - 1] * (1 + offsets)
+    amounts = [int(amount) * RATE_PRECISION for amount in rng.randint(1, 100, count)]
+    orders = dict(
+        position=order_ticks * 1000 + np.tile(np.arange(orders_per_tick), ticks),
+        id=np.arange(1, count + 1),
+        is_buy=is_buy,
+        order_type=np.zeros(count, dtype=np.int64),
+        exchangeable_amount=as_int_array(amounts),
+        reserved_commission=as_int_array([amount // 1000 for amount in amounts]),
+        price=as_int_array([int(price * 100) * RATE_PRECISION // 100 for price in prices]),
+        multiply_factor=as_int_array([0] * count),
+        expires_in_tick=order_ticks + rng.randint(1, 11, count))
+    cancelled = rng.choice(count, count // 20, replace=False)
+    cancels = dict(position=orders['position'][cancelled] + 2000, id=orders['id'][cancelled])
+    starts = dict(position=np.arange(1, ticks + 1) * 1000 + 999, tick=np.arange(1, ticks + 1))
+    ends = dict(tick=np.arange(1, ticks + 1), closing_price=as_int_array([0] * ticks))
+    pair = '0x{0:040x}'.format(2 * pair_index + 1), '0x{0:040x}'.format(2 * pair_index + 2)
+    return OrderFlow(pair[0], pair[1], orders, cancels, starts, ends), mid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--ticks', type=int, default=20000)
+    parser.add_argument('--orders-per-tick', type=int, default=6)
+    parser.add_argument('--pairs', type=int, default=1)
+    parser.add_argument('--spreads', default='0.005', help='comma separated spreads of the grid')
+    parser.add_argument('--processes', type=int, default=None, help='pool size (default: one per CPU)')
+    parser.add_argument('--tick-seconds', type=float, default=300, help='time between ticks, for the year estimate')
+    parser.add_argument('--seed', type=int, default=1)
+    options = parser.parse_args()
+
+    rng = np.random.RandomState(options.seed)
+    start = time.perf_counter()
+    flows = [synthetic_flow(rng, options.ticks, options.orders_per_tick, index)[0] for index in range(options.pairs)]
+    print('flows      {0} pairs x {1} ticks, {2} orders each, built in {3:.2f}s'.format(
+        options.pairs, options.ticks, len(flows[0].orders), time.perf_counter() - start))
+
+    rates = CommissionRates(RATE_PRECISION // 1000, RATE_PRECISION // 10, RATE_PRECISION // 2, 0)
+    strategy = SpreadQuoter(amount=100 * RATE_PRECISION, spread=int(float(options.spreads.split(',')[0]) *
+                                                                     RATE_PRECISION))
+    start = time.perf_counter()
+    result = Backtest(flows[0], strategy, rates=rates, initial_price=10000 * RATE_PRECISION).run()
+    elapsed = time.perf_counter() - start
+    ticks_per_second = options.ticks / elapsed
+    year_ticks = YEAR_SECONDS / options.tick_seconds
+    print('one run    {0:.2f}s  {1:.0f} ticks/s  fills={2}  -> a year ({3:.0f} ticks) in {4:.0f}s'.format(
+        elapsed, ticks_per_second, len(result.strategy_fills), year_ticks, year_ticks / ticks_per_second))
+
+    grid = {'amount': [100 * RATE_PRECISION],
+            'spread': [int(float(spread) * RATE_PRECISION) for spread in options.spreads.split(',')]}
+    runs = options.pairs * len(grid['spread'])
+    start = time.perf_counter()
+    results = run_grid(flows, SpreadQuoter, grid, processes=options.processes, rates=rates,
+                       initial_price=10000 * RATE_PRECISION)
+    elapsed = time.perf_counter() - start
+    print('grid       {0} runs in {1:.2f}s  -> a year of every run in {2:.0f}s'.format(
+        runs, elapsed, elapsed * year_ticks / options.ticks))
+    for result in results:
+        summary = result.summary()
+        print('  spread={0:<8} pnl={1:<14.4f} fills={2:<6} fees={3:.4f}'.format(
+            result.params['spread'] / RATE_PRECISION, summary['pnl'], summary['fills'], summary['fees_base']))
+
+
+if __name__ == '__main__':
+    main()
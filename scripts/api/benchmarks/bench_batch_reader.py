@@ -0,0 +1,86 @@
+"""
+Compares reading the status of every pair with one eth_call per getter (what the
+scripts do) against one JSON-RPC batch with BatchReader.
+
+Against the in-process fake node, with a simulated round trip latency:
+
+user> python ./benchmarks/bench_batch_reader.py --fake-rpc --pairs 20 --latency 0.005
+
+Against a node with the contracts deployed (all the listed pairs):
+
+user> python ./benchmarks/bench_batch_reader.py --connection-network ganache --config-network dexLocal
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tex_client import RPCSession, TexClient  # noqa: E402
+from tex_client.batch import PAIR_CALLS, BatchReader  # noqa: E402
+from tex_client.fake_rpc import FakeRPCServer  # noqa: E402
+
+
+def serial_status(reader, pairs):
+    """ One round trip per getter and pair """
+    for base_token, secondary_token in pairs:
+        for _, function_name, extra_args in PAIR_CALLS:
+            reader.call(function_name, base_token, secondary_token, *extra_args)
+
+
+def measure(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.mean(timings)
+
+
+def run(reader, pairs, iterations, server=None):
+    results = []
+    for name, fn in (('serial', lambda: serial_status(reader, pairs)),
+                     ('batch', lambda: reader.pairs_status(pairs))):
+        requests_before = server.requests_count if server else 0
+        mean = measure(fn, iterations)
+        line = '{0:<7} pairs={1:<4} mean={2:9.3f}ms'.format(name, len(pairs), mean)
+        if server:
+            line += '  round trips per refresh={0}'.format((server.requests_count - requests_before) // iterations)
+        print(line)
+        results.append(mean)
+    print('speedup: {0:.1f}x'.format(results[0] / results[1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--fake-rpc', action='store_true', help='use the in-process fake node')
+    parser.add_argument('--pairs', type=int, default=20, help='amount of pairs (fake rpc)')
+    parser.add_argument('--latency', type=float, default=0.005, help='simulated seconds per round trip (fake rpc)')
+    parser.add_argument('--connection-network', default='ganache')
+    parser.add_argument('--config-network', default='dexLocal')
+    parser.add_argument('--iterations', type=int, default=10)
+    options = parser.parse_args()
+
+    if options.fake_rpc:
+        pairs = [('0x' + '{0:040x}'.format(2 * i + 1), '0x' + '{0:040x}'.format(2 * i + 2))
+                 for i in range(options.pairs)]
+        # every getter answers zeros, enough to decode all of them
+        server = FakeRPCServer(latency=options.latency)
+        server.register('eth_call', lambda params: '0x' + '00' * 32 * 12)
+        with server:
+            reader = BatchReader(RPCSession(server.url), '0x' + '00' * 20, pairs=pairs)
+            run(reader, pairs, options.iterations, server)
+            reader.rpc.close()
+        return
+
+    with TexClient(connection_network=options.connection_network,
+                   config_network=options.config_network) as client:
+        reader = BatchReader.from_client(client)
+        run(reader, reader.pairs, options.iterations)
+
+
+if __name__ == '__main__':
+    main()
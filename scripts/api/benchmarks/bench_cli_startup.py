@@ -0,0 +1,59 @@
+"""
+Startup time of the tex command, kept under a target.
+
+user> python ./benchmarks/bench_cli_startup.py --runs 20 --target-ms 250
+
+Runs `python tex.py --help` (the parser of every command, no node needed) and a bare
+interpreter --runs times each and prints the medians. It exits with an error when the
+median of the command goes over --target-ms, or when the command loaded one of the
+heavy modules (brownie, web3, moneyonchain, requests, numpy), which are only imported
+by the commands that use them.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+API_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['brownie', 'web3', 'moneyonchain', 'requests', 'numpy']
+
+HELP = 'import sys; sys.argv = ["tex", "--help"]\n' \
+       'from tex_client.cli import main\n' \
+       'try:\n    main()\nexcept SystemExit:\n    pass\n' \
+       'print(",".join(sorted(set({0!r}) & set(sys.modules))), file=sys.stderr)'.format(HEAVY_MODULES)
+
+
+def measure(args, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable] + args, cwd=API_DIRECTORY, capture_output=True, text=True)
+        timings.append((time.perf_counter() - start) * 1000)
+        if completed.returncode:
+            raise SystemExit(completed.stderr)
+    return statistics.median(timings), completed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--target-ms', type=float, default=250)
+    options = parser.parse_args()
+
+    interpreter, _ = measure(['-c', 'pass'], options.runs)
+    command, _ = measure(['tex.py', '--help'], options.runs)
+    _, completed = measure(['-c', HELP], 1)
+    loaded = completed.stderr.strip()
+    print('interpreter  median={0:8.1f}ms'.format(interpreter))
+    print('tex --help   median={0:8.1f}ms  (+{1:.1f}ms)  target={2:.0f}ms'.format(
+        command, command - interpreter, options.target_ms))
+    print('heavy modules loaded: {0}'.format(loaded or 'none'))
+    if command > options.target_ms or loaded:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
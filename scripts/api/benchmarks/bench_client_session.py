@@ -0,0 +1,112 @@
+"""
+Compares the latency of a cold script (connect, load ABI, call, disconnect for every
+operation) against a warm TexClient that keeps everything open.
+
+Against a local ganache (scripts/run_ganache.sh) with the contracts deployed:
+
+user> python ./benchmarks/bench_client_session.py --connection-network ganache --config-network dexLocal
+
+Without a node, against the in-process fake RPC. In this mode only the transport is
+measured: the cold path opens a new HTTP session and does the handshake calls brownie
+does on connect before every call, the warm path reuses one pooled session:
+
+user> python ./benchmarks/bench_client_session.py --fake-rpc --latency 0.002
+
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tex_client import RPCSession, TexClient  # noqa: E402
+from tex_client.fake_rpc import FakeRPCServer  # noqa: E402
+
+# paused() selector, answered with a false bool by the fake node
+PAUSED_CALL = {'to': '0x' + '00' * 20, 'data': '0x5c975abb'}
+HANDSHAKE = [('eth_chainId', []), ('net_version', []), ('eth_blockNumber', [])]
+
+
+def measure(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name, timings):
+    timings_ms = sorted(t * 1000 for t in timings)
+    p95 = timings_ms[int(len(timings_ms) * 0.95) - 1]
+    print('{0:<6} n={1:<5} mean={2:8.3f}ms  median={3:8.3f}ms  p95={4:8.3f}ms'.format(
+        name, len(timings_ms), statistics.mean(timings_ms), statistics.median(timings_ms), p95))
+    return statistics.mean(timings_ms)
+
+
+def bench_fake_rpc(options):
+    server = FakeRPCServer(latency=options.latency)
+    server.register('eth_call', lambda params: '0x' + '00' * 32)
+    with server:
+
+        def cold():
+            session = RPCSession(server.url)
+            for method, params in HANDSHAKE:
+                session.call(method, params)
+            session.call('eth_call', [PAUSED_CALL, 'latest'])
+            session.close()
+
+        warm_session = RPCSession(server.url)
+
+        def warm():
+            warm_session.call('eth_call', [PAUSED_CALL, 'latest'])
+
+        cold_mean = report('cold', measure(cold, options.iterations))
+        connections = server.connections_count
+        warm_mean = report('warm', measure(warm, options.iterations))
+        warm_session.close()
+        print('tcp connections: cold={0} warm={1}'.format(
+            connections, server.connections_count - connections))
+    return cold_mean, warm_mean
+
+
+def bench_network(options):
+
+    def cold():
+        client = TexClient(
+            connection_network=options.connection_network,
+            config_network=options.config_network)
+        client.connect()
+        client.paused()
+        client.disconnect()
+
+    cold_mean = report('cold', measure(cold, options.iterations))
+    with TexClient(connection_network=options.connection_network,
+                   config_network=options.config_network) as client:
+        # first call loads the contract, not measured
+        client.paused()
+        warm_mean = report('warm', measure(client.paused, options.iterations))
+    return cold_mean, warm_mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--fake-rpc', action='store_true', help='use the in-process fake node')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated seconds per round trip (fake rpc)')
+    parser.add_argument('--connection-network', default='ganache')
+    parser.add_argument('--config-network', default='dexLocal')
+    parser.add_argument('--iterations', type=int, default=50)
+    options = parser.parse_args()
+
+    if options.fake_rpc:
+        cold_mean, warm_mean = bench_fake_rpc(options)
+    else:
+        cold_mean, warm_mean = bench_network(options)
+    print('speedup: {0:.1f}x'.format(cold_mean / warm_mean))
+
+
+if __name__ == '__main__':
+    main()
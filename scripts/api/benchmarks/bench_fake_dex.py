@@ -0,0 +1,240 @@
+"""
+Load test of tex_client.fake_dex.FakeExchange, and its check against the contracts.
+
+user> python ./benchmarks/bench_fake_dex.py --orders 100000 --orders-per-block 100
+
+Random limit and market orders (with hints from the book of the fake) are inserted in
+--pairs pairs, --orders-per-block per block, and the ticks run as the blocks are mined.
+It prints the insertions per second and the time of the ticks.
+
+With --ganache the same orders (--compare-orders of them) are sent to the DEX deployed
+on ganache (scripts/run_ganache.sh; --deploy runs the truffle migrations first, like
+bench_gas.py) and to a fake with the rules, commission rates and prices read from it.
+Then the tick runs on both and the BuyerMatch / SellerMatch events and the closing
+price are compared (order ids by insertion order). MoCDexFake
+(contracts/test/MoCDexFake.sol) only adds getters to MoCDecentralizedExchange, so the
+DEX of the migrations is used. Pass --dex-address to use another deploy, e.g. a
+MoCDexFake proxy with the pair added. The orderbook of the pair must be empty.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_gas import deploy  # noqa: E402
+from tex_client import RPCSession  # noqa: E402
+from tex_client.abi import FUNCTIONS  # noqa: E402
+from tex_client.aio import AsyncTexClient, NodeSigner  # noqa: E402
+from tex_client.batch import BatchReader  # noqa: E402
+from tex_client.commissions import CommissionEngine  # noqa: E402
+from tex_client.constants import NO_HINT, RATE_PRECISION, OrderType  # noqa: E402
+from tex_client.events import EventDecoder  # noqa: E402
+from tex_client.fake_dex import ContractRevert, FakeExchange  # noqa: E402
+from tex_client.orderbook import OrderbookMirror  # noqa: E402
+from tex_client.scheduler import SimulatedBlockClock, TickConfig  # noqa: E402
+from tex_client.validator import OrderValidator, limit_order, market_order  # noqa: E402
+from tex_client.wad import to_wad  # noqa: E402
+
+MATCH_FIELDS = ['amountSent', 'commission', 'received', 'remainingAmount', 'matchPrice']
+
+
+def token(index):
+    return '0x{0:040x}'.format(index)
+
+
+def random_order(rng, pair, price, options, crossing=False):
+    """ Buys below price and sells above it, the other way around if crossing """
+    is_buy = rng.random() < 0.5
+    offset = rng.uniform(0.001, options.spread)
+    amount = to_wad(round(rng.uniform(0.1, 1) * options.amount, 6))
+    lifespan = rng.randint(1, options.lifespan)
+    if rng.random() < options.market_ratio:
+        multiply_factor = to_wad(round(1 - offset if is_buy != crossing else 1 + offset, 6))
+        return market_order(*pair, amount, multiply_factor, lifespan, is_buy)
+    order_price = price * to_wad(round(1 - offset if is_buy != crossing else 1 + offset, 6)) // RATE_PRECISION
+    return limit_order(*pair, amount, order_price, lifespan, is_buy)
+
+
+def hint_for(dex, order):
+    side = dex.book.pair(order.base_token, order.secondary_token).side(order.is_buy)
+    if order.order_type == OrderType.MARKET_ORDER:
+        return side.market.previous_id_for(order.multiply_factor)
+    return side.limit.previous_id_for(order.price)
+
+
+def load_test(options):
+    rng = random.Random(options.seed)
+    dex = FakeExchange()
+    pairs = [(token(1), token(index + 2)) for index in range(options.pairs)]
+    for pair in pairs:
+        dex.list_pair(*pair, to_wad(options.price))
+    insert_seconds, tick_seconds, reverts, matches = 0, [], 0, 0
+    for sent in range(options.orders):
+        order = random_order(rng, rng.choice(pairs), to_wad(options.price), options, rng.random() < options.crossing)
+        start = time.perf_counter()
+        try:
+            dex.insert_order(order, hint_for(dex, order))
+        except ContractRevert:
+            reverts += 1
+        insert_seconds += time.perf_counter() - start
+        if (sent + 1) % options.orders_per_block == 0:
+            start = time.perf_counter()
+            receipts = dex.mine()
+            if receipts:
+                tick_seconds.append((time.perf_counter() - start) / len(receipts))
+                matches += sum(event.name == 'BuyerMatch' for receipt in receipts for event in receipt.events)
+
+    print('orders={0} pairs={1} blocks={2} reverts={3} events={4}'.format(
+        options.orders, options.pairs, dex.clock.block_number(), reverts, len(dex.events)))
+    print('insert  {0:10.0f} orders/s  mean={1:8.3f}ms'.format(
+        options.orders / insert_seconds, insert_seconds * 1000 / options.orders))
+    if tick_seconds:
+        print('tick    {0:10d} ticks     mean={1:8.3f}ms  max={2:8.3f}ms  matches={3}'.format(
+            len(tick_seconds), statistics.mean(tick_seconds) * 1000, max(tick_seconds) * 1000, matches))
+    book_sizes = [len(book.buy) + len(book.sell) for book in dex.book.pairs.values()]
+    print('book    {0:10d} orders left'.format(sum(book_sizes)))
+
+
+def insertion(order):
+    """ (function name, args) of the hintless insertion of an OrderRequest """
+    direction = 'Buy' if order.is_buy else 'Sell'
+    if order.order_type == OrderType.MARKET_ORDER:
+        return 'insertMarketOrder', (order.base_token, order.secondary_token, order.amount,
+                                     order.multiply_factor, order.lifespan, bool(order.is_buy))
+    return 'insert{0}LimitOrder'.format(direction), (order.base_token, order.secondary_token, order.amount,
+                                                     order.price, order.lifespan)
+
+
+async def compare_with_chain(account, options):
+    pair = (options.base_token, options.secondary_token)
+    decoder = EventDecoder(['NewOrderInserted', 'BuyerMatch', 'SellerMatch', 'TickEnd'])
+    async with AsyncTexClient(options.rpc_url, options.dex_address, NodeSigner(account),
+                              poll_interval=options.poll_interval) as client:
+        rpc = client.rpc.session
+        reader = BatchReader(rpc, options.dex_address, [pair])
+        mirror = OrderbookMirror()
+        mirror.sync(reader)
+        if len(mirror.pair(*pair).buy) or len(mirror.pair(*pair).sell):
+            raise SystemExit('The orderbook of the pair is not empty, use a fresh deploy (--deploy)')
+        commissions = CommissionEngine(rpc, options.dex_address)
+        rules = OrderValidator(reader, commissions).load()
+        status = reader.call('getTokenPairStatus', *pair)
+        market_price = reader.call('getMarketPrice', *pair)
+        config = reader.call('tickConfig')
+
+        block_number = int(await client.rpc.call('eth_blockNumber'), 16)
+        dex = FakeExchange(account=account, clock=SimulatedBlockClock(block_number), rules=rules,
+                           rates=commissions.rates, auto_tick=False,
+                           tick_config=TickConfig(config['expectedOrdersForTick'], config['maxBlocksForTick'],
+                                                  config['minBlocksForTick']))
+        dex.list_pair(*pair, status['emaPrice'], smoothing_factor=status['smoothingFactor'],
+                      market_price=market_price)
+        book = dex.book.pair(*pair)
+        book.tick_number, book.next_tick_block = status['tickNumber'], status['nextTickBlock']
+        book.last_closing_price = status['lastClosingPrice']
+        dex.pair(*pair).last_tick_block = status['lastTickBlock']
+
+        for token_address in pair:
+            await client.approve(token_address, options.allowance)
+        rng = random.Random(options.seed)
+        chain_ids, fake_ids, reverts = [], [], 0
+        for _ in range(options.compare_orders):
+            order = random_order(rng, pair, status['emaPrice'], options, rng.random() < options.crossing)
+            try:
+                fake_receipt = dex.insert_order(order, NO_HINT, account)
+            except ContractRevert:
+                fake_receipt = None
+            function_name, args = insertion(order)
+            try:
+                receipt = await client.transact(options.dex_address, FUNCTIONS[function_name].encode(*args))
+            except Exception:
+                receipt = None
+            if (fake_receipt is None) != (receipt is None):
+                print('mismatch: {0} reverted only on {1}'.format(order, 'the fake' if receipt else 'the chain'))
+            if fake_receipt is None or receipt is None:
+                reverts += 1
+                continue
+            fake_ids.append(fake_receipt.events[0].args['id'])
+            chain_ids.append(next(event.args['id'] for event in map(decoder.decode, receipt.logs)
+                                  if event is not None and event.name == 'NewOrderInserted'))
+
+        while int(await client.rpc.call('eth_blockNumber'), 16) < status['nextTickBlock']:
+            await client.rpc.call('evm_mine')
+        chain_events = []
+        while True:
+            receipt = await client.transact(options.dex_address, FUNCTIONS['matchOrders'].encode(
+                *pair, options.match_steps))
+            chain_events += [event for event in map(decoder.decode, receipt.logs) if event is not None]
+            if chain_events and chain_events[-1].name == 'TickEnd':
+                break
+        # the tick starts in the block of the first matchOrders, its TickStart
+        dex.clock = SimulatedBlockClock(chain_events[0].block_number)
+        fake_events = dex.run_tick(*pair).events
+
+    def rows(events, ids):
+        positions = dict((order_id, position) for position, order_id in enumerate(ids))
+        return [(event.name, positions[event.args['orderId']]) + tuple(event.args[field] for field in MATCH_FIELDS)
+                for event in events if event.name.endswith('Match')]
+
+    chain_rows, fake_rows = rows(chain_events, chain_ids), rows(fake_events, fake_ids)
+    differences = [(chain_row, fake_row) for chain_row, fake_row in zip(chain_rows, fake_rows)
+                   if chain_row != fake_row]
+    chain_end, fake_end = chain_events[-1].args, fake_events[-1].args
+    print('orders={0} reverted={1} matches chain={2} fake={3} differences={4}'.format(
+        len(chain_ids), reverts, len(chain_rows), len(fake_rows), len(differences)))
+    print('closingPrice chain={0} fake={1}'.format(chain_end['closingPrice'], fake_end['closingPrice']))
+    print('nextTickBlock chain={0} fake={1}'.format(chain_end['nextTickBlock'], fake_end['nextTickBlock']))
+    for chain_row, fake_row in differences[:10]:
+        print('  chain {0}\n  fake  {1}'.format(chain_row, fake_row))
+    return not differences and len(chain_rows) == len(fake_rows) and all(
+        chain_end[name] == fake_end[name] for name in ('closingPrice', 'nextTickBlock'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--orders-per-block', type=int, default=100)
+    parser.add_argument('--pairs', type=int, default=1)
+    parser.add_argument('--price', type=float, default=1)
+    parser.add_argument('--spread', type=float, default=0.1, help='relative range of the prices around --price')
+    parser.add_argument('--crossing', type=float, default=0.1, help='share of orders on the other side of --price')
+    parser.add_argument('--market-ratio', type=float, default=0.2)
+    parser.add_argument('--amount', type=float, default=1)
+    parser.add_argument('--lifespan', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--ganache', action='store_true', help='compare with the DEX on ganache instead')
+    parser.add_argument('--compare-orders', type=int, default=40)
+    parser.add_argument('--rpc-url', default='http://127.0.0.1:8545')
+    parser.add_argument('--deploy', action='store_true', help='run the truffle migrations first')
+    parser.add_argument('--dex-address')
+    parser.add_argument('--base-token')
+    parser.add_argument('--secondary-token')
+    parser.add_argument('--match-steps', type=int, default=100)
+    parser.add_argument('--allowance', type=float, default=1e9, help='approved of each token')
+    parser.add_argument('--poll-interval', type=float, default=0.05, help='seconds between receipt polls')
+    options = parser.parse_args()
+
+    if not options.ganache:
+        load_test(options)
+        return
+    if options.deploy:
+        addresses = deploy()
+        options.dex_address, options.base_token, options.secondary_token = \
+            addresses['dex'], addresses['doc'], addresses['bpro']
+    if not (options.dex_address and options.base_token and options.secondary_token):
+        parser.error('--dex-address, --base-token and --secondary-token are needed without --deploy')
+    rpc = RPCSession(options.rpc_url)
+    account = rpc.call('eth_accounts')[0]
+    rpc.close()
+    if not asyncio.run(compare_with_chain(account, options)):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
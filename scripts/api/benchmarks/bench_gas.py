@@ -0,0 +1,292 @@
+"""
+Gas and wall time of the core TEX operations for growing orderbooks, to compare commits
+and to plan capacity (e.g. before raising expectedOrdersForTick).
+
+Needs ganache running (scripts/run_ganache.sh). With --deploy the truffle migrations are
+run first (development network) and the DOC/BPRO pair they add is used, otherwise pass
+the addresses of an existing deploy. Orders are sent from the first unlocked account,
+which the migrations fund:
+
+user> python ./benchmarks/bench_gas.py --deploy --depths 10,50,100 --json gas-before.json
+user> python ./benchmarks/bench_gas.py --dex-address 0x... --base-token 0x... --secondary-token 0x... \\
+        --depths 10,50,100 --json gas-after.json --csv gas-after.csv
+user> python ./benchmarks/bench_gas.py --compare gas-before.json gas-after.json
+
+For every depth both sides of the book are filled (with hints) up to depth orders,
+prices spread uniformly over --spread around --price and --market-ratio of them being
+market orders, and then it measures:
+
+- insertBuyLimitOrder and insertBuyLimitOrderAfter of an order at the end of the book
+  (the worst case of the walk without hint), same for insertMarketOrder(After)
+- cancelBuyOrder walking from the start of the book and with the hint
+- matchOrders per step (gas_used / steps) in every stage of a tick with --crossing orders
+  to match on each side and --pending orders inserted while it runs
+- processExpired of --expired orders that expire in that tick
+
+The market orders inserted by the probes cannot be cancelled and stay in the book.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tex_client import RPCSession  # noqa: E402
+from tex_client.abi import FUNCTIONS  # noqa: E402
+from tex_client.aio import AsyncTexClient, NodeSigner  # noqa: E402
+from tex_client.batch import BatchReader  # noqa: E402
+from tex_client.constants import OrderType, TickStage  # noqa: E402
+from tex_client.gas_report import COMPARE_COLUMNS, SUMMARY_COLUMNS, GasReport, compare, current_commit  # noqa: E402
+from tex_client.hints import cancel_hint, limit_order_hint, market_order_hint  # noqa: E402
+from tex_client.keeper import first_expired  # noqa: E402
+from tex_client.orderbook import OrderbookMirror  # noqa: E402
+from tex_client.wad import to_wad  # noqa: E402
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+
+def deploy():
+    """ Runs the truffle migrations on ganache, returns the addresses they print at the end """
+    output = subprocess.check_output(
+        ['npx', 'truffle', 'migrate', '--network', 'development', '--reset'], cwd=REPOSITORY_ROOT).decode()
+    start = output.rfind('{\n  "dex"')
+    if start < 0:
+        raise RuntimeError('The addresses were not found in the output of the migrations')
+    addresses, _ = json.JSONDecoder().raw_decode(output[start:])
+    return addresses
+
+
+class GasBench(object):
+    """ Sends the operations of one pair from one account and records their gas """
+
+    def __init__(self, client, options, report):
+        self.client = client
+        self.options = options
+        self.report = report
+        self.rng = random.Random(options.seed)
+        self.pair = (options.base_token, options.secondary_token)
+        self.mirror = OrderbookMirror()
+        self.reader = BatchReader(client.rpc.session, client.dex_address, [self.pair])
+
+    @property
+    def book(self):
+        return self.mirror.pair(*self.pair)
+
+    def status(self):
+        return self.reader.pairs_status([self.pair])[0]
+
+    async def transact(self, function_name, *args):
+        """ Sends a call of the dex with the pair as first arguments, returns (receipt, seconds) """
+        start = time.perf_counter()
+        receipt = await self.client.transact(
+            self.client.dex_address, FUNCTIONS[function_name].encode(*(self.pair + args)))
+        seconds = time.perf_counter() - start
+        self.mirror.apply_logs(receipt.logs, self.client.rpc.session)
+        return receipt, seconds
+
+    async def measure(self, operation, scenario, function_name, *args):
+        receipt, seconds = await self.transact(function_name, *args)
+        self.report.add(operation, scenario, receipt.gas_used, seconds)
+        return receipt
+
+    def order_id(self, receipt):
+        for log in receipt.logs:
+            event = self.mirror.decoder.decode(log)
+            if event is not None and event.name in ('NewOrderInserted', 'NewOrderAddedToPendingQueue'):
+                return event.args['id']
+        return None
+
+    # Orders
+
+    def random_price(self, is_buy, crossing=False):
+        """ Buys below --price and sells above it, the other way around if crossing """
+        options = self.options
+        offset = self.rng.uniform(0.01, options.spread)
+        below = is_buy != crossing
+        return round(options.price * (1 - offset if below else 1 + offset), 6)
+
+    async def insert_random(self, is_buy, crossing=False, market_ratio=None):
+        options = self.options
+        lifespan = options.lifespan
+        market_ratio = options.market_ratio if market_ratio is None else market_ratio
+        amount = to_wad(options.amount)
+        value = self.random_price(is_buy, crossing)
+        if self.rng.random() < market_ratio:
+            factor = value / options.price
+            hint = market_order_hint(self.book, is_buy, to_wad(factor))
+            return await self.transact(
+                'insertMarketOrderAfter', amount, to_wad(factor), hint, lifespan, is_buy)
+        hint = limit_order_hint(self.book, is_buy, to_wad(value))
+        name = 'insertBuyLimitOrderAfter' if is_buy else 'insertSellLimitOrderAfter'
+        return await self.transact(name, amount, to_wad(value), lifespan, hint)
+
+    async def fill(self, depth):
+        for is_buy in (True, False):
+            while len(self.book.side(is_buy)) < depth:
+                await self.insert_random(is_buy)
+
+    # Measures
+
+    async def measure_orders(self, scenario):
+        options = self.options
+        amount, lifespan = to_wad(options.amount), options.lifespan
+        # below every buy order, the end of the book
+        price = to_wad(options.price * (1 - options.spread) * 0.99)
+        factor = to_wad(1 - options.spread * 1.01)
+        for _ in range(options.samples):
+            receipt = await self.measure(
+                'insertBuyLimitOrder', scenario, 'insertBuyLimitOrder', amount, price, lifespan)
+            no_hint_id = self.order_id(receipt)
+            receipt = await self.measure(
+                'insertBuyLimitOrderAfter', scenario, 'insertBuyLimitOrderAfter', amount, price, lifespan,
+                limit_order_hint(self.book, True, price))
+            hinted_id = self.order_id(receipt)
+            await self.measure('insertMarketOrder', scenario, 'insertMarketOrder', amount, factor, lifespan, True)
+            await self.measure(
+                'insertMarketOrderAfter', scenario, 'insertMarketOrderAfter', amount, factor,
+                market_order_hint(self.book, True, factor), lifespan, True)
+
+            await self.measure('cancelBuyOrder', scenario, 'cancelBuyOrder', hinted_id, 0)
+            await self.measure(
+                'cancelBuyOrder:hint', scenario, 'cancelBuyOrder', no_hint_id,
+                cancel_hint(self.book, True, no_hint_id))
+
+    async def mine_until(self, block_number):
+        while int(await self.client.rpc.call('eth_blockNumber'), 16) < block_number:
+            await self.client.rpc.call('evm_mine')
+
+    async def run_tick(self, scenario):
+        """ matchOrders with --match-steps until the tick ends, the pending orders sent after the first one """
+        options = self.options
+        row = self.status()
+        tick_number = row.tick_number
+        await self.mine_until(row.next_tick_block)
+        pending_sent = False
+        while True:
+            stage = TickStage(row.tick_stage)
+            receipt, seconds = await self.transact('matchOrders', options.match_steps)
+            self.report.add('matchOrders:' + stage.name, scenario, receipt.gas_used / options.match_steps, seconds)
+            if not pending_sent:
+                for i in range(options.pending):
+                    await self.insert_random(i % 2 == 0)
+                pending_sent = True
+            row = self.status()
+            if row.tick_stage == TickStage.RECEIVING_ORDERS and row.tick_number != tick_number:
+                return row
+
+    async def measure_expired(self, scenario, row):
+        index = self.book.buy.limit
+        order, previous_id = first_expired(index, row.tick_number)
+        if order is None:
+            print('no expired orders to process in {0}'.format(scenario), file=sys.stderr)
+            return
+        await self.measure(
+            'processExpired', scenario, 'processExpired', True, order.id, previous_id, self.options.expired,
+            OrderType.LIMIT_ORDER)
+
+    async def run_depth(self, depth):
+        options = self.options
+        scenario = 'depth={0}'.format(depth)
+        await self.fill(depth)
+        await self.measure_orders(scenario)
+
+        # expiring at the end of the buy book, never reached by the matching
+        price = to_wad(options.price * (1 - options.spread) * 0.98)
+        for _ in range(options.expired):
+            await self.transact('insertBuyLimitOrderAfter', to_wad(options.amount), price, 1,
+                                limit_order_hint(self.book, True, price))
+        for i in range(2 * options.crossing):
+            await self.insert_random(i % 2 == 0, crossing=True, market_ratio=0)
+        row = await self.run_tick('{0},pending={1},crossing={2}'.format(scenario, options.pending, options.crossing))
+        await self.measure_expired('{0},expired={1}'.format(scenario, options.expired), row)
+
+
+async def run(account, options, report):
+    async with AsyncTexClient(options.rpc_url, options.dex_address, NodeSigner(account),
+                              poll_interval=options.poll_interval) as client:
+        bench = GasBench(client, options, report)
+        bench.mirror.sync(bench.reader)
+        for token in bench.pair:
+            await client.approve(token, options.allowance)
+        for depth in options.depths:
+            await bench.run_depth(depth)
+            print('depth {0} done'.format(depth), file=sys.stderr)
+
+
+def format_value(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return '{0:.4g}'.format(value)
+    return str(value)
+
+
+def print_rows(columns, rows):
+    print(''.join('{0:>28}'.format(column) for column in columns))
+    for row in rows:
+        print(''.join('{0:>28}'.format(format_value(row[column])) for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--rpc-url', default='http://127.0.0.1:8545')
+    parser.add_argument('--deploy', action='store_true', help='run the truffle migrations first')
+    parser.add_argument('--dex-address')
+    parser.add_argument('--base-token')
+    parser.add_argument('--secondary-token')
+    parser.add_argument('--depths', default='10,50,100', help='orders per side of the book')
+    parser.add_argument('--samples', type=int, default=3, help='inserts and cancels measured per depth')
+    parser.add_argument('--market-ratio', type=float, default=0.2, help='share of market orders of the book')
+    parser.add_argument('--pending', type=int, default=10, help='orders sent while the tick runs')
+    parser.add_argument('--crossing', type=int, default=5, help='orders per side that match in the tick')
+    parser.add_argument('--expired', type=int, default=5, help='orders to expire and process')
+    parser.add_argument('--match-steps', type=int, default=10)
+    parser.add_argument('--price', type=float, default=1)
+    parser.add_argument('--spread', type=float, default=0.5, help='relative range of the prices around --price')
+    parser.add_argument('--amount', type=float, default=1, help='amount of every order')
+    parser.add_argument('--lifespan', type=int, default=10)
+    parser.add_argument('--allowance', type=float, default=1e9, help='approved of each token')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--poll-interval', type=float, default=0.05, help='seconds between receipt polls')
+    parser.add_argument('--json', help='write the samples and the summary to this file')
+    parser.add_argument('--csv', help='write the summary to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two --json results')
+    options = parser.parse_args()
+
+    if options.compare:
+        before, after = (GasReport.load(path) for path in options.compare)
+        print('before: {0}\nafter:  {1}'.format(before.commit, after.commit))
+        print_rows(COMPARE_COLUMNS, compare(before, after))
+        return
+
+    if options.deploy:
+        addresses = deploy()
+        options.dex_address, options.base_token, options.secondary_token = \
+            addresses['dex'], addresses['doc'], addresses['bpro']
+    if not (options.dex_address and options.base_token and options.secondary_token):
+        parser.error('--dex-address, --base-token and --secondary-token are needed without --deploy')
+    options.depths = [int(depth) for depth in options.depths.split(',')]
+
+    rpc = RPCSession(options.rpc_url)
+    account = rpc.call('eth_accounts')[0]
+    rpc.close()
+    parameters = dict((name, value) for name, value in vars(options).items()
+                      if name not in ('compare', 'json', 'csv', 'deploy'))
+    report = GasReport(commit=current_commit(REPOSITORY_ROOT), parameters=parameters)
+    asyncio.run(run(account, options, report))
+
+    print_rows(SUMMARY_COLUMNS, report.summary())
+    if options.json:
+        report.write_json(options.json)
+    if options.csv:
+        report.write_csv(options.csv)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Gas of inserting and cancelling a buy limit order with and without previous order
+hints, for growing orderbook sizes.
+
+Needs a local node with the contracts deployed and an account with balance of the
+base token (scripts/run_ganache.sh and the truffle migrations), e.g.:
+
+user> python ./benchmarks/bench_hints_gas.py --base-token 0x... --secondary-token 0x... --sizes 10,50,100,200
+
+The probe order always goes at the end of the book, the worst case of the walk the
+contract does without a hint. Prints a table, or CSV with --csv.
+"""
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tex_client import TexClient  # noqa: E402
+from tex_client.hints import HintedOrders, cancel_hint  # noqa: E402
+from tex_client.orderbook import OrderbookMirror  # noqa: E402
+
+COLUMNS = ['book_size', 'insert_no_hint', 'insert_hint', 'cancel_from_start', 'cancel_hint']
+
+
+def inserted_id(receipt):
+    return receipt.events['NewOrderInserted']['id']
+
+
+def fill_book(orders, options, size, rng):
+    """ Inserts buy orders, with hints so filling the book is cheap, until it has size orders """
+    book = orders.mirror.pair(options.base_token, options.secondary_token)
+    while len(book.buy) < size:
+        price = options.probe_price + rng.randint(1, 1000) / 100.0
+        orders.insert_buy_limit_order(
+            options.base_token, options.secondary_token, options.amount, price, options.lifespan)
+        orders.refresh()
+
+
+def measure(client, orders, options, size):
+    base_token, secondary_token = options.base_token, options.secondary_token
+    no_hint = client.insert_buy_limit_order(
+        base_token, secondary_token, options.amount, options.probe_price, options.lifespan)
+    hinted = orders.insert_buy_limit_order(
+        base_token, secondary_token, options.amount, options.probe_price, options.lifespan)
+    orders.refresh()
+    book = orders.mirror.pair(base_token, secondary_token)
+
+    # cancel the hinted one walking from the start, the other one with the exact hint
+    cancel_from_start = client.cancel_buy_order(base_token, secondary_token, inserted_id(hinted), 0)
+    orders.refresh()
+    previous_id = cancel_hint(book, True, inserted_id(no_hint))
+    cancel_hinted = client.cancel_buy_order(base_token, secondary_token, inserted_id(no_hint), previous_id)
+    orders.refresh()
+    return [size, no_hint.gas_used, hinted.gas_used, cancel_from_start.gas_used, cancel_hinted.gas_used]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--connection-network', default='ganache')
+    parser.add_argument('--config-network', default='dexLocal')
+    parser.add_argument('--base-token', required=True)
+    parser.add_argument('--secondary-token', required=True)
+    parser.add_argument('--sizes', default='10,50,100,200')
+    parser.add_argument('--amount', type=float, default=10, help='base token amount of every order')
+    parser.add_argument('--probe-price', type=float, default=1)
+    parser.add_argument('--lifespan', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--csv', action='store_true')
+    options = parser.parse_args()
+
+    sizes = [int(size) for size in options.sizes.split(',')]
+    rng = random.Random(options.seed)
+    rows = []
+    with TexClient(connection_network=options.connection_network,
+                   config_network=options.config_network) as client:
+        orders = HintedOrders(client, OrderbookMirror(), sync=False)
+        orders.refresh()
+        total = (max(sizes) + 2 * len(sizes)) * options.amount
+        client.approve(options.base_token, total)
+        for size in sizes:
+            fill_book(orders, options, size, rng)
+            rows.append(measure(client, orders, options, size))
+
+    if options.csv:
+        print(','.join(COLUMNS))
+        for row in rows:
+            print(','.join(str(value) for value in row))
+        return
+    print(''.join('{0:>18}'.format(column) for column in COLUMNS))
+    for row in rows:
+        print(''.join('{0:>18}'.format(value) for value in row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+RPCs removed by tex_client.cache.CachedRPC in a bot loop, against the fake DEX.
+
+user> python ./benchmarks/bench_read_cache.py --pairs 3 --minutes 10 --loop-seconds 0.5 --block-seconds 30
+
+Every --loop-seconds of simulated time the bot reads what a market maker reads before
+deciding: the status table of the pairs (one batch), the tick stage, tickIsRunning and
+last closing price of every pair, paused, the governance limits (min order amount, max
+lifespan, commission rate) and the allowance and balance of its tokens. A block is
+mined every --block-seconds. The same loop runs on a plain RPCSession and on a
+CachedRPC checking the head every --block-interval seconds, and the JSON-RPC calls and
+HTTP round trips the node received are compared (--latency adds a delay to every round
+trip of the fake node).
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tex_client import RPCSession  # noqa: E402
+from tex_client.abi import COMMISSION_FUNCTIONS, TOKEN_FUNCTIONS  # noqa: E402
+from tex_client.batch import BatchReader  # noqa: E402
+from tex_client.cache import CachedRPC  # noqa: E402
+from tex_client.fake_dex import FakeExchange  # noqa: E402
+from tex_client.fake_rpc import FakeRPCServer  # noqa: E402
+from tex_client.wad import to_wad  # noqa: E402
+
+ACCOUNT = '0x' + '33' * 20
+COMMISSION_MANAGER = '0x' + '66' * 20
+
+
+def token(index):
+    return '0x{0:040x}'.format(index)
+
+
+def serve(dex, server):
+    """ The fake DEX, plus a word for the token and commission manager calls """
+    dex.serve(server)
+    dex_call = server.handlers['eth_call']
+    server.register('eth_call', lambda params: dex_call(params) if params[0]['to'] == dex.address else
+                    '0x' + to_wad(1).to_bytes(32, 'big').hex())
+    return server
+
+
+def bot_loop(rpc, dex_address, pairs, tokens):
+    reader = BatchReader(rpc, dex_address, pairs)
+    reader.pairs_status()
+    for pair in pairs:
+        reader.call('getTickStage', *pair)
+        reader.call('tickIsRunning', *pair)
+        reader.call('getLastClosingPrice', *pair)
+    reader.batch_call([('paused', ()), ('minOrderAmount', ()), ('maxOrderLifespan', ())])
+    rpc.batch([('eth_call', [{'to': COMMISSION_MANAGER, 'data': COMMISSION_FUNCTIONS['commissionRate'].encode()},
+                             'latest'])] +
+              [('eth_call', [{'to': address, 'data': TOKEN_FUNCTIONS['allowance'].encode(ACCOUNT, dex_address)},
+                             'latest']) for address in tokens] +
+              [('eth_call', [{'to': address, 'data': TOKEN_FUNCTIONS['balanceOf'].encode(ACCOUNT)}, 'latest'])
+               for address in tokens])
+
+
+def run(options, cached):
+    dex = FakeExchange()
+    pairs = [(token(1), token(index + 2)) for index in range(options.pairs)]
+    for pair in pairs:
+        dex.list_pair(*pair, to_wad(10))
+    tokens = sorted(set(address for pair in pairs for address in pair))
+    now = [0.0]
+    with serve(dex, FakeRPCServer(latency=options.latency)) as server:
+        rpc = RPCSession(server.url)
+        if cached:
+            rpc = CachedRPC(rpc, block_interval=options.block_interval, clock=lambda: now[0])
+        loops = int(options.minutes * 60 / options.loop_seconds)
+        start = time.perf_counter()
+        for loop in range(loops):
+            now[0] = loop * options.loop_seconds
+            while dex.clock.block_number() < 1 + now[0] // options.block_seconds:
+                dex.mine()
+            bot_loop(rpc, dex.address, pairs, tokens)
+        seconds = time.perf_counter() - start
+        rpc.close()
+        return loops, server.calls_count, server.requests_count, seconds, getattr(rpc, 'stats', None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--pairs', type=int, default=3)
+    parser.add_argument('--minutes', type=float, default=10, help='simulated time')
+    parser.add_argument('--loop-seconds', type=float, default=0.5)
+    parser.add_argument('--block-seconds', type=float, default=30)
+    parser.add_argument('--block-interval', type=float, default=1, help='seconds between head checks of the cache')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per round trip of the fake node')
+    options = parser.parse_args()
+
+    results = [run(options, False), run(options, True)]
+    loops = results[0][0]
+    print('loops={0} blocks={1:.0f} pairs={2}'.format(loops, options.minutes * 60 / options.block_seconds,
+                                                     options.pairs))
+    for name, (_, calls, requests, seconds, _) in zip(('direct', 'cached'), results):
+        print('{0:<7} calls={1:<7} per loop={2:6.2f}  round trips={3:<7} per loop={4:6.2f}  {5:8.3f}s'.format(
+            name, calls, calls / loops, requests, requests / loops, seconds))
+    stats = results[1][4]
+    print('removed calls={0:.1%} round trips={1:.1%}  hit ratio={2:.1%}  block reads={3}'.format(
+        1 - results[1][1] / results[0][1], 1 - results[1][2] / results[0][2], stats.hit_ratio, stats.block_reads))
+
+
+if __name__ == '__main__':
+    main()
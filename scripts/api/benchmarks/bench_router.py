@@ -0,0 +1,111 @@
+"""
+Throughput of the order router (tex_client.router) as the pairs and accounts grow.
+
+Against the fake node, in its own process, with a simulated round trip latency and a
+block mined every --block-time seconds:
+
+user> python ./benchmarks/bench_router.py --orders 400 --pairs 1,4,16 --accounts 1,4,16 --latency 0.02
+user> python ./benchmarks/bench_router.py --orders 400 --pairs 16 --accounts 8 --pool-size 8,32 --latency 0.01
+
+Every run routes the same amount of orders spread over the pairs, to any account, and
+reports the orders per second, the HTTP requests (reads, sends and receipt polls) per
+order and checks that the nonces of every account have no gaps. The ticks of the pairs
+are open; the fake node answers the status of any pair. It runs in its own process, so
+it does not take the interpreter of the router.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tex_client.abi import FUNCTIONS  # noqa: E402
+from tex_client.aio import NodeSigner  # noqa: E402
+from tex_client.fake_rpc import FakeRPCServer, FakeTransactions  # noqa: E402
+from tex_client.router import OrderRouter  # noqa: E402
+from tex_client.validator import limit_order  # noqa: E402
+
+FAKE_DEX = '0x' + '44' * 20
+WAD = 10 ** 18
+SELECTORS = dict((function.selector, function) for function in FUNCTIONS.values())
+
+
+def fake_status(params):
+    """ eth_call of the DEX: every tick is receiving orders, far from the next one """
+    function = SELECTORS[params[0]['data'][2:10]]
+    if function.name == 'getTokenPairStatus':
+        return function.encode_output(*[10 ** 9 if name == 'nextTickBlock' else 0 for name in function.output_names])
+    return '0x' + '00' * 32
+
+
+def pairs_of(count):
+    return [('0x{0:040x}'.format(2 * i + 1), '0x{0:040x}'.format(2 * i + 2)) for i in range(count)]
+
+
+def gaps(transactions):
+    nonces = dict()
+    for transaction in transactions.mined:
+        nonces.setdefault(transaction['from'], []).append(int(transaction['nonce'], 16))
+    return sum(max(values) + 1 - len(values) for values in nonces.values())
+
+
+def serve(connection, latency, block_time):
+    """ Fake node process: sends its url, answers the request count and nonce gaps at every message """
+    with FakeRPCServer(latency=latency) as server:
+        server.register('eth_call', fake_status)
+        transactions = FakeTransactions(server).start_mining(block_time)
+        connection.send(server.url)
+        while connection.recv():
+            connection.send((server.requests_count, gaps(transactions)))
+        transactions.stop_mining()
+
+
+async def route(url, orders, accounts, options, pool_size):
+    signers = [NodeSigner('0x{0:040x}'.format(0xacc0000 + i)) for i in range(accounts)]
+    async with OrderRouter(url, FAKE_DEX, signers, pool_size=pool_size, poll_interval=options.block_time,
+                           tick_poll_interval=options.block_time, approve=False) as router:
+        start = time.perf_counter()
+        results = [result async for result in router.route(orders)]
+        elapsed = time.perf_counter() - start
+    errors = [result.error for result in results if result.error is not None]
+    return elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--orders', type=int, default=400)
+    parser.add_argument('--pairs', default='1,4,16', help='comma separated amounts of pairs')
+    parser.add_argument('--accounts', default='1,4,16', help='comma separated amounts of accounts')
+    parser.add_argument('--pool-size', default='20', help='comma separated connection pool sizes')
+    parser.add_argument('--latency', type=float, default=0.005, help='simulated seconds per round trip')
+    parser.add_argument('--block-time', type=float, default=0.05, help='seconds between fake blocks')
+    options = parser.parse_args()
+
+    print('{0:>6} {1:>9} {2:>5} {3:>9} {4:>9} {5:>13} {6:>5}'.format(
+        'pairs', 'accounts', 'pool', 'seconds', 'orders/s', 'requests/ord', 'gaps'))
+    for pairs in [int(value) for value in options.pairs.split(',')]:
+        orders = [limit_order(base_token, secondary_token, WAD, (100 + i // pairs) * WAD, 5, i % 2 == 0)
+                  for i, (base_token, secondary_token) in enumerate(pairs_of(pairs) * (options.orders // pairs))]
+        for accounts in [int(value) for value in options.accounts.split(',')]:
+            for pool_size in [int(value) for value in options.pool_size.split(',')]:
+                connection, node_connection = multiprocessing.Pipe()
+                node = multiprocessing.Process(target=serve, args=(node_connection, options.latency,
+                                                                   options.block_time), daemon=True)
+                node.start()
+                elapsed, errors = asyncio.run(route(connection.recv(), orders, accounts, options, pool_size))
+                connection.send(True)
+                requests, nonce_gaps = connection.recv()
+                connection.send(False)
+                node.join()
+                if errors:
+                    print('  {0} errors, first: {1}'.format(len(errors), errors[0]))
+                print('{0:>6} {1:>9} {2:>5} {3:>9.2f} {4:>9.0f} {5:>13.2f} {6:>5}'.format(
+                    pairs, accounts, pool_size, elapsed, len(orders) / elapsed, requests / len(orders), nonce_gaps))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Times the local tick simulation (tex_client.simulator) on random books.
+
+user> python ./benchmarks/bench_simulator.py --orders 10000 --overlap 0.1
+
+--overlap is the fraction of the price range where buy and sell orders cross, the
+walk of the simulation is proportional to the crossing orders.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tex_client.constants import RATE_PRECISION  # noqa: E402
+from tex_client.simulator import OrderArrays, match_tick, simulate  # noqa: E402
+
+
+def random_side(rng, size, low, high):
+    prices = rng.randint(low, high, size)
+    amounts = rng.randint(1, 1000, size)
+    return OrderArrays(
+        prices=[int(price) * RATE_PRECISION // 100 for price in prices],
+        amounts=[int(amount) * RATE_PRECISION for amount in amounts],
+        reserved_commissions=[int(amount) * RATE_PRECISION // 1000 for amount in amounts])
+
+
+def measure(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--orders', type=int, default=10000, help='orders per side')
+    parser.add_argument('--overlap', type=float, default=0.1)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    options = parser.parse_args()
+
+    rng = np.random.RandomState(options.seed)
+    price_range = 100000
+    crossing = int(price_range * options.overlap)
+    buys = random_side(rng, options.orders, 1, price_range)
+    sells = random_side(rng, options.orders, price_range - crossing, 2 * price_range - crossing)
+
+    for name, fn in (('simulate', lambda: simulate(buys, sells)), ('match_tick', lambda: match_tick(buys, sells))):
+        result, timings = measure(fn, options.iterations)
+        steps = result.steps if name == 'simulate' else len(result.buy)
+        print('{0:<10} orders={1}x2 steps={2:<6} mean={3:8.3f}ms  median={4:8.3f}ms'.format(
+            name, options.orders, steps, statistics.mean(timings), statistics.median(timings)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+"""
+pytest configuration; puts this folder in the path so the tests import tex_client
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
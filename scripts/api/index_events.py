@@ -0,0 +1,25 @@
+"""
+Indexes the match, tick, expiry and commission events of the TEX into ./events (a
+columnar store of NumPy arrays partitioned by pair and tick) and keeps following the
+new blocks. It resumes from the last indexed block, run this script with:
+
+user> python ./index_events.py
+
+"""
+
+from tex_client import TexClient
+from tex_client.event_store import EventStore
+from tex_client.indexer import EventIndexer
+
+connection_network = 'rskTesnetPublic'
+config_network = 'dexTestnet'
+
+store_path = 'events'
+from_block = 0
+poll_interval = 10
+
+with TexClient(connection_network=connection_network, config_network=config_network) as client:
+    indexer = EventIndexer(client.rpc, client.dex_address, EventStore(store_path), from_block=from_block)
+    indexed = indexer.run()
+    print("Indexed {0} events up to block {1}".format(indexed, indexer.last_block))
+    indexer.follow(poll_interval=poll_interval)
@@ -0,0 +1,43 @@
+"""
+Keeper: runs the ticks of every listed pair and processes the expired orders
+
+Signs with the private key of the environment variable ACCOUNT_PK_SECRET (needs eth_account)
+and writes the per pair metrics (tick duration, gas per step, ...) to keeper_metrics.json,
+run this script with:
+
+user> export ACCOUNT_PK_SECRET=PK
+user> python ./keeper.py
+
+Where replace with your PK, and also you need to have funds in this account
+
+"""
+
+import asyncio
+import os
+
+from tex_client import TexClient
+from tex_client.aio import AsyncTexClient, LocalSigner
+from tex_client.keeper import Keeper
+
+connection_network = 'rskTesnetPublic'
+config_network = 'dexTestnet'
+
+poll_interval = 10
+metrics_path = 'keeper_metrics.json'
+
+with TexClient(connection_network=connection_network, config_network=config_network) as client:
+    rpc_url, dex_address = client.rpc_url, client.dex_address
+
+
+async def main():
+    async with AsyncTexClient(rpc_url, dex_address, LocalSigner(os.environ['ACCOUNT_PK_SECRET'])) as client:
+        keeper = Keeper(client)
+        while True:
+            due = await keeper.step()
+            for row in due:
+                print("Tick {0} of {1}/{2} done".format(row.tick_number, row.base_token, row.secondary_token))
+            keeper.write_metrics(metrics_path)
+            await asyncio.sleep(poll_interval)
+
+
+asyncio.run(main())
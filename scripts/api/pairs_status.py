@@ -0,0 +1,19 @@
+"""
+Status of every listed pair (tick, stage, orderbook sizes, prices) in one request
+
+user> python ./pairs_status.py
+
+"""
+
+from tex_client import TexClient
+from tex_client.batch import BatchReader
+
+connection_network = 'rskTesnetPublic'
+config_network = 'dexTestnet'
+
+with TexClient(connection_network=connection_network, config_network=config_network) as client:
+    table = BatchReader.from_client(client).pairs_status()
+    print(table.format())
+    for row in table:
+        if row.errors:
+            print("{0}/{1} failed calls: {2}".format(row.base_token, row.secondary_token, row.errors))
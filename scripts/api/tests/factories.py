@@ -0,0 +1,84 @@
+"""
+Builders of raw chain data shared by the tests
+"""
+
+from tex_client.constants import OrderType
+from tex_client.events import EVENTS
+
+BASE = '0x' + '11' * 20
+SECONDARY = '0x' + '22' * 20
+OWNER = '0x' + '33' * 20
+WAD = 10 ** 18
+
+
+class LogFactory(object):
+    """ Builds raw logs like the ones returned by eth_getLogs """
+
+    def __init__(self):
+        self.logs = []
+        self.block_number = 1
+
+    def emit(self, name, tx_hash=None, **args):
+        topics, data = EVENTS[name].encode_args(args)
+        log = {'topics': topics, 'data': data, 'blockNumber': hex(self.block_number),
+               'logIndex': hex(len(self.logs)), 'transactionHash': tx_hash or '0x' + '00' * 32}
+        self.logs.append(log)
+        return log
+
+    def insert(self, order_id, is_buy, price, amount=WAD, order_type=OrderType.LIMIT_ORDER,
+               multiply_factor=0, expires_in_tick=10):
+        return self.emit(
+            'NewOrderInserted', id=order_id, sender=OWNER, baseTokenAddress=BASE,
+            secondaryTokenAddress=SECONDARY, exchangeableAmount=amount, reservedCommission=amount // 100,
+            price=price, multiplyFactor=multiply_factor, expiresInTick=expires_in_tick, isBuy=is_buy,
+            orderType=order_type)
+
+    def match(self, order_id, is_buy, remaining):
+        if is_buy:
+            return self.emit('BuyerMatch', orderId=order_id, amountSent=0, commission=0, change=0,
+                             received=0, remainingAmount=remaining, matchPrice=0, tickNumber=1)
+        return self.emit('SellerMatch', orderId=order_id, amountSent=0, commission=0, received=0,
+                         surplus=0, remainingAmount=remaining, matchPrice=0, tickNumber=1)
+
+    def serve(self, server):
+        """ Answers eth_getLogs and eth_blockNumber of a FakeRPCServer with these logs """
+
+        def get_logs(params):
+            from_block, to_block = int(params[0]['fromBlock'], 16), int(params[0]['toBlock'], 16)
+            return [log for log in self.logs if from_block <= int(log['blockNumber'], 16) <= to_block]
+
+        server.register('eth_getLogs', get_logs)
+        server.register('eth_blockNumber', lambda params: hex(self.block_number))
+        return server
+
+
+class FakeDex(object):
+    """
+    Answers the eth_call of the DEX (and CommissionManager) getters on a FakeRPCServer from python values:
+    results[(function name, args tuple)] = value, or an Exception to answer with an error
+    """
+
+    def __init__(self, address='0x' + '44' * 20):
+        self.address = address
+        self.results = dict()
+
+    def set(self, function_name, args, value):
+        self.results[(function_name, tuple(args))] = value
+
+    def eth_call(self, params):
+        from tex_client.abi import COMMISSION_FUNCTIONS, FUNCTIONS, TOKEN_FUNCTIONS
+
+        data = params[0]['data']
+        functions = list(FUNCTIONS.values()) + list(COMMISSION_FUNCTIONS.values()) + list(TOKEN_FUNCTIONS.values())
+        function = dict((function.selector, function) for function in functions)[data[2:10]]
+        args = tuple(function.decode_input(data).values())
+        value = self.results[(function.name, args)]
+        if isinstance(value, Exception):
+            raise value
+        if isinstance(value, dict):
+            return function.encode_output(*[value[name] for name in function.output_names])
+        return function.encode_output(value)
+
+    def serve(self, server):
+        server.register('eth_call', self.eth_call)
+        return server
@@ -0,0 +1,33 @@
+/*
+  Generates exchanges_calculator.json, the conformance cases of tex_client.simulator,
+  with the matching calculator of the contract tests. From the repository root:
+
+    node scripts/api/tests/fixtures/exchanges_calculator.js > scripts/api/tests/fixtures/exchanges_calculator.json
+*/
+const { match } = require('../../../../helpers/exchangesCalculator');
+
+const cases = [
+  { buy: { price: 1, amount: 10 }, sell: { price: 1, amount: 10 } },
+  { buy: { price: 20, amount: 150 }, sell: { price: 10, amount: 7.5 } },
+  { buy: { price: 2, amount: 10 }, sell: { price: 1, amount: 10 } },
+  { buy: { price: 4, amount: 100 }, sell: { price: 2, amount: 5 }, price: 3 },
+  { buy: { price: 3, amount: 30 }, sell: { price: 1.5, amount: 20 } },
+  { buy: { price: 0.5, amount: 1 }, sell: { price: 0.25, amount: 3 } },
+  { buy: { price: 1.4, amount: 7 }, sell: { price: 1.2, amount: 2.5 } },
+  { buy: { price: 0.001, amount: 0.000001 }, sell: { price: 0.0005, amount: 1 } },
+  { buy: { price: 14000, amount: 14 }, sell: { price: 13500, amount: 0.0005 } },
+  { buy: { price: 10, amount: 20 }, sell: { price: 10, amount: 1 } },
+  { buy: { price: 3, amount: 10 }, sell: { price: 2, amount: 5 } },
+  { buy: { price: 7, amount: 1 }, sell: { price: 3, amount: 1 } },
+  { buy: { price: 1.1, amount: 5.5 }, sell: { price: 0.9, amount: 5 }, price: 1 },
+  { buy: { price: 9, amount: 100 }, sell: { price: 6, amount: 11 } }
+];
+
+const results = cases.map(({ buy, sell, price }) => ({
+  buy,
+  sell,
+  price: price === undefined ? null : price,
+  expected: match(buy, sell, price)
+}));
+
+console.log(JSON.stringify(results, null, 2));
@@ -0,0 +1,63 @@
+import pytest
+
+from tex_client.abi import (COMMISSION_FUNCTIONS, FUNCTIONS, GOVERNOR_FUNCTIONS, TOKEN_FUNCTIONS,
+                            decode_function_input)
+from tex_client.events import EVENTS, TOKEN_EVENTS, EventDecoder
+
+A = '0x' + '11' * 20
+B = '0x' + '22' * 20
+
+
+def test_function_input_roundtrip():
+    data = FUNCTIONS['insertBuyLimitOrderAfter'].encode(A, B, 10 ** 18, 3 * 10 ** 17, 5, 7)
+    name, args = decode_function_input(data)
+    assert name == 'insertBuyLimitOrderAfter'
+    assert args == {'_baseToken': A, '_secondaryToken': B, '_amount': 10 ** 18,
+                    '_price': 3 * 10 ** 17, '_lifespan': 5, '_previousOrderIdHint': 7}
+    data = FUNCTIONS['insertMarketOrder'].encode(A, B, 1, 2, 3, True)
+    assert decode_function_input(data)[1]['_isBuy'] is True
+    assert decode_function_input('0xdeadbeef') == (None, None)
+
+
+def test_event_roundtrip():
+    definition = EVENTS['TickEnd']
+    args = {'baseTokenAddress': A, 'secondaryTokenAddress': B, 'number': 4,
+            'nextTickBlock': 100, 'closingPrice': 10 ** 18}
+    topics, data = definition.encode_args(args)
+    log = {'topics': topics, 'data': data, 'blockNumber': '0x10', 'logIndex': '0x0'}
+    event = EventDecoder().decode(log)
+    assert event.name == 'TickEnd'
+    assert event.args == args
+    assert event.block_number == 16
+
+
+def test_selectors_and_topics_match_the_signatures():
+    eth_utils = pytest.importorskip('eth_utils')
+    for function in FUNCTIONS.values():
+        assert eth_utils.keccak(text=function.signature)[:4].hex() == function.selector
+    for definition in list(EVENTS.values()) + list(TOKEN_EVENTS.values()):
+        assert '0x' + eth_utils.keccak(text=definition.signature).hex() == definition.topic
+
+
+def test_address_pairs_output():
+    pairs = [(A, B), (B, A)]
+    function = FUNCTIONS['getTokenPairs']
+    assert function.decode_output(function.encode_output(pairs)) == pairs
+    assert function.decode_output(function.encode_output([])) == []
+
+
+def test_token_and_governance_selectors_match_the_signatures():
+    eth_utils = pytest.importorskip('eth_utils')
+    for function in list(TOKEN_FUNCTIONS.values()) + list(COMMISSION_FUNCTIONS.values()) + \
+            list(GOVERNOR_FUNCTIONS.values()):
+        assert eth_utils.keccak(text=function.signature)[:4].hex() == function.selector
+
+
+def test_hint_ids_array_input():
+    function = FUNCTIONS['matchOrdersWithHints']
+    data = function.encode(A, B, 20, [3, 0, 9])
+    assert function.decode_input(data) == {'_baseToken': A, '_secondaryToken': B, 'steps': 20, 'hintIds': [3, 0, 9]}
+    # head: 4 words with the offset of the array in the last one, tail: length and items
+    assert int(data[2 + 8 + 3 * 64:2 + 8 + 4 * 64], 16) == 4 * 32
+    assert len(data) == 2 + 8 + 8 * 64
+    assert function.decode_input(function.encode(A, B, 1, []))['hintIds'] == []
@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+
+from factories import BASE, SECONDARY, OWNER, WAD
+from tex_client.abi import FUNCTIONS, TOKEN_FUNCTIONS, decode_function_input
+from tex_client.aio import AsyncTexClient, NodeSigner, TransactionFailed
+from tex_client.fake_rpc import FakeRPCServer, FakeTransactions
+from tex_client.nonces import NonceAllocator
+from tex_client.session import RPCError
+
+DEX = '0x' + '44' * 20
+
+
+@pytest.fixture
+def chain():
+    with FakeRPCServer() as server:
+        transactions = FakeTransactions(server).start_mining(0.01)
+        yield transactions
+        transactions.stop_mining()
+
+
+def run(chain, scenario, **kwargs):
+    async def main():
+        async with AsyncTexClient(chain.server.url, DEX, NodeSigner(OWNER), poll_interval=0.01, **kwargs) as client:
+            return await scenario(client)
+    return asyncio.run(main())
+
+
+def test_concurrent_orders_get_consecutive_nonces(chain):
+    async def scenario(client):
+        return await asyncio.gather(*[
+            client.insert_buy_limit_order(BASE, SECONDARY, 1, price, 5) for price in range(1, 21)])
+
+    receipts = run(chain, scenario)
+    assert [receipt.status for receipt in receipts] == [1] * 20
+    assert sorted(int(tx['nonce'], 16) for tx in chain.mined) == list(range(20))
+    prices = sorted(decode_function_input(tx['data'])[1]['_price'] for tx in chain.mined)
+    assert prices == [price * WAD for price in range(1, 21)]
+
+
+def test_starts_from_the_pending_nonce(chain):
+    chain.nonces[OWNER.lower()] = 7
+
+    async def scenario(client):
+        await client.approve(BASE, 10)
+        return client.nonces.next_nonce
+
+    assert run(chain, scenario) == 8
+    assert int(chain.mined[0]['nonce'], 16) == 7
+    assert chain.mined[0]['to'] == BASE
+    assert TOKEN_FUNCTIONS['approve'].decode_input(chain.mined[0]['data']) == {'spender': DEX, 'amount': 10 * WAD}
+
+
+def test_failed_send_gives_the_nonce_back(chain):
+    def send(params):
+        raise ValueError('insufficient funds')
+
+    chain.server.register('eth_sendTransaction', send)
+
+    async def scenario(client):
+        with pytest.raises(Exception, match='insufficient funds'):
+            await client.wrap(BASE, 1)
+        return client.nonces.next_nonce
+
+    assert run(chain, scenario) == 0
+
+
+def test_a_failed_send_among_concurrent_ones_is_filled_without_reusing_nonces(chain):
+    sent, failed = [], []
+
+    def send(params):
+        nonce = int(params[0]['nonce'], 16)
+        if nonce == 0 and not failed:
+            failed.append(nonce)
+            raise ValueError('connection reset')
+        sent.append(nonce)
+        return chain.send_transaction(params)
+
+    chain.server.register('eth_sendTransaction', send)
+
+    async def scenario(client):
+        results = await asyncio.gather(*[client.send_transaction(DEX, '0x', gas=100000) for _ in range(5)],
+                                       return_exceptions=True)
+        while len(chain.mined) < 5:
+            await asyncio.sleep(0.01)
+        return results, client.nonces.next_nonce
+
+    results, next_nonce = run(chain, scenario)
+    assert isinstance(results[0], RPCError) and next_nonce == 5
+    # nonce 0 is an empty transfer to itself, the later sends kept their nonces
+    assert sorted(sent) == list(range(5))
+    mined = dict((int(tx['nonce'], 16), tx) for tx in chain.mined)
+    assert sorted(mined) == list(range(5)) and mined[0]['to'].lower() == OWNER.lower()
+
+
+def test_released_nonces_are_allocated_first():
+    nonces = NonceAllocator(3)
+    assert [nonces.allocate() for _ in range(3)] == [3, 4, 5]
+    assert not nonces.release(4) and nonces.allocate() == 4
+    assert not nonces.release(3) and nonces.reclaim(3) and not nonces.reclaim(3)
+    assert not nonces.release(4) and nonces.release(5) and nonces.next_nonce == 4
+
+
+def test_reverted_transaction_raises(chain):
+    chain.revert = lambda tx: decode_function_input(tx['data'])[0] == 'cancelSellOrder'
+
+    async def scenario(client):
+        with pytest.raises(TransactionFailed) as error:
+            await client.cancel_sell_order(BASE, SECONDARY, 3)
+        return error.value.receipt
+
+    receipt = run(chain, scenario)
+    assert receipt.status == 0
+    args = FUNCTIONS['cancelSellOrder'].decode_input(chain.mined[0]['data'])
+    assert (args['_orderId'], args['_previousOrderIdHint']) == (3, 0)
+
+
+def test_receipts_are_polled_in_one_batch(chain):
+    chain.stop_mining()
+
+    async def scenario(client):
+        sends = [asyncio.ensure_future(client.insert_sell_market_order(BASE, SECONDARY, 1, 1.01, 5))
+                 for _ in range(10)]
+        while len(chain.pool) < 10:
+            await asyncio.sleep(0.01)
+        requests_before = chain.server.requests_count
+        await asyncio.sleep(0.05)
+        polls = chain.server.requests_count - requests_before
+        chain.mine()
+        return polls, await asyncio.gather(*sends)
+
+    polls, receipts = run(chain, scenario)
+    # one batch per poll interval for the 10 pending transactions, not one request each
+    assert polls <= 6
+    assert len({receipt.transaction_hash for receipt in receipts}) == 10
+    args = FUNCTIONS['insertMarketOrderAfter'].decode_input(chain.mined[0]['data'])
+    assert args['_isBuy'] is False
+    assert args['_multiplyFactor'] == 101 * WAD // 100
+
+
+def test_a_timed_out_receipt_is_no_longer_polled(chain):
+    chain.stop_mining()
+
+    async def scenario(client):
+        tx_hash = await client.send_transaction(BASE, '0x')
+        with pytest.raises(asyncio.TimeoutError):
+            await client.wait_for_receipt(tx_hash)
+        polling = tx_hash in client.receipts._pending
+        # waiting again, e.g. after a rebroadcast, gets a new future
+        chain.mine()
+        return polling, await client.wait_for_receipt(tx_hash)
+
+    polling, receipt = run(chain, scenario, receipt_timeout=0.05)
+    assert not polling and receipt.status == 1
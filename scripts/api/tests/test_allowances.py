@@ -0,0 +1,178 @@
+import asyncio
+
+import pytest
+
+from factories import BASE, SECONDARY, OWNER, WAD
+from tex_client.abi import TOKEN_FUNCTIONS, decode_function_input, to_bytes
+from tex_client.aio import AsyncTexClient, NodeSigner
+from tex_client.allowances import MAX_UINT256, AllowancePlanner
+from tex_client.bulk import BulkOrders
+from tex_client.events import TOKEN_EVENTS
+from tex_client.fake_rpc import FakeRPCServer, FakeTransactions
+from tex_client.orderbook import OrderbookMirror
+from tex_client.session import RPCSession
+from tex_client.validator import OrderRejected, limit_order
+
+DEX = '0x' + '44' * 20
+OTHER = '0x' + '55' * 20
+
+
+class Ledger(object):
+    """ The ERC20 state of BASE (WRBTC) and SECONDARY on the fake node, with the logs of its changes """
+
+    def __init__(self, server):
+        self.server = server
+        self.balances = {(BASE, OWNER): 0, (SECONDARY, OWNER): 0}
+        self.allowances = {(BASE, OWNER): 0, (SECONDARY, OWNER): 0}
+        self.native = 0
+        self.logs = []
+        self.reads = 0
+        server.register('eth_call', self.call)
+        server.register('eth_getBalance', lambda params: hex(self.native))
+        server.register('eth_getLogs', self.get_logs)
+
+    def call(self, params):
+        self.reads += 1
+        token, data = params[0]['to'], params[0]['data']
+        for name in ('allowance', 'balanceOf'):
+            function = TOKEN_FUNCTIONS[name]
+            if data[2:10] == function.selector:
+                state = self.allowances if name == 'allowance' else self.balances
+                owner = list(function.decode_input(data).values())[0]
+                return function.encode_output(state.get((token, owner), 0))
+        raise ValueError('execution reverted')
+
+    def emit(self, token, name, transaction_hash='0x01', **args):
+        amount = args.get('value', args.get('wad'))
+        if name == 'Approval':
+            self.allowances[(token, args['owner'])] = amount
+        elif name == 'Transfer':
+            self.balances[(token, args['from'])] = self.balances.get((token, args['from']), 0) - amount
+            self.balances[(token, args['to'])] = self.balances.get((token, args['to']), 0) + amount
+            if args['to'] == DEX and self.allowances.get((token, args['from'])) != MAX_UINT256:
+                self.allowances[(token, args['from'])] -= amount
+        else:
+            account = args.get('dst', args.get('src'))
+            sign = 1 if name == 'Deposit' else -1
+            self.balances[(token, account)] += sign * amount
+        topics, data = TOKEN_EVENTS[name].encode_args(args)
+        log = {'address': token, 'topics': topics, 'data': data, 'blockNumber': hex(self.server.block_number),
+               'logIndex': hex(len(self.logs)), 'transactionHash': transaction_hash}
+        self.logs.append(log)
+        return log
+
+    def get_logs(self, params):
+        query = params[0]
+
+        def matches(log):
+            if log['address'] not in query['address']:
+                return False
+            if not int(query['fromBlock'], 16) <= int(log['blockNumber'], 16) <= int(query['toBlock'], 16):
+                return False
+            return all(topic is None or log['topics'][i] in (topic if isinstance(topic, list) else [topic])
+                       for i, topic in enumerate(query['topics']))
+        return [log for log in self.logs if matches(log)]
+
+    def receipt_logs(self, transaction):
+        """ The approvals, wraps and insertions (a transferFrom of the locked amount) of OWNER """
+        to, selector = transaction['to'], transaction['data'][2:10]
+        if selector == TOKEN_FUNCTIONS['approve'].selector:
+            amount = TOKEN_FUNCTIONS['approve'].decode_input(transaction['data'])['amount']
+            return [self.emit(to, 'Approval', transaction['hash'], owner=OWNER, spender=DEX, value=amount)]
+        if selector == TOKEN_FUNCTIONS['deposit'].selector:
+            value = int(transaction['value'], 16)
+            self.native -= value
+            return [self.emit(to, 'Deposit', transaction['hash'], dst=OWNER, wad=value)]
+        name, args = decode_function_input(to_bytes(transaction['data']))
+        token = BASE if 'Buy' in name else SECONDARY
+        transfer = {'from': OWNER, 'to': DEX, 'value': args['_amount']}
+        return [self.emit(token, 'Transfer', transaction['hash'], **transfer)]
+
+
+@pytest.fixture
+def ledger():
+    with FakeRPCServer() as server:
+        yield Ledger(server)
+
+
+def test_follows_the_token_logs(ledger):
+    ledger.balances[(BASE, OWNER)] = 5 * WAD
+    ledger.native = 20 * WAD
+    planner = AllowancePlanner(RPCSession(ledger.server.url), OWNER, DEX, wrbtc=BASE).load([SECONDARY])
+    assert (planner.balances, planner.allowances) == ({BASE: 5 * WAD, SECONDARY: 0}, {BASE: 0, SECONDARY: 0})
+
+    ledger.server.block_number = 2
+    ledger.emit(BASE, 'Approval', owner=OWNER, spender=DEX, value=10 * WAD)
+    ledger.emit(BASE, 'Approval', owner=OTHER, spender=DEX, value=WAD)
+    ledger.emit(BASE, 'Transfer', **{'from': OWNER, 'to': DEX, 'value': 3 * WAD})
+    ledger.server.block_number = 3
+    ledger.emit(SECONDARY, 'Transfer', **{'from': OTHER, 'to': OWNER, 'value': 7 * WAD})
+    # in the results of both queries, applied once
+    ledger.emit(SECONDARY, 'Transfer', **{'from': OWNER, 'to': OWNER, 'value': 7 * WAD})
+    ledger.emit(BASE, 'Deposit', dst=OWNER, wad=2 * WAD)
+    ledger.emit(BASE, 'Withdrawal', src=OWNER, wad=WAD)
+    ledger.native = 19 * WAD
+
+    assert planner.sync() == 6 and planner.last_block == 3
+    assert planner.balances == {BASE: 3 * WAD, SECONDARY: 7 * WAD} == {
+        token: ledger.balances[(token, OWNER)] for token in (BASE, SECONDARY)}
+    assert planner.allowances == {BASE: 7 * WAD, SECONDARY: 0} and planner.native_balance == 19 * WAD
+    assert planner.sync() == 0
+
+
+def test_plans_the_approvals_wraps_and_failing_orders():
+    planner = AllowancePlanner(None, OWNER, DEX, wrbtc=BASE, native_reserve=WAD)
+    planner.balances = {BASE: 2 * WAD, SECONDARY: 4 * WAD}
+    planner.allowances = {BASE: 0, SECONDARY: MAX_UINT256}
+    planner.native_balance = 10 * WAD
+    orders = [limit_order(BASE, SECONDARY, 2 * WAD, price * WAD, 5, is_buy=True) for price in (9, 8, 7)]
+    orders += [limit_order(BASE, SECONDARY, 3 * WAD, price * WAD, 5, is_buy=False) for price in (11, 12)]
+
+    plan = planner.plan(orders)
+    assert plan.needed == {BASE: 6 * WAD, SECONDARY: 6 * WAD}
+    assert (plan.wrap, plan.approvals, plan.transactions) == (4 * WAD, [(BASE, 6 * WAD)], 2)
+    assert list(plan.failing) == [4] and plan.failing[4].startswith('Token transfer failed')
+
+    # the wrap keeps the gas reserve, without approvals the buys fail on the allowance
+    planner.native_balance = 4 * WAD
+    plan = planner.plan(orders[:3], approve=False)
+    assert (plan.wrap, plan.approvals) == (3 * WAD, [])
+    assert [reason.split(':')[0] for reason in plan.failing.values()] == ['Allowance too low'] * 2 + [
+        'Token transfer failed']
+
+
+def test_bulk_orders_approve_once_for_several_batches(ledger):
+    transactions = FakeTransactions(ledger.server)
+    transactions.receipt_logs = ledger.receipt_logs
+    transactions.start_mining(0.01)
+    ledger.balances[(SECONDARY, OWNER)] = 10 * WAD
+    ledger.native = 20 * WAD
+    planner = AllowancePlanner(RPCSession(ledger.server.url), OWNER, DEX, wrbtc=BASE, approval_factor=2)
+    planner.load([SECONDARY])
+    reads = ledger.reads
+    batches = [[limit_order(BASE, SECONDARY, 2 * WAD, (9 - index) * WAD, 5, is_buy=True),
+                limit_order(BASE, SECONDARY, 4 * WAD, (11 + index) * WAD, 5, is_buy=False)] for index in range(2)]
+    batches.append([limit_order(BASE, SECONDARY, 4 * WAD, 13 * WAD, 5, is_buy=False)])
+
+    async def main():
+        async with AsyncTexClient(ledger.server.url, DEX, NodeSigner(OWNER), poll_interval=0.01) as client:
+            bulk = BulkOrders(client, OrderbookMirror(), planner=planner)
+            results = []
+            for orders in batches:
+                results.append([result async for result in bulk.place(orders)])
+            return bulk, results
+    try:
+        bulk, results = asyncio.run(main())
+    finally:
+        transactions.stop_mining()
+
+    # the approvals of the first batch cover the second one, the third runs out of SECONDARY before sending
+    selectors = [tx['data'][2:10] for tx in transactions.mined]
+    assert bulk.approvals_count == selectors.count(TOKEN_FUNCTIONS['approve'].selector) == 2
+    assert selectors.count(TOKEN_FUNCTIONS['deposit'].selector) == 2 and len(selectors) == 8
+    assert [result.error for result in results[0] + results[1]] == [None] * 4
+    assert len(results[2]) == 1 and isinstance(results[2][0].error, OrderRejected)
+    # no reads after load, the state comes from the receipts
+    assert ledger.reads == reads
+    assert planner.balances == {token: ledger.balances[(token, OWNER)] for token in (BASE, SECONDARY)}
+    assert planner.allowances == {token: ledger.allowances[(token, OWNER)] for token in (BASE, SECONDARY)}
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from factories import BASE, SECONDARY, OWNER, WAD, FakeDex, LogFactory
+from tex_client.abi import decode_function_input
+from tex_client.aio import AsyncTexClient, NodeSigner
+from tex_client.amend import OrderAmender, diff_orders
+from tex_client.commissions import CommissionEngine, CommissionRates
+from tex_client.fake_rpc import FakeRPCServer, FakeTransactions
+from tex_client.orderbook import OrderbookMirror
+from tex_client.pipeline import TransactionPipeline
+from tex_client.validator import limit_order
+
+DEX = '0x' + '44' * 20
+OTHER = '0x' + '55' * 20
+RATES = CommissionRates(commission_rate=WAD // 1000, cancelation_penalty_rate=WAD // 4, expiration_penalty_rate=0,
+                        minimum_commission=0)
+
+
+@pytest.fixture
+def chain():
+    with FakeRPCServer() as server:
+        transactions = FakeTransactions(server)
+        dex = FakeDex(DEX)
+        dex.set('allowance', (OWNER, DEX), 0)
+        dex.serve(server)
+        transactions.start_mining(0.01)
+        yield transactions
+        transactions.stop_mining()
+
+
+@pytest.fixture
+def mirror():
+    logs = LogFactory()
+    for order_id, price in [(1, 100), (2, 99), (3, 98)]:
+        logs.insert(order_id, True, price * WAD)
+    logs.emit('NewOrderInserted', id=4, sender=OTHER, baseTokenAddress=BASE, secondaryTokenAddress=SECONDARY,
+              exchangeableAmount=WAD, reservedCommission=0, price=975 * WAD // 10, multiplyFactor=0,
+              expiresInTick=10, isBuy=True, orderType=0)
+    mirror = OrderbookMirror()
+    mirror.apply_logs(logs.logs)
+    return mirror
+
+
+def buy(price):
+    return limit_order(BASE, SECONDARY, WAD, int(price * WAD), 5, is_buy=True)
+
+
+def test_keeps_the_levels_that_sort_the_same(mirror):
+    index = mirror.pair(BASE, SECONDARY).buy.limit
+    live = [order for order in index if order.owner == OWNER]
+    plan = diff_orders(live, [buy(100), buy(99), buy(97)], index)
+    assert [(order.id, desired.price) for order, desired in plan.keep] == [(1, 100 * WAD), (2, 99 * WAD)]
+    assert [order.id for order in plan.cancel] == [3] and plan.insert == [buy(97)]
+    # 98 can move to 97.8 but not to 97, the order of 97.5 is in between
+    plan = diff_orders(live, [buy(100), buy(99), buy(97.8)], index, tolerance=WAD)
+    assert len(plan.keep) == 3 and not plan.cancel and not plan.insert
+    plan = diff_orders(live, [buy(100), buy(99), buy(97)], index, tolerance=WAD)
+    assert [order.id for order in plan.cancel] == [3]
+
+
+def test_amends_in_one_batch_and_reports_the_savings(chain, mirror):
+    async def scenario():
+        async with AsyncTexClient(chain.server.url, DEX, NodeSigner(OWNER), poll_interval=0.01) as client:
+            async with TransactionPipeline(client):
+                amender = OrderAmender(client, mirror, CommissionEngine(None, None, rates=RATES))
+                return await amender.amend(BASE, SECONDARY, [buy(100), buy(99), buy(97)], is_buy=True)
+
+    report = asyncio.run(scenario())
+    assert not report.errors and report.kept == 2
+    calls = [decode_function_input(tx['data']) for tx in sorted(chain.mined, key=lambda tx: int(tx['nonce'], 16))]
+    # the cancel of 3 goes after 2, then the approval and 97 after the order of 97.5
+    sent = [(name, args and args.get('_orderId'), args and args['_previousOrderIdHint']) for name, args in calls]
+    assert sent == [('cancelBuyOrder', 3, 2), (None, None, None), ('insertBuyLimitOrderAfter', None, 4)]
+    assert report.gas_used == 200000 and report.naive_gas == 600000 and report.gas_saved == 400000
+    # the reserved commission of every order is 0.01
+    assert report.penalty == WAD // 400 and report.penalty_saved == 2 * WAD // 400
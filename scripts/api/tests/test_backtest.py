@@ -0,0 +1,139 @@
+import random
+
+import numpy as np
+import pytest
+
+from factories import BASE, SECONDARY, OWNER, WAD
+from tex_client.backtest import Backtest, OrderFlow, SpreadQuoter, run_grid
+from tex_client.commissions import CommissionRates
+from tex_client.event_store import EventStore, event_columns, pair_partition
+from tex_client.fake_dex import FakeExchange
+from tex_client.validator import limit_order, market_order
+
+RATES = CommissionRates(WAD // 100, WAD // 10, WAD // 2, 0)
+
+
+@pytest.fixture(scope='module')
+def history():
+    """ A FakeExchange after 30 ticks of random limit and market orders, and cancelations """
+    rng = random.Random(3)
+    dex = FakeExchange(account=OWNER, rates=RATES)
+    dex.list_pair(BASE, SECONDARY, 10 * WAD)
+    book = dex.book.pair(BASE, SECONDARY)
+    while book.tick_number <= 30:
+        for _ in range(rng.randint(0, 4)):
+            is_buy = rng.random() < 0.5
+            if rng.random() < 0.2:
+                dex.insert_order(market_order(BASE, SECONDARY, rng.randint(1, 20) * WAD,
+                                              rng.choice([WAD * 98 // 100, WAD, WAD * 102 // 100]),
+                                              rng.randint(1, 4), is_buy))
+            else:
+                price = 10 * WAD + rng.randint(-20, 20) * WAD // 100
+                dex.insert_order(limit_order(BASE, SECONDARY, rng.randint(1, 20) * WAD, price,
+                                             rng.randint(1, 4), is_buy))
+        orders = list(book.buy.orders.values()) + list(book.sell.orders.values())
+        if orders and rng.random() < 0.2:
+            order = rng.choice(orders)
+            dex.cancel_order(BASE, SECONDARY, order.id, order.is_buy)
+        dex.mine(1)
+    return dex
+
+
+def test_replays_the_history_like_the_contract(history):
+    flow = OrderFlow.from_events(history.events, BASE, SECONDARY)
+    assert list(flow.ticks) == list(range(1, 31)) and len(flow.cancelled_ids)
+    result = Backtest(flow, market_prices=dict((tick, 10 * WAD) for tick in flow.ticks), history_fills=True).run()
+
+    matches = [(event.args['tickNumber'], event.args['orderId'], event.name == 'BuyerMatch',
+                event.args['amountSent'], event.args['received'], event.args['commission'], event.args['matchPrice'])
+               for event in history.events if event.name in ('BuyerMatch', 'SellerMatch')]
+    fills = result.fills
+    replayed = list(zip(*[fills[name].tolist() for name in
+                          ('tick', 'order_id', 'is_buy', 'amount_sent', 'received', 'commission', 'match_price')]))
+    assert len(matches) > 20 and sorted(replayed) == sorted(matches)
+    closing = dict((event.args['number'], event.args['closingPrice']) for event in history.events
+                   if event.name == 'TickEnd')
+    assert list(result.closing_prices) == [closing[tick] for tick in result.ticks]
+    assert result.pnl == 0 and not len(result.strategy_fills)
+
+
+def test_strategy_fills_commissions_and_pnl(history):
+    flow = OrderFlow.from_events(history.events, BASE, SECONDARY)
+    orders = {}
+
+    def strategy(backtest):
+        if backtest.tick_number == 5:
+            # an order whose fee is above its amount reverts
+            assert backtest.insert(limit_order(BASE, SECONDARY, 1, 11 * WAD, 2, True)) is None
+            orders['buy'] = backtest.insert(limit_order(BASE, SECONDARY, 10000 * WAD, 11 * WAD, 2, True))
+            orders['kept'] = backtest.insert(limit_order(BASE, SECONDARY, 10 * WAD, WAD, 1, True))
+            orders['cancelled'] = backtest.insert(limit_order(BASE, SECONDARY, 10 * WAD, 20 * WAD, 3, False))
+        if backtest.tick_number in (6, 7):
+            reserved.update((order.id, order.reserved_commission) for order in backtest.open_orders())
+        if backtest.tick_number == 6:
+            assert set(reserved) == set(orders.values())
+            assert backtest.cancel(orders['cancelled']) and not backtest.cancel(orders['cancelled'])
+        if backtest.tick_number == 7:
+            # what is left of the buy after its fills of tick 6
+            assert [order.id for order in backtest.open_orders()] == [orders['buy']]
+            assert backtest.cancel(orders['buy'])
+
+    reserved = {}
+    rates = CommissionRates(WAD // 100, WAD // 10, WAD // 2, WAD // 1000)
+    result = Backtest(flow, strategy, rates=rates, latency=1).run()
+    rows = result.strategy_fills
+    assert set(result.fills['order_id'][rows]) == {orders['buy']} and set(result.fills['tick'][rows]) == {6}
+    sent, received, commission = [int(result.fills[name][rows].sum()) for name in ('amount_sent', 'received',
+                                                                                   'commission')]
+    cancel_penalty = reserved[orders['cancelled']] // 10
+    base_penalties = reserved[orders['kept']] // 2 + reserved[orders['buy']] // 10
+    assert (result.base, result.secondary) == (-sent - commission - base_penalties, received - cancel_penalty)
+    assert (result.fees_base, result.fees_secondary) == (commission + base_penalties, cancel_penalty)
+    assert (result.inserted, result.rejected, result.cancelled, result.expired) == (3, 1, 2, 1)
+    # valued at the last closing price
+    closing_price = [price for price in result.closing_prices if price][-1]
+    assert result.pnl == result.base + result.secondary * closing_price // WAD
+
+
+def test_quoter_waits_for_its_quotes_in_flight(history):
+    flow = OrderFlow.from_events(history.events, BASE, SECONDARY)
+    market_prices = dict((tick, 10 * WAD) for tick in flow.ticks)
+    # the first quotes reach the book at tick 4, until then they are pending
+    result = Backtest(flow, SpreadQuoter(WAD, WAD // 100, lifespan=10), market_prices=market_prices,
+                      latency=3).run(to_tick=3)
+    assert (result.inserted, result.rejected) == (2, 0)
+
+
+def store_events(store, events):
+    """ The events in the store like EventIndexer, addresses as bytes """
+    tick = 1
+    for event in events:
+        tick = event.args.get('number', tick)
+        row = dict(event.args, block_number=event.block_number, log_index=event.log_index, tick=tick,
+                   transaction_hash=bytes.fromhex(event.transaction_hash[2:]))
+        for name, kind in event_columns(event.name):
+            if kind == 'address':
+                row[name] = bytes.fromhex(row[name][2:])
+        store.append(event.name, pair_partition(BASE, SECONDARY), row)
+    store.flush()
+
+
+def test_reads_the_store_and_runs_grids_in_processes(history, tmp_path):
+    events = [event for event in history.events
+              if event.name in ('NewOrderInserted', 'OrderCancelled', 'TickStart', 'TickEnd')]
+    store = EventStore(str(tmp_path / 'events'))
+    store_events(store, events)
+    flow = OrderFlow.from_store(store, BASE, SECONDARY)
+    expected = OrderFlow.from_events(events, BASE, SECONDARY)
+    for name in ('ticks', 'closing_prices', 'arrival_ticks', 'is_buy', 'cancel_ticks', 'cancelled_ids'):
+        assert list(getattr(flow, name)) == list(getattr(expected, name))
+    assert list(flow.orders.amounts) == list(expected.orders.amounts)
+
+    grid = {'amount': [10 * WAD], 'spread': [WAD // 100, WAD // 20]}
+    options = dict(rates=RATES, market_prices=dict((tick, 10 * WAD) for tick in flow.ticks))
+    results = run_grid([flow, expected], SpreadQuoter, grid, processes=2, **options)
+    assert [result.params['spread'] for result in results] == grid['spread'] * 2
+    inline = run_grid(flow, SpreadQuoter, grid, processes=0, **options)
+    assert [result.summary() for result in results[:2]] == [result.summary() for result in inline]
+    assert all(result.inserted for result in results) and results[0].pnl != results[1].pnl
+    assert np.array_equal(results[0].equity, results[2].equity)
@@ -0,0 +1,68 @@
+import pytest
+
+from factories import BASE, SECONDARY, FakeDex
+from tex_client.batch import BatchReader
+from tex_client.constants import TickStage
+from tex_client.fake_rpc import FakeRPCServer
+from tex_client.session import RPCSession
+
+OTHER = '0x' + '55' * 20
+
+STATUS = {
+    'emergentPrice': 5, 'lastBuyMatchId': 1, 'lastBuyMatchAmount': 10, 'lastSellMatchId': 2, 'tickNumber': 7,
+    'nextTickBlock': 100, 'lastTickBlock': 90, 'lastClosingPrice': 4, 'disabled': False, 'emaPrice': 3,
+    'smoothingFactor': 1, 'marketPrice': 6}
+
+
+def set_pair(dex, base_token, secondary_token, stage=TickStage.RECEIVING_ORDERS, market_price=6):
+    pair = (base_token, secondary_token)
+    dex.set('getTokenPairStatus', pair, dict(STATUS, marketPrice=market_price))
+    dex.set('getTickStage', pair, stage)
+    dex.set('tickIsRunning', pair, stage != TickStage.RECEIVING_ORDERS)
+    dex.set('getMarketPrice', pair, market_price)
+    dex.set('buyOrdersLength', pair, 3)
+    dex.set('sellOrdersLength', pair, 4)
+    dex.set('pendingBuyOrdersLength', pair, 1)
+    dex.set('pendingSellOrdersLength', pair, 2)
+    dex.set('pendingMarketOrdersLength', pair + (True,), 0)
+    dex.set('pendingMarketOrdersLength', pair + (False,), 1)
+
+
+@pytest.fixture
+def dex():
+    dex = FakeDex()
+    dex.set('getTokenPairs', (), [(BASE, SECONDARY), (BASE, OTHER)])
+    set_pair(dex, BASE, SECONDARY)
+    set_pair(dex, BASE, OTHER, stage=TickStage.RUNNING_MATCHING, market_price=ValueError('Price not available'))
+    return dex
+
+
+def test_all_pairs_in_one_round_trip(dex):
+    with dex.serve(FakeRPCServer()) as server:
+        rpc = RPCSession(server.url)
+        reader = BatchReader(rpc, dex.address)
+        assert reader.pairs == [(BASE, SECONDARY), (BASE, OTHER)]
+        requests_count = server.requests_count
+        table = reader.pairs_status()
+        assert server.requests_count == requests_count + 1
+        rpc.close()
+
+    assert len(table) == 2
+    row = table.pair(BASE, SECONDARY)
+    assert row.tick_stage == TickStage.RECEIVING_ORDERS
+    assert not row.tick_is_running
+    assert (row.tick_number, row.next_tick_block, row.market_price) == (7, 100, 6)
+    assert (row.buy_orders_length, row.sell_orders_length) == (3, 4)
+    assert row.pending_sell_market_orders_length == 1
+    assert not row.errors
+
+    # the failed calls leave their columns empty
+    row = table.pair(BASE, OTHER)
+    assert row.tick_is_running
+    assert row.tick_stage == TickStage.RUNNING_MATCHING
+    assert row.market_price is None
+    assert row.emergent_price is None
+    assert set(row.errors) == {'status', 'market_price'}
+    assert table.column('buy_orders_length') == [3, 3]
+    assert 'RUNNING_MATCHING' in table.format()
+    assert table.to_records()[0]['base_token'] == BASE
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from factories import BASE, SECONDARY, OWNER, WAD, FakeDex, LogFactory
+from tex_client import NO_HINT
+from tex_client.abi import TOKEN_FUNCTIONS, decode_function_input
+from tex_client.aio import AsyncTexClient, NodeSigner
+from tex_client.bulk import BulkOrders, grid, ladder, locked_amounts
+from tex_client.events import EVENTS
+from tex_client.fake_rpc import FakeRPCServer, FakeTransactions
+from tex_client.orderbook import OrderbookMirror
+from tex_client.pipeline import TransactionPipeline
+from tex_client.validator import OrderRejected, limit_order
+
+DEX = '0x' + '44' * 20
+
+
+@pytest.fixture
+def chain():
+    with FakeRPCServer() as server:
+        transactions = FakeTransactions(server)
+        dex = FakeDex(DEX)
+        dex.set('allowance', (OWNER, DEX), 0)
+        dex.serve(server)
+        order_ids = iter(range(100, 200))
+
+        def receipt_logs(transaction):
+            name, args = decode_function_input(transaction['data'])
+            if name is None:
+                return []
+            topics, data = EVENTS['NewOrderInserted'].encode_args(dict(
+                id=next(order_ids), sender=OWNER, baseTokenAddress=BASE, secondaryTokenAddress=SECONDARY,
+                exchangeableAmount=args['_amount'], reservedCommission=0, price=args['_price'],
+                multiplyFactor=0, expiresInTick=5, isBuy=name == 'insertBuyLimitOrderAfter', orderType=0))
+            return [{'topics': topics, 'data': data, 'blockNumber': hex(server.block_number), 'logIndex': '0x0'}]
+
+        transactions.receipt_logs = receipt_logs
+        transactions.start_mining(0.01)
+        yield transactions
+        transactions.stop_mining()
+
+
+@pytest.fixture
+def mirror():
+    logs = LogFactory()
+    logs.insert(1, True, 100 * WAD)
+    logs.insert(2, True, 95 * WAD)
+    logs.insert(3, False, 110 * WAD)
+    mirror = OrderbookMirror()
+    mirror.apply_logs(logs.logs)
+    return mirror
+
+
+def run(chain, scenario):
+    async def main():
+        async with AsyncTexClient(chain.server.url, DEX, NodeSigner(OWNER), poll_interval=0.01) as client:
+            async with TransactionPipeline(client):
+                return await scenario(client)
+    return asyncio.run(main())
+
+
+def sent_orders(chain):
+    calls = [decode_function_input(tx['data']) for tx in sorted(chain.mined, key=lambda tx: int(tx['nonce'], 16))]
+    return [(name, args['_price'] // WAD, args['_previousOrderIdHint']) if name else (name, args)
+            for name, args in calls]
+
+
+def test_ladders():
+    assert [order.price for order in ladder(BASE, SECONDARY, True, 10, 2, 3, WAD, 5)] == [10, 8, 6]
+    orders = grid(BASE, SECONDARY, 10, 1, 2, WAD, 5)
+    assert [(order.is_buy, order.price) for order in orders] == [(True, 9), (True, 8), (False, 11), (False, 12)]
+    assert locked_amounts(orders) == {BASE: 2 * WAD, SECONDARY: 2 * WAD}
+
+
+def test_places_least_competitive_first_with_known_hints(chain, mirror):
+    orders = [limit_order(BASE, SECONDARY, WAD, price * WAD, 5, is_buy=True) for price in [99, 97, 97, 94]]
+    orders += [limit_order(BASE, SECONDARY, 2 * WAD, price * WAD, 5, is_buy=False) for price in [111, 112]]
+
+    async def scenario(client):
+        return [result async for result in BulkOrders(client, mirror).place(iter(orders))]
+
+    results = run(chain, scenario)
+    assert all(result.error is None for result in results)
+    assert sorted(result.index for result in results) == list(range(6))
+    approvals = [tx for tx in chain.mined if tx['to'] == BASE]
+    assert len(approvals) == 1 and approvals[0]['data'] == TOKEN_FUNCTIONS['approve'].encode(DEX, 4 * WAD)
+    # the secondary token allowance is short too
+    assert len([tx for tx in chain.mined if tx['to'] == SECONDARY]) == 1
+    inserts = [call for call in sent_orders(chain) if call[0]]
+    buys = [call[1:] for call in inserts if call[0] == 'insertBuyLimitOrderAfter']
+    by_index = dict((result.index, result) for result in results)
+    # 94 after 2 (95), the rest after 1 (100) but the second 97 after the first one, once it is mined
+    assert buys == [(94, 2), (97, 1), (99, 1), (97, by_index[1].order_id)]
+    assert [call[1:] for call in inserts if call[0] == 'insertSellLimitOrderAfter'] == [(112, 3), (111, 3)]
+
+
+def test_rejected_and_stale_hints(chain, mirror):
+    stale = []
+
+    def gas(transaction):
+        name, args = decode_function_input(transaction['data'])
+        if name and args['_previousOrderIdHint'] == 2 and not stale:
+            stale.append(transaction)
+            raise ValueError('execution reverted: Order should go after')
+        return 100000
+
+    chain.gas_estimate = gas
+
+    class Validator(object):
+        def check_many(self, orders):
+            return [None if order.lifespan <= 5 else 'Lifespan too high' for order in orders]
+
+    orders = [limit_order(BASE, SECONDARY, WAD, 94 * WAD, 5, is_buy=True),
+              limit_order(BASE, SECONDARY, WAD, 94 * WAD, 6, is_buy=True)]
+
+    async def scenario(client):
+        bulk = BulkOrders(client, mirror, Validator())
+        return [result async for result in bulk.place(orders)], bulk.hintless_count
+
+    results, hintless_count = run(chain, scenario)
+    assert isinstance(results[0].error, OrderRejected) and results[0].index == 1
+    assert results[1].error is None and results[1].hint == NO_HINT and hintless_count == 1
+    assert [call[1:] for call in sent_orders(chain) if call[0]] == [(94, NO_HINT)]
@@ -0,0 +1,99 @@
+import pytest
+
+from factories import BASE, SECONDARY, OWNER
+from tex_client.abi import COMMISSION_FUNCTIONS, FUNCTIONS, TOKEN_FUNCTIONS
+from tex_client.batch import BatchReader
+from tex_client.cache import CachedRPC
+from tex_client.fake_rpc import FakeRPCServer
+from tex_client.session import RPCError, RPCSession
+
+DEX = '0x' + '44' * 20
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def node():
+    """ (server, calls): every eth_call answers the block number it was made at """
+    with FakeRPCServer() as server:
+        calls = []
+
+        def eth_call(params):
+            calls.append(params[0]['data'][:10])
+            if params[0]['data'][2:10] == FUNCTIONS['paused'].selector and server.block_number == 3:
+                raise ValueError('execution reverted')
+            return '0x' + server.block_number.to_bytes(32, 'big').hex()
+
+        server.register('eth_call', eth_call)
+        yield server, calls
+
+
+def test_results_last_until_the_next_block(node):
+    server, calls = node
+    clock = Clock()
+    rpc = CachedRPC(RPCSession(server.url), block_interval=1, clock=clock)
+    reader = BatchReader(rpc, DEX)
+    for _ in range(3):
+        assert reader.call('getTickStage', BASE, SECONDARY) == 1
+        assert reader.batch_call([('paused', ()), ('getMarketPrice', (BASE, SECONDARY))]) == [True, 1]
+    assert len(calls) == 3 and rpc.stats.block_reads == 1
+    assert reader.call('getMarketPrice', BASE, SECONDARY, block=hex(1)) == 1 and len(calls) == 3
+    assert reader.call('getMarketPrice', BASE, SECONDARY, block=hex(0)) == 1 and len(calls) == 4
+
+    # the new block is only seen when the head is read again
+    server.block_number = 2
+    assert reader.call('getTickStage', BASE, SECONDARY) == 1
+    clock.now = 1
+    assert reader.call('getTickStage', BASE, SECONDARY) == 2
+    assert rpc.stats.expired == 3 and rpc.stats.block_reads == 2
+
+    # the results at a block number stay, the errors are not cached
+    server.block_number = 3
+    rpc.set_block(3)
+    assert reader.call('getMarketPrice', BASE, SECONDARY, block=hex(0)) == 1
+    assert reader.call('getMarketPrice', BASE, SECONDARY) == 3
+    for _ in range(2):
+        assert isinstance(reader.batch_call([('paused', ())])[0], RPCError)
+    with pytest.raises(RPCError):
+        rpc.batch([('eth_call', [{'to': DEX, 'data': FUNCTIONS['paused'].encode()}, 'latest'])])
+    assert rpc.stats.hits == 9 and rpc.stats.misses == len(calls) == 9
+
+
+def test_governance_values_live_until_their_ttl(node):
+    server, calls = node
+    clock = Clock()
+    rpc = CachedRPC(RPCSession(server.url), block_interval=None, governance_ttl=60, clock=clock)
+    manager = '0x' + '66' * 20
+    reads = [('eth_call', [{'to': DEX, 'data': FUNCTIONS['minOrderAmount'].encode()}, 'latest']),
+             ('eth_call', [{'to': manager, 'data': COMMISSION_FUNCTIONS['commissionRate'].encode()}, 'latest']),
+             ('eth_call', [{'to': BASE, 'data': TOKEN_FUNCTIONS['balanceOf'].encode(OWNER)}, 'latest'])]
+    rpc.batch(reads)
+    server.block_number = 5
+    rpc.call('eth_blockNumber')
+    clock.now = 59
+    rpc.batch(reads)
+    assert calls == ['0x46b62c4a', '0x5ea1d6f8', '0x70a08231', '0x70a08231']
+    clock.now = 60
+    assert [int(result, 16) for result in rpc.batch(reads)] == [5, 5, 5] and len(calls) == 6
+    rpc.invalidate(governance_only=True)
+    rpc.batch(reads)
+    assert len(calls) == 8
+
+
+def test_least_recently_used_entries_are_evicted(node):
+    server, calls = node
+    rpc = CachedRPC(RPCSession(server.url), maxsize=2)
+    reader = BatchReader(rpc, DEX)
+    for token in (BASE, SECONDARY, BASE, OWNER, BASE, SECONDARY):
+        reader.call('getMarketPrice', token, token)
+    # SECONDARY was evicted by OWNER, the same calls in a batch are sent once
+    assert len(calls) == 4 and rpc.stats.evicted == 2
+    reader.batch_call([('getMarketPrice', (DEX, DEX))] * 3)
+    assert len(calls) == 5
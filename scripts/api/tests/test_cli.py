@@ -0,0 +1,120 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from factories import BASE, SECONDARY, OWNER, WAD
+from tex_client import cli
+from tex_client.abi import TOKEN_FUNCTIONS, encode_args
+from tex_client.config import ConfigError, Profile, get_profile
+from tex_client.fake_dex import FakeExchange
+from tex_client.fake_rpc import FakeRPCServer
+
+API_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SYMBOLS = {BASE: 'DOC', SECONDARY: 'WRBTC'}
+
+
+def write_config(tmp_path, config):
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps(config))
+    return str(path)
+
+
+def test_profiles_go_over_the_defaults(tmp_path, monkeypatch):
+    path = write_config(tmp_path, {'default_profile': 'local', 'profiles': {
+        'testnet': {'account': OWNER, 'pairs': {'DOC/BPRO': [BASE, SECONDARY]}},
+        'mine': {'rpc_url': 'http://node:4444', 'dex_address': SECONDARY}}})
+    monkeypatch.delenv('TEX_PROFILE', raising=False)
+    assert get_profile(path=path).rpc_url == 'http://127.0.0.1:8545'
+    testnet = get_profile('testnet', path)
+    assert testnet.account == OWNER and sorted(testnet.pairs) == ['DOC/BPRO', 'DOC/WRBTC']
+    monkeypatch.setenv('TEX_PROFILE', 'mine')
+    assert get_profile(path=path).connection() == ('http://node:4444', SECONDARY)
+
+    with pytest.raises(ConfigError, match='Unknown profile other'):
+        get_profile('other', path)
+    with pytest.raises(ConfigError, match='Unknown settings in profile mine: rpc'):
+        get_profile(path=write_config(tmp_path, {'profiles': {'mine': {'rpc': 'http://node:4444'}}}))
+    with pytest.raises(ConfigError, match=r'mine.pairs.x should be \[base token, secondary token\]'):
+        get_profile(path=write_config(tmp_path, {'profiles': {'mine': {'pairs': {'x': [BASE]}}}}))
+
+
+@pytest.fixture
+def served(tmp_path):
+    """ (profile, server) of a fake DEX with one pair whose tokens answer symbol() and decimals() """
+    dex = FakeExchange(account=OWNER)
+    dex.list_pair(BASE, SECONDARY, 10 * WAD)
+    dex.insert_buy_limit_order(BASE, SECONDARY, 1, 10, 5)
+    with dex.serve(FakeRPCServer()) as server:
+        dex_call = server.handlers['eth_call']
+        token_calls = []
+
+        def eth_call(params):
+            to, data = params[0]['to'], params[0]['data']
+            if to == dex.address:
+                return dex_call(params)
+            token_calls.append(to)
+            if data[2:10] == TOKEN_FUNCTIONS['symbol'].selector:
+                return '0x' + encode_args(['string'], [SYMBOLS[to]]).hex()
+            return '0x' + encode_args(['uint8'], [18]).hex()
+
+        server.register('eth_call', eth_call)
+        yield Profile('test', rpc_url=server.url, dex_address=dex.address, cache_dir=str(tmp_path)), token_calls
+
+
+def run(profile, argv, client=None):
+    context = cli.Context(profile, client)
+    options = cli.build_parser().parse_args(argv)
+    try:
+        return options.handler(context, options)
+    finally:
+        context.close()
+
+
+def test_read_commands_and_the_pair_registry_cache(served, capsys):
+    profile, token_calls = served
+    run(profile, ['pairs'])
+    assert capsys.readouterr().out.split() == ['DOC/WRBTC', BASE, SECONDARY]
+    assert len(token_calls) == 4
+
+    run(profile, ['tick-stage', 'doc/wrbtc'])
+    run(profile, ['status', 'DOC/WRBTC'])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'RECEIVING_ORDERS' and len(lines) > 1
+    # the pairs and the token metadata come from the cache
+    assert len(token_calls) == 4
+    assert profile.registry().resolve('DOC/WRBTC') == (BASE, SECONDARY)
+    with pytest.raises(ConfigError, match='The pair DOC/BPRO is not listed, the pairs are: DOC/WRBTC'):
+        profile.registry().resolve('DOC/BPRO')
+
+
+def test_transactions_go_to_the_client(tmp_path, monkeypatch):
+    class Client(object):
+        def connect(self):
+            pass
+
+        def disconnect(self):
+            pass
+
+        def insert_buy_limit_order(self, *args):
+            calls.append(args)
+
+    calls = []
+    path = write_config(tmp_path, {'profiles': {'test': {'cache_dir': str(tmp_path),
+                                                         'pairs': {'DOC/WRBTC': [BASE, SECONDARY]}}}})
+    monkeypatch.setenv('TEX_CONFIG', path)
+    assert cli.main(['--profile', 'test', 'buy-limit', 'DOC/WRBTC', '14', '14000', '5'], Client()) == 0
+    assert calls == [(BASE, SECONDARY, 14.0, 14000.0, 5)]
+    assert cli.main(['--profile', 'other', 'paused'], Client()) == 2
+
+
+def test_the_command_starts_without_the_heavy_imports():
+    code = 'import sys; sys.argv = ["tex", "--help"]\n' \
+           'from tex_client.cli import main\n' \
+           'try:\n    main()\nexcept SystemExit:\n    pass\n' \
+           'print(sorted({"requests", "numpy", "brownie", "web3", "moneyonchain"} & set(sys.modules)))'
+    output = subprocess.run([sys.executable, '-c', code], cwd=API_DIRECTORY, capture_output=True, text=True,
+                            check=True).stdout
+    assert output.splitlines()[-1] == '[]'
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from factories import BASE, SECONDARY, WAD, FakeDex
+from tex_client import RPCSession
+from tex_client.abi import GOVERNOR_FUNCTIONS
+from tex_client.batch import PairStatus, StatusTable
+from tex_client.commissions import CommissionEngine, CommissionRates, CommonBaseConverter, PriceUnavailable, \
+    common_base_token
+from tex_client.fake_rpc import FakeRPCServer
+from tex_client.wad import UINT256_MAX
+
+THIRD = '0x' + '33' * 20
+MANAGER = '0x' + '66' * 20
+GOVERNOR = '0x' + '77' * 20
+RATES = CommissionRates(commission_rate=WAD // 1000, cancelation_penalty_rate=WAD // 4,
+                        expiration_penalty_rate=WAD // 10, minimum_commission=WAD // 100, governor=GOVERNOR)
+
+
+@pytest.fixture
+def converter():
+    # BASE (DOC) / SECONDARY at 20000, SECONDARY / THIRD at 0.5
+    return CommonBaseConverter(BASE, {(BASE, SECONDARY): 20000 * WAD, (SECONDARY, THIRD): WAD // 2})
+
+
+def test_converts_like_token_pair_converter(converter):
+    assert common_base_token([(BASE, SECONDARY), (SECONDARY, THIRD)]) == BASE.lower()
+    assert converter.order_price(BASE, SECONDARY, is_buy=True) == WAD
+    assert converter.order_price(BASE, SECONDARY, is_buy=False) == 20000 * WAD
+    # through the pair of its base token
+    assert converter.order_price(SECONDARY, THIRD, is_buy=False) == 10000 * WAD
+    assert converter.order_price(SECONDARY, THIRD, is_buy=True) == 20000 * WAD
+    assert converter.convert(THIRD, WAD, BASE) == UINT256_MAX
+
+
+def test_a_pair_without_status_only_fails_its_conversions():
+    broken = PairStatus(SECONDARY, THIRD, errors={'status': 'price provider reverted'})
+    table = StatusTable([PairStatus(BASE, SECONDARY, ema_price=20000 * WAD), broken], 'latest')
+    converter = CommonBaseConverter.from_status(table)
+    assert converter.order_price(BASE, SECONDARY, is_buy=False) == 20000 * WAD
+    # buying THIRD locks SECONDARY, converted through BASE/SECONDARY only
+    assert converter.order_price(SECONDARY, THIRD, is_buy=True) == 20000 * WAD
+    with pytest.raises(PriceUnavailable, match='price provider reverted') as error:
+        converter.order_price(SECONDARY, THIRD, is_buy=False)
+    assert error.value.pair == (SECONDARY, THIRD)
+
+
+def test_projects_a_basket(converter):
+    engine = CommissionEngine(None, None, rates=RATES)
+    orders = [(BASE, SECONDARY, 10 * WAD, True), (BASE, SECONDARY, WAD // 1000, False),
+              (SECONDARY, THIRD, WAD, False), (BASE, SECONDARY, WAD // 1000, True)]
+    projection = engine.project_orders(orders, converter)
+    prices = [WAD, 20000 * WAD, 10000 * WAD, WAD]
+    fees = [RATES.minimum_commission * WAD // price + amount * RATES.commission_rate // WAD
+            for (_, _, amount, _), price in zip(orders, prices)]
+    assert list(projection.accepted) == [True, True, True, False]
+    assert list(projection.reserved_commission) == fees[:3] + [0]
+    assert list(projection.exchangeable_amount) == \
+        [amount - fee for (_, _, amount, _), fee in zip(orders, fees[:3])] + [0]
+    assert list(projection.cancelation_penalty) == \
+        [fee * RATES.cancelation_penalty_rate // WAD for fee in fees[:3]] + [0]
+    assert list(projection.expiration_penalty) == \
+        [fee * RATES.expiration_penalty_rate // WAD for fee in fees[:3]] + [0]
+    assert engine.match_commission(10 * WAD, 3 * WAD, fees[0]) == 3 * WAD * fees[0] // (10 * WAD)
+    assert len(engine.project(np.array([], dtype=object), [])) == 0
+
+
+def test_reads_the_rates_once_until_a_governance_change():
+    dex = FakeDex()
+    dex.set('commissionManager', (), MANAGER)
+    for name, value in [('commissionRate', RATES.commission_rate),
+                        ('cancelationPenaltyRate', RATES.cancelation_penalty_rate),
+                        ('expirationPenaltyRate', RATES.expiration_penalty_rate),
+                        ('minimumCommission', RATES.minimum_commission), ('governor', GOVERNOR)]:
+        dex.set(name, (), value)
+    with FakeRPCServer() as server:
+        dex.serve(server)
+        engine = CommissionEngine(RPCSession(server.url), dex.address)
+        assert engine.initial_fee(WAD, WAD) == RATES.minimum_commission + WAD // 1000
+        engine.project([WAD] * 100, [WAD] * 100)
+        assert engine.rates == RATES and engine.commission_manager == MANAGER and engine.loads_count == 1
+
+        execute = {'to': GOVERNOR, 'input': GOVERNOR_FUNCTIONS['executeChange'].encode(THIRD)}
+        assert not engine.observe({'to': THIRD, 'input': execute['input']})
+        assert engine.observe(execute)
+        dex.set('commissionRate', (), WAD // 100)
+        assert engine.initial_fee(WAD, WAD) == RATES.minimum_commission + WAD // 100
+        assert engine.loads_count == 2
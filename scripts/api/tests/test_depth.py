@@ -0,0 +1,71 @@
+import copy
+import random
+
+import numpy as np
+
+from factories import BASE, SECONDARY, WAD
+from tex_client.depth import DepthEstimator
+from tex_client.fake_dex import FakeExchange
+from tex_client.simulator import OrderArrays, match_tick
+from tex_client.validator import limit_order, market_order
+
+
+def exchange():
+    dex = FakeExchange()
+    dex.list_pair(BASE, SECONDARY, 10 * WAD)
+    return dex
+
+
+def test_queue_position_depth_and_fill_price():
+    dex = exchange()
+    dex.insert_order(market_order(BASE, SECONDARY, 20 * WAD, WAD, 5, True))
+    dex.insert_order(limit_order(BASE, SECONDARY, 10 * WAD, 10 * WAD, 5, True))
+    dex.insert_order(market_order(BASE, SECONDARY, 30 * WAD, 102 * WAD // 100, 5, True))
+    dex.insert_order(limit_order(BASE, SECONDARY, 4 * WAD, 9 * WAD, 5, False))
+    dex.insert_order(limit_order(BASE, SECONDARY, 4 * WAD, 11 * WAD, 5, False))
+    estimator = DepthEstimator(dex.book.pair(BASE, SECONDARY), 10 * WAD)
+    factors = [105 * WAD // 100, WAD, 98 * WAD // 100]
+    estimates = estimator.estimate(factors, 20 * WAD, is_buy=True)
+
+    assert list(estimates.spot_price) == [105 * WAD // 10, 10 * WAD, 98 * WAD // 10]
+    assert list(estimates.queue_position) == [0, 2, 2]
+    # the 10.2 market order, then the limit and market orders at 10 (the candidate at 10 after them)
+    assert list(estimates.depth_ahead) == [0, 60 * WAD, 60 * WAD]
+    # only the 4 secondary at 9 cross: the first candidate is filled, the 10.2 order after it is the last match
+    assert np.allclose(estimates.fill_ratio, [1, 0, 0])
+    assert estimates.fill_price[0] == (102 * WAD // 10 + 9 * WAD) / 2
+    assert np.isnan(estimates.fill_price[1]) and list(estimates.fill_probability) == [1, 0, 0]
+    assert estimates.slippage[0] == estimates.fill_price[0] / (10 * WAD) - 1
+
+    sell = estimator.estimate([WAD], 10 * WAD, is_buy=False, volatility=0.05)
+    assert sell.queue_position[0] == 0 and 0 < sell.fill_probability[0] <= 1
+
+
+def test_fill_price_matches_the_simulator():
+    rng = random.Random(3)
+    for _ in range(30):
+        dex = exchange()
+        for _ in range(rng.randint(0, 20)):
+            is_buy = rng.random() < 0.5
+            if rng.random() < 0.3:
+                dex.insert_order(market_order(BASE, SECONDARY, rng.randint(1, 50) * WAD,
+                                              WAD + rng.randint(-50, 50) * WAD // 1000, 5, is_buy))
+            else:
+                dex.insert_order(limit_order(BASE, SECONDARY, rng.randint(1, 50) * WAD,
+                                             10 * WAD + rng.randint(-50, 50) * WAD // 100, 5, is_buy))
+        is_buy, amount = rng.random() < 0.5, rng.randint(1, 80) * WAD
+        factors = [WAD + rng.randint(-80, 80) * WAD // 1000 for _ in range(4)]
+        estimates = DepthEstimator(dex.book.pair(BASE, SECONDARY), 10 * WAD).estimate(factors, amount, is_buy)
+        for factor, fill_ratio, fill_price in zip(factors, estimates.fill_ratio, estimates.fill_price):
+            with_candidate = copy.deepcopy(dex)
+            order_id = with_candidate.insert_order(
+                market_order(BASE, SECONDARY, amount, factor, 5, is_buy)).events[0].args['id']
+            book = with_candidate.book.pair(BASE, SECONDARY)
+            buys = OrderArrays.from_orders(list(book.buy.limit) + list(book.buy.market))
+            sells = OrderArrays.from_orders(list(book.sell.limit) + list(book.sell.market))
+            tick = match_tick(buys, sells, 10 * WAD, 1)
+            side, rows = (buys, tick.buy) if is_buy else (sells, tick.sell)
+            matched = order_id in side.ids[list(rows)]
+            assert matched == (fill_ratio > 0)
+            if matched:
+                assert abs(fill_price - tick.simulation.emergent_price) <= tick.simulation.emergent_price * 1e-12
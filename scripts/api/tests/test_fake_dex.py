@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+
+import pytest
+
+from factories import BASE, SECONDARY, OWNER, WAD
+from tex_client.batch import BatchReader
+from tex_client.commissions import CommissionRates
+from tex_client.fake_dex import ContractRevert, FakeExchange
+from tex_client.fake_rpc import FakeRPCServer
+from tex_client.orderbook import OrderbookMirror
+from tex_client.session import RPCSession
+from tex_client.simulator import OrderArrays, match_tick
+from tex_client.wad import calculate_new_ema
+
+OTHER = '0x' + '55' * 20
+
+
+@pytest.fixture
+def dex():
+    dex = FakeExchange(account=OWNER)
+    dex.list_pair(BASE, SECONDARY, 10 * WAD)
+    return dex
+
+
+def reverts(call, *args, **kwargs):
+    with pytest.raises(ContractRevert) as e:
+        call(*args, **kwargs)
+    return e.value.reason
+
+
+def test_insertions_and_cancels_revert_like_the_contract(dex):
+    assert dex.insert_buy_limit_order(BASE, SECONDARY, 1, 10, 5).events[0].args['id'] == 1
+    dex.insert_buy_limit_order(BASE, SECONDARY, 1, 9, 5)
+    dex.insert_buy_limit_order(BASE, SECONDARY, 1, 8, 5, **{'from': OTHER})
+    assert reverts(dex.insert_buy_limit_order, BASE, SECONDARY, 1, 10, 11) == 'Lifespan too high'
+    assert reverts(dex.insert_sell_market_order, BASE, SECONDARY, 1, 200, 5) == 'High MultiplyFactor'
+    # the only valid hint is the order before the new one
+    assert reverts(dex.insert_buy_limit_order_after, BASE, SECONDARY, 1, 8.5, 5, 0) == 'Price doesnt belong to start'
+    assert reverts(dex.insert_buy_limit_order_after, BASE, SECONDARY, 1, 8.5, 5, 1) == 'Order should go after'
+    assert reverts(dex.insert_buy_limit_order_after, BASE, SECONDARY, 1, 8.5, 5, 3) == 'Order should go before'
+    assert reverts(dex.insert_buy_limit_order_after, BASE, SECONDARY, 1, 8.5, 5, 7) == 'PreviousOrder doesnt exist'
+    assert dex.insert_buy_limit_order_after(BASE, SECONDARY, 1, 8.5, 5, 2).events[0].args['id'] == 4
+    assert [order.id for order in dex.book.pair(BASE, SECONDARY).buy.limit] == [1, 2, 4, 3]
+
+    assert reverts(dex.cancel_buy_order, BASE, SECONDARY, 3) == 'Not order owner'
+    assert reverts(dex.cancel_buy_order, BASE, SECONDARY, 2, 4) == 'Previous order not found'
+    assert reverts(dex.cancel_sell_order, BASE, SECONDARY, 2) == 'Order not found'
+    event = dex.cancel_buy_order(BASE, SECONDARY, 4, 1).events[0]
+    assert (event.name, event.args['returnedAmount']) == ('OrderCancelled', WAD)
+    dex.pause()
+    assert reverts(dex.insert_buy_limit_order, BASE, SECONDARY, 1, 10, 5) == 'paused'
+    assert dex.paused() and dex.tick_stage((BASE, SECONDARY)) == 0
+
+
+def test_ticks_match_with_the_simulator_and_expire_orders():
+    dex = FakeExchange(account=OWNER, rates=CommissionRates(WAD // 100, 0, WAD // 2, 0))
+    dex.list_pair(BASE, SECONDARY, 10 * WAD)
+    dex.insert_buy_limit_order(BASE, SECONDARY, 100, 10, 5)
+    dex.insert_buy_limit_order(BASE, SECONDARY, 100, 9, 0)
+    dex.insert_sell_limit_order(BASE, SECONDARY, 5, 9.5, 5)
+    dex.insert_sell_market_order(BASE, SECONDARY, 2, 0.9, 5)
+    book = dex.book.pair(BASE, SECONDARY)
+    expected = match_tick(OrderArrays.from_orders(list(book.buy.limit) + list(book.buy.market)),
+                          OrderArrays.from_orders(list(book.sell.limit) + list(book.sell.market)), 10 * WAD, 1)
+
+    assert dex.mine(3) == []
+    receipt, = dex.mine(1)
+    names = [event.name for event in receipt.events]
+    assert names == ['TickStart'] + ['BuyerMatch', 'SellerMatch'] * 2 + ['ExpiredOrderProcessed', 'TickEnd']
+    buyer_matches = [event.args for event in receipt.events if event.name == 'BuyerMatch']
+    assert [args['amountSent'] for args in buyer_matches] == list(expected.buyer_sent)
+    expired = receipt.events[-2].args
+    assert expired['orderId'] == 2 and expired['commission'] == WAD // 2
+    price = expected.simulation.emergent_price
+    assert receipt.events[-1].args == dict(baseTokenAddress=BASE, secondaryTokenAddress=SECONDARY, number=1,
+                                           nextTickBlock=5 + 12, closingPrice=price)
+    status = dex.token_pairs_status(BASE, SECONDARY)
+    assert (status['tickNumber'], status['lastTickBlock'], status['lastClosingPrice']) == (2, 5, price)
+    assert status['EMAPrice'] == calculate_new_ema(10 * WAD, price, status['smoothingFactor'])
+    assert [order.id for order in book.buy.limit] == [1] and not book.sell.orders
+
+
+def test_serves_the_mirror_and_the_batch_reader(dex):
+    dex.list_pair(BASE, OTHER, WAD)
+    dex.insert_buy_limit_order(BASE, SECONDARY, 1, 10, 5)
+    dex.insert_sell_limit_order(BASE, OTHER, 1, 2, 5)
+    dex.mine(4)
+    dex.insert_buy_limit_order(BASE, SECONDARY, 1, 9, 5)
+    with dex.serve(FakeRPCServer()) as server:
+        rpc = RPCSession(server.url)
+        mirror = OrderbookMirror()
+        assert mirror.sync(SimpleNamespace(rpc=rpc, dex_address=dex.address)) == len(dex.events)
+        table = BatchReader(rpc, dex.address).pairs_status()
+        rpc.close()
+    book = mirror.pair(BASE, SECONDARY)
+    assert [order.id for order in book.buy.limit] == [1, 3]
+    assert (book.tick_number, book.next_tick_block) == (2, 17)
+    assert [order.id for order in mirror.pair(BASE, OTHER).sell.limit] == [2]
+    row = table.pair(BASE, SECONDARY)
+    assert (row.tick_number, row.buy_orders_length, row.ema_price, row.errors) == (2, 2, 10 * WAD, {})
+    assert dex.get_events(5, names=['NewOrderInserted'])[0].args['id'] == 3
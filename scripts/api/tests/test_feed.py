@@ -0,0 +1,134 @@
+import asyncio
+
+from factories import BASE, SECONDARY, OWNER, WAD
+from tex_client.aio import AsyncRPCSession
+from tex_client.constants import TickStage
+from tex_client.fake_dex import FakeExchange
+from tex_client.fake_rpc import FakeRPCServer
+from tex_client.feed import (DISCONNECT, DROP_OLDEST, NEW_BLOCK, ORDER_ADDED, ORDER_EXPIRED, ORDER_MATCHED,
+                             STAGE_CHANGED, TICK_END, TICK_START, Feed, Message, Subscription, socket_messages)
+
+OTHER = '0x' + '55' * 20
+
+
+def run_feed(dex, scenario):
+    """
+    Runs scenario(feed) with a feed of the dex polling every 10ms, returns (its result,
+    eth_getLogs calls). The fake adds the transactions to its last block, so the feed
+    reads up to the block before it
+    """
+    with dex.serve(FakeRPCServer()) as server:
+        get_logs = server.handlers['eth_getLogs']
+        calls = []
+        server.register('eth_getLogs', lambda params: calls.append(params) or get_logs(params))
+
+        async def main():
+            rpc = AsyncRPCSession(server.url)
+            feed = Feed(rpc, dex.address, poll_interval=0.01, confirmations=1)
+            stop = asyncio.Event()
+            task = asyncio.ensure_future(feed.run(stop))
+            try:
+                return await asyncio.wait_for(scenario(feed), 10)
+            finally:
+                stop.set()
+                await task
+                feed.close()
+                rpc.close()
+
+        return asyncio.run(main()), calls
+
+
+async def until_block(subscription, block_number):
+    messages = []
+    async for message in subscription:
+        messages.append(message)
+        if message.kind == NEW_BLOCK and message.block_number >= block_number:
+            return messages
+
+
+def test_fans_out_the_messages_of_every_block_read_once():
+    dex = FakeExchange(account=OWNER)
+    dex.list_pair(BASE, SECONDARY, 10 * WAD)
+    dex.list_pair(BASE, OTHER, WAD)
+    # history, only in the mirror
+    dex.insert_buy_limit_order(BASE, SECONDARY, 10, 10, 5)
+    dex.mine()
+
+    async def scenario(feed):
+        while feed.mirror.last_block < 0:
+            await asyncio.sleep(0.01)
+        everything = feed.subscribe()
+        matches = [feed.subscribe(kinds=[ORDER_MATCHED, NEW_BLOCK], pairs=[(BASE, SECONDARY)]) for _ in range(10)]
+        dex.insert_sell_limit_order(BASE, SECONDARY, 0.5, 9, 5)
+        dex.insert_sell_limit_order(BASE, OTHER, 1, 2, 0)
+        dex.mine(4)
+        return await until_block(everything, 5), [await until_block(subscription, 5) for subscription in matches]
+
+    (messages, matched), calls = run_feed(dex, scenario)
+    orders = [(message.kind, message.order_id, message.is_buy) for message in messages if message.order_id]
+    assert orders == [(ORDER_ADDED, 2, False), (ORDER_ADDED, 3, False), (ORDER_MATCHED, 1, True),
+                      (ORDER_MATCHED, 2, False), (ORDER_EXPIRED, 3, None)]
+    tick_end, = [message for message in messages
+                 if message.kind == TICK_END and message.secondary_token == SECONDARY]
+    assert tick_end.args['closingPrice'] > 0 and tick_end.base_token == BASE
+    stages = [(message.secondary_token, message.args['stage'])
+              for message in messages if message.kind == STAGE_CHANGED]
+    assert stages.count((SECONDARY, TickStage.RUNNING_SIMULATION)) == 1
+    assert stages[-1] == (OTHER, TickStage.RECEIVING_ORDERS)
+    assert sum(message.kind == TICK_START for message in messages) == 2
+    for subscription in matched:
+        assert [message.kind for message in subscription][-3:] == [ORDER_MATCHED, ORDER_MATCHED, NEW_BLOCK]
+    # one read of the logs per new block, whatever the subscribers
+    assert len(calls) <= dex.clock.block_number() + 1
+
+
+def test_full_subscriptions_wait_drop_or_disconnect():
+    async def scenario():
+        messages = [Message(ORDER_ADDED, block_number, BASE, SECONDARY) for block_number in range(5)]
+        dropping = Subscription(maxsize=2, policy=DROP_OLDEST)
+        disconnecting = Subscription(maxsize=2, policy=DISCONNECT)
+        waiting = Subscription(maxsize=2)
+        other_pair = Subscription(pairs=[(BASE, OTHER)])
+        subscriptions = [dropping, disconnecting, waiting, other_pair]
+        assert [subscription.wants(messages[0]) for subscription in subscriptions] == [True, True, True, False]
+        for message in messages[:2]:
+            for subscription in subscriptions[:3]:
+                assert subscription.offer(message)
+        puts = asyncio.ensure_future(asyncio.gather(*[waiting.put(message) for message in messages[2:]]))
+        for message in messages[2:]:
+            dropping.offer(message)
+            disconnecting.offer(message)
+        await asyncio.sleep(0)
+        assert not puts.done() and waiting.waits == 3
+        received = [(await waiting.get()).block_number for _ in range(5)]
+        await puts
+        assert received == [0, 1, 2, 3, 4]
+        dropping.close()
+        assert [message.block_number async for message in dropping] == [3, 4] and dropping.dropped == 3
+        assert disconnecting.overflowed and [message.block_number async for message in disconnecting] == [0, 1]
+
+    asyncio.run(scenario())
+
+
+def test_serves_the_messages_on_a_local_socket():
+    dex = FakeExchange(account=OWNER)
+    dex.list_pair(BASE, SECONDARY, 10 * WAD)
+
+    async def scenario(feed):
+        server = await feed.serve(port=0)
+        port = server.sockets[0].getsockname()[1]
+        consumer = socket_messages(port=port, kinds=[ORDER_ADDED, NEW_BLOCK], pairs=[[BASE, SECONDARY]])
+        first = asyncio.ensure_future(consumer.__anext__())
+        while not feed.subscriptions:
+            await asyncio.sleep(0.01)
+        dex.insert_buy_limit_order(BASE, SECONDARY, 1, 10, 5)
+        dex.mine()
+        messages = [await first]
+        while messages[-1].kind != ORDER_ADDED:
+            messages.append(await consumer.__anext__())
+        await consumer.aclose()
+        server.close()
+        return messages[-1]
+
+    message, _ = run_feed(dex, scenario)
+    assert (message.order_id, message.is_buy, message.args['sender']) == (1, True, OWNER.lower())
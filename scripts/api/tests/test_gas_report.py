@@ -0,0 +1,45 @@
+import csv
+
+import pytest
+
+from tex_client.gas_report import GasReport, compare
+
+
+def report(commit, gas):
+    report = GasReport(commit=commit, parameters={'depths': [10]})
+    for operation, scenario, values in gas:
+        for value in values:
+            report.add(operation, scenario, value, 0.5)
+    return report
+
+
+def test_summary_groups_by_operation_and_scenario():
+    summary = report('a', [('cancelBuyOrder', 'depth=10', [100, 300]),
+                           ('cancelBuyOrder', 'depth=50', [500])]).summary()
+    assert [(row['operation'], row['scenario'], row['count']) for row in summary] == [
+        ('cancelBuyOrder', 'depth=10', 2), ('cancelBuyOrder', 'depth=50', 1)]
+    assert (summary[0]['gas_mean'], summary[0]['gas_min'], summary[0]['gas_max']) == (200, 100, 300)
+    assert summary[0]['seconds_mean'] == 0.5
+
+
+def test_written_results_load_and_compare(tmp_path):
+    before = report('a', [('matchOrders:RUNNING_MATCHING', 'depth=10', [1000]),
+                          ('processExpired', 'depth=10', [50])])
+    after = report('b', [('matchOrders:RUNNING_MATCHING', 'depth=10', [1100]),
+                         ('insertBuyLimitOrder', 'depth=10', [70])])
+    before.write_json(str(tmp_path / 'before.json'))
+    after.write_csv(str(tmp_path / 'after.csv'))
+
+    loaded = GasReport.load(str(tmp_path / 'before.json'))
+    assert loaded.commit == 'a' and loaded.parameters == {'depths': [10]}
+    assert loaded.summary() == before.summary()
+    with open(str(tmp_path / 'after.csv')) as f:
+        assert [row['gas_mean'] for row in csv.DictReader(f)] == ['1100.0', '70.0']
+
+    rows = compare(loaded, after)
+    assert [(row['operation'], row['gas_before'], row['gas_after']) for row in rows] == [
+        ('matchOrders:RUNNING_MATCHING', 1000, 1100),
+        ('processExpired', 50, None),
+        ('insertBuyLimitOrder', None, 70)]
+    assert rows[0]['gas_change'] == pytest.approx(0.1)
+    assert rows[1]['gas_change'] is None
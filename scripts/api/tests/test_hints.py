@@ -0,0 +1,146 @@
+import pytest
+
+from factories import BASE, SECONDARY, WAD, LogFactory
+from tex_client.constants import NO_HINT, OrderType
+from tex_client.fake_rpc import FakeRPCServer
+from tex_client.hints import HintedOrders, cancel_hint, limit_order_hint, market_order_hint, pending_move_hints
+from tex_client.orderbook import OrderbookMirror
+from tex_client.session import RPCSession
+
+
+class FakeClient(object):
+    """ Records the hinted calls; rejects the hints listed in stale_hints like the contract """
+
+    dex_address = '0x' + '44' * 20
+
+    def __init__(self, rpc, logs):
+        self.rpc = rpc
+        self.logs = logs
+        self.calls = []
+        self.stale_hints = set()
+        self.on_stale = None
+
+    def _call(self, name, hint):
+        self.calls.append((name, hint))
+        if hint in self.stale_hints:
+            self.stale_hints.discard(hint)
+            if self.on_stale:
+                self.on_stale()
+            raise ValueError('execution reverted: Order should go after')
+        return hint
+
+    def insert_buy_limit_order_after(self, base_token, secondary_token, amount, price, lifespan, hint):
+        return self._call('insertBuyLimitOrderAfter', hint)
+
+    def insert_sell_limit_order_after(self, base_token, secondary_token, amount, price, lifespan, hint):
+        return self._call('insertSellLimitOrderAfter', hint)
+
+    def insert_market_order_after(self, base_token, secondary_token, amount, multiply_factor, hint, lifespan,
+                                  is_buy):
+        return self._call('insertMarketOrderAfter', hint)
+
+    def cancel_buy_order(self, base_token, secondary_token, order_id, hint):
+        return self._call('cancelBuyOrder', hint)
+
+    def cancel_sell_order(self, base_token, secondary_token, order_id, hint):
+        return self._call('cancelSellOrder', hint)
+
+
+@pytest.fixture
+def client():
+    logs = LogFactory()
+    logs.insert(1, True, 10 * WAD)
+    logs.insert(2, True, 8 * WAD)
+    logs.insert(3, True, 8 * WAD)
+    logs.insert(4, False, 12 * WAD)
+    logs.insert(5, True, 0, order_type=OrderType.MARKET_ORDER, multiply_factor=WAD)
+    with logs.serve(FakeRPCServer()) as server:
+        rpc = RPCSession(server.url)
+        yield FakeClient(rpc, logs)
+        rpc.close()
+
+
+def test_hints_from_the_book():
+    logs = LogFactory()
+    logs.insert(1, True, 10)
+    logs.insert(2, True, 8)
+    logs.insert(3, True, 8, order_type=OrderType.MARKET_ORDER, multiply_factor=WAD)
+    mirror = OrderbookMirror()
+    mirror.apply_logs(logs.logs)
+    book = mirror.pair(BASE, SECONDARY)
+    assert limit_order_hint(book, True, 11) == 0
+    assert limit_order_hint(book, True, 10) == 1
+    assert limit_order_hint(book, True, 9) == 1
+    assert limit_order_hint(book, True, 1) == 2
+    assert limit_order_hint(book, False, 1) == 0
+    assert market_order_hint(book, True, 2 * WAD) == 0
+    assert market_order_hint(book, True, WAD // 2) == 3
+    assert cancel_hint(book, True, 2) == 1
+    assert cancel_hint(book, True, 1) == 0
+    assert cancel_hint(book, True, 99) == 0
+
+
+def test_pending_move_hints_follow_the_moving_order():
+    logs = LogFactory()
+    logs.insert(1, True, 10)
+    logs.insert(2, True, 8)
+    logs.insert(3, False, 12)
+    mirror = OrderbookMirror()
+    mirror.apply_logs(logs.logs)
+    for order_id, is_buy, price in ((4, True, 9), (5, True, 9), (6, False, 11), (7, True, 20)):
+        mirror.add_pending(order_id, BASE, SECONDARY, is_buy, OrderType.LIMIT_ORDER, 1, price=price)
+    mirror.add_pending(8, BASE, SECONDARY, False, OrderType.MARKET_ORDER, 1, multiply_factor=WAD)
+    book = mirror.pair(BASE, SECONDARY)
+    # buy queue 4, 5, 7 (5 goes after 4, which is already moved), sell queue 6, then market 8
+    assert pending_move_hints(book) == [1, 4, 0, 0, 0]
+    assert pending_move_hints(book, count=2) == [1, 4]
+    # the book itself is not changed
+    assert len(book.buy.limit) == 2
+
+
+def test_calls_are_sent_with_the_hints(client):
+    orders = HintedOrders(client)
+    orders.insert_buy_limit_order(BASE, SECONDARY, 1, 9, 5)
+    orders.insert_buy_limit_order(BASE, SECONDARY, 1, 7, 5)
+    orders.insert_sell_limit_order(BASE, SECONDARY, 1, 13, 5)
+    orders.insert_buy_market_order(BASE, SECONDARY, 1, 0.5, 5)
+    orders.cancel_buy_order(BASE, SECONDARY, 3)
+    assert client.calls == [
+        ('insertBuyLimitOrderAfter', 1),
+        ('insertBuyLimitOrderAfter', 3),
+        ('insertSellLimitOrderAfter', 4),
+        ('insertMarketOrderAfter', 5),
+        ('cancelBuyOrder', 2),
+    ]
+
+
+def test_stale_hints_are_retried_with_a_synced_book(client):
+    orders = HintedOrders(client)
+
+    def new_order_arrives():
+        client.logs.block_number += 1
+        client.logs.insert(6, True, 9 * WAD)
+
+    client.stale_hints.add(1)
+    client.on_stale = new_order_arrives
+    orders.insert_buy_limit_order(BASE, SECONDARY, 1, 9, 5)
+    assert client.calls == [('insertBuyLimitOrderAfter', 1), ('insertBuyLimitOrderAfter', 6)]
+    assert orders.retries_count == 1
+
+
+def test_falls_back_to_no_hint(client):
+    orders = HintedOrders(client, max_retries=1)
+    client.stale_hints.update([1])
+    client.on_stale = lambda: client.stale_hints.add(1)
+    orders.insert_buy_limit_order(BASE, SECONDARY, 1, 9, 5)
+    assert client.calls[-1] == ('insertBuyLimitOrderAfter', NO_HINT)
+    assert len(client.calls) == 3
+
+
+def test_other_errors_are_raised(client):
+    def insert(*args):
+        raise ValueError('execution reverted: Token transfer failed')
+
+    client.insert_buy_limit_order_after = insert
+    with pytest.raises(ValueError):
+        HintedOrders(client).insert_buy_limit_order(BASE, SECONDARY, 1, 9, 5)
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from factories import BASE, SECONDARY, WAD
+from tex_client.event_store import EventStore, event_columns, pair_partition
+from tex_client.history import PriceHistory
+from tex_client.wad import calculate_new_ema
+
+PAIR = pair_partition(BASE, SECONDARY)
+SMOOTHING = WAD // 4
+
+
+def append(store, name, block, tick, **args):
+    defaults = {'uint256': 0, 'uint': 0, 'bool': False, 'address': b'\0' * 20, 'bytes32': b'\0' * 32}
+    row = dict((column, defaults[kind]) for column, kind in event_columns(name))
+    row.update(args, block_number=block, tick=tick)
+    store.append(name, PAIR, row)
+
+
+def close_tick(store, tick, price, matches=()):
+    """ A tick closed at block 10 * tick, with (amount sent, received, match price) matches """
+    for sent, received, match_price in matches:
+        append(store, 'BuyerMatch', 10 * tick, tick, amountSent=sent, received=received, matchPrice=match_price)
+        append(store, 'SellerMatch', 10 * tick, tick, amountSent=received, received=sent, matchPrice=match_price)
+    append(store, 'TickEnd', 10 * tick, tick, number=tick, closingPrice=price)
+    store.flush()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EventStore(str(tmp_path / 'events'))
+
+
+def history_of(store, tmp_path):
+    # a block every 6 seconds, candles of 60 seconds are 10 blocks: one tick each
+    history = PriceHistory(store, str(tmp_path / 'history'), intervals=(60, 120),
+                           timestamps=lambda blocks: np.asarray(blocks) * 6)
+    history.configure(BASE, SECONDARY, SMOOTHING, initial_ema=WAD)
+    return history
+
+
+def test_calculate_new_ema_rounds_like_the_contract():
+    assert calculate_new_ema(WAD, 2 * WAD, SMOOTHING) == WAD * 3 // 4 + WAD // 2
+    assert calculate_new_ema(7, 3, WAD // 3) == 7 * (WAD - WAD // 3) // WAD + 3 * (WAD // 3) // WAD
+
+
+def test_ticks_and_candles(store, tmp_path):
+    close_tick(store, 1, 2 * WAD, [(4 * WAD, 2 * WAD, 2 * WAD), (2 * WAD, WAD, 2 * WAD)])
+    close_tick(store, 2, 0)
+    close_tick(store, 3, 3 * WAD, [(3 * WAD, WAD, 3 * WAD)])
+    history = history_of(store, tmp_path)
+    assert history.update() == 3
+
+    ticks = history.ticks(BASE, SECONDARY)
+    assert list(ticks['tick']) == [1, 2, 3]
+    assert list(ticks['volume_base']) == [6, 0, 3] and list(ticks['matches']) == [2, 0, 1]
+    assert np.isnan(ticks['close'][1])
+    ema = calculate_new_ema(WAD, 2 * WAD, SMOOTHING)
+    assert ticks['ema'][1] == ema / WAD
+    assert ticks['ema'][2] == calculate_new_ema(ema, 3 * WAD, SMOOTHING) / WAD
+
+    # tick 1 closes at 60 seconds, ticks 2 (without matches) and 3 in the next 120 seconds bucket
+    candles = history.candles(BASE, SECONDARY, 120)
+    assert list(candles['start']) == [0, 120]
+    assert list(candles['ticks']) == [1, 2]
+    assert list(candles['open']) == [2, 3] and list(candles['volume_base']) == [6, 3]
+    assert list(history.candles(BASE, SECONDARY, 60, start=100)['start']) == [120, 180]
+
+
+def test_updates_incrementally_and_reloads(store, tmp_path):
+    close_tick(store, 1, 2 * WAD, [(2 * WAD, WAD, 2 * WAD)])
+    close_tick(store, 2, 4 * WAD, [(4 * WAD, WAD, 4 * WAD)])
+    history = history_of(store, tmp_path)
+    history.update()
+    # tick 3 closes in the same 120 seconds bucket as tick 2
+    close_tick(store, 3, 5 * WAD, [(5 * WAD, WAD, 6 * WAD), (5 * WAD, WAD, 4 * WAD)])
+    assert history.update() == 1
+    assert history.update() == 0
+
+    reloaded = PriceHistory(store, str(tmp_path / 'history'), intervals=(60, 120))
+    candles = reloaded.candles(BASE, SECONDARY, 120, start=120)
+    assert list(candles['start']) == [120]
+    candle = dict((column, values[-1]) for column, values in candles.items())
+    assert (candle['open'], candle['high'], candle['low'], candle['close']) == (4, 6, 4, 5)
+    assert candle['volume_base'] == 14 and candle['ticks'] == 2
+    assert list(reloaded.ticks(BASE, SECONDARY, from_tick=2)['tick']) == [2, 3]
+
+
+def test_an_update_appends_segments_and_matches_a_full_build(store, tmp_path):
+    close_tick(store, 1, 2 * WAD, [(2 * WAD, WAD, 2 * WAD)])
+    close_tick(store, 2, 4 * WAD, [(4 * WAD, WAD, 4 * WAD)])
+    history = history_of(store, tmp_path)
+    history.update()
+    ticks_path = tmp_path / 'history' / PAIR / 'ticks'
+    first_segment = (ticks_path / '0-1' / 'tick.npy').stat().st_mtime_ns
+    for tick in (3, 4, 5):
+        close_tick(store, tick, tick * WAD, [(tick * WAD, WAD, tick * WAD)])
+        history.update()
+    assert sorted(path.name for path in ticks_path.iterdir()) == ['0-1', '2-2', '3-3', '4-4']
+    assert (ticks_path / '0-1' / 'tick.npy').stat().st_mtime_ns == first_segment
+
+    full = PriceHistory(store, str(tmp_path / 'full'), intervals=(60, 120),
+                        timestamps=lambda blocks: np.asarray(blocks) * 6)
+    full.configure(BASE, SECONDARY, SMOOTHING, initial_ema=WAD)
+    full.update()
+    reloaded = PriceHistory(store, str(tmp_path / 'history'), intervals=(60, 120))
+    for interval in (60, 120):
+        expected = full.candles(BASE, SECONDARY, interval)
+        for candles in (history.candles(BASE, SECONDARY, interval), reloaded.candles(BASE, SECONDARY, interval)):
+            for column, values in expected.items():
+                np.testing.assert_array_equal(candles[column], values)
+    np.testing.assert_array_equal(reloaded.ticks(BASE, SECONDARY)['ema'], full.ticks(BASE, SECONDARY)['ema'])
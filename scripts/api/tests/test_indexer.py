@@ -0,0 +1,139 @@
+import os
+
+import numpy as np
+import pytest
+
+from factories import BASE, SECONDARY, OWNER, WAD, LogFactory
+from tex_client import RPCSession
+from tex_client.abi import FUNCTIONS
+from tex_client.event_store import EventStore, limbs_to_float, limbs_to_ints, pair_partition, to_limbs
+from tex_client.fake_rpc import FakeRPCServer
+from tex_client.indexer import EventIndexer
+
+OTHER = '0x' + '55' * 20
+DEX = '0x' + '44' * 20
+
+
+class FakeChain(object):
+    """ Logs, transactions and block hashes of a chain with one tick per block and pair """
+
+    def __init__(self, server, max_logs=None):
+        self.logs = LogFactory()
+        self.transactions = dict()
+        # blocks from fork_block on have other hashes after a reorg
+        self.fork, self.fork_block = 0, 0
+        self.max_logs = max_logs
+        self.logs.serve(server)
+        server.register('eth_getLogs', self.get_logs)
+        server.register('eth_getTransactionByHash', lambda params: self.transactions.get(params[0]))
+        server.register('eth_getBlockByNumber', lambda params: {'hash': self.block_hash(int(params[0], 16))})
+
+    def block_hash(self, number):
+        return '0x{0:032x}{1:032x}'.format(self.fork if number >= self.fork_block else 0, number)
+
+    def get_logs(self, params):
+        from_block, to_block = int(params[0]['fromBlock'], 16), int(params[0]['toBlock'], 16)
+        logs = [log for log in self.logs.logs if from_block <= int(log['blockNumber'], 16) <= to_block]
+        if self.max_logs is not None and len(logs) > self.max_logs:
+            raise ValueError('query returned more than {0} results'.format(self.max_logs))
+        return logs
+
+    def tick(self, base_token, secondary_token, number, price):
+        """ A block with a matchOrders transaction running a whole tick of the pair """
+        tx_hash = '0x{0:064x}'.format(len(self.transactions) + 1)
+        self.transactions[tx_hash] = {'hash': tx_hash, 'input': FUNCTIONS['matchOrders'].encode(
+            base_token, secondary_token, 10)}
+        self.logs.emit('TickStart', tx_hash, baseTokenAddress=base_token, secondaryTokenAddress=secondary_token,
+                       number=number)
+        self.logs.emit('BuyerMatch', tx_hash, orderId=1, amountSent=3 * WAD, commission=0, change=0,
+                       received=2 * WAD, remainingAmount=0, matchPrice=price, tickNumber=number)
+        self.logs.emit('SellerMatch', tx_hash, orderId=2, amountSent=2 * WAD, commission=0, received=3 * WAD,
+                       surplus=0, remainingAmount=0, matchPrice=price, tickNumber=number)
+        self.logs.emit('TickEnd', tx_hash, baseTokenAddress=base_token, secondaryTokenAddress=secondary_token,
+                       number=number, nextTickBlock=self.logs.block_number + 10, closingPrice=price)
+
+    def expire(self, base_token, secondary_token, order_id):
+        tx_hash = '0x{0:064x}'.format(len(self.transactions) + 1)
+        self.transactions[tx_hash] = {'hash': tx_hash, 'input': FUNCTIONS['processExpired'].encode(
+            base_token, secondary_token, True, order_id, 0, 10, 1)}
+        self.logs.emit('ExpiredOrderProcessed', tx_hash, orderId=order_id, owner=OWNER, returnedAmount=WAD,
+                       commission=0, returnedCommission=0)
+
+    def mine(self, blocks=1):
+        self.logs.block_number += blocks
+
+
+@pytest.fixture
+def server():
+    with FakeRPCServer() as server:
+        yield server
+
+
+def build(chain, blocks, start_tick=1):
+    for i in range(blocks):
+        chain.tick(BASE, SECONDARY, start_tick + i, (100 + i) * WAD)
+        chain.tick(BASE, OTHER, start_tick + i, 7 * WAD)
+        chain.mine()
+    chain.expire(BASE, SECONDARY, 9)
+
+
+def test_limbs_are_exact():
+    values = [0, 1, 2 ** 64, 123 * WAD + 7, 2 ** 256 - 1]
+    limbs = to_limbs(values)
+    assert limbs.shape == (5, 4) and limbs.dtype == np.uint64
+    assert list(limbs_to_ints(limbs)) == values
+    assert limbs_to_float(to_limbs([15 * WAD // 10]), WAD)[0] == 1.5
+
+
+def test_indexes_the_pairs_by_tick(server, tmp_path):
+    chain = FakeChain(server)
+    build(chain, 30)
+    store = EventStore(str(tmp_path), ticks_per_partition=10)
+    indexer = EventIndexer(RPCSession(server.url), DEX, store, from_block=1, workers=3, blocks_per_request=4)
+    assert indexer.run() == 30 * 8 + 1
+
+    ends = store.read('TickEnd', BASE, SECONDARY)
+    assert list(ends['tick']) == list(range(1, 31))
+    assert list(limbs_to_ints(ends['closingPrice'])) == [(100 + i) * WAD for i in range(30)]
+    assert list(store.read('BuyerMatch', BASE, OTHER, from_tick=5, to_tick=6)['tick']) == [5, 6]
+    # the pair of the matches and the expired order comes from their transactions
+    expired = store.read('ExpiredOrderProcessed', BASE, SECONDARY)
+    assert list(limbs_to_ints(expired['orderId'])) == [9] and list(expired['tick']) == [31]
+    assert len(store.read('SellerMatch')['block_number']) == 60
+    partition = os.path.join(str(tmp_path), pair_partition(BASE, SECONDARY), 'TickEnd')
+    assert sorted(os.listdir(partition)) == ['ticks-0', 'ticks-10', 'ticks-20', 'ticks-30']
+
+
+def test_splits_the_ranges_the_node_refuses(server, tmp_path):
+    chain = FakeChain(server, max_logs=20)
+    build(chain, 10)
+    indexer = EventIndexer(RPCSession(server.url), DEX, EventStore(str(tmp_path)), from_block=1,
+                           blocks_per_request=64, target_logs=10)
+    assert indexer.run() == 10 * 8 + 1
+    assert indexer.splits_count > 0
+    assert indexer.blocks_per_request < 64
+
+
+def test_resumes_and_reindexes_after_a_reorg(server, tmp_path):
+    chain = FakeChain(server)
+    build(chain, 5)
+    EventIndexer(RPCSession(server.url), DEX, EventStore(str(tmp_path)), from_block=1).run()
+
+    # blocks 4 and 5 are replaced by others with different ticks, then the chain grows
+    chain.logs.logs = [log for log in chain.logs.logs if int(log['blockNumber'], 16) < 4]
+    chain.fork, chain.fork_block = 1, 4
+    chain.logs.block_number = 4
+    build(chain, 3, start_tick=40)
+
+    store = EventStore(str(tmp_path))
+    indexer = EventIndexer(RPCSession(server.url), DEX, store, from_block=1)
+    indexer.run()
+    assert indexer.reorgs_count == 1
+    assert list(store.read('TickStart', BASE, SECONDARY)['tick']) == [1, 2, 3, 40, 41, 42]
+    assert list(store.read('ExpiredOrderProcessed', BASE, SECONDARY)['tick']) == [43]
+
+    # nothing new: resuming again does not duplicate rows
+    indexer = EventIndexer(RPCSession(server.url), DEX, store, from_block=1)
+    assert indexer.run() == 0
+    store.compact()
+    assert len(store.read('TickEnd', BASE, OTHER)['tick']) == 6
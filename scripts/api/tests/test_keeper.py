@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+
+from factories import BASE, SECONDARY, OWNER, WAD, FakeDex, LogFactory
+from tex_client.abi import decode_function_input
+from tex_client.aio import AsyncTexClient, NodeSigner
+from tex_client.constants import OrderType, TickStage
+from tex_client.fake_rpc import FakeRPCServer, FakeTransactions
+from tex_client.keeper import Keeper
+from tex_client.orderbook import OrderbookMirror
+
+OTHER = '0x' + '55' * 20
+GAS_PER_STEP = 100000
+
+
+class FakeTickDex(FakeDex):
+    """ Pairs whose tick advances with the steps of the mined matchOrders """
+
+    def __init__(self, chain, pairs, tick_steps=10):
+        super().__init__()
+        self.chain = chain
+        self.tick_steps = tick_steps
+        self.state = dict()
+        self.set('getTokenPairs', (), pairs)
+        for pair in pairs:
+            self.state[pair] = {'stage': TickStage.RECEIVING_ORDERS, 'tick': 5, 'next_tick_block': 1,
+                                'remaining': tick_steps, 'expire': {True: False, False: False}}
+            self.publish(pair)
+        chain.on_mined = self.on_mined
+        chain.gas_estimate = self.gas
+
+    def publish(self, pair):
+        state = self.state[pair]
+        self.set('getTokenPairStatus', pair, {
+            'emergentPrice': 0, 'lastBuyMatchId': 0, 'lastBuyMatchAmount': 0, 'lastSellMatchId': 0,
+            'tickNumber': state['tick'], 'nextTickBlock': state['next_tick_block'], 'lastTickBlock': 0,
+            'lastClosingPrice': 0, 'disabled': False, 'emaPrice': 0, 'smoothingFactor': 0, 'marketPrice': WAD})
+        self.set('getTickStage', pair, state['stage'])
+        self.set('tickIsRunning', pair, state['stage'] != TickStage.RECEIVING_ORDERS)
+        self.set('getMarketPrice', pair, WAD)
+        for name in ('buyOrdersLength', 'sellOrdersLength', 'pendingBuyOrdersLength', 'pendingSellOrdersLength'):
+            self.set(name, pair, 20)
+        for is_buy in (True, False):
+            self.set('pendingMarketOrdersLength', pair + (is_buy,), 0)
+            self.set('areOrdersToExpire', pair + (is_buy,), state['expire'][is_buy])
+
+    def gas(self, transaction):
+        name, args = decode_function_input(transaction['data'])
+        if name in ('matchOrders', 'matchOrdersWithHints'):
+            return 60000 + args['steps'] * GAS_PER_STEP
+        return 100000
+
+    def on_mined(self, transaction):
+        name, args = decode_function_input(transaction['data'])
+        if name not in ('matchOrders', 'matchOrdersWithHints'):
+            return
+        pair = (args['_baseToken'], args['_secondaryToken'])
+        state = self.state[pair]
+        state['remaining'] -= args['steps']
+        if state['remaining'] <= 0:
+            state.update(stage=TickStage.RECEIVING_ORDERS, tick=state['tick'] + 1, remaining=self.tick_steps,
+                         next_tick_block=self.chain.server.block_number + 100)
+        else:
+            state['stage'] = TickStage.RUNNING_MATCHING
+        self.publish(pair)
+
+
+@pytest.fixture
+def chain():
+    logs = LogFactory()
+    with logs.serve(FakeRPCServer()) as server:
+        server.register('eth_blockNumber', lambda params: hex(server.block_number))
+        transactions = FakeTransactions(server, block_gas_limit=1000000).start_mining(0.01)
+        transactions.logs = logs
+        yield transactions
+        transactions.stop_mining()
+
+
+def run_step(chain, dex, **keeper_options):
+    async def main():
+        async with AsyncTexClient(chain.server.url, dex.address, NodeSigner(OWNER), poll_interval=0.01) as client:
+            keeper = Keeper(client, **keeper_options)
+            await keeper.step()
+            return keeper
+    chain.server.register('eth_call', dex.eth_call)
+    return asyncio.run(main())
+
+
+def sent(chain, name):
+    calls = [decode_function_input(tx['data']) for tx in chain.mined]
+    return [args for function_name, args in calls if function_name == name]
+
+
+def test_runs_the_due_ticks_in_gas_bounded_steps(chain):
+    dex = FakeTickDex(chain, [(BASE, SECONDARY), (BASE, OTHER)], tick_steps=12)
+    dex.state[(BASE, OTHER)]['next_tick_block'] = 1000
+    dex.publish((BASE, OTHER))
+
+    keeper = run_step(chain, dex)
+    budget = keeper.gas_budget
+    assert budget == 800000
+    matches = sent(chain, 'matchOrders')
+    assert {(args['_baseToken'], args['_secondaryToken']) for args in matches} == {(BASE, SECONDARY)}
+    assert sum(args['steps'] for args in matches) >= 12
+    # every call fits in the budget, with the gas multiplier of the client
+    assert all((60000 + args['steps'] * GAS_PER_STEP) * 1.2 <= budget for args in matches)
+
+    metrics = keeper.metrics[(BASE.lower(), SECONDARY.lower())]
+    assert metrics.ticks == 1
+    assert metrics.transactions == len(matches) > 1
+    assert metrics.gas_per_step == pytest.approx(GAS_PER_STEP)
+    assert metrics.last_tick_blocks >= 1 and metrics.last_tick_seconds > 0
+    assert (BASE.lower(), OTHER.lower()) not in keeper.metrics
+
+
+def test_pairs_run_concurrently(chain):
+    dex = FakeTickDex(chain, [(BASE, SECONDARY), (BASE, OTHER)], tick_steps=3)
+    keeper = run_step(chain, dex)
+    matches = sent(chain, 'matchOrders')
+    assert {args['_secondaryToken'] for args in matches} == {SECONDARY, OTHER}
+    assert all(metrics.ticks == 1 for metrics in keeper.metrics.values())
+    # both ticks ran at the same time: the first two transactions are one of each pair
+    assert {args['_secondaryToken'] for args in matches[:2]} == {SECONDARY, OTHER}
+
+
+def test_moves_the_pending_orders_with_hints(chain):
+    dex = FakeTickDex(chain, [(BASE, SECONDARY)], tick_steps=2)
+    dex.state[(BASE, SECONDARY)]['stage'] = TickStage.MOVING_PENDING_ORDERS
+    dex.publish((BASE, SECONDARY))
+    chain.logs.insert(1, True, 10 * WAD)
+    chain.logs.insert(2, True, 8 * WAD)
+    mirror = OrderbookMirror()
+    mirror.add_pending(3, BASE, SECONDARY, True, OrderType.LIMIT_ORDER, WAD, price=9 * WAD)
+    mirror.add_pending(4, BASE, SECONDARY, True, OrderType.LIMIT_ORDER, WAD, price=11 * WAD)
+
+    run_step(chain, dex, mirror=mirror)
+    hinted = sent(chain, 'matchOrdersWithHints')
+    assert hinted[0]['hintIds'] == [1, 0]
+
+
+def test_processes_the_expired_orders_between_ticks(chain):
+    dex = FakeTickDex(chain, [(BASE, SECONDARY)])
+    dex.state[(BASE, SECONDARY)].update(next_tick_block=1000, expire={True: True, False: False})
+    dex.publish((BASE, SECONDARY))
+    chain.logs.insert(1, True, 10 * WAD, expires_in_tick=10)
+    chain.logs.insert(2, True, 8 * WAD, expires_in_tick=3)
+
+    keeper = run_step(chain, dex)
+    assert sent(chain, 'matchOrders') == []
+    expired = sent(chain, 'processExpired')
+    assert len(expired) == 1
+    args = expired[0]
+    assert (args['_evaluateBuyOrders'], args['_orderId'], args['_previousOrderIdHint']) == (True, 2, 1)
+    assert args['_orderType'] == OrderType.LIMIT_ORDER
+    assert keeper.metrics[(BASE.lower(), SECONDARY.lower())].expired_transactions == 1
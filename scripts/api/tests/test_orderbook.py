@@ -0,0 +1,116 @@
+import pytest
+
+from factories import BASE, OWNER, SECONDARY, WAD, LogFactory
+from tex_client.abi import FUNCTIONS
+from tex_client.constants import OrderType
+from tex_client.fake_rpc import FakeRPCServer
+from tex_client.orderbook import OrderbookMirror
+from tex_client.session import RPCSession
+
+
+@pytest.fixture
+def logs():
+    return LogFactory()
+
+
+def build(logs):
+    mirror = OrderbookMirror()
+    mirror.apply_logs(logs.logs)
+    return mirror
+
+
+def test_sides_are_sorted_like_the_contract(logs):
+    logs.insert(1, True, 10)
+    logs.insert(2, True, 12)
+    logs.insert(3, True, 10)
+    logs.insert(4, False, 15)
+    logs.insert(5, False, 13)
+    book = build(logs).pair(BASE, SECONDARY)
+    assert [order.id for order in book.buy.limit] == [2, 1, 3]
+    assert [order.id for order in book.sell.limit] == [5, 4]
+    assert book.best_bid() == 12
+    assert book.best_ask() == 13
+    assert book.spread() == 1
+    assert book.buy.limit.depth() == [(12, WAD, 1), (10, 2 * WAD, 2)]
+    # a new order with price 10 goes after the last order with that price
+    assert book.buy.limit.previous_id_for(10) == 3
+    assert book.buy.limit.previous_id_for(20) == 0
+    assert book.buy.limit.previous_id_of(book.buy.orders[3]) == 1
+    assert book.buy.limit.previous_id_of(book.buy.orders[1]) == 2
+
+
+def test_limit_order_wins_ties_against_market_orders(logs):
+    logs.insert(1, True, 2 * WAD)
+    logs.insert(2, True, 0, order_type=OrderType.MARKET_ORDER, multiply_factor=WAD)
+    book = build(logs).pair(BASE, SECONDARY)
+    assert book.buy.best_order(market_price=2 * WAD).id == 1
+    assert book.buy.best_order(market_price=3 * WAD).id == 2
+    assert book.buy.best_order().id == 1
+
+
+def test_matches_cancels_and_expirations(logs):
+    logs.insert(1, True, 10)
+    logs.insert(2, False, 10)
+    logs.insert(3, False, 11)
+    logs.match(1, True, WAD // 4)
+    logs.match(2, False, 0)
+    logs.emit('OrderCancelled', id=3, sender=OWNER, returnedAmount=WAD, commission=0,
+              returnedCommission=0, isBuy=False)
+    mirror = build(logs)
+    book = mirror.pair(BASE, SECONDARY)
+    assert book.buy.orders[1].exchangeable_amount == WAD // 4
+    assert book.buy.orders[1].reserved_commission == WAD // 400
+    assert book.buy.limit.depth() == [(10, WAD // 4, 1)]
+    assert len(book.sell) == 0
+    assert book.best_ask() is None
+    logs.emit('ExpiredOrderProcessed', orderId=1, owner=OWNER, returnedAmount=0, commission=0,
+              returnedCommission=0)
+    mirror.apply_logs(logs.logs[-1:])
+    assert len(book.buy) == 0
+    assert mirror.order_pairs == {}
+
+
+def test_tick_events(logs):
+    logs.emit('TickStart', baseTokenAddress=BASE, secondaryTokenAddress=SECONDARY, number=1)
+    mirror = build(logs)
+    book = mirror.pair(BASE, SECONDARY)
+    assert book.tick_running
+    logs.emit('TickEnd', baseTokenAddress=BASE, secondaryTokenAddress=SECONDARY, number=1,
+              nextTickBlock=50, closingPrice=7)
+    mirror.apply_logs(logs.logs[-1:])
+    assert not book.tick_running
+    assert (book.tick_number, book.next_tick_block, book.last_closing_price) == (2, 50, 7)
+
+
+def test_pending_orders_are_resolved_from_the_transaction(logs):
+    tx_hash = '0x' + 'ab' * 32
+    logs.emit('NewOrderAddedToPendingQueue', tx_hash=tx_hash, id=9, notIndexedArgumentSoTheThingDoesntBreak=0)
+    transaction = {'from': OWNER, 'input': FUNCTIONS['insertSellLimitOrder'].encode(BASE, SECONDARY, WAD, 5, 3)}
+    with FakeRPCServer() as server:
+        server.register('eth_getTransactionByHash', lambda params: transaction)
+        rpc = RPCSession(server.url)
+        mirror = OrderbookMirror()
+        mirror.apply_logs(logs.logs, rpc)
+        rpc.close()
+    book = mirror.pair(BASE, SECONDARY)
+    assert list(book.sell.pending_limit) == [9]
+    assert not mirror.unresolved_pending
+    # moved to the orderbook when the tick ends
+    logs.insert(9, False, 5)
+    mirror.apply_logs(logs.logs[-1:])
+    assert not book.sell.pending_limit
+    assert [order.id for order in book.sell.limit] == [9]
+
+
+def test_snapshot_roundtrip(logs, tmp_path):
+    logs.insert(1, True, 10)
+    logs.insert(2, True, 0, order_type=OrderType.MARKET_ORDER, multiply_factor=WAD)
+    logs.insert(3, False, 12)
+    logs.emit('NewOrderAddedToPendingQueue', id=4, notIndexedArgumentSoTheThingDoesntBreak=0)
+    mirror = build(logs)
+    path = str(tmp_path / 'orderbook.json')
+    mirror.save(path)
+    loaded = OrderbookMirror.load(path)
+    assert loaded.snapshot() == mirror.snapshot()
+    assert loaded.pair_of(2).buy.market.best() == WAD
+    assert OrderbookMirror.load(str(tmp_path / 'missing.json')).last_block == -1
@@ -0,0 +1,145 @@
+import asyncio
+import gc
+import json
+
+import pytest
+
+from factories import BASE, SECONDARY, OWNER
+from tex_client.abi import decode_function_input
+from tex_client.aio import AsyncTexClient, NodeSigner
+from tex_client.fake_rpc import FakeRPCServer, FakeTransactions
+from tex_client.nonces import missing_nonces
+from tex_client.pipeline import TransactionPipeline
+
+DEX = '0x' + '44' * 20
+
+
+@pytest.fixture
+def chain():
+    with FakeRPCServer() as server:
+        transactions = FakeTransactions(server)
+        yield transactions
+        transactions.stop_mining()
+
+
+def run(chain, scenario, **pipeline_options):
+    async def main():
+        async with AsyncTexClient(chain.server.url, DEX, NodeSigner(OWNER), poll_interval=0.01) as client:
+            async with TransactionPipeline(client, **pipeline_options) as pipeline:
+                return await scenario(client, pipeline)
+    return asyncio.run(main())
+
+
+async def wait_pool(chain, size):
+    while len(chain.pool) < size:
+        await asyncio.sleep(0.01)
+
+
+def test_missing_nonces():
+    assert missing_nonces(3, 8, [3, 5, 7]) == [4, 6]
+    assert missing_nonces(3, 3, []) == []
+
+
+def test_window_bounds_the_transactions_in_flight(chain):
+    async def scenario(client, pipeline):
+        orders = [asyncio.ensure_future(client.insert_buy_limit_order(BASE, SECONDARY, 1, price, 5))
+                  for price in range(1, 11)]
+        await wait_pool(chain, 4)
+        await asyncio.sleep(0.05)
+        in_pool = len(chain.pool)
+        chain.start_mining(0.01)
+        await asyncio.gather(*orders)
+        return in_pool
+
+    assert run(chain, scenario, window=4) == 4
+    assert [int(tx['nonce'], 16) for tx in chain.mined] == list(range(10))
+
+
+def test_orders_cancels_and_approvals_share_the_queue(chain):
+    chain.start_mining(0.01)
+
+    async def scenario(client, pipeline):
+        await asyncio.gather(
+            client.approve(BASE, 100),
+            client.insert_sell_limit_order(BASE, SECONDARY, 1, 2, 5),
+            client.cancel_sell_order(BASE, SECONDARY, 1),
+            client.unwrap(BASE, 1))
+        return pipeline.sent_count
+
+    assert run(chain, scenario) == 4
+    names = [decode_function_input(tx['data'])[0] for tx in sorted(chain.mined, key=lambda tx: tx['nonce'])]
+    assert names == [None, 'insertSellLimitOrderAfter', 'cancelSellOrder', None]
+    assert [tx['to'] for tx in chain.mined] == [BASE, DEX, DEX, BASE]
+
+
+def test_stalled_transaction_is_replaced_with_more_gas(chain):
+    chain.min_gas_price = 2 * chain.gas_price
+    chain.start_mining(0.01)
+
+    async def scenario(client, pipeline):
+        receipt = await client.approve(BASE, 100)
+        return receipt, pipeline.replacements_count
+
+    receipt, replacements = run(chain, scenario, stall_timeout=0.05, gas_bump=1.5)
+    assert replacements == 2
+    assert [tx['hash'] for tx in chain.mined] == [receipt.transaction_hash]
+    assert int(chain.mined[0]['gasPrice'], 16) == int(chain.gas_price * 1.5 * 1.5)
+
+
+def test_lost_transaction_is_broadcast_again(chain):
+    async def scenario(client, pipeline):
+        approval = asyncio.ensure_future(client.approve(BASE, 100))
+        await wait_pool(chain, 1)
+        chain.drop(list(chain.pool.values())[0]['hash'])
+        while not pipeline.rebroadcasts_count:
+            await asyncio.sleep(0.01)
+        chain.start_mining(0.01)
+        await approval
+        return pipeline.rebroadcasts_count, pipeline.replacements_count
+
+    assert run(chain, scenario, stall_timeout=0.2) == (1, 0)
+    assert len(chain.mined) == 1
+
+
+def test_journal_recovers_and_fills_the_gaps(chain, tmp_path):
+    journal = str(tmp_path / 'nonces.json')
+    sent = dict((nonce, {'to': DEX, 'data': '0x', 'value': 0, 'gas': 100000, 'nonce': nonce,
+                         'gasPrice': chain.gas_price, 'hashes': []}) for nonce in (0, 2, 4))
+    with open(journal, 'w') as f:
+        json.dump(sent, f)
+    chain.start_mining(0.01)
+
+    async def scenario(client, pipeline):
+        await client.approve(BASE, 100)
+        while pipeline.in_flight:
+            await asyncio.sleep(0.01)
+        return pipeline.gaps_filled_count
+
+    assert run(chain, scenario, journal=journal) == 2
+    mined = dict((int(tx['nonce'], 16), tx) for tx in chain.mined)
+    assert sorted(mined) == [0, 1, 2, 3, 4, 5]
+    assert mined[1]['to'] == mined[3]['to'] == OWNER
+    assert mined[5]['to'] == BASE
+    with open(journal) as f:
+        assert json.load(f) == {}
+
+
+def test_recovered_transactions_that_fail_are_not_reported_as_unretrieved(chain, tmp_path):
+    journal = str(tmp_path / 'nonces.json')
+    with open(journal, 'w') as f:
+        json.dump({0: {'to': DEX, 'data': '0x', 'value': 0, 'gas': 100000, 'nonce': 0,
+                       'gasPrice': chain.gas_price, 'hashes': []}}, f)
+    chain.revert = lambda transaction: int(transaction['nonce'], 16) == 0
+    chain.start_mining(0.01)
+
+    async def scenario(client, pipeline):
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context['message']))
+        while pipeline.in_flight or pipeline._tracking:
+            await asyncio.sleep(0.01)
+        gc.collect()
+        await asyncio.sleep(0)
+        return errors
+
+    assert run(chain, scenario, journal=journal) == []
+    assert len(chain.mined) == 1
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from factories import BASE, SECONDARY, WAD, FakeDex
+from tex_client.abi import decode_function_input
+from tex_client.aio import NodeSigner
+from tex_client.constants import TickStage
+from tex_client.fake_rpc import FakeRPCServer, FakeTransactions
+from tex_client.router import OrderRouter
+from tex_client.validator import limit_order
+
+DEX = '0x' + '44' * 20
+OTHER = '0x' + '55' * 20
+ACCOUNTS = ['0x' + byte * 20 for byte in ('a1', 'a2', 'a3')]
+
+
+def set_tick(dex, base_token, secondary_token, stage, next_tick_block=10 ** 6):
+    dex.set('getTokenPairStatus', (base_token, secondary_token), dict(
+        emergentPrice=0, lastBuyMatchId=0, lastBuyMatchAmount=0, lastSellMatchId=0, tickNumber=3,
+        nextTickBlock=next_tick_block, lastTickBlock=1, lastClosingPrice=0, disabled=False, emaPrice=0,
+        smoothingFactor=0, marketPrice=WAD))
+    dex.set('getTickStage', (base_token, secondary_token), stage)
+
+
+@pytest.fixture
+def dex():
+    # the other getters of the status answer errors, the tick state is enough
+    dex = FakeDex(DEX)
+    for secondary_token in (SECONDARY, OTHER):
+        set_tick(dex, BASE, secondary_token, TickStage.RECEIVING_ORDERS)
+    return dex
+
+
+@pytest.fixture
+def chain(dex):
+    with FakeRPCServer() as server:
+        transactions = FakeTransactions(server)
+        dex.serve(server)
+        # ACCOUNTS[1] has sent 7 transactions already
+        transactions.nonces[ACCOUNTS[1]] = 7
+        transactions.start_mining(0.01)
+        yield transactions
+        transactions.stop_mining()
+
+
+def route(chain, orders, accounts=None, scenario=None, **kwargs):
+    async def main():
+        async with OrderRouter(chain.server.url, DEX, [NodeSigner(account) for account in ACCOUNTS],
+                               poll_interval=0.01, tick_poll_interval=0.02, approve=False, **kwargs) as router:
+            if scenario is not None:
+                return await scenario(router)
+            return router, [result async for result in router.route(orders, accounts)]
+    return asyncio.run(main())
+
+
+def nonces_by_account(chain):
+    nonces = dict()
+    for transaction in chain.mined:
+        nonces.setdefault(transaction['from'].lower(), []).append(int(transaction['nonce'], 16))
+    return dict((account, sorted(values)) for account, values in nonces.items())
+
+
+def test_orders_of_many_pairs_and_accounts_get_one_nonce_stream_each(chain):
+    orders = [limit_order(BASE, SECONDARY if i % 2 else OTHER, WAD, (90 + i) * WAD, 5, True) for i in range(12)]
+    accounts = [ACCOUNTS[2], ACCOUNTS[2]] + [None] * 10
+    router, results = route(chain, orders, accounts)
+
+    assert sorted(result.index for result in results) == list(range(12))
+    assert all(result.error is None and result.receipt.status == 1 for result in results)
+    assert [result.account for result in sorted(results)[:2]] == [ACCOUNTS[2]] * 2
+    # every account was used, from its pending nonce and without gaps
+    nonces = nonces_by_account(chain)
+    assert set(nonces) == set(ACCOUNTS)
+    for account, values in nonces.items():
+        first = 7 if account == ACCOUNTS[1] else 0
+        assert values == list(range(first, first + len(values)))
+    assert sum(metrics.orders for metrics in router.metrics.values()) == 12
+    assert all(metrics.in_flight == 0 for metrics in router.metrics.values())
+    prices = sorted(decode_function_input(tx['data'])[1]['_price'] // WAD for tx in chain.mined)
+    assert prices == list(range(90, 102))
+
+
+def test_holds_the_orders_of_a_pair_while_its_tick_runs(chain, dex):
+    set_tick(dex, BASE, OTHER, TickStage.RUNNING_MATCHING)
+    # SECONDARY is open but its tick can start in 2 blocks, with safety_blocks=2 it waits too
+    set_tick(dex, BASE, SECONDARY, TickStage.RECEIVING_ORDERS, next_tick_block=chain.server.block_number + 2)
+
+    async def scenario(router):
+        held = [router.submit(limit_order(BASE, OTHER, WAD, price * WAD, 5, True), ACCOUNTS[0]) for price in (1, 2)]
+        late = router.submit(limit_order(BASE, SECONDARY, WAD, 3 * WAD, 5, True))
+        await asyncio.sleep(0.2)
+        assert router.scheduler.held_count == 3 and not chain.mined
+        set_tick(dex, BASE, SECONDARY, TickStage.RECEIVING_ORDERS)
+        await late[1]
+        assert router.scheduler.held_count == 2
+        # the tick ends: the held orders go in one batch of their account
+        set_tick(dex, BASE, OTHER, TickStage.RECEIVING_ORDERS)
+        batches = router.metrics[ACCOUNTS[0]].batches
+        results = await asyncio.gather(*[future for _, future in held])
+        return results, router.metrics[ACCOUNTS[0]].batches - batches
+
+    results, batches = route(chain, None, scenario=scenario, safety_blocks=2)
+    assert [result.error for result in results] == [None, None] and batches == 1
+    prices = [decode_function_input(tx['data'])[1]['_price'] // WAD for tx in chain.mined]
+    assert prices[0] == 3 and sorted(prices[1:]) == [1, 2]
+
+
+def test_failed_orders_do_not_stop_the_account(chain):
+    # the order at price 13 reverts; its account goes on with the next nonces
+    chain.revert = lambda transaction: decode_function_input(transaction['data'])[1]['_price'] == 13 * WAD
+    orders = [limit_order(BASE, SECONDARY, WAD, price * WAD, 5, False) for price in range(10, 16)]
+    router, results = route(chain, orders, [ACCOUNTS[0]] * 6)
+
+    errors = dict((result.order.price // WAD, result.error) for result in results)
+    assert [price for price, error in errors.items() if error is not None] == [13]
+    assert nonces_by_account(chain) == {ACCOUNTS[0]: list(range(6))}
+    assert (router.metrics[ACCOUNTS[0]].orders, router.metrics[ACCOUNTS[0]].errors) == (6, 1)
+
+
+def test_stop_cancels_the_held_orders(chain, dex):
+    set_tick(dex, BASE, OTHER, TickStage.RUNNING_MATCHING)
+
+    async def scenario(router):
+        account, future = router.submit(limit_order(BASE, OTHER, WAD, WAD, 5, True))
+        await asyncio.sleep(0.1)
+        return router, account, future
+
+    router, account, future = route(chain, None, scenario=scenario)
+    assert future.cancelled() and not chain.mined
+    assert router.metrics[account].in_flight == 0 and not router.active
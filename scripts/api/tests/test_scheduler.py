@@ -0,0 +1,103 @@
+import pytest
+
+from factories import BASE, SECONDARY
+from tex_client.batch import PairStatus, StatusTable
+from tex_client.constants import TickStage
+from tex_client.scheduler import SimulatedBlockClock, TickConfig, TickScheduler, calculate_blocks
+
+OTHER = '0x' + '55' * 20
+
+
+class FakeReader(object):
+    """ BatchReader answering from the tick state set by the test """
+
+    def __init__(self):
+        self.rows = dict()
+        self.batches_count = 0
+
+    def set(self, base_token, secondary_token, stage, tick_number=1, next_tick_block=100, last_tick_block=80):
+        self.rows[(base_token, secondary_token)] = PairStatus(
+            base_token, secondary_token, tick_stage=stage, tick_number=tick_number,
+            next_tick_block=next_tick_block, last_tick_block=last_tick_block)
+
+    def pairs_status(self, pairs):
+        self.batches_count += 1
+        return StatusTable([self.rows[pair] for pair in pairs], 'latest')
+
+    def call(self, function_name):
+        assert function_name == 'tickConfig'
+        return {'expectedOrdersForTick': 10, 'maxBlocksForTick': 50, 'minBlocksForTick': 5}
+
+
+@pytest.fixture
+def reader():
+    reader = FakeReader()
+    reader.set(BASE, SECONDARY, TickStage.RECEIVING_ORDERS)
+    reader.set(BASE, OTHER, TickStage.RECEIVING_ORDERS)
+    return reader
+
+
+@pytest.mark.parametrize('actual_orders, current_block, expected', [
+    (4, 120, 50),   # 10 * 20 // 4
+    (100, 120, 5),  # under the min
+    (1, 120, 50),   # over the max
+    (8, 110, 37),   # 10 * 30 // 8
+])
+def test_calculate_blocks_like_the_contract(actual_orders, current_block, expected):
+    assert calculate_blocks(10, 80, 50, 5, actual_orders, current_block) == expected
+
+
+def test_sends_right_away_while_receiving_orders(reader):
+    scheduler = TickScheduler(reader, SimulatedBlockClock(90))
+    scheduler.refresh([(BASE, SECONDARY)])
+    assert scheduler.schedule(BASE, SECONDARY, lambda: 'sent') == 'sent'
+    assert scheduler.held_count == 0
+    assert scheduler.blocks_until_closed(BASE, SECONDARY) == 8
+
+
+def test_holds_near_the_tick_and_releases_after_it(reader):
+    clock = SimulatedBlockClock(98)
+    scheduler = TickScheduler(reader, clock, safety_blocks=2)
+    sent = []
+    scheduler.schedule(BASE, SECONDARY, lambda: sent.append(1) or 1)
+    scheduler.schedule(BASE, SECONDARY, lambda: sent.append(2) or 2)
+    assert scheduler.step() == []
+    assert scheduler.held_count == 2
+
+    clock.advance(3)
+    reader.set(BASE, SECONDARY, TickStage.RUNNING_MATCHING)
+    assert scheduler.step() == []
+
+    reader.set(BASE, SECONDARY, TickStage.RECEIVING_ORDERS, tick_number=2, next_tick_block=130, last_tick_block=101)
+    assert scheduler.step() == [1, 2]
+    assert sent == [1, 2]
+    # one batch per step for all the pairs with held orders
+    assert reader.batches_count == 3
+
+
+def test_pairs_are_independent(reader):
+    reader.set(BASE, OTHER, TickStage.RUNNING_SIMULATION)
+    scheduler = TickScheduler(reader, SimulatedBlockClock(90))
+    scheduler.refresh([(BASE, SECONDARY), (BASE, OTHER)])
+    scheduler.schedule(BASE, OTHER, lambda: 'other')
+    assert scheduler.schedule(BASE, SECONDARY, lambda: 'pair') == 'pair'
+    assert scheduler.release() == []
+    assert scheduler.held_count == 1
+
+
+def test_releases_when_the_tick_is_overdue(reader):
+    clock = SimulatedBlockClock(99)
+    scheduler = TickScheduler(reader, clock, max_overdue_blocks=10)
+    scheduler.schedule(BASE, SECONDARY, lambda: 'late')
+    assert scheduler.step() == []
+    clock.advance(12)
+    assert scheduler.step() == ['late']
+
+
+def test_predicts_the_next_tick_block(reader):
+    scheduler = TickScheduler(reader, SimulatedBlockClock(90))
+    scheduler.refresh([(BASE, SECONDARY)])
+    assert scheduler.config == TickConfig(10, 50, 5)
+    # tick starting at nextTickBlock 100, 20 blocks after the last one, with 8 matches
+    assert scheduler.predict_next_tick_block(BASE, SECONDARY, 8) == 100 + 10 * 20 // 8
+    assert scheduler.predict_next_tick_block(BASE, SECONDARY, 0, tick_start_block=110) == 110 + 50
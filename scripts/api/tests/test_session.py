@@ -0,0 +1,46 @@
+import pytest
+
+from tex_client import RPCError, RPCSession
+from tex_client.fake_rpc import FakeRPCServer
+
+
+@pytest.fixture
+def server():
+    with FakeRPCServer() as fake:
+        fake.register('eth_call', lambda params: params[0]['data'])
+        yield fake
+
+
+def test_call_returns_the_result(server):
+    session = RPCSession(server.url)
+    assert session.call('eth_blockNumber') == '0x1'
+    assert session.call('eth_call', [{'data': '0x01'}, 'latest']) == '0x01'
+    session.close()
+
+
+def test_calls_reuse_one_connection(server):
+    session = RPCSession(server.url)
+    for _ in range(10):
+        session.call('eth_blockNumber')
+    session.close()
+    assert server.requests_count == 10
+    assert server.connections_count == 1
+
+
+def test_batch_is_one_round_trip_and_keeps_the_order(server):
+    session = RPCSession(server.url)
+    calls = [('eth_call', [{'data': hex(i)}, 'latest']) for i in range(20)]
+    assert session.batch(calls) == [hex(i) for i in range(20)]
+    assert server.requests_count == 1
+    assert server.calls_count == 20
+    session.close()
+
+
+def test_errors(server):
+    session = RPCSession(server.url)
+    with pytest.raises(RPCError):
+        session.call('eth_unknown')
+    results = session.batch([('eth_blockNumber', []), ('eth_unknown', [])], raise_on_error=False)
+    assert results[0] == '0x1'
+    assert isinstance(results[1], RPCError)
+    session.close()
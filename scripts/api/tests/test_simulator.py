@@ -0,0 +1,152 @@
+import json
+import os
+from decimal import Decimal
+
+import numpy as np
+
+from tex_client.constants import OrderType
+from tex_client.simulator import OrderArrays, match_amounts, match_tick, simulate
+
+WAD = 10 ** 18
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def wad(value):
+    return int(Decimal(str(value)) * WAD)
+
+
+def wads(values):
+    return [wad(value) for value in values]
+
+
+def load_cases():
+    with open(os.path.join(FIXTURES, 'exchanges_calculator.json')) as f:
+        return json.load(f)
+
+
+def test_match_amounts_conform_to_the_exchanges_calculator():
+    cases = load_cases()
+    result = match_amounts(
+        buy_prices=wads(case['buy']['price'] for case in cases),
+        buy_amounts=wads(case['buy']['amount'] for case in cases),
+        sell_prices=wads(case['sell']['price'] for case in cases),
+        sell_amounts=wads(case['sell']['amount'] for case in cases),
+        match_prices=[wad(case['price']) if case['price'] is not None else
+                      wad((Decimal(str(case['buy']['price'])) + Decimal(str(case['sell']['price']))) / 2)
+                      for case in cases])
+    fields = [
+        ('sent', 'BuyerMatch', 'sent'),
+        ('change', 'BuyerMatch', 'change'),
+        ('expected_send', 'BuyerMatch', 'expectedSend'),
+        ('limiting_amount', 'BuyerMatch', 'received'),
+        ('match_price', 'BuyerMatch', 'matchPrice'),
+        ('surplus', 'SellerMatch', 'surplus'),
+        ('expected_return', 'SellerMatch', 'expectedReturn'),
+        ('buy_remaining', 'buy', 'amount'),
+        ('sell_remaining', 'sell', 'amount'),
+    ]
+    for index, case in enumerate(cases):
+        expected = [Decimal(case['expected'][group][key]) * WAD for _, group, key in fields]
+        if all(value == value.to_integral_value() for value in expected):
+            # exact in wad: the contract gets the same value
+            for (name, _, _), value in zip(fields, expected):
+                assert result[name][index] == int(value), (index, name)
+        else:
+            # the calculator works with 30 decimals and the contract floors every
+            # operation to wei; the difference is at most a few wei per operation
+            tolerance = 2 * (max(case['buy']['price'], case['sell']['price']) + 1)
+            for (name, _, _), value in zip(fields, expected):
+                assert abs(result[name][index] - value) <= tolerance, (index, name)
+
+
+def test_single_match_with_commissions():
+    # test/singleMatchingTests.js: 150 @ 20 (15 of commission) against 7.5 @ 10 (0.75)
+    buys = OrderArrays(prices=wads([20]), amounts=wads([135]), reserved_commissions=wads([15]))
+    sells = OrderArrays(prices=wads([10]), amounts=wads([6.75]), reserved_commissions=wads([0.75]))
+    tick = match_tick(buys, sells)
+    assert tick.simulation.emergent_price == wad(15)
+    assert tick.simulation.matches_amount == 2
+    assert list(tick.buyer_sent) == wads([101.25])
+    assert list(tick.change) == wads([37.5])
+    assert list(tick.buyer_commission) == wads([11.25])
+    assert list(tick.limiting_amount) == wads([6.75])
+    assert list(tick.seller_commission) == wads([0.75])
+    assert list(tick.surplus) == wads([33.75])
+    assert list(tick.buys.amounts) == [0]
+    assert list(tick.sells.amounts) == [0]
+
+
+def test_multiple_matches():
+    # test/multipleMatchingTests.js: one sell order fills two buy orders
+    buys = OrderArrays(prices=wads([20, 10]), amounts=wads([59.4, 118.8]), ids=[2, 1],
+                       reserved_commissions=wads([0.6, 1.2]))
+    sells = OrderArrays(prices=wads([10]), amounts=wads([14.85]), ids=[3], reserved_commissions=wads([0.15]))
+    tick = match_tick(buys, sells)
+    assert tick.simulation.emergent_price == wad(10)
+    assert tick.simulation.matches_amount == 3
+    assert tick.simulation.steps == 2
+    assert [buys.ids[i] for i in tick.buy] == [2, 1]
+    assert list(tick.buyer_sent) == wads([29.7, 118.8])
+    assert list(tick.change) == wads([30, 0])
+    assert list(tick.buyer_commission) == wads([0.3, 1.2])
+    assert list(tick.seller_commission) == wads([0.03, 0.12])
+    assert list(tick.seller_remaining) == wads([11.88, 0])
+
+    # two complete fills at different prices, the emergent price is the average of the last ones
+    buys = OrderArrays(prices=wads([100, 80]), amounts=wads([100, 240]))
+    sells = OrderArrays(prices=wads([45, 55]), amounts=wads([1, 3]))
+    tick = match_tick(buys, sells)
+    assert tick.simulation.emergent_price == wad(67.5)
+    assert list(tick.buyer_sent) == wads([67.5, 202.5])
+    assert list(tick.change) == wads([32.5, 37.5])
+    assert list(tick.surplus) == wads([22.5, 37.5])
+
+
+def test_emergent_price_with_market_orders():
+    # test/emergentPriceWithMO.js, market price 2
+    market_price = wad(2)
+    buys = OrderArrays(prices=wads([10]), amounts=wads([20]))
+    sells = OrderArrays(prices=[wad(1), 0], amounts=wads([1, 1]),
+                        order_types=[OrderType.LIMIT_ORDER, OrderType.MARKET_ORDER],
+                        multiply_factors=[0, wad(5)])
+    assert simulate(buys, sells, market_price=market_price).emergent_price == wad(10)
+    sells = OrderArrays(prices=[wad(10), 0], amounts=wads([1, 1]),
+                        order_types=[OrderType.LIMIT_ORDER, OrderType.MARKET_ORDER],
+                        multiply_factors=[0, wad(0.5)])
+    assert simulate(buys, sells, market_price=market_price).emergent_price == wad(10)
+
+
+def test_priority_and_expiration():
+    # limit orders go before market orders with the same price, expired orders are skipped
+    buys = OrderArrays(prices=[0, wad(2), wad(3)], amounts=wads([1, 1, 1]), ids=[1, 2, 3],
+                       order_types=[OrderType.MARKET_ORDER, OrderType.LIMIT_ORDER, OrderType.LIMIT_ORDER],
+                       multiply_factors=[wad(1), 0, 0], expires_in_tick=[5, 5, 1])
+    simulation = simulate(buys, OrderArrays(prices=[], amounts=[]), market_price=wad(2), tick_number=1)
+    assert [buys.ids[i] for i in simulation.buy_priority] == [2, 1]
+    assert simulation.emergent_price == 0
+    assert simulation.last_buy_match == -1
+
+
+def test_big_crossing_books():
+    rng = np.random.RandomState(7)
+    size = 2000
+    buys = OrderArrays(prices=[wad(p) for p in rng.randint(1, 1000, size)],
+                       amounts=[wad(a) for a in rng.randint(1, 100, size)])
+    sells = OrderArrays(prices=[wad(p) for p in rng.randint(900, 2000, size)],
+                        amounts=[wad(a) for a in rng.randint(1, 100, size)])
+    simulation = simulate(buys, sells)
+    buy_prices = sorted(buys.prices, reverse=True)
+    sell_prices = sorted(sells.prices)
+    assert list(simulation.buy_prices[simulation.buy_priority]) == buy_prices
+    assert list(simulation.sell_prices[simulation.sell_priority]) == sell_prices
+    assert simulation.steps > 0
+    assert buys.prices[simulation.last_buy_match] >= sells.prices[simulation.last_sell_match]
+    tick = match_tick(buys, sells)
+    assert len(tick.buy) == simulation.steps
+    # the matched orders before the last ones are filled
+    assert all(tick.buys.amounts[i] == 0 for i in set(tick.buy) - {tick.buy[-1]})
+    assert all(tick.sells.amounts[i] == 0 for i in set(tick.sell) - {tick.sell[-1]})
+    # and what is left of the books does not cross
+    best_buy = max(price for price, amount in zip(buys.prices, tick.buys.amounts) if amount)
+    best_sell = min(price for price, amount in zip(sells.prices, tick.sells.amounts) if amount)
+    assert best_buy < best_sell
@@ -0,0 +1,100 @@
+import pytest
+
+from factories import BASE, SECONDARY, WAD, FakeDex
+from tex_client import RPCSession
+from tex_client.abi import FUNCTIONS, GOVERNOR_FUNCTIONS
+from tex_client.batch import BatchReader
+from tex_client.commissions import CommissionEngine, CommissionRates
+from tex_client.events import Event
+from tex_client.fake_rpc import FakeRPCServer
+from tex_client.validator import OrderRejected, OrderValidator, limit_order, market_order
+
+THIRD = '0x' + '33' * 20
+RULES = {'paused': False, 'minOrderAmount': WAD // 100, 'minMultiplyFactor': WAD // 100,
+         'maxMultiplyFactor': 199 * WAD // 100, 'maxOrderLifespan': 10}
+RATES = CommissionRates(commission_rate=WAD // 1000, cancelation_penalty_rate=0, expiration_penalty_rate=0,
+                        minimum_commission=WAD // 50)
+
+
+def status(ema_price, disabled=False):
+    values = dict((name, 0) for name in FUNCTIONS['getTokenPairStatus'].output_names)
+    values.update(emaPrice=ema_price, disabled=disabled)
+    return values
+
+
+@pytest.fixture
+def dex():
+    dex = FakeDex()
+    for name, value in RULES.items():
+        dex.set(name, (), value)
+    # DOC / BTC at 10000, BTC / THIRD at 0.5
+    dex.set('getTokenPairs', (), [(BASE, SECONDARY), (SECONDARY, THIRD)])
+    dex.set('getTokenPairStatus', (BASE, SECONDARY), status(10000 * WAD))
+    dex.set('getTokenPairStatus', (SECONDARY, THIRD), status(WAD // 2, disabled=True))
+    return dex
+
+
+@pytest.fixture
+def validator(dex):
+    with FakeRPCServer() as server:
+        dex.serve(server)
+        reader = BatchReader(RPCSession(server.url), dex.address)
+        yield OrderValidator(reader, CommissionEngine(None, None, rates=RATES))
+
+
+def event(name, **args):
+    return Event(name, args, 1, 0, None, None, None)
+
+
+def test_checks_like_the_contract(validator):
+    assert validator.check(limit_order(BASE, SECONDARY, WAD, WAD, 5, is_buy=True)) is None
+    # 0.001 BTC is 10 DOC
+    assert validator.check(limit_order(BASE, SECONDARY, WAD // 1000, WAD, 5, is_buy=False)) is None
+    assert validator.check(limit_order(BASE, SECONDARY, WAD // 1000, WAD, 5, is_buy=True)) == 'Amount too low'
+    assert validator.check(limit_order(BASE, SECONDARY, WAD, WAD, 11, is_buy=True)) == 'Lifespan too high'
+    assert validator.check(limit_order(BASE, SECONDARY, WAD, 0, 5, is_buy=True)) == 'Price cannot be zero'
+    # the minimum commission (0.02 DOC) is bigger than the amount
+    assert validator.check(limit_order(BASE, SECONDARY, WAD // 100, WAD, 5, is_buy=True)) == \
+        'Amount is greater than Fee'
+
+    assert validator.check(market_order(BASE, SECONDARY, WAD, WAD, 5, is_buy=False)) is None
+    assert validator.check(market_order(BASE, SECONDARY, WAD, 0, 5, is_buy=False)) == 'MultiplyFactor is zero'
+    assert validator.check(market_order(BASE, SECONDARY, WAD, 2 * WAD, 5, is_buy=False)) == 'High MultiplyFactor'
+    # the lifespan is checked before the multiply factor in the market orders
+    assert validator.check(market_order(BASE, SECONDARY, WAD, 0, 11, is_buy=False)) == 'Lifespan too high'
+
+    # selling THIRD converts through BTC: 1 THIRD is 5000 DOC, the pair is disabled
+    assert validator.check(limit_order(SECONDARY, THIRD, WAD, WAD, 5, is_buy=False)) == 'Pair has been disabled'
+    assert validator.check(limit_order(THIRD, BASE, WAD, WAD, 5, is_buy=True)) == 'Token pair does not exist'
+    with pytest.raises(OrderRejected) as error:
+        validator.validate(limit_order(BASE, SECONDARY, WAD, WAD, 11, is_buy=True))
+    assert error.value.reason == 'Lifespan too high'
+
+
+def test_a_pair_with_a_failing_status_only_rejects_its_orders(validator, dex):
+    dex.set('getTokenPairStatus', (SECONDARY, THIRD), ValueError('price provider reverted'))
+    assert validator.check(limit_order(BASE, SECONDARY, WAD, WAD, 5, is_buy=True)) is None
+    reasons = validator.check_many([limit_order(SECONDARY, THIRD, WAD, WAD, 5, is_buy=is_buy)
+                                    for is_buy in (True, False)])
+    assert all(reason.startswith('Pair status unavailable') and 'price provider reverted' in reason
+               for reason in reasons)
+    assert list(validator.pair_errors) == [(SECONDARY, THIRD)]
+
+
+def test_follows_the_events_and_governance_changes(validator, dex):
+    order = limit_order(BASE, SECONDARY, WAD, WAD, 5, is_buy=True)
+    assert validator.check_many([order] * 1000) == [None] * 1000
+    assert validator.loads_count == 1
+
+    validator.observe(event('Paused', account=THIRD))
+    assert validator.check(order) == 'paused'
+    validator.observe(event('Unpaused', account=THIRD))
+    validator.observe(event('TokenPairDisabled', baseToken=BASE, secondaryToken=SECONDARY))
+    assert validator.check(order) == 'Pair has been disabled'
+    validator.observe(event('TokenPairEnabled', baseToken=BASE, secondaryToken=SECONDARY))
+    assert validator.check(order) is None and validator.loads_count == 1
+
+    dex.set('maxOrderLifespan', (), 3)
+    assert validator.observe_transaction({'input': GOVERNOR_FUNCTIONS['executeChange'].encode(THIRD)})
+    assert validator.check(order) == 'Lifespan too high'
+    assert validator.loads_count == 2
@@ -0,0 +1,76 @@
+import random
+
+import numpy as np
+import pytest
+
+from factories import WAD
+from tex_client.wad import (UINT256_MAX, SafeMathError, as_int_array, calculate_initial_fee, commission_for_match,
+                            convert_to_base, exceptional_commission, market_order_spot_price, mul_div, to_wad,
+                            to_wad_array)
+
+SEEDS = range(5)
+
+
+def random_uint(rng, bits):
+    return rng.getrandbits(rng.randint(0, bits))
+
+
+def test_to_wad_is_exact():
+    assert to_wad('1.1') == 1100000000000000000
+    assert int(1.1 * WAD) == 1100000000000000128
+    assert to_wad(3) == 3 * WAD
+    assert list(to_wad_array(['0.1', 2])) == [WAD // 10, 2 * WAD]
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_mul_div_truncates_like_solidity(seed):
+    rng = random.Random(seed)
+    a = [random_uint(rng, 128) for _ in range(200)] + [0, 1, 2 ** 64, 2 ** 128 - 1]
+    b = [random_uint(rng, 128) for _ in range(200)] + [UINT256_MAX, 1, 2 ** 64, 2 ** 128 + 1]
+    c = [random_uint(rng, 128) + 1 for _ in range(204)]
+    expected = [x * y // z for x, y, z in zip(a, b, c)]
+    assert list(mul_div(as_int_array(a), as_int_array(b), as_int_array(c))) == expected
+    assert [mul_div(x, y, z) for x, y, z in zip(a, b, c)] == expected
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_int64_fast_path_matches_the_exact_path(seed):
+    rng = random.Random(seed)
+    a = np.array([rng.getrandbits(31) for _ in range(500)], dtype=np.int64)
+    b = np.array([rng.getrandbits(31) for _ in range(500)], dtype=np.int64)
+    c = np.array([rng.getrandbits(20) + 1 for _ in range(500)], dtype=np.int64)
+    fast = mul_div(a, b, c)
+    assert fast.dtype == np.int64
+    assert list(fast) == list(mul_div(as_int_array(a), as_int_array(b), as_int_array(c)))
+
+
+def test_reverts_like_safe_math():
+    with pytest.raises(SafeMathError):
+        mul_div(2 ** 128, 2 ** 128, 1)
+    with pytest.raises(SafeMathError):
+        mul_div(as_int_array([1, 2]), 3, as_int_array([1, 0]))
+    # a zero factor does not overflow
+    assert list(mul_div(as_int_array([0, 1]), as_int_array([UINT256_MAX, 1]), 1)) == [0, 1]
+    with pytest.raises(SafeMathError):
+        commission_for_match(WAD, 2 * WAD, WAD)
+    with pytest.raises(SafeMathError):
+        calculate_initial_fee(WAD, 0, 0, 0)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_contract_operations(seed):
+    rng = random.Random(seed)
+    amounts = [random_uint(rng, 100) + 1 for _ in range(100)]
+    prices = [random_uint(rng, 80) + 1 for _ in range(100)]
+    rate, minimum = rng.randint(0, WAD), rng.randint(0, 10 * WAD)
+    fees = calculate_initial_fee(as_int_array(amounts), as_int_array(prices), rate, minimum)
+    assert list(fees) == [minimum * WAD // price + amount * rate // WAD for amount, price in zip(amounts, prices)]
+    assert list(convert_to_base(as_int_array(amounts), as_int_array(prices))) == \
+        [amount * price // WAD for amount, price in zip(amounts, prices)]
+
+    matched = [rng.randint(0, amount) for amount in amounts]
+    assert list(commission_for_match(as_int_array(amounts), as_int_array(matched), fees)) == \
+        [part * fee // amount for amount, part, fee in zip(amounts, matched, fees)]
+    assert list(exceptional_commission(fees, rate)) == [fee * rate // WAD for fee in fees]
+    factor = rng.randint(WAD // 100, 199 * WAD // 100)
+    assert market_order_spot_price(prices[0], factor) == factor * prices[0] // WAD
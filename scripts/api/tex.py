@@ -0,0 +1,15 @@
+"""
+The tex command, every operation of the scripts with the settings of a profile
+(see tex_client/config.py and tex_client/cli.py), run it with:
+
+user> python ./tex.py --help
+user> python ./tex.py status
+user> python ./tex.py buy-limit DOC/WRBTC 14 14000 5
+
+"""
+
+import sys
+
+from tex_client.cli import main
+
+sys.exit(main())
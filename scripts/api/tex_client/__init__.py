@@ -0,0 +1,9 @@
+"""
+Client tooling for the TEX (MoC Decentralized Exchange)
+
+Only the light modules are imported here; brownie / moneyonchain are imported when a
+client connects and the numeric modules are imported from their own submodules.
+"""
+
+from .constants import NO_HINT, RATE_PRECISION, OrderType, TickStage
+from .session import RPCError, RPCSession, TexClient
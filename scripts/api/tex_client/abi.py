@@ -0,0 +1,237 @@
+"""
+Minimal static ABI codec for the TEX calls and events used by the client
+
+Every argument the client sends or decodes is a static type (address, uintN, bool or an
+enum), each one a single 32 bytes word, so there is no need to go through web3 to
+encode or decode them. The only dynamic values are the address[2][] of getTokenPairs,
+the uint256[] hints of matchOrdersWithHints and the string of the token symbols.
+Selectors and topics are precomputed (keccak of the signature), tests/test_abi.py
+checks them against eth_utils when it is installed.
+"""
+
+WORD = 32
+
+
+def signature(name, types):
+    return '{0}({1})'.format(name, ','.join(types))
+
+
+def to_bytes(data):
+    if isinstance(data, (bytes, bytearray)):
+        return bytes(data)
+    if data.startswith('0x'):
+        data = data[2:]
+    return bytes.fromhex(data)
+
+
+def encode_word(abi_type, value):
+    if abi_type == 'address':
+        return bytes(12) + to_bytes(value)
+    if abi_type == 'bool':
+        return int(bool(value)).to_bytes(WORD, 'big')
+    return int(value).to_bytes(WORD, 'big')
+
+
+def decode_word(abi_type, word):
+    if abi_type == 'address':
+        return '0x' + word[12:].hex()
+    if abi_type == 'bool':
+        return word[-1] == 1
+    return int.from_bytes(word, 'big')
+
+
+def encode_args(types, args):
+    """ Static words, plus the tails of the uint256[] and string arguments after the head """
+    head, tail = [], []
+    for abi_type, value in zip(types, args):
+        if abi_type == 'uint256[]':
+            head.append(encode_word('uint256', WORD * len(types) + sum(len(word) for word in tail)))
+            tail.append(encode_word('uint256', len(value)))
+            tail += [encode_word('uint256', item) for item in value]
+        elif abi_type == 'string':
+            head.append(encode_word('uint256', WORD * len(types) + sum(len(word) for word in tail)))
+            value = value.encode()
+            tail.append(encode_word('uint256', len(value)))
+            tail.append(value + bytes(-len(value) % WORD))
+        else:
+            head.append(encode_word(abi_type, value))
+    return b''.join(head + tail)
+
+
+def encode_address_pairs(pairs):
+    """ address[2][] as the only value of an output: head offset, length and the addresses """
+    words = [encode_word('uint256', WORD), encode_word('uint256', len(pairs))]
+    for base_token, secondary_token in pairs:
+        words += [encode_word('address', base_token), encode_word('address', secondary_token)]
+    return b''.join(words)
+
+
+def decode_address_pairs(data, offset):
+    """ address[2][] whose head word is at offset """
+    start = decode_word('uint256', data[offset:offset + WORD])
+    length = decode_word('uint256', data[start:start + WORD])
+    words = [data[start + (i + 1) * WORD:start + (i + 2) * WORD] for i in range(2 * length)]
+    return [(decode_word('address', words[2 * i]), decode_word('address', words[2 * i + 1])) for i in range(length)]
+
+
+def decode_args(types, data):
+    data = to_bytes(data)
+    values = []
+    for i, abi_type in enumerate(types):
+        if abi_type == 'address[2][]':
+            values.append(decode_address_pairs(data, i * WORD))
+        elif abi_type == 'uint256[]':
+            start = decode_word('uint256', data[i * WORD:(i + 1) * WORD])
+            length = decode_word('uint256', data[start:start + WORD])
+            values.append([decode_word('uint256', data[start + (j + 1) * WORD:start + (j + 2) * WORD])
+                           for j in range(length)])
+        elif abi_type == 'string':
+            start = decode_word('uint256', data[i * WORD:(i + 1) * WORD])
+            length = decode_word('uint256', data[start:start + WORD])
+            values.append(data[start + WORD:start + WORD + length].decode())
+        else:
+            values.append(decode_word(abi_type, data[i * WORD:(i + 1) * WORD]))
+    return values
+
+
+class Function(object):
+    """ A contract function with static inputs and outputs (and the two dynamic arrays above) """
+
+    def __init__(self, name, selector, inputs, outputs=()):
+        self.name = name
+        self.selector = selector
+        self.input_names = [arg_name for _, arg_name in inputs]
+        self.input_types = [arg_type for arg_type, _ in inputs]
+        self.output_names = [arg_name for _, arg_name in outputs]
+        self.output_types = [arg_type for arg_type, _ in outputs]
+
+    @property
+    def signature(self):
+        return signature(self.name, self.input_types)
+
+    def encode(self, *args):
+        return '0x' + self.selector + encode_args(self.input_types, args).hex()
+
+    def decode_input(self, data):
+        data = to_bytes(data)
+        return dict(zip(self.input_names, decode_args(self.input_types, data[4:])))
+
+    def encode_output(self, *values):
+        """ Return data as the node answers an eth_call, used by the fake nodes """
+        if self.output_types == ['address[2][]']:
+            return '0x' + encode_address_pairs(values[0]).hex()
+        return '0x' + encode_args(self.output_types, values).hex()
+
+    def decode_output(self, data):
+        values = decode_args(self.output_types, data)
+        if len(values) == 1 and not self.output_names[0]:
+            return values[0]
+        return dict(zip(self.output_names, values))
+
+
+_PAIR = [('address', '_baseToken'), ('address', '_secondaryToken')]
+
+FUNCTIONS = dict((function.name, function) for function in [
+    Function('insertBuyLimitOrder', 'a268e212',
+             _PAIR + [('uint256', '_amount'), ('uint256', '_price'), ('uint64', '_lifespan')]),
+    Function('insertSellLimitOrder', 'b232634c',
+             _PAIR + [('uint256', '_amount'), ('uint256', '_price'), ('uint64', '_lifespan')]),
+    Function('insertBuyLimitOrderAfter', 'ec62d9ef',
+             _PAIR + [('uint256', '_amount'), ('uint256', '_price'), ('uint64', '_lifespan'),
+                      ('uint256', '_previousOrderIdHint')]),
+    Function('insertSellLimitOrderAfter', '4e420fd4',
+             _PAIR + [('uint256', '_amount'), ('uint256', '_price'), ('uint64', '_lifespan'),
+                      ('uint256', '_previousOrderIdHint')]),
+    Function('insertMarketOrder', '64ce594c',
+             _PAIR + [('uint256', '_amount'), ('uint256', '_multiplyFactor'), ('uint64', '_lifespan'),
+                      ('bool', '_isBuy')]),
+    Function('insertMarketOrderAfter', '030fe436',
+             _PAIR + [('uint256', '_amount'), ('uint256', '_multiplyFactor'),
+                      ('uint256', '_previousOrderIdHint'), ('uint64', '_lifespan'), ('bool', '_isBuy')]),
+    Function('cancelBuyOrder', '1617b922', _PAIR + [('uint256', '_orderId'), ('uint256', '_previousOrderIdHint')]),
+    Function('cancelSellOrder', '91988cb8', _PAIR + [('uint256', '_orderId'), ('uint256', '_previousOrderIdHint')]),
+    Function('matchOrders', 'f5b5f6cb', _PAIR + [('uint256', 'steps')]),
+    Function('matchOrdersWithHints', '9221ffa6', _PAIR + [('uint256', 'steps'), ('uint256[]', 'hintIds')]),
+    Function('processExpired', '0a2c1470',
+             _PAIR + [('bool', '_evaluateBuyOrders'), ('uint256', '_orderId'), ('uint256', '_previousOrderIdHint'),
+                      ('uint256', '_steps'), ('uint8', '_orderType')]),
+    Function('areOrdersToExpire', '6bf5de4d', _PAIR + [('bool', '_evaluateBuyOrders')], [('bool', '')]),
+    Function('paused', '5c975abb', [], [('bool', '')]),
+    Function('tickConfig', '9c27ee4c', [], [
+        ('uint256', 'expectedOrdersForTick'),
+        ('uint256', 'maxBlocksForTick'),
+        ('uint256', 'minBlocksForTick')]),
+    Function('getTokenPairs', 'e24e4fdb', [], [('address[2][]', '')]),
+    Function('getTokenPairStatus', '16dedc84', _PAIR, [
+        ('uint256', 'emergentPrice'),
+        ('uint256', 'lastBuyMatchId'),
+        ('uint256', 'lastBuyMatchAmount'),
+        ('uint256', 'lastSellMatchId'),
+        ('uint64', 'tickNumber'),
+        ('uint256', 'nextTickBlock'),
+        ('uint256', 'lastTickBlock'),
+        ('uint256', 'lastClosingPrice'),
+        ('bool', 'disabled'),
+        ('uint256', 'emaPrice'),
+        ('uint256', 'smoothingFactor'),
+        ('uint256', 'marketPrice')]),
+    Function('getEmergentPrice', 'ff0e4bac', _PAIR, [
+        ('uint256', 'emergentPrice'),
+        ('uint256', 'lastBuyMatchId'),
+        ('uint256', 'lastBuyMatchAmount'),
+        ('uint256', 'lastSellMatchId')]),
+    Function('getTickStage', '95b6f0d4', _PAIR, [('uint8', '')]),
+    Function('tickIsRunning', '79c5827c', _PAIR, [('bool', '')]),
+    Function('getMarketPrice', '42872a02', _PAIR, [('uint256', '')]),
+    Function('getLastClosingPrice', '50090c6b', _PAIR, [('uint256', 'lastClosingPrice')]),
+    Function('getPriceProvider', '5a3970b1', _PAIR, [('address', '')]),
+    Function('buyOrdersLength', '41f3844d', _PAIR, [('uint256', '')]),
+    Function('sellOrdersLength', '9df64e1e', _PAIR, [('uint256', '')]),
+    Function('pendingBuyOrdersLength', 'fc3a4962', _PAIR, [('uint256', '')]),
+    Function('pendingSellOrdersLength', '5394e8e6', _PAIR, [('uint256', '')]),
+    Function('pendingMarketOrdersLength', '80446d87', _PAIR + [('bool', '_isBuy')], [('uint256', '')]),
+    Function('commissionManager', '0ef51d0d', [], [('address', '')]),
+    Function('minOrderAmount', '46b62c4a', [], [('uint256', '')]),
+    Function('minMultiplyFactor', 'b5febde0', [], [('uint256', '')]),
+    Function('maxMultiplyFactor', 'afac413f', [], [('uint256', '')]),
+    Function('maxOrderLifespan', '237d9c8e', [], [('uint64', '')]),
+    Function('convertTokenToCommonBase', 'df318d1b',
+             [('address', '_tokenAddress'), ('uint256', '_amount'), ('address', '_baseAddress')],
+             [('uint256', 'convertedAmount')]),
+])
+
+# CommissionManager getters
+COMMISSION_FUNCTIONS = dict((function.name, function) for function in [
+    Function('commissionRate', '5ea1d6f8', [], [('uint256', '')]),
+    Function('cancelationPenaltyRate', '084cb5dc', [], [('uint256', '')]),
+    Function('expirationPenaltyRate', '05bfe695', [], [('uint256', '')]),
+    Function('minimumCommission', '6514aaca', [], [('uint256', '')]),
+    Function('governor', '0c340a24', [], [('address', '')]),
+])
+
+# Governor: the changers (CommissionRateChanger, MinOrderAmountChanger, ...) run through it
+GOVERNOR_FUNCTIONS = dict((function.name, function) for function in [
+    Function('executeChange', '8c777e82', [('address', 'changeContract')]),
+])
+
+# ERC20 / WRBTC functions used by the client
+TOKEN_FUNCTIONS = dict((function.name, function) for function in [
+    Function('approve', '095ea7b3', [('address', 'spender'), ('uint256', 'amount')], [('bool', '')]),
+    Function('allowance', 'dd62ed3e', [('address', 'owner'), ('address', 'spender')], [('uint256', '')]),
+    Function('balanceOf', '70a08231', [('address', 'account')], [('uint256', '')]),
+    Function('deposit', 'd0e30db0', []),
+    Function('withdraw', '2e1a7d4d', [('uint256', 'wad')]),
+    Function('symbol', '95d89b41', [], [('string', '')]),
+    Function('decimals', '313ce567', [], [('uint8', '')]),
+])
+
+FUNCTIONS_BY_SELECTOR = dict((function.selector, function) for function in FUNCTIONS.values())
+
+
+def decode_function_input(data):
+    """ Returns (function name, args) of a TEX call input, (None, None) if unknown """
+    data = to_bytes(data)
+    function = FUNCTIONS_BY_SELECTOR.get(data[:4].hex())
+    if function is None:
+        return None, None
+    return function.name, function.decode_input(data)
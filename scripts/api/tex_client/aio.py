@@ -0,0 +1,331 @@
+"""
+asyncio client for the TEX: many transactions in flight from one account
+
+The scripts send one transaction and block until it is mined. AsyncTexClient sends
+them without waiting, with locally allocated nonces, and every call returns when its
+receipt is available, so many orders can be awaited together:
+
+    async with AsyncTexClient(rpc_url, dex_address, NodeSigner(account)) as client:
+        await client.approve(base_token, 1000)
+        receipts = await asyncio.gather(*[
+            client.insert_buy_limit_order(base_token, secondary_token, 10, price, 5)
+            for price in prices])
+
+Amounts and prices are in token units like TexClient. Transactions are signed by the
+node (NodeSigner, unlocked accounts like ganache's) or locally with a private key
+(LocalSigner, needs eth_account, installed with web3/brownie). The receipts of all
+the pending transactions are polled together, one batch request per poll.
+
+The JSON-RPC requests run on the pooled RPCSession in a thread pool of the same size
+as the connection pool, so no extra HTTP dependency is needed.
+"""
+
+import asyncio
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .abi import FUNCTIONS, TOKEN_FUNCTIONS
+from .constants import NO_HINT
+from .nonces import NonceAllocator
+from .session import RPCSession
+from .wad import to_wad
+
+# gas of a value transfer, used for the transactions that fill nonce gaps
+TRANSFER_GAS = 21000
+
+Receipt = namedtuple('Receipt', 'transaction_hash status block_number gas_used logs raw')
+
+
+class TransactionFailed(Exception):
+    """ The transaction was mined but reverted """
+
+    def __init__(self, receipt):
+        self.receipt = receipt
+        super().__init__('Transaction {0} reverted'.format(receipt.transaction_hash))
+
+
+def _to_int(value):
+    return value if isinstance(value, int) else int(value, 16)
+
+
+def _to_receipt(raw):
+    return Receipt(
+        transaction_hash=raw['transactionHash'],
+        status=_to_int(raw['status']),
+        block_number=_to_int(raw['blockNumber']),
+        gas_used=_to_int(raw['gasUsed']),
+        logs=raw.get('logs', []),
+        raw=raw)
+
+
+class AsyncRPCSession(object):
+    """ Awaitable calls and batches on a pooled RPCSession """
+
+    def __init__(self, rpc_url, pool_size=10, timeout=30):
+        self.session = RPCSession(rpc_url, pool_size=pool_size, timeout=timeout)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='tex-rpc')
+
+    async def call(self, method, params=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.session.call, method, params)
+
+    async def batch(self, calls, raise_on_error=True):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.session.batch, list(calls), raise_on_error)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+class NodeSigner(object):
+    """ The node signs with eth_sendTransaction, for unlocked accounts (ganache) """
+
+    def __init__(self, address):
+        self.address = address
+
+    async def send(self, rpc, transaction):
+        transaction = dict((key, value if key in ('from', 'to', 'data') else hex(value))
+                           for key, value in transaction.items())
+        return await rpc.call('eth_sendTransaction', [transaction])
+
+
+class LocalSigner(object):
+    """ Signs with a private key and sends the raw transaction """
+
+    def __init__(self, private_key):
+        from eth_account import Account
+        self._account = Account.from_key(private_key)
+        self.address = self._account.address
+
+    async def send(self, rpc, transaction):
+        transaction = dict(transaction)
+        transaction.pop('from', None)
+        signed = self._account.sign_transaction(transaction)
+        raw = getattr(signed, 'raw_transaction', None) or signed.rawTransaction
+        return await rpc.call('eth_sendRawTransaction', ['0x' + bytes(raw).hex()])
+
+
+class ReceiptWatcher(object):
+    """ Polls the receipts of all the pending transactions in one batch per interval """
+
+    def __init__(self, rpc, poll_interval=0.5):
+        self.rpc = rpc
+        self.poll_interval = poll_interval
+        self._pending = dict()
+        self._task = None
+
+    def watch(self, transaction_hash):
+        future = self._pending.get(transaction_hash)
+        # a future cancelled by a timeout of an earlier wait is replaced
+        if future is None or future.done():
+            future = self._pending[transaction_hash] = asyncio.get_running_loop().create_future()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._poll())
+        return future
+
+    async def _poll(self):
+        while self._pending:
+            await asyncio.sleep(self.poll_interval)
+            for tx_hash in [tx_hash for tx_hash, future in self._pending.items() if future.done()]:
+                del self._pending[tx_hash]
+            hashes = list(self._pending)
+            if not hashes:
+                break
+            results = await self.rpc.batch(
+                [('eth_getTransactionReceipt', [tx_hash]) for tx_hash in hashes], raise_on_error=False)
+            for tx_hash, result in zip(hashes, results):
+                if result is None:
+                    continue
+                future = self._pending.pop(tx_hash, None)
+                if future is None or future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(_to_receipt(result))
+
+    def forget(self, transaction_hash):
+        """ Stops polling a hash, e.g. of a transaction replaced by another one """
+        future = self._pending.pop(transaction_hash, None)
+        if future is not None:
+            future.cancel()
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        for future in self._pending.values():
+            future.cancel()
+        self._pending = dict()
+
+
+class AsyncTexClient(object):
+    """ Asynchronous counterpart of the writes of TexClient """
+
+    def __init__(self, rpc_url, dex_address, signer, gas_price=None, gas_multiplier=1.2, pool_size=10,
+                 poll_interval=0.5, receipt_timeout=600, rpc=None, receipts=None):
+        # rpc (AsyncRPCSession) and receipts (ReceiptWatcher) can be shared by the clients of several
+        # accounts, they are closed by their owner
+        self._owns_rpc = rpc is None
+        self._owns_receipts = receipts is None
+        self.rpc = AsyncRPCSession(rpc_url, pool_size=pool_size) if rpc is None else rpc
+        self.dex_address = dex_address
+        self.signer = signer
+        self.gas_price = gas_price
+        self.gas_multiplier = gas_multiplier
+        self.receipt_timeout = receipt_timeout
+        self.nonces = NonceAllocator()
+        self.receipts = ReceiptWatcher(self.rpc, poll_interval) if receipts is None else receipts
+        self.chain_id = None
+        # TransactionPipeline the writes go through, set by TransactionPipeline.start()
+        self.pipeline = None
+
+    @property
+    def address(self):
+        return self.signer.address
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def connect(self):
+        """ Reads the chain id, the gas price and the pending nonce in one batch """
+        chain_id, gas_price, nonce = await self.rpc.batch([
+            ('eth_chainId', []),
+            ('eth_gasPrice', []),
+            ('eth_getTransactionCount', [self.address, 'pending'])])
+        self.chain_id = _to_int(chain_id)
+        if self.gas_price is None:
+            self.gas_price = _to_int(gas_price)
+        self.nonces.reset(_to_int(nonce))
+        return self
+
+    def close(self):
+        if self._owns_receipts:
+            self.receipts.close()
+        if self._owns_rpc:
+            self.rpc.close()
+
+    # Transactions
+
+    async def estimate_gas(self, to, data, value=0):
+        estimate = await self.rpc.call('eth_estimateGas', [
+            {'from': self.address, 'to': to, 'data': data, 'value': hex(value)}])
+        return int(_to_int(estimate) * self.gas_multiplier)
+
+    def build_transaction(self, to, data, value, gas, nonce, gas_price=None):
+        return {
+            'from': self.address,
+            'to': to,
+            'data': data,
+            'value': value,
+            'gas': gas,
+            'gasPrice': gas_price or self.gas_price,
+            'nonce': nonce,
+            'chainId': self.chain_id,
+        }
+
+    async def send_transaction(self, to, data, value=0, gas=None):
+        """ Signs and broadcasts, returns the transaction hash without waiting for it """
+        if gas is None:
+            # estimating first also surfaces the reverts before a nonce is used
+            gas = await self.estimate_gas(to, data, value)
+        nonce = self.nonces.allocate()
+        try:
+            return await self.signer.send(self.rpc, self.build_transaction(to, data, value, gas, nonce))
+        except Exception:
+            if not self.nonces.release(nonce):
+                await self.fill_nonce_gap(nonce)
+            raise
+
+    async def fill_nonce_gap(self, nonce):
+        """
+        Sends an empty transaction to itself with a released nonce that later transactions
+        wait for, unless another send took it meanwhile. If it fails too, the gap is left
+        for TransactionPipeline.recover (missing_nonces).
+        """
+        if not self.nonces.reclaim(nonce):
+            return None
+        transaction = self.build_transaction(self.address, '0x', 0, TRANSFER_GAS, nonce)
+        try:
+            return await self.signer.send(self.rpc, transaction)
+        except Exception:
+            return None
+
+    async def wait_for_receipt(self, transaction_hash):
+        try:
+            receipt = await asyncio.wait_for(self.receipts.watch(transaction_hash), self.receipt_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # e.g. a dropped transaction: its hash is no longer polled
+            self.receipts.forget(transaction_hash)
+            raise
+        if receipt.status != 1:
+            raise TransactionFailed(receipt)
+        return receipt
+
+    async def transact(self, to, data, value=0, gas=None):
+        """ Sends a transaction and returns its receipt once mined, queued in the pipeline if any """
+        if self.pipeline is not None:
+            return await self.pipeline.transact(to, data, value, gas)
+        return await self.wait_for_receipt(await self.send_transaction(to, data, value, gas))
+
+    async def call(self, function_name, *args, **kwargs):
+        """ eth_call of a DEX getter, decoded """
+        function = FUNCTIONS[function_name]
+        result = await self.rpc.call('eth_call', [
+            {'to': kwargs.get('to', self.dex_address), 'data': function.encode(*args)}, 'latest'])
+        return function.decode_output(result)
+
+    async def _dex(self, function_name, *args, **kwargs):
+        return await self.transact(self.dex_address, FUNCTIONS[function_name].encode(*args), **kwargs)
+
+    async def _token(self, token_address, function_name, *args, **kwargs):
+        return await self.transact(token_address, TOKEN_FUNCTIONS[function_name].encode(*args), **kwargs)
+
+    # Write operations
+
+    async def approve(self, token_address, amount, spender=None, **kwargs):
+        return await self._token(token_address, 'approve', spender or self.dex_address, to_wad(amount), **kwargs)
+
+    async def wrap(self, token_address, amount, **kwargs):
+        return await self._token(token_address, 'deposit', value=to_wad(amount), **kwargs)
+
+    async def unwrap(self, token_address, amount, **kwargs):
+        return await self._token(token_address, 'withdraw', to_wad(amount), **kwargs)
+
+    async def insert_buy_limit_order(self, base_token, secondary_token, amount, price, lifespan,
+                                     previous_order_id=NO_HINT, **kwargs):
+        return await self._dex(
+            'insertBuyLimitOrderAfter', base_token, secondary_token, to_wad(amount), to_wad(price), lifespan,
+            previous_order_id, **kwargs)
+
+    async def insert_sell_limit_order(self, base_token, secondary_token, amount, price, lifespan,
+                                      previous_order_id=NO_HINT, **kwargs):
+        return await self._dex(
+            'insertSellLimitOrderAfter', base_token, secondary_token, to_wad(amount), to_wad(price), lifespan,
+            previous_order_id, **kwargs)
+
+    async def insert_market_order(self, base_token, secondary_token, amount, multiply_factor, lifespan, is_buy,
+                                  previous_order_id=NO_HINT, **kwargs):
+        return await self._dex(
+            'insertMarketOrderAfter', base_token, secondary_token, to_wad(amount), to_wad(multiply_factor),
+            previous_order_id, lifespan, is_buy, **kwargs)
+
+    async def insert_buy_market_order(self, base_token, secondary_token, amount, multiply_factor, lifespan,
+                                      previous_order_id=NO_HINT, **kwargs):
+        return await self.insert_market_order(
+            base_token, secondary_token, amount, multiply_factor, lifespan, True, previous_order_id, **kwargs)
+
+    async def insert_sell_market_order(self, base_token, secondary_token, amount, multiply_factor, lifespan,
+                                       previous_order_id=NO_HINT, **kwargs):
+        return await self.insert_market_order(
+            base_token, secondary_token, amount, multiply_factor, lifespan, False, previous_order_id, **kwargs)
+
+    async def cancel_buy_order(self, base_token, secondary_token, order_id, previous_order_id=0, **kwargs):
+        return await self._dex('cancelBuyOrder', base_token, secondary_token, order_id, previous_order_id, **kwargs)
+
+    async def cancel_sell_order(self, base_token, secondary_token, order_id, previous_order_id=0, **kwargs):
+        return await self._dex('cancelSellOrder', base_token, secondary_token, order_id, previous_order_id, **kwargs)
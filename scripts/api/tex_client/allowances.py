@@ -0,0 +1,222 @@
+"""
+Allowances and balances of an account for the DEX, planned per batch of orders
+
+An insertion takes its amount (exchangeable amount plus commission) from the sender
+with a transferFrom of the token it locks, the base token for buys and the secondary
+token for sells. Sending an approve before every order doubles the transactions.
+AllowancePlanner reads the allowances and balances once and then keeps them from the
+Approval, Transfer, Deposit and Withdrawal logs of the tokens, so a batch of orders
+gets at most one approve per token, one wrap of the missing WRBTC, and the orders
+whose transferFrom would fail are flagged before anything is sent:
+
+    planner = AllowancePlanner(rpc, account, dex_address, wrbtc=wrbtc_address)
+    planner.load([base_token, secondary_token])
+    ...
+    planner.sync()  # the token logs since the last block read
+    plan = planner.plan(orders)
+    for index, reason in plan.failing.items():
+        print(orders[index], reason)
+    await planner.execute(plan, client)  # the wrap and the approvals, before the orders
+
+Amounts are in wad. The receipts of the planner and of the orders can be applied right
+away with apply_logs() (bulk.BulkOrders does it when given a planner), sync() skips
+those logs. The RBTC balance has no logs, it is read again by every sync(); a wrap
+keeps native_reserve of it for the gas.
+
+approval_factor > 1 approves that many times the batch, so the next batches need no
+approve while it lasts; unlimited approves the maximum uint256, that WRBTC and most
+tokens do not decrease.
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+
+from .abi import TOKEN_FUNCTIONS
+from .bulk import locked_amounts
+from .events import TOKEN_EVENTS, EventDecoder
+
+MAX_UINT256 = 2 ** 256 - 1
+
+
+def _address_topic(address):
+    return '0x' + '00' * 12 + address[2:].lower()
+
+
+@dataclass
+class AllowancePlan(object):
+    """ What a batch of orders needs before it is sent """
+    # token -> amount the orders take
+    needed: dict
+    # (token, amount) to approve, at most one per token
+    approvals: list = field(default_factory=list)
+    # WRBTC to wrap from the RBTC balance
+    wrap: int = 0
+    # index of the order -> why its transferFrom would fail after the approvals and the wrap
+    failing: dict = field(default_factory=dict)
+
+    @property
+    def transactions(self):
+        return len(self.approvals) + (1 if self.wrap else 0)
+
+
+class AllowancePlanner(object):
+    """ Allowances for spender and balances of owner, kept from the token logs """
+
+    def __init__(self, rpc, owner, spender, wrbtc=None, approval_factor=1, unlimited=False,
+                 native_reserve=10 ** 15):
+        self.rpc = rpc
+        self.owner = owner.lower()
+        self.spender = spender.lower()
+        self.wrbtc = wrbtc.lower() if wrbtc else None
+        self.approval_factor = approval_factor
+        self.unlimited = unlimited
+        self.native_reserve = native_reserve
+        self.decoder = EventDecoder(list(TOKEN_EVENTS))
+        self.allowances = dict()
+        self.balances = dict()
+        self.native_balance = 0
+        self.last_block = None
+        # (transaction hash, log index) -> block of the logs applied from receipts, skipped by sync
+        self._applied = dict()
+
+    @property
+    def tokens(self):
+        return sorted(self.balances)
+
+    def load(self, tokens, block=None):
+        """ Reads the allowance and balance of every token and the RBTC balance at block (the head) """
+        if block is None:
+            block = int(self.rpc.call('eth_blockNumber'), 16)
+        tokens = [token.lower() for token in tokens]
+        if self.wrbtc is not None and self.wrbtc not in tokens:
+            tokens.append(self.wrbtc)
+        allowance = TOKEN_FUNCTIONS['allowance'].encode(self.owner, self.spender)
+        balance = TOKEN_FUNCTIONS['balanceOf'].encode(self.owner)
+        calls = [('eth_getBalance', [self.owner, hex(block)])]
+        for token in tokens:
+            calls += [('eth_call', [{'to': token, 'data': allowance}, hex(block)]),
+                      ('eth_call', [{'to': token, 'data': balance}, hex(block)])]
+        results = self.rpc.batch(calls)
+        self.native_balance = int(results[0], 16)
+        for i, token in enumerate(tokens):
+            self.allowances[token] = TOKEN_FUNCTIONS['allowance'].decode_output(results[1 + 2 * i])
+            self.balances[token] = TOKEN_FUNCTIONS['balanceOf'].decode_output(results[2 + 2 * i])
+        self.last_block = block
+        return self
+
+    def sync(self, to_block=None):
+        """ Applies the token logs of owner after the last block read, up to to_block (the head) """
+        if to_block is None:
+            to_block = int(self.rpc.call('eth_blockNumber'), 16)
+        if to_block <= self.last_block:
+            return 0
+        query = {'address': self.tokens, 'fromBlock': hex(self.last_block + 1), 'toBlock': hex(to_block)}
+        owner = _address_topic(self.owner)
+        sent, received, native_balance = self.rpc.batch([
+            # approvals, transfers and withdrawals from owner, deposits to owner
+            ('eth_getLogs', [dict(query, topics=[self.decoder.topics(), owner])]),
+            ('eth_getLogs', [dict(query, topics=[TOKEN_EVENTS['Transfer'].topic, None, owner])]),
+            ('eth_getBalance', [self.owner, hex(to_block)])])
+        logs = dict(((log['transactionHash'], int(log['logIndex'], 16)), log) for log in sent + received)
+        applied = self.apply_logs([log for key, log in logs.items() if key not in self._applied], receipt=False)
+        self.native_balance = int(native_balance, 16)
+        self.last_block = to_block
+        self._applied = dict((key, block) for key, block in self._applied.items() if block > to_block)
+        return applied
+
+    def apply_logs(self, logs, receipt=True):
+        """ Applies the token logs that concern owner (e.g. of a receipt), returns how many """
+        events = []
+        for log in logs:
+            if log['address'].lower() not in self.balances:
+                continue
+            event = self.decoder.decode(log)
+            if event is None:
+                continue
+            if receipt:
+                key = (event.transaction_hash, event.log_index)
+                if key in self._applied:
+                    continue
+                self._applied[key] = event.block_number
+            events.append(event)
+        applied = 0
+        for event in sorted(events, key=lambda event: (event.block_number, event.log_index)):
+            applied += self.apply(event.address.lower(), event.name, event.args)
+        return applied
+
+    def apply(self, token, name, args):
+        """ Applies one event of token, returns 1 if it concerns owner """
+        if name == 'Approval':
+            if args['owner'] != self.owner or args['spender'] != self.spender:
+                return 0
+            self.allowances[token] = args['value']
+        elif name == 'Transfer':
+            if self.owner not in (args['from'], args['to']):
+                return 0
+            if args['from'] == self.owner:
+                self.balances[token] -= args['value']
+                # a transferFrom of the spender, the infinite allowances stay
+                if args['to'] == self.spender and self.allowances[token] != MAX_UINT256:
+                    self.allowances[token] = max(self.allowances[token] - args['value'], 0)
+            if args['to'] == self.owner:
+                self.balances[token] += args['value']
+        elif name == 'Deposit':
+            if args['dst'] != self.owner:
+                return 0
+            self.balances[token] += args['wad']
+        elif name == 'Withdrawal':
+            if args['src'] != self.owner:
+                return 0
+            self.balances[token] -= args['wad']
+        return 1
+
+    def plan(self, orders, approve=True, wrap=True):
+        """ AllowancePlan of a batch of validator.OrderRequest, in the order they will be sent """
+        needed = locked_amounts(orders)
+        plan = AllowancePlan(needed)
+        balances = dict((token, self.balances.get(token, 0)) for token in needed)
+        allowances = dict((token, self.allowances.get(token, 0)) for token in needed)
+
+        short = needed.get(self.wrbtc, 0) - balances.get(self.wrbtc, 0)
+        if wrap and self.wrbtc is not None and short > 0:
+            plan.wrap = min(short, max(self.native_balance - self.native_reserve, 0))
+            balances[self.wrbtc] += plan.wrap
+        # the balances first: no approval for the orders that cannot pay
+        funded = dict()
+        for index, order in enumerate(orders):
+            token = (order.base_token if order.is_buy else order.secondary_token).lower()
+            if order.amount > balances[token]:
+                plan.failing[index] = 'Token transfer failed: the balance of {0} is {1} short'.format(
+                    token, order.amount - balances[token])
+                continue
+            balances[token] -= order.amount
+            funded[token] = funded.get(token, 0) + order.amount
+        for token in sorted(funded):
+            if approve and allowances[token] < funded[token]:
+                amount = MAX_UINT256 if self.unlimited else funded[token] * self.approval_factor
+                plan.approvals.append((token, amount))
+                allowances[token] = amount
+        for index, order in enumerate(orders):
+            token = (order.base_token if order.is_buy else order.secondary_token).lower()
+            if index in plan.failing:
+                continue
+            if order.amount > allowances[token]:
+                plan.failing[index] = 'Allowance too low: {0} short for {1}'.format(
+                    order.amount - allowances[token], token)
+            elif allowances[token] != MAX_UINT256:
+                allowances[token] -= order.amount
+        plan.failing = dict(sorted(plan.failing.items()))
+        return plan
+
+    async def execute(self, plan, client):
+        """ Sends the wrap and the approvals of the plan with an aio.AsyncTexClient, returns their receipts """
+        transactions = []
+        if plan.wrap:
+            transactions.append(client.transact(self.wrbtc, TOKEN_FUNCTIONS['deposit'].encode(), value=plan.wrap))
+        for token, amount in plan.approvals:
+            transactions.append(client.transact(token, TOKEN_FUNCTIONS['approve'].encode(self.spender, amount)))
+        receipts = await asyncio.gather(*transactions)
+        for receipt in receipts:
+            self.apply_logs(receipt.logs)
+        self.native_balance -= plan.wrap
+        return receipts
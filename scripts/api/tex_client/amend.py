@@ -0,0 +1,230 @@
+"""
+Amending the orders of an account: only the levels that moved are cancelled and inserted
+
+There is no amend in the contract, a quote is moved with a cancel (that charges the
+cancelation penalty) and a new insertion. OrderAmender diffs the desired orders of a
+pair (validator.OrderRequest, in wad) against the live orders of the account in the
+synced mirror: the orders at a desired price are kept, the others are cancelled and
+the missing levels inserted, all in one pipelined batch:
+
+    amender = OrderAmender(client, mirror, CommissionEngine(client.rpc, client.dex_address))
+    async with TransactionPipeline(client, window=32):
+        report = await amender.amend(base_token, secondary_token, ladder(...), is_buy=True)
+    print(report.kept, report.gas_saved, report.penalty_saved)
+
+With a tolerance, a live order within tolerance of a desired price is kept too, when no
+other level of the book is between the two prices, i.e. it still sorts the same.
+
+The cancels are sent first, the least competitive first, so the order before each one
+(its hint) is still in the book when it is mined; the insertions go through
+bulk.BulkOrders with hints from the book without the cancelled orders.
+
+The report compares the batch with cancelling every live order and inserting every
+desired one: the gas per cancel and per insertion is the mean of the batch (or an
+eth_estimateGas of a kept order if there were none), the penalties come from the
+reserved commission of the orders and the CommissionManager rates.
+"""
+
+import asyncio
+from collections import namedtuple
+from dataclasses import dataclass, field
+
+from .abi import FUNCTIONS
+from .bulk import BulkOrders, insertion_call, sort_value
+from .constants import OrderType
+from .hints import is_stale_hint_error
+from .orderbook import OrderbookMirror
+
+AmendPlan = namedtuple('AmendPlan', 'keep cancel insert')
+
+# a cancel of the batch: the live orderbook.Order, the hint it was sent with, and its receipt or error
+CancelResult = namedtuple('CancelResult', 'order hint receipt error')
+
+
+def diff_orders(live, desired, index=None, tolerance=0):
+    """
+    AmendPlan of live orderbook.Orders against desired OrderRequests of one side and type:
+    keep is a list of (live order, desired order), cancel of live orders, insert of desired ones
+    """
+    remaining = dict()
+    for order in live:
+        remaining.setdefault(order.sort_value, []).append(order)
+    keep, missing = [], []
+    for order in desired:
+        same_level = remaining.get(sort_value(order))
+        if same_level:
+            keep.append((same_level.pop(0), order))
+        else:
+            missing.append(order)
+    insert = []
+    for order in missing:
+        value = sort_value(order)
+        candidates = [live_order for level in remaining.values() for live_order in level
+                      if abs(live_order.sort_value - value) <= tolerance and
+                      (index is None or index.levels_between(live_order.sort_value, value) == 0)]
+        if not tolerance or not candidates:
+            insert.append(order)
+            continue
+        nearest = min(candidates, key=lambda live_order: abs(live_order.sort_value - value))
+        remaining[nearest.sort_value].remove(nearest)
+        keep.append((nearest, order))
+    cancel = [order for level in remaining.values() for order in level]
+    return AmendPlan(keep, cancel, insert)
+
+
+@dataclass
+class AmendReport(object):
+    """ What an amend sent, and what cancelling and inserting everything would have cost """
+    kept: int
+    gas_used: int
+    naive_gas: int
+    # None without a CommissionEngine
+    penalty: int = None
+    naive_penalty: int = None
+    cancels: list = field(default_factory=list)
+    inserts: list = field(default_factory=list)
+
+    @property
+    def gas_saved(self):
+        return None if self.naive_gas is None else self.naive_gas - self.gas_used
+
+    @property
+    def penalty_saved(self):
+        return None if self.penalty is None else self.naive_penalty - self.penalty
+
+    @property
+    def errors(self):
+        return [result.error for result in self.cancels + self.inserts if result.error is not None]
+
+
+def _index(side, order_type):
+    return side.market if order_type == OrderType.MARKET_ORDER else side.limit
+
+
+class OrderAmender(object):
+    """ Moves the orders of the client account to the desired levels with the fewest transactions """
+
+    def __init__(self, client, mirror, commissions=None, validator=None, tolerance=0):
+        self.client = client
+        self.mirror = mirror
+        self.commissions = commissions
+        self.validator = validator
+        self.tolerance = tolerance
+
+    def live_orders(self, base_token, secondary_token, is_buy):
+        """ Orders of the account in the limit and market indexes of a side """
+        owner = self.client.address.lower()
+        side = self.mirror.pair(base_token, secondary_token).side(is_buy)
+        return [order for order in list(side.limit) + list(side.market) if order.owner.lower() == owner]
+
+    def plan(self, base_token, secondary_token, desired, is_buy=None):
+        """ AmendPlan of the pair, of one side if is_buy is given, else both """
+        keep, cancel, insert = [], [], []
+        for side_is_buy in ([True, False] if is_buy is None else [bool(is_buy)]):
+            side = self.mirror.pair(base_token, secondary_token).side(side_is_buy)
+            live = self.live_orders(base_token, secondary_token, side_is_buy)
+            for order_type in (OrderType.LIMIT_ORDER, OrderType.MARKET_ORDER):
+                index = _index(side, order_type)
+                orders = [order for order in desired
+                          if bool(order.is_buy) == side_is_buy and order.order_type == order_type]
+                plan = diff_orders([order for order in live if side.index_for(order) is index], orders, index,
+                                   self.tolerance)
+                keep += plan.keep
+                cancel += plan.cancel
+                insert += plan.insert
+        return AmendPlan(keep, cancel, insert)
+
+    def cancel_steps(self, base_token, secondary_token, orders):
+        """ (order, hint) of the cancels, least competitive first in every index """
+        side_orders = dict()
+        for order in orders:
+            side_orders.setdefault((order.is_buy, order.is_market_order), []).append(order)
+        steps = []
+        for (is_buy, _), group in side_orders.items():
+            side = self.mirror.pair(base_token, secondary_token).side(is_buy)
+            index = side.index_for(group[0])
+            positions = dict((order.id, position) for position, order in enumerate(index))
+            for order in sorted(group, key=lambda order: positions[order.id], reverse=True):
+                steps.append((order, index.previous_id_of(order)))
+        return steps
+
+    def book_without(self, base_token, secondary_token, orders):
+        """ A mirror with a copy of the pair orderbook without the given orders """
+        mirror = OrderbookMirror()
+        original = self.mirror.pair(base_token, secondary_token)
+        book = mirror.pair(base_token, secondary_token)
+        for is_buy in (True, False):
+            side, copy = original.side(is_buy), book.side(is_buy)
+            copy.orders = dict(side.orders)
+            copy.limit, copy.market = side.limit.copy(), side.market.copy()
+        for order in orders:
+            book.side(order.is_buy).remove(order.id)
+        return mirror
+
+    async def _cancel(self, base_token, secondary_token, order, hint):
+        function = FUNCTIONS['cancelBuyOrder' if order.is_buy else 'cancelSellOrder']
+        try:
+            try:
+                receipt = await self.client.transact(
+                    self.client.dex_address, function.encode(base_token, secondary_token, order.id, hint))
+            except Exception as e:
+                if hint == 0 or not is_stale_hint_error(e):
+                    raise
+                hint = 0
+                receipt = await self.client.transact(
+                    self.client.dex_address, function.encode(base_token, secondary_token, order.id, hint))
+            return CancelResult(order, hint, receipt, None)
+        except Exception as e:
+            return CancelResult(order, hint, None, e)
+
+    async def amend(self, base_token, secondary_token, desired, is_buy=None):
+        """ Sends the cancels and insertions of the plan, returns an AmendReport """
+        desired = list(desired)
+        plan = self.plan(base_token, secondary_token, desired, is_buy)
+        cancels = [asyncio.ensure_future(self._cancel(base_token, secondary_token, order, hint))
+                   for order, hint in self.cancel_steps(base_token, secondary_token, plan.cancel)]
+        bulk = BulkOrders(self.client, self.book_without(base_token, secondary_token, plan.cancel), self.validator)
+        inserts = [result async for result in bulk.place(plan.insert)]
+        cancels = list(await asyncio.gather(*cancels))
+        return await self.report(base_token, secondary_token, plan, cancels, inserts)
+
+    async def _estimate(self, data):
+        try:
+            return int(await self.client.rpc.call('eth_estimateGas', [
+                {'from': self.client.address, 'to': self.client.dex_address, 'data': data}]), 16)
+        except Exception:
+            return None
+
+    async def report(self, base_token, secondary_token, plan, cancels, inserts):
+        receipts = dict(
+            cancel=[result.receipt for result in cancels if result.receipt is not None],
+            insert=[result.receipt for result in inserts if result.receipt is not None])
+        gas_used = sum(receipt.gas_used for receipt in receipts['cancel'] + receipts['insert'])
+        gas = dict((kind, sum(receipt.gas_used for receipt in kind_receipts) // len(kind_receipts))
+                   for kind, kind_receipts in receipts.items() if kind_receipts)
+        if plan.keep and 'cancel' not in gas:
+            order = plan.keep[0][0]
+            function = FUNCTIONS['cancelBuyOrder' if order.is_buy else 'cancelSellOrder']
+            gas['cancel'] = await self._estimate(function.encode(
+                base_token, secondary_token, order.id, self.mirror.pair(base_token, secondary_token)
+                .side(order.is_buy).index_for(order).previous_id_of(order)))
+        if plan.keep and 'insert' not in gas:
+            order = plan.keep[0][1]
+            side = self.mirror.pair(base_token, secondary_token).side(order.is_buy)
+            hint = _index(side, order.order_type).previous_id_for(sort_value(order))
+            function_name, args = insertion_call(order, hint)
+            gas['insert'] = await self._estimate(FUNCTIONS[function_name].encode(*args))
+        live_count = len(plan.keep) + len(plan.cancel)
+        desired_count = len(plan.keep) + len(plan.insert)
+        naive_gas = None
+        if (not live_count or gas.get('cancel')) and (not desired_count or gas.get('insert')):
+            naive_gas = live_count * gas.get('cancel', 0) + desired_count * gas.get('insert', 0)
+        report = AmendReport(kept=len(plan.keep), gas_used=gas_used, naive_gas=naive_gas, cancels=cancels,
+                             inserts=inserts)
+        if self.commissions is not None:
+            report.penalty = sum(self.commissions.cancelation_penalty(result.order.reserved_commission)
+                                 for result in cancels if result.receipt is not None)
+            report.naive_penalty = sum(self.commissions.cancelation_penalty(order.reserved_commission)
+                                       for order in [live for live, _ in plan.keep] + plan.cancel)
+        return report
+
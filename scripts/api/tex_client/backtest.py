@@ -0,0 +1,517 @@
+"""
+Replay of the indexed order flow tick by tick, with the orders of a strategy
+
+OrderFlow reads the orders (NewOrderInserted), cancelations (OrderCancelled) and ticks
+(TickStart, TickEnd) of a pair from an EventStore, or from events.Event objects like the
+ones of fake_dex.FakeExchange. Backtest replays them through the matching of
+simulator.match_tick: before every tick the strategy is called and can insert and
+cancel orders, and the fills, commissions and PnL of its orders are reported:
+
+    flow = OrderFlow.from_store(EventStore('events'), base_token, secondary_token)
+    result = Backtest(flow, SpreadQuoter(amount=to_wad(100), spread=to_wad('0.01')), rates=rates).run()
+    print(result.summary())
+
+    results = run_grid(flow, SpreadQuoter, {'amount': [to_wad(100)], 'spread': [to_wad('0.005'), to_wad('0.01')]})
+
+The events are not indexed by default: index them with
+EventIndexer(..., events=DEFAULT_EVENTS + ['NewOrderInserted', 'OrderCancelled']). The
+book starts empty at the first tick read.
+
+The rules are the ones of the contract: an order takes part from the first tick that
+starts after it was inserted, so the orders inserted while a tick runs (the ones
+logged between its TickStart and TickEnd, moved from the pending queues) wait for the
+next one; it expires once the tick reaches its expiresInTick, with the expiration
+penalty; the market orders are priced at marketPrice * multiplyFactor. The orders of
+the strategy reach the book latency ticks after they are inserted (0: in the tick
+they are inserted before), their reserved commission is the one of the rates with the
+base token as common base, the EMA following the closing prices from initial_ema.
+
+The contract does not log the market price: market_prices maps tick numbers to the
+price of the price provider, the last closing price of the replay is used otherwise.
+Injected orders change the matches, so the replay diverges from the history; the
+history orders keep their recorded amounts and cancelations. The strategy has no
+balance limits: base and secondary are its net token flows and the PnL is their value
+in base tokens at the closing price (wad).
+
+The open orders are kept as the arrays of simulator.OrderArrays, the strategy orders
+with negative ids. run_grid replays parameter grids (and several pairs) in a process
+pool; benchmarks/bench_backtest.py measures the ticks replayed per second.
+"""
+
+import itertools
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from .commissions import CommissionEngine, CommissionRates
+from .constants import DEFAULT_PRICE_PRECISION, RATE_PRECISION, OrderType
+from .event_store import limbs_to_ints
+from .fake_dex import DEFAULT_SMOOTHING_FACTOR
+from .simulator import OrderArrays, match_tick
+from .validator import limit_order
+from .wad import as_int_array, calculate_new_ema, convert_to_base
+
+LOG_INDEX_BITS = 20
+
+FILL_COLUMNS = ['tick', 'order_id', 'is_buy', 'amount_sent', 'received', 'commission', 'match_price']
+
+# an open order of the strategy
+OpenOrder = namedtuple('OpenOrder', 'id is_buy order_type amount reserved_commission price multiply_factor '
+                                    'expires_in_tick')
+
+
+def _positions(block_numbers, log_indexes):
+    """ Chain order of the logs as one int64 key """
+    return (np.asarray(block_numbers, dtype=np.int64) << LOG_INDEX_BITS) + np.asarray(log_indexes, dtype=np.int64)
+
+
+def _empty_orders():
+    return OrderArrays(prices=[], amounts=[])
+
+
+class OrderFlow(object):
+    """ The orders of a pair sorted by the tick they reach the book, the cancelations and the ticks """
+
+    def __init__(self, base_token, secondary_token, orders, cancels, starts, ends,
+                 price_precision=DEFAULT_PRICE_PRECISION):
+        """
+        orders, cancels, starts and ends are columns (position in chain order, see
+        _positions, and the arguments) of the NewOrderInserted, OrderCancelled, TickStart
+        and TickEnd events of the pair
+        """
+        self.base_token = base_token.lower()
+        self.secondary_token = secondary_token.lower()
+        self.price_precision = price_precision
+        order = np.argsort(starts['position'], kind='stable')
+        start_positions = starts['position'][order]
+        self.ticks = np.asarray(starts['tick'], dtype=np.int64)[order]
+        closing = dict(zip(np.asarray(ends['tick'], dtype=np.int64).tolist(), ends['closing_price'].tolist()))
+        self.closing_prices = as_int_array([closing.get(tick, 0) for tick in self.ticks.tolist()])
+
+        # the tick of the first TickStart after an event; after the last one: not replayed
+        def ticks_of(positions):
+            indexes = np.searchsorted(start_positions, positions)
+            ticks = np.full(len(positions), np.iinfo(np.int64).max, dtype=np.int64)
+            ticks[indexes < len(self.ticks)] = self.ticks[indexes[indexes < len(self.ticks)]]
+            return ticks
+
+        arrival = ticks_of(orders['position'])
+        order = np.lexsort((orders['position'], arrival))
+        self.arrival_ticks = arrival[order]
+        self.is_buy = np.asarray(orders['is_buy'], dtype=bool)[order]
+        self.orders = OrderArrays(
+            prices=orders['price'], amounts=orders['exchangeable_amount'], ids=orders['id'],
+            reserved_commissions=orders['reserved_commission'], order_types=orders['order_type'],
+            multiply_factors=orders['multiply_factor'], expires_in_tick=orders['expires_in_tick']).take(order)
+        cancel_ticks = ticks_of(cancels['position'])
+        order = np.lexsort((cancels['position'], cancel_ticks))
+        self.cancel_ticks = cancel_ticks[order]
+        self.cancelled_ids = np.asarray(cancels['id'], dtype=np.int64)[order]
+
+    def __len__(self):
+        return len(self.ticks)
+
+    @property
+    def pair(self):
+        return self.base_token, self.secondary_token
+
+    def arrivals(self, tick):
+        """ Slice of the orders reaching the book at tick """
+        return slice(*np.searchsorted(self.arrival_ticks, [tick, tick + 1]))
+
+    def cancelations(self, tick):
+        """ Ids of the orders cancelled before the matching of tick """
+        start, end = np.searchsorted(self.cancel_ticks, [tick, tick + 1])
+        return self.cancelled_ids[start:end]
+
+    @classmethod
+    def from_events(cls, events, base_token, secondary_token, price_precision=DEFAULT_PRICE_PRECISION):
+        """ From events.Event objects in chain order, e.g. FakeExchange.events """
+        pair = (base_token.lower(), secondary_token.lower())
+        orders, cancels, starts, ends = [], [], [], []
+        ids = set()
+        for event in events:
+            args, position = event.args, (event.block_number << LOG_INDEX_BITS) + event.log_index
+            if event.name == 'NewOrderInserted':
+                if (args['baseTokenAddress'].lower(), args['secondaryTokenAddress'].lower()) != pair:
+                    continue
+                ids.add(args['id'])
+                orders.append((position, args['id'], args['isBuy'], args['orderType'], args['exchangeableAmount'],
+                               args['reservedCommission'], args['price'], args['multiplyFactor'],
+                               args['expiresInTick']))
+            elif event.name == 'OrderCancelled':
+                if args['id'] in ids:
+                    cancels.append((position, args['id']))
+            elif event.name in ('TickStart', 'TickEnd'):
+                if (args['baseTokenAddress'].lower(), args['secondaryTokenAddress'].lower()) != pair:
+                    continue
+                if event.name == 'TickStart':
+                    starts.append((position, args['number']))
+                else:
+                    ends.append((args['number'], args['closingPrice']))
+
+        def columns(rows, names):
+            values = list(zip(*rows)) or [[]] * len(names)
+            return dict((name, np.asarray(column, dtype=object if name in _INT_COLUMNS else np.int64))
+                        for name, column in zip(names, values))
+        return cls(base_token, secondary_token, columns(orders, _ORDER_COLUMNS),
+                   columns(cancels, ['position', 'id']), columns(starts, ['position', 'tick']),
+                   columns(ends, ['tick', 'closing_price']), price_precision)
+
+    @classmethod
+    def from_store(cls, store, base_token, secondary_token, from_tick=None, to_tick=None,
+                   price_precision=DEFAULT_PRICE_PRECISION):
+        """ From the events of the pair in an event_store.EventStore, between the ticks (inclusive) """
+        def read(event_name):
+            table = store.read(event_name, base_token, secondary_token, from_tick=from_tick, to_tick=to_tick)
+            return table, _positions(table['block_number'], table['log_index'])
+
+        inserted, positions = read('NewOrderInserted')
+        orders = dict(position=positions, id=limbs_to_ints(inserted['id']).astype(np.int64),
+                      is_buy=np.asarray(inserted['isBuy'], dtype=bool),
+                      order_type=np.asarray(inserted['orderType'], dtype=np.int64),
+                      exchangeable_amount=limbs_to_ints(inserted['exchangeableAmount']),
+                      reserved_commission=limbs_to_ints(inserted['reservedCommission']),
+                      price=limbs_to_ints(inserted['price']),
+                      multiply_factor=limbs_to_ints(inserted['multiplyFactor']),
+                      expires_in_tick=np.asarray(inserted['expiresInTick'], dtype=np.int64))
+        cancelled, positions = read('OrderCancelled')
+        cancels = dict(position=positions, id=limbs_to_ints(cancelled['id']).astype(np.int64))
+        started, positions = read('TickStart')
+        starts = dict(position=positions, tick=np.asarray(started['number'], dtype=np.int64))
+        ended, _ = read('TickEnd')
+        ends = dict(tick=np.asarray(ended['number'], dtype=np.int64),
+                    closing_price=limbs_to_ints(ended['closingPrice']))
+        return cls(base_token, secondary_token, orders, cancels, starts, ends, price_precision)
+
+
+_ORDER_COLUMNS = ['position', 'id', 'is_buy', 'order_type', 'exchangeable_amount', 'reserved_commission', 'price',
+                  'multiply_factor', 'expires_in_tick']
+# uint256 columns, kept as python ints
+_INT_COLUMNS = {'exchangeable_amount', 'reserved_commission', 'price', 'multiply_factor', 'closing_price'}
+
+
+@dataclass
+class BacktestResult(object):
+    base_token: str
+    secondary_token: str
+    # one value per tick replayed
+    ticks: np.ndarray
+    closing_prices: np.ndarray
+    # base + secondary valued in base tokens at the closing price, after the tick
+    equity: np.ndarray
+    # FILL_COLUMNS -> arrays, the fills of the strategy (and of the history with history_fills)
+    fills: dict
+    # net token flows of the strategy, commissions included
+    base: int
+    secondary: int
+    fees_base: int
+    fees_secondary: int
+    inserted: int = 0
+    rejected: int = 0
+    cancelled: int = 0
+    expired: int = 0
+    params: dict = None
+
+    @property
+    def pnl(self):
+        return int(self.equity[-1]) if len(self.equity) else 0
+
+    @property
+    def strategy_fills(self):
+        return np.flatnonzero(self.fills['order_id'] < 0)
+
+    @property
+    def volume(self):
+        """ Base tokens paid and received by the strategy """
+        rows = self.strategy_fills
+        is_buy = self.fills['is_buy'][rows]
+        return int(self.fills['amount_sent'][rows][is_buy].sum()) + int(self.fills['received'][rows][~is_buy].sum())
+
+    def summary(self):
+        """ The figures of the strategy in token units """
+        return dict(ticks=len(self.ticks), pnl=self.pnl / RATE_PRECISION, fills=len(self.strategy_fills),
+                    volume=self.volume / RATE_PRECISION, base=self.base / RATE_PRECISION,
+                    secondary=self.secondary / RATE_PRECISION, fees_base=self.fees_base / RATE_PRECISION,
+                    fees_secondary=self.fees_secondary / RATE_PRECISION, inserted=self.inserted,
+                    rejected=self.rejected, cancelled=self.cancelled, expired=self.expired, params=self.params)
+
+
+class Backtest(object):
+    """ Replays an OrderFlow calling strategy(backtest) before every tick """
+
+    def __init__(self, flow, strategy=None, rates=None, market_prices=None, latency=0, initial_price=None,
+                 initial_ema=None, smoothing_factor=DEFAULT_SMOOTHING_FACTOR, history_fills=False):
+        self.flow = flow
+        self.strategy = strategy
+        self.commissions = CommissionEngine(None, None, rates=rates or CommissionRates(0, 0, 0, 0))
+        self.market_prices = market_prices or dict()
+        self.latency = latency
+        self.smoothing_factor = smoothing_factor
+        self.history_fills = history_fills
+        if initial_price is None:
+            prices = flow.closing_prices[flow.closing_prices > 0]
+            initial_price = int(prices[0]) if len(prices) else 0
+        self.closing_price = initial_price
+        self.ema_price = initial_price if initial_ema is None else initial_ema
+        self.tick_number = None
+        self.market_price = initial_price
+        self.buys = _empty_orders()
+        self.sells = _empty_orders()
+        # tick -> strategy orders that reach the book then: (is_buy, OrderArrays fields)
+        self.pending = dict()
+        self.base = self.secondary = self.fees_base = self.fees_secondary = 0
+        self.inserted = self.rejected = self.cancelled = self.expired = 0
+        self._ids = itertools.count(1)
+        self._fills = []
+        self._equity = []
+        self._closing_prices = []
+
+    # What the strategy uses
+
+    @property
+    def pair(self):
+        return self.flow.pair
+
+    def best_bid(self):
+        prices = self.buys.prices[self.buys.order_types == OrderType.LIMIT_ORDER]
+        return int(prices.max()) if len(prices) else None
+
+    def best_ask(self):
+        prices = self.sells.prices[self.sells.order_types == OrderType.LIMIT_ORDER]
+        return int(prices.min()) if len(prices) else None
+
+    def open_orders(self):
+        """ OpenOrder of the strategy orders in the book """
+        orders = []
+        for is_buy, side in ((True, self.buys), (False, self.sells)):
+            for position in np.flatnonzero(side.ids < 0):
+                orders.append(OpenOrder(
+                    int(side.ids[position]), is_buy, int(side.order_types[position]), side.amounts[position],
+                    side.reserved_commissions[position], side.prices[position], side.multiply_factors[position],
+                    int(side.expires_in_tick[position])))
+        return orders
+
+    def order_price(self, is_buy):
+        """ _priceCommonBase of an order, with the base token of the pair as the common base """
+        if is_buy:
+            return RATE_PRECISION
+        return convert_to_base(RATE_PRECISION, self.ema_price, self.flow.price_precision)
+
+    def insert(self, order):
+        """ Inserts a validator.OrderRequest of the pair, returns its id or None if the contract would revert """
+        fee = self.commissions.initial_fee(order.amount, self.order_price(order.is_buy)) if self.ema_price else None
+        pair = (order.base_token.lower(), order.secondary_token.lower())
+        if fee is None or fee > order.amount or pair != self.pair:
+            self.rejected += 1
+            return None
+        order_id = -next(self._ids)
+        self.pending.setdefault(self.tick_number + self.latency, []).append((
+            bool(order.is_buy), order_id, order.amount - fee, fee, order.order_type, order.price,
+            order.multiply_factor, self.tick_number + order.lifespan))
+        self.inserted += 1
+        return order_id
+
+    def cancel(self, order_id):
+        """ Cancels a strategy order in the book with the cancelation penalty, returns if it was there """
+        self._add_pending()
+        for is_buy, side in ((True, self.buys), (False, self.sells)):
+            found = np.flatnonzero(side.ids == order_id)
+            if not len(found):
+                continue
+            penalty = self.commissions.cancelation_penalty(side.reserved_commissions[found[0]])
+            self._charge(is_buy, penalty)
+            self._remove(is_buy, side.ids != order_id)
+            self.cancelled += 1
+            return True
+        return False
+
+    # Replay
+
+    def _charge(self, is_buy, commission):
+        if is_buy:
+            self.base -= commission
+            self.fees_base += commission
+        else:
+            self.secondary -= commission
+            self.fees_secondary += commission
+
+    def _remove(self, is_buy, keep):
+        if is_buy:
+            self.buys = self.buys.take(keep)
+        else:
+            self.sells = self.sells.take(keep)
+
+    def _add(self, is_buy, orders):
+        if not len(orders):
+            return
+        if is_buy:
+            self.buys = OrderArrays.concatenate([self.buys, orders])
+        else:
+            self.sells = OrderArrays.concatenate([self.sells, orders])
+
+    def _add_pending(self):
+        """ The strategy orders due at the current tick to the book """
+        due = self.pending.pop(self.tick_number, None)
+        for is_buy in (True, False):
+            rows = [row[1:] for row in due or () if row[0] == is_buy]
+            if rows:
+                ids, amounts, fees, order_types, prices, multiply_factors, expires = zip(*rows)
+                self._add(is_buy, OrderArrays(prices, amounts, ids, fees, order_types, multiply_factors, expires))
+
+    def _arrive(self, tick):
+        """ The history orders and cancelations of tick """
+        flow = self.flow
+        arrivals = flow.arrivals(tick)
+        if arrivals.start < arrivals.stop:
+            orders, is_buy = flow.orders.take(arrivals), flow.is_buy[arrivals]
+            self._add(True, orders.take(is_buy))
+            self._add(False, orders.take(~is_buy))
+        cancelled = flow.cancelations(tick)
+        if len(cancelled):
+            self.buys = self.buys.take(~np.isin(self.buys.ids, cancelled))
+            self.sells = self.sells.take(~np.isin(self.sells.ids, cancelled))
+
+    def _match(self, tick):
+        # most ticks do not cross, without the sorts of the simulation
+        buy_prices = self.buys.spot_prices(self.market_price)[self.buys.expires_in_tick > tick]
+        sell_prices = self.sells.spot_prices(self.market_price)[self.sells.expires_in_tick > tick]
+        if not len(buy_prices) or not len(sell_prices) or buy_prices.max() < sell_prices.min():
+            return 0, 0
+        result = match_tick(self.buys, self.sells, self.market_price, tick, self.flow.price_precision)
+        if not len(result.buy):
+            return 0, 0
+        buy_ids = self.buys.ids[result.buy.astype(np.int64)]
+        sell_ids = self.sells.ids[result.sell.astype(np.int64)]
+        price = result.simulation.emergent_price
+        mine = buy_ids < 0
+        if mine.any():
+            self.base -= int(result.buyer_sent[mine].sum())
+            self.secondary += int(result.limiting_amount[mine].sum())
+            self._charge(True, int(result.buyer_commission[mine].sum()))
+        mine = sell_ids < 0
+        if mine.any():
+            self.secondary -= int(result.limiting_amount[mine].sum())
+            self.base += int(result.buyer_sent[mine].sum())
+            self._charge(False, int(result.seller_commission[mine].sum()))
+        for is_buy, ids, sent, received, commission in (
+                (True, buy_ids, result.buyer_sent, result.limiting_amount, result.buyer_commission),
+                (False, sell_ids, result.limiting_amount, result.buyer_sent, result.seller_commission)):
+            rows = slice(None) if self.history_fills else ids < 0
+            count = len(ids[rows])
+            if count:
+                self._fills.append((np.full(count, tick, dtype=np.int64), ids[rows], np.full(count, is_buy),
+                                    sent[rows], received[rows], commission[rows], as_int_array([price] * count)))
+        self.buys, self.sells = result.buys, result.sells
+        return price, result.simulation.matches_amount
+
+    def _expire(self, tick):
+        """ Drops the filled orders and processExpired of the ones that expired at tick """
+        for is_buy, side in ((True, self.buys), (False, self.sells)):
+            expired = side.expires_in_tick <= tick
+            mine = expired & (side.ids < 0)
+            if mine.any():
+                penalties = self.commissions.expiration_penalty(side.reserved_commissions[mine])
+                self._charge(is_buy, int(np.sum(penalties)))
+                self.expired += int(mine.sum())
+            keep = ~expired & np.asarray(side.amounts > 0, dtype=bool)
+            if not keep.all():
+                self._remove(is_buy, keep)
+
+    def step(self, tick):
+        """ Replays one tick """
+        self.tick_number = tick
+        self.market_price = self.market_prices.get(tick, self.closing_price)
+        self._arrive(tick)
+        self._add_pending()
+        if self.strategy is not None:
+            self.strategy(self)
+            self._add_pending()
+        price, matches_amount = self._match(tick)
+        self._expire(tick)
+        if matches_amount:
+            self.closing_price = price
+            self.ema_price = calculate_new_ema(self.ema_price, price, self.smoothing_factor)
+        self._closing_prices.append(price)
+        self._equity.append(self.base + self.secondary * self.closing_price // self.flow.price_precision)
+
+    def run(self, from_tick=None, to_tick=None):
+        """ Replays the ticks of the flow (between the given ones, inclusive), returns a BacktestResult """
+        ticks = self.flow.ticks
+        if from_tick is not None:
+            ticks = ticks[ticks >= from_tick]
+        if to_tick is not None:
+            ticks = ticks[ticks <= to_tick]
+        for tick in ticks.tolist():
+            self.step(tick)
+        return self.result(ticks)
+
+    def result(self, ticks):
+        fills = [np.concatenate(column) for column in zip(*self._fills)] if self._fills else \
+            [np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)] + \
+            [as_int_array([])] * 4
+        return BacktestResult(
+            self.flow.base_token, self.flow.secondary_token, ticks, as_int_array(self._closing_prices),
+            as_int_array(self._equity), dict(zip(FILL_COLUMNS, fills)), self.base, self.secondary, self.fees_base,
+            self.fees_secondary, self.inserted, self.rejected, self.cancelled, self.expired)
+
+
+class SpreadQuoter(object):
+    """ Example strategy: a buy and a sell limit order at spread (wad) around the market price, renewed """
+
+    def __init__(self, amount, spread, lifespan=1):
+        # amount in base tokens of each side
+        self.amount = amount
+        self.spread = spread
+        self.lifespan = lifespan
+
+    def __call__(self, backtest):
+        price = backtest.market_price
+        # its orders waiting for the latency count as quoting too
+        if not price or backtest.open_orders() or backtest.pending:
+            return
+        base_token, secondary_token = backtest.pair
+        precision = backtest.flow.price_precision
+        buy_price = price * (RATE_PRECISION - self.spread) // RATE_PRECISION
+        sell_price = price * (RATE_PRECISION + self.spread) // RATE_PRECISION
+        backtest.insert(limit_order(base_token, secondary_token, self.amount, buy_price, self.lifespan, True))
+        backtest.insert(limit_order(base_token, secondary_token, self.amount * precision // sell_price, sell_price,
+                                     self.lifespan, False))
+
+
+# Parameter grids
+
+_flows = None
+
+
+def _set_flows(flows):
+    global _flows
+    _flows = flows
+
+
+def _run_task(task):
+    index, strategy_factory, params, options = task
+    result = Backtest(_flows[index], strategy_factory(**params), **options).run()
+    result.params = dict(params, pair=_flows[index].pair)
+    return result
+
+
+def run_grid(flows, strategy_factory, grid, processes=None, **options):
+    """
+    Backtest of strategy_factory(**params) for every combination of the grid (name ->
+    values) and every flow, in a pool of processes (None: one per CPU, 0: in this
+    process). strategy_factory must be picklable (a module level class or function);
+    options go to every Backtest. Returns the BacktestResult list, with their params.
+    """
+    flows = [flows] if isinstance(flows, OrderFlow) else list(flows)
+    names = list(grid)
+    tasks = [(index, strategy_factory, dict(zip(names, values)), options)
+             for index in range(len(flows)) for values in itertools.product(*[grid[name] for name in names])]
+    if processes == 0:
+        _set_flows(flows)
+        return [_run_task(task) for task in tasks]
+    # the flows go to every worker once
+    with ProcessPoolExecutor(processes, initializer=_set_flows, initargs=(flows,)) as executor:
+        return list(executor.map(_run_task, tasks))
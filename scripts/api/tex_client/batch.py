@@ -0,0 +1,195 @@
+"""
+Status of every token pair in one JSON-RPC round trip
+
+The scripts pair_info.py, tick_stage.py, tick_is_running.py, ... make one eth_call each
+for one pair. BatchReader encodes all the getters for all the pairs with the static
+codec of abi.py and sends them as one JSON-RPC batch; the results come back as a
+table of PairStatus rows:
+
+    reader = BatchReader.from_client(client)
+    table = reader.pairs_status()
+    print(table.format())
+    for row in table:
+        print(row.base_token, row.tick_stage, row.market_price)
+
+The pairs are read with getTokenPairs() the first time and cached, refresh_pairs()
+reads them again (e.g. after a TokenPairListed event).
+"""
+
+from dataclasses import asdict, dataclass, field, fields
+from typing import Optional
+
+from .abi import FUNCTIONS
+from .constants import TickStage
+from .session import RPCError
+
+# (column, function, extra arguments after the pair)
+PAIR_CALLS = [
+    ('status', 'getTokenPairStatus', ()),
+    ('tick_stage', 'getTickStage', ()),
+    ('tick_is_running', 'tickIsRunning', ()),
+    ('market_price', 'getMarketPrice', ()),
+    ('buy_orders_length', 'buyOrdersLength', ()),
+    ('sell_orders_length', 'sellOrdersLength', ()),
+    ('pending_buy_orders_length', 'pendingBuyOrdersLength', ()),
+    ('pending_sell_orders_length', 'pendingSellOrdersLength', ()),
+    ('pending_buy_market_orders_length', 'pendingMarketOrdersLength', (True,)),
+    ('pending_sell_market_orders_length', 'pendingMarketOrdersLength', (False,)),
+]
+
+STATUS_FIELDS = [
+    ('emergentPrice', 'emergent_price'),
+    ('lastBuyMatchId', 'last_buy_match_id'),
+    ('lastBuyMatchAmount', 'last_buy_match_amount'),
+    ('lastSellMatchId', 'last_sell_match_id'),
+    ('tickNumber', 'tick_number'),
+    ('nextTickBlock', 'next_tick_block'),
+    ('lastTickBlock', 'last_tick_block'),
+    ('lastClosingPrice', 'last_closing_price'),
+    ('disabled', 'disabled'),
+    ('emaPrice', 'ema_price'),
+    ('smoothingFactor', 'smoothing_factor'),
+]
+
+
+@dataclass
+class PairStatus(object):
+    """ One row of the status table; None when the call failed (see errors) """
+    base_token: str
+    secondary_token: str
+    emergent_price: Optional[int] = None
+    last_buy_match_id: Optional[int] = None
+    last_buy_match_amount: Optional[int] = None
+    last_sell_match_id: Optional[int] = None
+    tick_number: Optional[int] = None
+    next_tick_block: Optional[int] = None
+    last_tick_block: Optional[int] = None
+    last_closing_price: Optional[int] = None
+    disabled: Optional[bool] = None
+    ema_price: Optional[int] = None
+    smoothing_factor: Optional[int] = None
+    market_price: Optional[int] = None
+    tick_stage: Optional[TickStage] = None
+    tick_is_running: Optional[bool] = None
+    buy_orders_length: Optional[int] = None
+    sell_orders_length: Optional[int] = None
+    pending_buy_orders_length: Optional[int] = None
+    pending_sell_orders_length: Optional[int] = None
+    pending_buy_market_orders_length: Optional[int] = None
+    pending_sell_market_orders_length: Optional[int] = None
+    # column -> error message of the failed calls, e.g. the price provider not answering
+    errors: dict = field(default_factory=dict)
+
+
+COLUMNS = [f.name for f in fields(PairStatus) if f.name != 'errors']
+
+
+class StatusTable(object):
+    """ PairStatus rows with column access """
+
+    def __init__(self, rows, block):
+        self.rows = rows
+        self.block = block
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        return self.rows[index]
+
+    def pair(self, base_token, secondary_token):
+        key = (base_token.lower(), secondary_token.lower())
+        for row in self.rows:
+            if (row.base_token.lower(), row.secondary_token.lower()) == key:
+                return row
+        return None
+
+    def column(self, name):
+        return [getattr(row, name) for row in self.rows]
+
+    def to_records(self):
+        return [asdict(row) for row in self.rows]
+
+    def format(self, columns=None):
+        columns = columns or ['base_token', 'secondary_token', 'tick_number', 'tick_stage', 'buy_orders_length',
+                              'sell_orders_length', 'emergent_price', 'market_price']
+        cells = [columns] + [[_format_cell(getattr(row, column)) for column in columns] for row in self.rows]
+        widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+        return '\n'.join('  '.join(cell.ljust(width) for cell, width in zip(line, widths)) for line in cells)
+
+
+def _format_cell(value):
+    if isinstance(value, TickStage):
+        return value.name
+    return '-' if value is None else str(value)
+
+
+class BatchReader(object):
+    """ Sends the read calls of the DEX as JSON-RPC batches """
+
+    def __init__(self, rpc, dex_address, pairs=None):
+        self.rpc = rpc
+        self.dex_address = dex_address
+        self._pairs = pairs
+
+    @classmethod
+    def from_client(cls, client):
+        return cls(client.rpc, client.dex_address)
+
+    def _eth_call(self, function_name, args, block):
+        data = FUNCTIONS[function_name].encode(*args)
+        return 'eth_call', [{'to': self.dex_address, 'data': data}, block]
+
+    def call(self, function_name, *args, **kwargs):
+        """ Single decoded call, e.g. reader.call('getMarketPrice', base_token, secondary_token) """
+        method, params = self._eth_call(function_name, args, kwargs.get('block', 'latest'))
+        return FUNCTIONS[function_name].decode_output(self.rpc.call(method, params))
+
+    def batch_call(self, calls, block='latest'):
+        """ [(function name, args)] in one batch; decoded values, RPCError for the failed ones """
+        results = self.rpc.batch([self._eth_call(name, args, block) for name, args in calls], raise_on_error=False)
+        return [result if isinstance(result, RPCError) else FUNCTIONS[name].decode_output(result)
+                for (name, _), result in zip(calls, results)]
+
+    def refresh_pairs(self):
+        self._pairs = self.call('getTokenPairs')
+        return self._pairs
+
+    @property
+    def pairs(self):
+        if self._pairs is None:
+            self.refresh_pairs()
+        return self._pairs
+
+    def pairs_status(self, pairs=None, block='latest'):
+        """ Status table of the given pairs (all the listed ones by default) in one batch """
+        pairs = self.pairs if pairs is None else pairs
+        calls = []
+        for base_token, secondary_token in pairs:
+            for _, function_name, extra_args in PAIR_CALLS:
+                calls.append(self._eth_call(function_name, (base_token, secondary_token) + extra_args, block))
+        results = self.rpc.batch(calls, raise_on_error=False)
+
+        rows = []
+        for i, (base_token, secondary_token) in enumerate(pairs):
+            row = PairStatus(base_token, secondary_token)
+            pair_results = results[i * len(PAIR_CALLS):(i + 1) * len(PAIR_CALLS)]
+            for (column, function_name, _), result in zip(PAIR_CALLS, pair_results):
+                if isinstance(result, RPCError):
+                    row.errors[column] = str(result)
+                    continue
+                value = FUNCTIONS[function_name].decode_output(result)
+                if column == 'status':
+                    for key, name in STATUS_FIELDS:
+                        setattr(row, name, value[key])
+                    if row.market_price is None:
+                        row.market_price = value['marketPrice']
+                elif column == 'tick_stage':
+                    row.tick_stage = TickStage(value)
+                else:
+                    setattr(row, column, value)
+            rows.append(row)
+        return StatusTable(rows, block)
@@ -0,0 +1,205 @@
+"""
+Bulk placement of orders: ladders and grids sent as one pipelined batch
+
+BulkOrders takes a list (or generator) of validator.OrderRequest (amounts and prices in
+wad), approves the total locked amount of every token once, and sends the insertions
+through the AsyncTexClient (its TransactionPipeline if started), yielding the result of
+every order as its receipt arrives:
+
+    orders = ladder(base_token, secondary_token, is_buy=True, best_price=to_wad('0.0001'),
+                    step=to_wad('0.000001'), levels=30, amount=to_wad(10), lifespan=5)
+    async with TransactionPipeline(client, window=32):
+        async for result in BulkOrders(client, mirror, validator).place(orders):
+            print(result.index, result.order_id, result.error)
+
+The orders of every side are sent from the least competitive to the most competitive
+one. Each new order then goes right after an order that is already in the synced
+mirror (its hint), before the orders of the batch sent earlier, so every hint is known
+upfront and the contract only checks the two neighbours instead of walking the book.
+An order with the same price as an earlier one of the batch goes after it: it waits
+for that receipt to take its id from the NewOrderInserted log. If another order lands
+in between and the contract rejects a hint, the order is sent again without hint.
+
+Given an allowances.AllowancePlanner, the approvals and the wrap of WRBTC come from its
+tracked allowances and balances instead of reading them, and the orders whose transfer
+would fail are rejected before anything is sent.
+"""
+
+import asyncio
+from collections import namedtuple
+
+from .abi import FUNCTIONS, TOKEN_FUNCTIONS
+from .constants import NO_HINT, OrderType
+from .events import EventDecoder
+from .hints import is_stale_hint_error
+from .validator import OrderRejected, OrderRequest, limit_order
+
+# an order and the result of its insertion; order_id is None for pending orders without log
+BulkResult = namedtuple('BulkResult', 'index order hint receipt order_id error')
+
+# (index in the batch, order, hint): hint is an order id, or the Step of the order it goes after
+Step = namedtuple('Step', 'index order hint')
+
+
+def ladder(base_token, secondary_token, is_buy, best_price, step, levels, amount, lifespan):
+    """ Limit orders of amount at best_price and the next levels - 1 prices, step away from the spread """
+    direction = -1 if is_buy else 1
+    return [limit_order(base_token, secondary_token, amount, best_price + direction * i * step, lifespan, is_buy)
+            for i in range(levels)]
+
+
+def grid(base_token, secondary_token, mid_price, step, levels, amount, lifespan):
+    """ A ladder of levels buy orders under mid_price and one of levels sell orders over it """
+    return (ladder(base_token, secondary_token, True, mid_price - step, step, levels, amount, lifespan) +
+            ladder(base_token, secondary_token, False, mid_price + step, step, levels, amount, lifespan))
+
+
+def sort_value(order):
+    return order.multiply_factor if order.order_type == OrderType.MARKET_ORDER else order.price
+
+
+def plan(orders, mirror, skip=()):
+    """
+    Steps in sending order: per pair, side and type the least competitive order first,
+    with its hint in the mirror (or the step it goes after, for repeated prices);
+    the orders at the indexes in skip are left out
+    """
+    groups = dict()
+    for index, order in enumerate(orders):
+        if index in skip:
+            continue
+        key = (order.base_token.lower(), order.secondary_token.lower(), bool(order.is_buy), order.order_type)
+        groups.setdefault(key, []).append((index, order))
+    steps = []
+    for (base_token, secondary_token, is_buy, order_type), group in groups.items():
+        side = mirror.pair(base_token, secondary_token).side(is_buy)
+        book_index = side.market if order_type == OrderType.MARKET_ORDER else side.limit
+        # buy orders by ascending value, sell orders by descending value; the sort is stable,
+        # so the orders with the same value keep their order in the batch
+        group = sorted(group, key=lambda item: sort_value(item[1]), reverse=not is_buy)
+        last_of_value = dict()
+        for index, order in group:
+            value = sort_value(order)
+            previous_step = last_of_value.get(value)
+            hint = book_index.previous_id_for(value) if previous_step is None else previous_step
+            last_of_value[value] = Step(index, order, hint)
+            steps.append(last_of_value[value])
+    return steps
+
+
+def insertion_call(order, hint):
+    """ (function name, args) of the *After insertion of an OrderRequest """
+    pair = (order.base_token, order.secondary_token)
+    if order.order_type == OrderType.MARKET_ORDER:
+        return 'insertMarketOrderAfter', pair + (order.amount, order.multiply_factor, hint, order.lifespan,
+                                                 bool(order.is_buy))
+    function_name = 'insertBuyLimitOrderAfter' if order.is_buy else 'insertSellLimitOrderAfter'
+    return function_name, pair + (order.amount, order.price, order.lifespan, hint)
+
+
+def locked_amounts(orders):
+    """ token (lowercase) -> total amount the orders lock: base token for buys, secondary for sells """
+    totals = dict()
+    for order in orders:
+        token = (order.base_token if order.is_buy else order.secondary_token).lower()
+        totals[token] = totals.get(token, 0) + order.amount
+    return totals
+
+
+class BulkOrders(object):
+    """ Sends batches of orders with one approval per token and precomputed hints """
+
+    def __init__(self, client, mirror, validator=None, planner=None):
+        self.client = client
+        self.mirror = mirror
+        self.validator = validator
+        # allowances.AllowancePlanner: approvals and wrap from the tracked state, failing orders rejected
+        self.planner = planner
+        self.decoder = EventDecoder(['NewOrderInserted', 'NewOrderAddedToPendingQueue'])
+        self.approvals_count = 0
+        self.hintless_count = 0
+
+    async def allowances(self, tokens):
+        function = TOKEN_FUNCTIONS['allowance']
+        results = await self.client.rpc.batch([
+            ('eth_call', [{'to': token, 'data': function.encode(self.client.address, self.client.dex_address)},
+                          'latest'])
+            for token in tokens])
+        return [function.decode_output(result) for result in results]
+
+    async def approve(self, orders):
+        """ Approves the total amount of the orders for every token whose allowance is short """
+        totals = locked_amounts(orders)
+        tokens = sorted(totals)
+        approvals = []
+        for token, allowance in zip(tokens, await self.allowances(tokens)):
+            if allowance < totals[token]:
+                data = TOKEN_FUNCTIONS['approve'].encode(self.client.dex_address, totals[token])
+                approvals.append(self.client.transact(token, data))
+        # the insertions are estimated against the approvals, so they go first
+        await asyncio.gather(*approvals)
+        self.approvals_count += len(approvals)
+        return len(approvals)
+
+    def order_id(self, receipt):
+        for log in receipt.logs:
+            event = self.decoder.decode(log)
+            if event is not None:
+                return event.args['id']
+        return None
+
+    async def _insert(self, step, hint):
+        function_name, args = insertion_call(step.order, hint)
+        data = FUNCTIONS[function_name].encode(*args)
+        try:
+            return await self.client.transact(self.client.dex_address, data), hint
+        except Exception as e:
+            if hint == NO_HINT or not is_stale_hint_error(e):
+                raise
+        self.hintless_count += 1
+        function_name, args = insertion_call(step.order, NO_HINT)
+        return await self.client.transact(self.client.dex_address, FUNCTIONS[function_name].encode(*args)), NO_HINT
+
+    async def _run(self, step, results):
+        hint = step.hint
+        try:
+            if isinstance(hint, Step):
+                hint = (await results[hint.index]).order_id
+                if hint is None:
+                    raise ValueError('The order {0} it goes after was not inserted'.format(step.hint.index))
+            receipt, hint = await self._insert(step, hint)
+            if self.planner is not None:
+                self.planner.apply_logs(receipt.logs)
+            return BulkResult(step.index, step.order, hint, receipt, self.order_id(receipt), None)
+        except Exception as e:
+            return BulkResult(step.index, step.order, hint, None, None, e)
+
+    async def place(self, orders, approve=True):
+        """
+        Sends the orders (OrderRequest, or tuples of its fields), yields a BulkResult per
+        order as it finishes; the rejected ones first, with the reason of the validator
+        """
+        orders = [OrderRequest(*order) for order in orders]
+        rejected = set()
+        if self.validator is not None:
+            for index, reason in enumerate(self.validator.check_many(orders)):
+                if reason is not None:
+                    rejected.add(index)
+                    yield BulkResult(index, orders[index], None, None, None, OrderRejected(orders[index], reason))
+        if self.planner is not None:
+            indexes = [index for index in range(len(orders)) if index not in rejected]
+            allowance_plan = self.planner.plan([orders[index] for index in indexes], approve=approve)
+            for position, reason in sorted(allowance_plan.failing.items()):
+                index = indexes[position]
+                rejected.add(index)
+                yield BulkResult(index, orders[index], None, None, None, OrderRejected(orders[index], reason))
+            await self.planner.execute(allowance_plan, self.client)
+            self.approvals_count += len(allowance_plan.approvals)
+        elif approve:
+            await self.approve([order for index, order in enumerate(orders) if index not in rejected])
+        results = dict()
+        # the tasks reach the pipeline queue in the order they are created
+        for step in plan(orders, self.mirror, rejected):
+            results[step.index] = asyncio.ensure_future(self._run(step, results))
+        for future in asyncio.as_completed(list(results.values())):
+            yield await future
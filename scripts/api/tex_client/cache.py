@@ -0,0 +1,213 @@
+"""
+Block-scoped cache of the view calls
+
+Bots read getTokenPairStatus, getTickStage, paused, allowances, balances, ... many times
+per block, but the results only change with a new block. CachedRPC goes in front of an
+RPCSession, so in front of everything that reads through one (BatchReader,
+CommissionEngine, OrderValidator, the token calls): the results of eth_call and
+eth_getBalance are kept by (method, address, call data, block number) and dropped when
+a new block is seen:
+
+    rpc = CachedRPC(RPCSession(rpc_url))
+    reader = BatchReader(rpc, dex_address)
+    reader.call('getTickStage', base_token, secondary_token)  # eth_blockNumber and eth_call
+    reader.call('getTickStage', base_token, secondary_token)  # from the cache until the next block
+    print(rpc.stats)
+
+The head is read with eth_blockNumber at most every block_interval seconds, so a
+cached result can be that much older than a new block. Whoever already follows the
+blocks (feed.Feed, a keeper loop) can give them with set_block() and a block_interval
+of None; the eth_blockNumber calls sent through the cache move the head too. Calls at a
+given block number never change, they stay until evicted.
+
+The governance values (GOVERNANCE_FUNCTIONS: commission rates, min order amount,
+multiply factor limits, max lifespan, tick config, price providers) only change
+through the governor, they are kept governance_ttl seconds whatever the block; call
+invalidate() after a governance change. The entries are evicted in LRU order past
+maxsize. Any other method, writes included, goes to the node untouched.
+
+For the readers of an aio.AsyncRPCSession wrap its session, it is thread safe:
+
+    async_rpc.session = CachedRPC(async_rpc.session)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from .abi import COMMISSION_FUNCTIONS, FUNCTIONS, TOKEN_FUNCTIONS
+
+GOVERNANCE_FUNCTIONS = [
+    FUNCTIONS['minOrderAmount'], FUNCTIONS['minMultiplyFactor'], FUNCTIONS['maxMultiplyFactor'],
+    FUNCTIONS['maxOrderLifespan'], FUNCTIONS['tickConfig'], FUNCTIONS['commissionManager'],
+    FUNCTIONS['getPriceProvider'], TOKEN_FUNCTIONS['symbol'], TOKEN_FUNCTIONS['decimals'],
+] + list(COMMISSION_FUNCTIONS.values())
+
+# methods whose results only depend on their first param and the block (the second one)
+BLOCK_METHODS = {'eth_call', 'eth_getBalance'}
+
+
+@dataclass
+class CacheStats(object):
+    hits: int = 0
+    misses: int = 0
+    # entries dropped by a new block, and by the LRU limit
+    expired: int = 0
+    evicted: int = 0
+    # eth_blockNumber calls of the cache itself
+    block_reads: int = 0
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class CachedRPC(object):
+    """ RPCSession with the view calls cached per block """
+
+    def __init__(self, rpc, maxsize=4096, block_interval=1.0, governance_ttl=3600, clock=time.monotonic):
+        self.rpc = rpc
+        self.maxsize = maxsize
+        self.block_interval = block_interval
+        self.governance_ttl = governance_ttl
+        self.clock = clock
+        self.governance_selectors = set('0x' + function.selector for function in GOVERNANCE_FUNCTIONS)
+        self.stats = CacheStats()
+        # key -> (result, expiration time of the governance values, if it goes with the block)
+        self._entries = OrderedDict()
+        self._block = None
+        self._block_read_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def rpc_url(self):
+        return self.rpc.rpc_url
+
+    # Blocks
+
+    def set_block(self, block_number):
+        """ The head moved to block_number: the results of the previous block are dropped """
+        with self._lock:
+            self._block_read_at = self.clock()
+            if block_number == self._block:
+                return
+            self._block = block_number
+            expired = [key for key, (_, _, scoped) in self._entries.items() if scoped]
+            for key in expired:
+                del self._entries[key]
+            self.stats.expired += len(expired)
+
+    def block_number(self):
+        """ The head, read again when it is older than block_interval seconds """
+        if self._block is None or (self.block_interval is not None and
+                                   self.clock() - self._block_read_at >= self.block_interval):
+            self.stats.block_reads += 1
+            self.set_block(int(self.rpc.call('eth_blockNumber'), 16))
+        return self._block
+
+    def invalidate(self, governance_only=False):
+        with self._lock:
+            if governance_only:
+                for key in [key for key, (_, expires_at, _) in self._entries.items() if expires_at is not None]:
+                    del self._entries[key]
+            else:
+                self._entries.clear()
+
+    # Entries
+
+    def _key(self, method, params):
+        """ (key, is a governance value, goes with the block) of a cacheable call, None otherwise """
+        if method not in BLOCK_METHODS or not params:
+            return None
+        target = params[0]
+        if method == 'eth_call':
+            if set(target) - {'to', 'data'}:
+                # calls with a sender, gas, ... are not views for the cache
+                return None
+            target = (target['to'].lower(), target['data'].lower())
+        else:
+            target = target.lower()
+        block = params[1] if len(params) > 1 else 'latest'
+        if block == 'latest':
+            if method == 'eth_call' and target[1][:10] in self.governance_selectors:
+                return (method, target), True, False
+            return (method, target, self.block_number()), False, True
+        if isinstance(block, int) or block.startswith('0x'):
+            return (method, target, block if isinstance(block, int) else int(block, 16)), False, False
+        # pending, earliest, safe, ...
+        return None
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > self.clock()):
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return True, entry[0]
+            self.stats.misses += 1
+            return False, None
+
+    def _put(self, key, result, governance, scoped):
+        with self._lock:
+            self._entries[key] = (result, self.clock() + self.governance_ttl if governance else None, scoped)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats.evicted += 1
+
+    # RPCSession
+
+    def call(self, method, params=None):
+        cacheable = self._key(method, params)
+        if cacheable is None:
+            result = self.rpc.call(method, params)
+            if method == 'eth_blockNumber':
+                self.set_block(int(result, 16))
+            return result
+        key, governance, scoped = cacheable
+        found, result = self._get(key)
+        if not found:
+            result = self.rpc.call(method, params)
+            self._put(key, result, governance, scoped)
+        return result
+
+    def batch(self, calls, raise_on_error=True):
+        """ RPCSession.batch with the cached results taken out: only the misses are sent, in one batch """
+        calls = list(calls)
+        results = [None] * len(calls)
+        # key -> positions of the calls that miss, the same call is sent once
+        missing = OrderedDict()
+        uncached = []
+        for i, (method, params) in enumerate(calls):
+            cacheable = self._key(method, params)
+            if cacheable is None:
+                uncached.append(i)
+                continue
+            key, governance, scoped = cacheable
+            if key in missing:
+                missing[key][2].append(i)
+                continue
+            found, result = self._get(key)
+            if found:
+                results[i] = result
+            else:
+                missing[key] = (governance, scoped, [i])
+        sent = [positions[0] for _, _, positions in missing.values()] + uncached
+        answers = self.rpc.batch([calls[i] for i in sent], raise_on_error=False) if sent else []
+        for (key, (governance, scoped, positions)), answer in zip(missing.items(), answers):
+            for i in positions:
+                results[i] = answer
+            if not isinstance(answer, Exception):
+                self._put(key, answer, governance, scoped)
+        for i, answer in zip(uncached, answers[len(missing):]):
+            results[i] = answer
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+    def close(self):
+        self.rpc.close()
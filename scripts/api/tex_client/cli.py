@@ -0,0 +1,212 @@
+"""
+The tex command: the operations of the scripts as subcommands of one entry point
+
+    python ./tex.py status
+    python ./tex.py --profile local pairs --refresh
+    python ./tex.py tick-stage DOC/WRBTC
+    python ./tex.py buy-limit DOC/WRBTC 14 14000 5
+    python -m tex_client cancel-buy DOC/WRBTC 162
+
+The settings come from the profile (config.get_profile: --profile, $TEX_PROFILE or the
+default one). A pair is an alias of the profile, SYMBOL/SYMBOL of the listed pairs or
+the base/secondary addresses; amounts, prices and multiply factors are in token units,
+like the scripts.
+
+The read commands go to the node with an RPCSession and the cached node url and DEX
+address of the profile, brownie is only connected by the commands that send
+transactions (and by the first read of a profile without rpc_url / dex_address). Every
+module beyond config is imported inside the commands, so the startup of the command is
+the one of the interpreter; benchmarks/bench_cli_startup.py measures it.
+"""
+
+import argparse
+import sys
+
+from .config import ConfigError, get_profile
+from .session import RPCError
+
+
+class Context(object):
+    """ What the commands need, created on first use """
+
+    def __init__(self, profile, client=None):
+        self.profile = profile
+        self._client = client
+        self._rpc = None
+        self._reader = None
+        self.registry = profile.registry(lambda: self.reader)
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self.profile.client()
+        self._client.connect()
+        return self._client
+
+    @property
+    def rpc(self):
+        if self._rpc is None:
+            from .session import RPCSession
+            self._rpc = RPCSession(self.profile.connection(self._client)[0])
+        return self._rpc
+
+    @property
+    def reader(self):
+        if self._reader is None:
+            from .batch import BatchReader
+            self._reader = BatchReader(self.rpc, self.profile.connection(self._client)[1])
+        return self._reader
+
+    def pair(self, name):
+        return self.registry.resolve(name)
+
+    def token(self, name):
+        """ Address of a token given by address or by the symbol of a listed token """
+        if name.lower().startswith('0x'):
+            return name
+        for token in self.registry.tokens():
+            if token.symbol.upper() == name.upper():
+                return token.address
+        raise ConfigError('No listed token with the symbol {0}'.format(name))
+
+    def close(self):
+        if self._rpc is not None:
+            self._rpc.close()
+        if self._client is not None:
+            self._client.disconnect()
+
+
+# Read commands
+
+def paused(context, options):
+    print(context.reader.call('paused'))
+
+
+def pairs(context, options):
+    if options.refresh:
+        context.registry.refresh()
+    for base_token, secondary_token in context.registry.pairs:
+        print('{0:<16} {1} {2}'.format(context.registry.name(base_token, secondary_token), base_token,
+                                       secondary_token))
+
+
+def status(context, options):
+    pairs = [context.pair(name) for name in options.pairs] or None
+    print(context.reader.pairs_status(pairs).format())
+
+
+def pair_info(context, options):
+    base_token, secondary_token = context.pair(options.pair)
+    pair_status, market_price = context.reader.batch_call([
+        ('getTokenPairStatus', (base_token, secondary_token)), ('getMarketPrice', (base_token, secondary_token))])
+    for value in (pair_status, market_price):
+        if isinstance(value, Exception):
+            raise value
+    pair_status['marketPrice'] = market_price
+    for name in sorted(pair_status):
+        print('{0:<20} {1}'.format(name, pair_status[name]))
+
+
+def tick_stage(context, options):
+    from .constants import TickStage
+    print(TickStage(context.reader.call('getTickStage', *context.pair(options.pair))).name)
+
+
+def tick_is_running(context, options):
+    print(context.reader.call('tickIsRunning', *context.pair(options.pair)))
+
+
+# Transactions, through the moneyonchain wrapper of the TexClient
+
+def approve(context, options):
+    return context.client.approve(context.token(options.token), options.amount)
+
+
+def wrap(context, options):
+    return context.client.wrap(context.token(options.token), options.amount)
+
+
+def unwrap(context, options):
+    return context.client.unwrap(context.token(options.token), options.amount)
+
+
+def limit_order(context, options):
+    method = context.client.insert_buy_limit_order if options.is_buy else context.client.insert_sell_limit_order
+    return method(*context.pair(options.pair), options.amount, options.price, options.lifespan)
+
+
+def market_order(context, options):
+    method = context.client.insert_buy_market_order if options.is_buy else context.client.insert_sell_market_order
+    return method(*context.pair(options.pair), options.amount, options.multiply_factor, options.lifespan)
+
+
+def cancel_order(context, options):
+    method = context.client.cancel_buy_order if options.is_buy else context.client.cancel_sell_order
+    return method(*context.pair(options.pair), options.order_id, options.previous_order_id)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='tex', description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--profile', help='profile of the config file (default: $TEX_PROFILE or default_profile)')
+    parser.add_argument('--config', help='config file (default: $TEX_CONFIG or ~/.tex/config.json)')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    def command(name, handler, help_text, pair=False, **defaults):
+        subparser = commands.add_parser(name, help=help_text)
+        subparser.set_defaults(handler=handler, **defaults)
+        if pair:
+            subparser.add_argument('pair', help='alias, SYMBOL/SYMBOL or base/secondary addresses')
+        return subparser
+
+    command('paused', paused, 'if the DEX is paused')
+    command('pairs', pairs, 'listed pairs').add_argument(
+        '--refresh', action='store_true', help='read getTokenPairs() again')
+    command('status', status, 'status of the pairs in one request').add_argument(
+        'pairs', nargs='*', help='all the listed pairs by default')
+    command('pair-info', pair_info, 'getTokenPairStatus and market price of a pair', pair=True)
+    command('tick-stage', tick_stage, 'tick stage of a pair', pair=True)
+    command('tick-is-running', tick_is_running, 'if the tick of a pair is running', pair=True)
+
+    for name, handler, help_text in (('approve', approve, 'approves the DEX to take an amount of a token'),
+                                     ('wrap', wrap, 'wraps RBTC'), ('unwrap', unwrap, 'unwraps WRBTC')):
+        subparser = command(name, handler, help_text)
+        if name == 'approve':
+            subparser.add_argument('token', help='address or symbol of a listed token')
+        else:
+            subparser.add_argument('--token', default='WRBTC', help='address or symbol of the WRBTC token')
+        subparser.add_argument('amount', type=float)
+
+    for side, is_buy in (('buy', True), ('sell', False)):
+        subparser = command(side + '-limit', limit_order, 'inserts a {0} limit order'.format(side), pair=True,
+                            is_buy=is_buy)
+        subparser.add_argument('amount', type=float, help='locked amount: base token to buy, secondary to sell')
+        subparser.add_argument('price', type=float)
+        subparser.add_argument('lifespan', type=int, help='ticks')
+        subparser = command(side + '-market', market_order, 'inserts a {0} market order'.format(side), pair=True,
+                            is_buy=is_buy)
+        subparser.add_argument('amount', type=float, help='locked amount: base token to buy, secondary to sell')
+        subparser.add_argument('multiply_factor', type=float, help='of the market price, e.g. 1.01')
+        subparser.add_argument('lifespan', type=int, help='ticks')
+        subparser = command('cancel-' + side, cancel_order, 'cancels a {0} order'.format(side), pair=True,
+                            is_buy=is_buy)
+        subparser.add_argument('order_id', type=int)
+        subparser.add_argument('--previous-order-id', type=int, default=0, help='hint, 0 to search from the start')
+    return parser
+
+
+def main(argv=None, client=None):
+    options = build_parser().parse_args(argv)
+    try:
+        context = Context(get_profile(options.profile, options.config), client)
+    except ConfigError as e:
+        print('tex: {0}'.format(e), file=sys.stderr)
+        return 2
+    try:
+        options.handler(context, options)
+    except (ConfigError, RPCError) as e:
+        print('tex: {0}'.format(e), file=sys.stderr)
+        return 2 if isinstance(e, ConfigError) else 1
+    finally:
+        context.close()
+    return 0
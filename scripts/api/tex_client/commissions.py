@@ -0,0 +1,238 @@
+"""
+Local projection of the commissions of the TEX orders, without calls per order
+
+CommissionEngine reads the CommissionManager rates (commissionRate, the cancelation and
+expiration penalty rates and minimumCommission) once, in one batch, and keeps them until
+invalidated. The orders of a basket are then priced in one vectorized pass with the
+same integer math as calculateInitialFee, chargeCommissionForMatch and
+chargeExceptionalCommission (see wad.py):
+
+    engine = CommissionEngine(client.rpc, client.dex_address)
+    converter = CommonBaseConverter.from_status(BatchReader.from_client(client).pairs_status())
+    projection = engine.project_orders([(base_token, secondary_token, amount, True), ...], converter)
+    print(projection.reserved_commission, projection.exchangeable_amount, projection.cancelation_penalty)
+
+The rates only change when the governor executes a changer (CommissionRateChanger,
+MinimumCommissionChanger, ...), and the CommissionManager does not log it: pass the
+transactions the process sees (e.g. of the blocks it polls) to observe(), the rates are
+read again after a Governor.executeChange.
+
+The minimum commission is in common base tokens (DOC), calculateInitialFee converts it
+with the price of the order token in the common base, i.e. convertTokenToCommonBase of
+one token. CommonBaseConverter copies it from the emaPrice of the listed pairs; a pair
+whose status could not be read only fails the conversions through it (PriceUnavailable).
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from .abi import COMMISSION_FUNCTIONS, FUNCTIONS, GOVERNOR_FUNCTIONS
+from .constants import DEFAULT_PRICE_PRECISION, RATE_PRECISION
+from .wad import UINT256_MAX, as_int_array, calculate_initial_fee, commission_for_match, convert_to_base, \
+    exceptional_commission
+
+RATE_FIELDS = [
+    ('commissionRate', 'commission_rate'),
+    ('cancelationPenaltyRate', 'cancelation_penalty_rate'),
+    ('expirationPenaltyRate', 'expiration_penalty_rate'),
+    ('minimumCommission', 'minimum_commission'),
+    ('governor', 'governor'),
+]
+
+
+def common_base_token(pairs):
+    """ The base token that is not the secondary token of any pair (DOC in the TEX deployments) """
+    secondary_tokens = set(secondary_token.lower() for _, secondary_token in pairs)
+    bases = sorted(set(base_token.lower() for base_token, _ in pairs) - secondary_tokens)
+    if len(bases) != 1:
+        raise ValueError('Cannot tell the common base token from the pairs, candidates: {0}'.format(bases))
+    return bases[0]
+
+
+class PriceUnavailable(ValueError):
+    """ The emaPrice of a pair needed by a conversion could not be read """
+
+    def __init__(self, pair, reason=None):
+        self.pair = pair
+        self.reason = reason
+        super().__init__('No emaPrice for the pair {0}/{1}: {2}'.format(pair[0], pair[1], reason or 'not read'))
+
+
+class CommonBaseConverter(object):
+    """ TokenPairConverter.convertTokenToCommonBase over the emaPrice of the listed pairs """
+
+    def __init__(self, common_base, ema_prices, price_precisions=None, unavailable=None):
+        self.common_base = common_base.lower()
+        # (base token, secondary token) in lowercase -> emaPrice
+        self.ema_prices = dict(((base_token.lower(), secondary_token.lower()), int(price))
+                               for (base_token, secondary_token), price in ema_prices.items())
+        self.price_precisions = dict(((base_token.lower(), secondary_token.lower()), precision) for
+                                     (base_token, secondary_token), precision in (price_precisions or {}).items())
+        # (base token, secondary token) in lowercase -> why its emaPrice is missing
+        self.unavailable = dict(((base_token.lower(), secondary_token.lower()), reason)
+                                for (base_token, secondary_token), reason in (unavailable or {}).items())
+
+    @classmethod
+    def from_status(cls, table, common_base=None):
+        """ From a batch.StatusTable of every listed pair, the rows without emaPrice are unavailable """
+        pairs = [(row.base_token, row.secondary_token) for row in table]
+        ema_prices = dict(((row.base_token, row.secondary_token), row.ema_price) for row in table
+                          if row.ema_price is not None)
+        unavailable = dict(((row.base_token, row.secondary_token), row.errors.get('status')) for row in table
+                           if row.ema_price is None)
+        return cls(common_base or common_base_token(pairs), ema_prices, unavailable=unavailable)
+
+    def _listed(self, key):
+        return key in self.ema_prices or key in self.unavailable
+
+    def _convert(self, amount, base_token, secondary_token):
+        key = (base_token, secondary_token)
+        if key in self.unavailable:
+            raise PriceUnavailable(key, self.unavailable[key])
+        return convert_to_base(amount, self.ema_prices[key], self.price_precisions.get(key, DEFAULT_PRICE_PRECISION))
+
+    def convert(self, token, amount, base_token):
+        """
+        amount (an int or an array) of token in common base tokens, uint256 max if not
+        convertible; PriceUnavailable if a pair of the conversion has no emaPrice
+        """
+        token, base_token = token.lower(), base_token.lower()
+        if token == self.common_base:
+            return amount
+        if self._listed((self.common_base, token)):
+            return self._convert(amount, self.common_base, token)
+        if self._listed((self.common_base, base_token)) and self._listed((base_token, token)):
+            intermediary_amount = self._convert(amount, self.common_base, base_token)
+            return self._convert(intermediary_amount, base_token, token)
+        if isinstance(amount, int):
+            return UINT256_MAX
+        return as_int_array([UINT256_MAX] * len(amount))
+
+    def order_price(self, base_token, secondary_token, is_buy):
+        """ _priceCommonBase of the OrderListing insertions: one locked token in common base """
+        if is_buy:
+            return self.convert(base_token, RATE_PRECISION, secondary_token)
+        return self.convert(secondary_token, RATE_PRECISION, base_token)
+
+
+@dataclass
+class CommissionRates(object):
+    """ The CommissionManager parameters, rates in wad """
+    commission_rate: int
+    cancelation_penalty_rate: int
+    expiration_penalty_rate: int
+    minimum_commission: int
+    governor: str = None
+
+
+@dataclass
+class FeeProjection(object):
+    """ What the DEX would reserve and charge for each order of a basket, as arrays """
+    amount: np.ndarray
+    reserved_commission: np.ndarray
+    exchangeable_amount: np.ndarray
+    cancelation_penalty: np.ndarray
+    expiration_penalty: np.ndarray
+    # False where the insertion reverts with 'Amount is greater than Fee'
+    accepted: np.ndarray
+
+    def __len__(self):
+        return len(self.amount)
+
+
+class CommissionEngine(object):
+    """ Commissions of the orders from cached CommissionManager rates """
+
+    def __init__(self, rpc, dex_address, commission_manager=None, rates=None):
+        self.rpc = rpc
+        self.dex_address = dex_address
+        self.commission_manager = commission_manager
+        self._rates = rates
+        self.loads_count = 0
+
+    def _eth_call(self, to, function, block):
+        return 'eth_call', [{'to': to, 'data': function.encode()}, block]
+
+    def load_rates(self, block='latest'):
+        """ Reads the rates of the CommissionManager in one batch """
+        if self.commission_manager is None:
+            method, params = self._eth_call(self.dex_address, FUNCTIONS['commissionManager'], block)
+            self.commission_manager = FUNCTIONS['commissionManager'].decode_output(self.rpc.call(method, params))
+        functions = [COMMISSION_FUNCTIONS[name] for name, _ in RATE_FIELDS]
+        results = self.rpc.batch([self._eth_call(self.commission_manager, function, block)
+                                  for function in functions])
+        values = [function.decode_output(result) for function, result in zip(functions, results)]
+        self._rates = CommissionRates(**dict((field_name, value)
+                                             for (_, field_name), value in zip(RATE_FIELDS, values)))
+        self.loads_count += 1
+        return self._rates
+
+    @property
+    def rates(self):
+        if self._rates is None:
+            self.load_rates()
+        return self._rates
+
+    def invalidate(self):
+        self._rates = None
+
+    def observe(self, transaction):
+        """ Invalidates the rates if the transaction executes a governance change, returns if it did """
+        if self._rates is None or not transaction or not transaction.get('input'):
+            return False
+        governor = self._rates.governor
+        to = (transaction.get('to') or '').lower()
+        if governor is not None and to != governor.lower():
+            return False
+        if transaction['input'][2:10] != GOVERNOR_FUNCTIONS['executeChange'].selector:
+            return False
+        self.invalidate()
+        return True
+
+    # Projections
+
+    def initial_fee(self, amount, price_common_base):
+        """ calculateInitialFee: reserved commission of an order of amount (int or array) """
+        rates = self.rates
+        return calculate_initial_fee(amount, price_common_base, rates.commission_rate, rates.minimum_commission)
+
+    def match_commission(self, order_amount, matched_amount, reserved_commission):
+        """ chargeCommissionForMatch: commission charged for matching part of an order """
+        return commission_for_match(order_amount, matched_amount, reserved_commission)
+
+    def cancelation_penalty(self, reserved_commission):
+        return exceptional_commission(reserved_commission, self.rates.cancelation_penalty_rate)
+
+    def expiration_penalty(self, reserved_commission):
+        return exceptional_commission(reserved_commission, self.rates.expiration_penalty_rate)
+
+    def project(self, amounts, prices_common_base):
+        """ FeeProjection of orders of amounts with the _priceCommonBase of each one """
+        amounts, prices = as_int_array(amounts), as_int_array(prices_common_base)
+        # a zero price (a pair without emaPrice) reverts the insertion with a division by zero
+        priced = np.asarray(prices > 0, dtype=bool)
+        fees = as_int_array(self.initial_fee(amounts, np.where(priced, prices, 1)))
+        accepted = priced & np.asarray(fees <= amounts, dtype=bool)
+        # the amount and commission reserved by the orders that would be inserted
+        exchangeable = np.where(accepted, amounts - fees, 0)
+        fees = np.where(accepted, fees, 0)
+        return FeeProjection(
+            amount=amounts,
+            reserved_commission=fees,
+            exchangeable_amount=exchangeable,
+            cancelation_penalty=self.cancelation_penalty(fees),
+            expiration_penalty=self.expiration_penalty(fees),
+            accepted=accepted)
+
+    def project_orders(self, orders, converter):
+        """ FeeProjection of (base token, secondary token, amount, is buy) orders, no RPC calls """
+        orders = list(orders)
+        prices = dict()
+        for base_token, secondary_token, _, is_buy in orders:
+            key = (base_token, secondary_token, bool(is_buy))
+            if key not in prices:
+                prices[key] = converter.order_price(*key)
+        return self.project([amount for _, _, amount, _ in orders],
+                            [prices[(base_token, secondary_token, bool(is_buy))]
+                             for base_token, secondary_token, _, is_buy in orders])
@@ -0,0 +1,271 @@
+"""
+Named profiles of client settings, and the registry of the listed pairs
+
+Every script copies the networks, the token addresses and the account. A Profile keeps
+them under a name, the profiles come from DEFAULT_PROFILES plus a JSON file
+(~/.tex/config.json, or the path of $TEX_CONFIG) whose values go over the defaults:
+
+    {
+        "default_profile": "testnet",
+        "profiles": {
+            "testnet": {"account": "0xCD8A1c9aCc980ae031456573e34dC05cD7daE6e3"},
+            "local": {"dex_address": "0x...", "pairs": {"DOC/BPRO": ["0x...", "0x..."]}}
+        }
+    }
+
+    profile = get_profile()  # the --profile of the CLI, $TEX_PROFILE or default_profile
+    with profile.client() as client:
+        registry = profile.registry(lambda: BatchReader.from_client(client))
+        base_token, secondary_token = registry.resolve('DOC/WRBTC')
+
+The node url and the DEX address are read from the brownie connection the first time
+and cached in the cache directory of the profile, so read-only tools can go straight
+to the node with an RPCSession after that (profile.connection()). The registry keeps
+the getTokenPairs() pairs and the symbol / decimals of their tokens in the same
+directory, read only when missing, in one batch.
+
+Only the standard library is imported here, the client and the node are reached
+when first needed.
+"""
+
+import json
+import os
+from collections import namedtuple
+from dataclasses import asdict, dataclass, field, fields
+
+from .constants import DEFAULT_CONFIG_NETWORK, DEFAULT_CONNECTION_NETWORK
+
+CONFIG_PATH_VARIABLE = 'TEX_CONFIG'
+PROFILE_VARIABLE = 'TEX_PROFILE'
+DEFAULT_CONFIG_PATH = os.path.join('~', '.tex', 'config.json')
+DEFAULT_CACHE_DIR = os.path.join('~', '.tex', 'cache')
+DEFAULT_PROFILE = 'testnet'
+
+DOC_TESTNET = '0xCB46c0ddc60D18eFEB0E586C17Af6ea36452Dae0'
+WRBTC_TESTNET = '0x09b6ca5E4496238A1F176aEa6Bb607DB96c2286E'
+
+TokenMetadata = namedtuple('TokenMetadata', 'address symbol decimals')
+
+
+class ConfigError(ValueError):
+    """ Invalid or missing settings """
+
+
+@dataclass
+class Profile(object):
+    """ Settings of one environment """
+    name: str
+    # brownie connection network and TEX config network of moneyonchain
+    connection_network: str = DEFAULT_CONNECTION_NETWORK
+    config_network: str = DEFAULT_CONFIG_NETWORK
+    # read from the brownie connection (and cached) when not set
+    rpc_url: str = None
+    dex_address: str = None
+    # sender of the transactions, the first brownie account when not set
+    account: str = None
+    # alias -> [base token, secondary token], besides the SYMBOL/SYMBOL names of the registry
+    pairs: dict = field(default_factory=dict)
+    cache_dir: str = DEFAULT_CACHE_DIR
+
+    @classmethod
+    def from_dict(cls, name, values, base=None):
+        """ Profile from the values of the config file, over base (a Profile) if given """
+        known = dict((f.name, f) for f in fields(cls) if f.name != 'name')
+        unknown = sorted(set(values) - set(known))
+        if unknown:
+            raise ConfigError('Unknown settings in profile {0}: {1}'.format(name, ', '.join(unknown)))
+        for key, value in values.items():
+            expected = dict if known[key].type is dict else str
+            if value is not None and not isinstance(value, expected):
+                raise ConfigError('{0}.{1} should be a {2}'.format(name, key, expected.__name__))
+        for alias, pair in values.get('pairs', dict()).items():
+            if not (isinstance(pair, (list, tuple)) and len(pair) == 2):
+                raise ConfigError('{0}.pairs.{1} should be [base token, secondary token]'.format(name, alias))
+        settings = dict() if base is None else base.to_dict()
+        settings.update(values)
+        settings['pairs'] = dict(dict() if base is None else base.pairs, **values.get('pairs', dict()))
+        settings['name'] = name
+        return cls(**settings)
+
+    def to_dict(self):
+        settings = asdict(self)
+        del settings['name']
+        return settings
+
+    def cache_path(self, file_name):
+        return os.path.join(os.path.expanduser(self.cache_dir), self.name, file_name)
+
+    def client(self, **kwargs):
+        """ session.TexClient of the profile, not connected yet """
+        from .session import TexClient
+        return TexClient(connection_network=self.connection_network, config_network=self.config_network,
+                         rpc_url=self.rpc_url, account=self.account, **kwargs)
+
+    def connection(self, client=None):
+        """
+        (rpc url, dex address): the ones of the profile, the cached ones, or the ones of
+        the (connected on demand) client, which are cached for the next time
+        """
+        if self.rpc_url and self.dex_address:
+            return self.rpc_url, self.dex_address
+        path = self.cache_path('connection.json')
+        cached = _read_json(path) or dict()
+        rpc_url = self.rpc_url or cached.get('rpc_url')
+        dex_address = self.dex_address or cached.get('dex_address')
+        if not (rpc_url and dex_address):
+            client = client or self.client()
+            rpc_url, dex_address = self.rpc_url or client.rpc_url, self.dex_address or client.dex_address
+            _write_json(path, dict(rpc_url=rpc_url, dex_address=dex_address))
+        return rpc_url, dex_address
+
+    def registry(self, reader_factory=None):
+        return PairRegistry(self.cache_path('pairs.json'), reader_factory, aliases=self.pairs)
+
+
+DEFAULT_PROFILES = {
+    'testnet': Profile('testnet', pairs={'DOC/WRBTC': [DOC_TESTNET, WRBTC_TESTNET]}),
+    # ganache with the truffle migrations (scripts/run_ganache.sh)
+    'local': Profile('local', connection_network='ganache', config_network='dexLocal',
+                     rpc_url='http://127.0.0.1:8545'),
+}
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        raise ConfigError('{0} is not valid JSON: {1}'.format(path, e))
+
+
+def _write_json(path, value):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump(value, f, indent=2, sort_keys=True)
+    os.replace(temporary_path, path)
+
+
+def config_path(path=None):
+    return os.path.expanduser(path or os.environ.get(CONFIG_PATH_VARIABLE) or DEFAULT_CONFIG_PATH)
+
+
+def load_profiles(path=None):
+    """ (profiles by name, default profile name) of the defaults and the config file """
+    config = _read_json(config_path(path)) or dict()
+    profiles = dict(DEFAULT_PROFILES)
+    for name, values in (config.get('profiles') or dict()).items():
+        profiles[name] = Profile.from_dict(name, values, DEFAULT_PROFILES.get(name))
+    return profiles, config.get('default_profile', DEFAULT_PROFILE)
+
+
+def get_profile(name=None, path=None):
+    """ The profile called name, else the one of $TEX_PROFILE, else the default one of the config """
+    profiles, default_name = load_profiles(path)
+    name = name or os.environ.get(PROFILE_VARIABLE) or default_name
+    if name not in profiles:
+        raise ConfigError('Unknown profile {0}, the profiles are: {1}'.format(name, ', '.join(sorted(profiles))))
+    return profiles[name]
+
+
+class PairRegistry(object):
+    """
+    The listed pairs and the metadata of their tokens, cached in a JSON file.
+    reader_factory returns a batch.BatchReader and is only called when the cache misses
+    """
+
+    def __init__(self, path, reader_factory=None, aliases=None):
+        self.path = path
+        self.reader_factory = reader_factory
+        self.aliases = aliases or dict()
+        self._reader = None
+        self._pairs = None
+        self._tokens = dict()
+        self.refreshes_count = 0
+        self._load()
+
+    def _load(self):
+        cached = _read_json(self.path)
+        if cached is not None:
+            self._pairs = [tuple(pair) for pair in cached.get('pairs', [])]
+            self._tokens = dict((address, TokenMetadata(address, *values))
+                                for address, values in cached.get('tokens', dict()).items())
+
+    def save(self):
+        _write_json(self.path, dict(
+            pairs=[list(pair) for pair in self._pairs or []],
+            tokens=dict((address, [token.symbol, token.decimals]) for address, token in self._tokens.items())))
+
+    @property
+    def reader(self):
+        if self._reader is None:
+            if self.reader_factory is None:
+                raise ConfigError('{0} has no cached pairs and there is no reader to get them'.format(self.path))
+            self._reader = self.reader_factory()
+        return self._reader
+
+    def refresh(self):
+        """ Reads getTokenPairs() again, e.g. after a pair was listed """
+        self._pairs = [tuple(pair) for pair in self.reader.refresh_pairs()]
+        self.refreshes_count += 1
+        self.save()
+        return self._pairs
+
+    @property
+    def pairs(self):
+        if self._pairs is None:
+            self.refresh()
+        return self._pairs
+
+    def tokens(self, addresses=None):
+        """ TokenMetadata of the tokens (of every pair by default), the missing ones read in one batch """
+        if addresses is None:
+            addresses = [address for pair in self.pairs for address in pair]
+        addresses = list(dict.fromkeys(address.lower() for address in addresses))
+        missing = [address for address in addresses if address not in self._tokens]
+        if missing:
+            from .abi import TOKEN_FUNCTIONS, to_bytes
+
+            calls = [('eth_call', [{'to': address, 'data': TOKEN_FUNCTIONS[name].encode()}, 'latest'])
+                     for address in missing for name in ('symbol', 'decimals')]
+            results = self.reader.rpc.batch(calls, raise_on_error=False)
+            for i, address in enumerate(missing):
+                symbol, decimals = results[2 * i], results[2 * i + 1]
+                if isinstance(symbol, Exception) or isinstance(decimals, Exception):
+                    raise ConfigError('Cannot read the symbol and decimals of {0}'.format(address))
+                data = to_bytes(symbol)
+                # a few old tokens return a bytes32 symbol
+                symbol = data.rstrip(b'\0').decode() if len(data) == 32 else \
+                    TOKEN_FUNCTIONS['symbol'].decode_output(data)
+                self._tokens[address] = TokenMetadata(
+                    address, symbol, TOKEN_FUNCTIONS['decimals'].decode_output(to_bytes(decimals)))
+            self.save()
+        return [self._tokens[address] for address in addresses]
+
+    def token(self, address):
+        return self.tokens([address])[0]
+
+    def name(self, base_token, secondary_token):
+        base, secondary = self.tokens([base_token, secondary_token])
+        return '{0}/{1}'.format(base.symbol, secondary.symbol)
+
+    def resolve(self, name):
+        """ (base token, secondary token) of an alias of the profile, SYMBOL/SYMBOL or base/secondary addresses """
+        if name in self.aliases:
+            return tuple(self.aliases[name])
+        parts = name.split('/')
+        if len(parts) != 2:
+            raise ConfigError('A pair is BASE/SECONDARY, not {0}'.format(name))
+        if all(part.lower().startswith('0x') and len(part) == 42 for part in parts):
+            return tuple(parts)
+        self.tokens()
+        symbols = [part.upper() for part in parts]
+        for pair in self.pairs:
+            if [token.symbol.upper() for token in self.tokens(pair)] == symbols:
+                return pair
+        raise ConfigError('The pair {0} is not listed, the pairs are: {1}'.format(
+            name, ', '.join(sorted(self.name(*pair) for pair in self.pairs))))
@@ -0,0 +1,33 @@
+"""
+Constants shared by the client modules, copied from the TEX contracts
+"""
+
+from enum import IntEnum
+
+
+# MoCExchangeLib.RATE_PRECISION / CommissionManager.RATE_PRECISION
+RATE_PRECISION = 10 ** 18
+
+# Default priceComparisonPrecision used when the pairs are listed
+DEFAULT_PRICE_PRECISION = 10 ** 18
+
+# OrderListing.NO_HINT, the biggest possible uint256 so it doesn't conflict with valid ids
+NO_HINT = 2 ** 256 - 1
+
+# Default brownie connection network and TEX config network used by the scripts
+DEFAULT_CONNECTION_NETWORK = 'rskTesnetPublic'
+DEFAULT_CONFIG_NETWORK = 'dexTestnet'
+
+
+class OrderType(IntEnum):
+    """ MoCExchangeLib.OrderType """
+    LIMIT_ORDER = 0
+    MARKET_ORDER = 1
+
+
+class TickStage(IntEnum):
+    """ MoCExchangeLib.TickStage """
+    RECEIVING_ORDERS = 0
+    RUNNING_SIMULATION = 1
+    RUNNING_MATCHING = 2
+    MOVING_PENDING_ORDERS = 3
@@ -0,0 +1,207 @@
+"""
+Depth and slippage of candidate market orders against the mirrored orderbook
+
+A market order sorts by multiplyFactor among the market orders of its side, but it is
+matched at its spot price, marketOrderSpotPrice(marketPrice, multiplyFactor), merged
+with the limit orders (simulator.priority). DepthEstimator sweeps many candidate
+multiply factors of one amount in a few vectorized passes over the book of a pair:
+
+    estimator = DepthEstimator.from_reader(reader, mirror, base_token, secondary_token)
+    estimates = estimator.estimate(np.arange(950, 1051) * RATE_PRECISION // 1000, to_wad(20), is_buy=True,
+                                   volatility=0.02)
+    best = estimates.fill_probability.argmax()
+    print(estimates.multiply_factor[best], estimates.fill_price[best], estimates.queue_position[best])
+
+For every candidate it gives the position among the market orders, the amount of the
+orders ahead in the matching, the share of the order that the next tick would fill
+and the price of the tick, which is the price of every match (the average of the last
+matching buy and sell orders, like the emergent price of the contract).
+
+The estimate takes the book as it is (the not expired orders of the next tick) and is
+computed with floats, so it may be off by a few wei; simulator.simulate gives the exact
+emergent price of a given book. With a volatility (relative standard deviation of the
+market price at the tick) the fill probability is the share of market price scenarios
+where the candidate matches, the spot prices of every market order moving with it;
+without it the fill probability is 1 or 0.
+"""
+
+from dataclasses import dataclass
+from statistics import NormalDist
+
+import numpy as np
+
+from .constants import RATE_PRECISION
+from .simulator import OrderArrays, priority
+from .wad import as_int_array, market_order_spot_price
+
+# relative tolerance of the float volumes, so the units at the boundary between two
+# orders are not attributed to the wrong one
+VOLUME_TOLERANCE = 1e-12
+
+
+@dataclass
+class MarketOrderEstimates(object):
+    """ Estimates of candidate market orders of one side, one entry per multiply factor """
+    multiply_factor: np.ndarray
+    spot_price: np.ndarray
+    # market orders of the side that go before the candidate
+    queue_position: np.ndarray
+    # sum of the amounts (in the locked token) of the orders matched before the candidate
+    depth_ahead: np.ndarray
+    fill_ratio: np.ndarray
+    filled_amount: np.ndarray
+    # price of the matches of the tick, nan where the candidate does not match
+    fill_price: np.ndarray
+    # fill_price relative to the market price, nan where the candidate does not match
+    slippage: np.ndarray
+    fill_probability: np.ndarray
+
+    def __len__(self):
+        return len(self.multiply_factor)
+
+
+class _Curve(object):
+    """ One side in matching order: prices and cumulative volumes in secondary token """
+
+    def __init__(self, prices, volumes, amounts):
+        self.prices = prices
+        self.end = np.cumsum(volumes)
+        self.start = np.concatenate([[0.0], self.end])
+        self.amount_start = np.concatenate([[0.0], np.cumsum(amounts)])
+
+    @classmethod
+    def from_orders(cls, orders, is_buy, market_price, tick_number, price_precision):
+        positions = priority(orders, is_buy, market_price, tick_number)
+        prices = np.array(orders.spot_prices(market_price)[positions].tolist(), dtype=float)
+        amounts = np.array(orders.amounts[positions].tolist(), dtype=float)
+        # the buyers intent, compareIntents
+        volumes = amounts * price_precision / prices if is_buy else amounts
+        return cls(prices, volumes, amounts)
+
+    def price_at(self, volume):
+        """ Price of the order matching the unit at volume, inf past the end """
+        positions = np.searchsorted(self.end, volume * (1 + VOLUME_TOLERANCE), side='right')
+        return np.where(positions < len(self.prices), self.prices[np.minimum(positions, len(self.prices) - 1)]
+                        if len(self.prices) else np.inf, np.inf)
+
+    def price_before(self, volume):
+        """ Price of the order matching the unit right before volume """
+        positions = np.minimum(np.searchsorted(self.end, volume * (1 - VOLUME_TOLERANCE), side='left'),
+                               len(self.prices) - 1)
+        return self.prices[positions]
+
+    def volume_until(self, price):
+        """ Volume of the orders with a price up to price (the other side must be ascending) """
+        return self.start[np.searchsorted(self.prices, price, side='right')]
+
+
+def _crossing(own, other, positions, prices, volumes):
+    """
+    Matches of candidates inserted at positions of own (prices non increasing) against
+    other (non decreasing): returns the filled volume and the prices of the last
+    matching pair of orders (nan where the candidate does not match)
+    """
+    start = own.start[positions]
+    matched = other.price_at(start) <= prices
+    stop = np.minimum(start + volumes, other.volume_until(prices))
+    full = matched & (stop - start >= volumes * (1 - VOLUME_TOLERANCE))
+    filled = np.where(full, volumes, np.where(matched, np.clip(stop - start, 0, volumes), 0.0))
+
+    # orders of own after a fully filled candidate go on matching, shifted by its volume:
+    # binary search of the last one still crossing, -1 meaning the candidate itself
+    size = len(own.prices)
+    low, high = positions - 1, np.full(len(positions), size)
+    while True:
+        active = full & (high - low > 1)
+        if not active.any():
+            break
+        middle = (low + high) // 2
+        index = np.minimum(middle, size - 1)
+        crosses = own.prices[index] >= other.price_at(own.start[index] + volumes)
+        low = np.where(active & crosses, middle, low)
+        high = np.where(active & ~crosses, middle, high)
+
+    last = np.where(full & (low >= positions), low, -1)
+    index = np.maximum(last, 0) if size else last
+    own_price = np.where(last >= 0, own.prices[index] if size else prices, prices)
+    own_stop = np.where(last >= 0, own.end[index] + volumes if size else stop, stop)
+    stop = np.where(last >= 0, np.minimum(own_stop, other.volume_until(own_price)), stop)
+    other_price = other.price_before(stop) if len(other.prices) else np.full(len(prices), np.nan)
+    return filled, np.where(matched, own_price, np.nan), np.where(matched, other_price, np.nan)
+
+
+class DepthEstimator(object):
+    """ Market order estimates against the book of one pair """
+
+    def __init__(self, book, market_price, tick_number=None, price_precision=RATE_PRECISION):
+        self.book = book
+        self.market_price = market_price
+        self.tick_number = book.tick_number if tick_number is None else tick_number
+        self.price_precision = price_precision
+        self.buys = OrderArrays.from_orders(list(book.buy.limit) + list(book.buy.market))
+        self.sells = OrderArrays.from_orders(list(book.sell.limit) + list(book.sell.market))
+
+    @classmethod
+    def from_reader(cls, reader, mirror, base_token, secondary_token, price_precision=RATE_PRECISION):
+        """ With the getMarketPrice of a batch.BatchReader and the book of a synced mirror """
+        market_price = reader.call('getMarketPrice', base_token, secondary_token)
+        return cls(mirror.pair(base_token, secondary_token), market_price, price_precision=price_precision)
+
+    def _curves(self, market_price, is_buy):
+        """ (own side, other side) curves, the sells with negated prices for sell candidates """
+        args = (market_price, self.tick_number, self.price_precision)
+        buys = _Curve.from_orders(self.buys, True, *args)
+        sells = _Curve.from_orders(self.sells, False, *args)
+        if is_buy:
+            return buys, sells
+        sells.prices, buys.prices = -sells.prices, -buys.prices
+        return sells, buys
+
+    def _fills(self, market_price, multiply_factors, amounts, is_buy):
+        """ (spot prices, positions in own, filled volume, volume, own and other price of the last match) """
+        spot_prices = market_order_spot_price(int(market_price), multiply_factors)
+        prices = np.array(spot_prices.tolist(), dtype=float)
+        own, other = self._curves(market_price, is_buy)
+        # after the orders with the same price: the limit ones go first, and the older market ones
+        signed = prices if is_buy else -prices
+        positions = np.searchsorted(-own.prices, -signed, side='right')
+        volumes = amounts * self.price_precision / prices if is_buy else amounts
+        filled, own_price, other_price = _crossing(own, other, positions, signed, volumes)
+        return spot_prices, own, positions, filled, volumes, own_price, other_price
+
+    def estimate(self, multiply_factors, amount, is_buy, volatility=0, scenarios=33):
+        """
+        MarketOrderEstimates of market orders of amount (exchangeable, in the locked
+        token, wad; one or one per candidate) for every multiply factor (wad)
+        """
+        multiply_factors = as_int_array(multiply_factors)
+        amounts = np.broadcast_to(np.array(np.asarray(amount).tolist(), dtype=float), len(multiply_factors))
+        spot_prices, own, positions, filled, volumes, own_price, other_price = self._fills(
+            self.market_price, multiply_factors, amounts, is_buy)
+        fill_ratio = np.where(volumes > 0, filled / np.where(volumes > 0, volumes, 1), 0.0)
+        fill_price = np.abs(own_price + other_price) / 2
+        market_price = float(self.market_price)
+
+        side = self.book.side(is_buy)
+        live = [order.multiply_factor for order in side.market if order.expires_in_tick > self.tick_number]
+        factors = np.array(sorted(live), dtype=float)
+        candidates = np.array(multiply_factors.tolist(), dtype=float)
+        # older market orders with the same multiplyFactor go first
+        queue_position = len(factors) - np.searchsorted(factors, candidates, side='left') if is_buy else \
+            np.searchsorted(factors, candidates, side='right')
+
+        if volatility:
+            quantiles = [NormalDist().inv_cdf((i + 0.5) / scenarios) for i in range(scenarios)]
+            matches = np.zeros(len(multiply_factors))
+            for quantile in quantiles:
+                scenario_price = int(self.market_price * np.exp(volatility * quantile))
+                matches += self._fills(scenario_price, multiply_factors, amounts, is_buy)[3] > 0
+            fill_probability = matches / scenarios
+        else:
+            fill_probability = (filled > 0).astype(float)
+
+        return MarketOrderEstimates(
+            multiply_factor=multiply_factors, spot_price=spot_prices, queue_position=queue_position,
+            depth_ahead=own.amount_start[positions], fill_ratio=fill_ratio, filled_amount=fill_ratio * amounts,
+            fill_price=fill_price, slippage=fill_price / market_price - 1 if market_price else fill_price * np.nan,
+            fill_probability=fill_probability)
@@ -0,0 +1,262 @@
+"""
+Columnar on-disk store of decoded TEX events, one NumPy array file per column
+
+The events are partitioned by pair, event and tick:
+
+    <root>/<pair>/<EventName>/ticks-<first tick>/<first block>-<last block>/<column>.npy
+    <root>/state.json
+
+pair is '<base>-<secondary>' (lowercase addresses), or 'global' for the events that are
+not bound to a pair (CommissionWithdrawn, TransferFailed). Every flush writes new
+segments (the block range folders), first to a .tmp folder and then renamed, so a crash
+never leaves half a segment. compact() merges the segments of every partition.
+
+Every event has the columns block_number, log_index, tick (uint64) and transaction_hash
+(S32), plus one per argument: uint256 values as (n, 4) uint64 limbs, most significant
+first, so they are exact; other uintN as uint64, bool, and addresses as S20 bytes. The
+files are opened memory-mapped:
+
+    store = EventStore('events')
+    table = store.read('TickEnd', base_token, secondary_token, from_tick=100)
+    closing_prices = limbs_to_float(table['closingPrice'], 10 ** 18)
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+from .events import EVENTS
+
+LIMBS = 4
+LIMB_BITS = 64
+LIMB_MASK = (1 << LIMB_BITS) - 1
+
+GLOBAL_PARTITION = 'global'
+META_COLUMNS = [('block_number', 'uint'), ('log_index', 'uint'), ('tick', 'uint'), ('transaction_hash', 'bytes32')]
+
+
+def column_kind(abi_type):
+    if abi_type == 'uint256':
+        return 'uint256'
+    if abi_type == 'address':
+        return 'address'
+    if abi_type == 'bool':
+        return 'bool'
+    return 'uint'
+
+
+def event_columns(event_name):
+    """ (column name, kind) of the stored columns of an event """
+    definition = EVENTS[event_name]
+    return META_COLUMNS + [(arg_name, column_kind(arg_type)) for arg_type, arg_name, _ in definition.inputs]
+
+
+def to_limbs(values):
+    """ (n, 4) uint64 array of python ints < 2 ** 256 """
+    limbs = np.empty((len(values), LIMBS), dtype=np.uint64)
+    for i, value in enumerate(values):
+        limbs[i] = [(value >> (LIMB_BITS * (LIMBS - 1 - j))) & LIMB_MASK for j in range(LIMBS)]
+    return limbs
+
+
+def limbs_to_ints(limbs):
+    """ Object array of exact python ints """
+    values = np.zeros(len(limbs), dtype=object)
+    for j in range(LIMBS):
+        values = (values << LIMB_BITS) + limbs[:, j].astype(object)
+    return values
+
+
+def limbs_to_float(limbs, scale=1):
+    """ float64 values divided by scale (e.g. 10 ** 18 for wad amounts) """
+    values = np.zeros(len(limbs), dtype=np.float64)
+    for j in range(LIMBS):
+        values = values * float(1 << LIMB_BITS) + limbs[:, j].astype(np.float64)
+    return values / scale
+
+
+def to_array(kind, values):
+    if kind == 'uint256':
+        return to_limbs(values) if values else np.empty((0, LIMBS), dtype=np.uint64)
+    if kind == 'address':
+        return np.array(values, dtype='S20')
+    if kind == 'bytes32':
+        return np.array(values, dtype='S32')
+    if kind == 'bool':
+        return np.array(values, dtype=bool)
+    return np.array(values, dtype=np.uint64)
+
+
+def write_segment(path, columns):
+    """ Writes the columns to a .tmp folder renamed to path, so a crash never leaves half a segment """
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    for name, values in columns.items():
+        np.save(os.path.join(tmp_path, name + '.npy'), values)
+    os.replace(tmp_path, path)
+
+
+def load_segment(path, names):
+    """ The columns of a segment, memory-mapped """
+    return dict((name, np.load(os.path.join(path, name + '.npy'), mmap_mode='r')) for name in names)
+
+
+def pair_partition(base_token, secondary_token):
+    return '{0}-{1}'.format(base_token.lower(), secondary_token.lower())
+
+
+class EventStore(object):
+    """ Buffers decoded events in memory and writes them as column segments on flush """
+
+    def __init__(self, root, ticks_per_partition=1000):
+        self.root = root
+        self.ticks_per_partition = ticks_per_partition
+        # (pair partition, event name, tick bucket) -> list of rows
+        self.buffers = dict()
+        os.makedirs(root, exist_ok=True)
+
+    @property
+    def state_path(self):
+        return os.path.join(self.root, 'state.json')
+
+    def load_state(self):
+        if not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def save_state(self, state):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    # Writing
+
+    def bucket(self, tick):
+        return tick - tick % self.ticks_per_partition
+
+    def append(self, event_name, partition, row):
+        """ Buffers a row: a dict with a value for every column of the event """
+        key = (partition, event_name, self.bucket(row['tick']))
+        self.buffers.setdefault(key, []).append(row)
+
+    @property
+    def buffered(self):
+        return sum(len(rows) for rows in self.buffers.values())
+
+    def flush(self):
+        """ Writes the buffered rows as new segments, returns how many were written """
+        written = 0
+        for (partition, event_name, bucket), rows in self.buffers.items():
+            columns = dict((name, to_array(kind, [row[name] for row in rows]))
+                           for name, kind in event_columns(event_name))
+            self._write_segment(partition, event_name, bucket, columns)
+            written += len(rows)
+        self.buffers = dict()
+        return written
+
+    def _partition_path(self, partition, event_name, bucket):
+        return os.path.join(self.root, partition, event_name, 'ticks-{0}'.format(bucket))
+
+    def _write_segment(self, partition, event_name, bucket, columns):
+        blocks = columns['block_number']
+        path = os.path.join(self._partition_path(partition, event_name, bucket),
+                            '{0}-{1}'.format(int(blocks.min()), int(blocks.max())))
+        # two flushes can write the same block range (a block split by a flush)
+        suffix = 0
+        while os.path.exists(path if not suffix else '{0}.{1}'.format(path, suffix)):
+            suffix += 1
+        write_segment(path if not suffix else '{0}.{1}'.format(path, suffix), columns)
+
+    # Reading
+
+    def partitions(self):
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def segments(self, event_name, partition=None):
+        """ Paths of the segments of an event (of one pair partition or all), by first block """
+        segments = []
+        for name in ([partition] if partition else self.partitions()):
+            event_path = os.path.join(self.root, name, event_name)
+            if not os.path.isdir(event_path):
+                continue
+            for bucket in os.listdir(event_path):
+                bucket_path = os.path.join(event_path, bucket)
+                segments += [os.path.join(bucket_path, segment) for segment in os.listdir(bucket_path)
+                             if not segment.endswith('.tmp')]
+        return sorted(segments, key=lambda path: int(os.path.basename(path).split('-')[0]))
+
+    @staticmethod
+    def _load_segment(path, event_name):
+        return load_segment(path, [name for name, _ in event_columns(event_name)])
+
+    def read(self, event_name, base_token=None, secondary_token=None, from_tick=None, to_tick=None,
+             from_block=None, to_block=None):
+        """
+        Columns of the stored events of a pair (every pair and the global ones if no pair
+        is given), in chain order, filtered by tick and block ranges (inclusive)
+        """
+        partition = pair_partition(base_token, secondary_token) if base_token else None
+        segments = [self._load_segment(path, event_name) for path in self.segments(event_name, partition)]
+        segments = [segment for segment in segments if len(segment['block_number'])]
+        if not segments:
+            return dict((name, to_array(kind, [])) for name, kind in event_columns(event_name))
+        if len(segments) == 1:
+            table = segments[0]
+        else:
+            table = dict((name, np.concatenate([segment[name] for segment in segments])) for name in segments[0])
+            order = np.lexsort((table['log_index'], table['block_number']))
+            table = dict((name, values[order]) for name, values in table.items())
+        mask = np.ones(len(table['block_number']), dtype=bool)
+        for column, low, high in (('tick', from_tick, to_tick), ('block_number', from_block, to_block)):
+            if low is not None:
+                mask &= table[column] >= low
+            if high is not None:
+                mask &= table[column] <= high
+        if mask.all():
+            return table
+        return dict((name, values[mask]) for name, values in table.items())
+
+    # Maintenance
+
+    def truncate(self, from_block):
+        """ Drops the stored (and buffered) rows from from_block on, e.g. after a reorg """
+        self.buffers = dict((key, [row for row in rows if row['block_number'] < from_block])
+                            for key, rows in self.buffers.items())
+        for partition in self.partitions():
+            for event_name in os.listdir(os.path.join(self.root, partition)):
+                for path in self.segments(event_name, partition):
+                    last_block = int(os.path.basename(path).split('-')[1].split('.')[0])
+                    if last_block < from_block:
+                        continue
+                    table = self._load_segment(path, event_name)
+                    keep = np.asarray(table['block_number']) < from_block
+                    table = dict((name, np.array(values[keep])) for name, values in table.items())
+                    shutil.rmtree(path)
+                    if keep.any():
+                        self._write_segment(partition, event_name, self._bucket_of(path), table)
+
+    @staticmethod
+    def _bucket_of(segment_path):
+        return int(os.path.basename(os.path.dirname(segment_path)).split('-')[1])
+
+    def compact(self):
+        """ Merges the segments of every partition into one """
+        for partition in self.partitions():
+            for event_name in os.listdir(os.path.join(self.root, partition)):
+                by_bucket = dict()
+                for path in self.segments(event_name, partition):
+                    by_bucket.setdefault(self._bucket_of(path), []).append(path)
+                for bucket, paths in by_bucket.items():
+                    if len(paths) < 2:
+                        continue
+                    tables = [self._load_segment(path, event_name) for path in paths]
+                    table = dict((name, np.concatenate([table[name] for table in tables])) for name in tables[0])
+                    self._write_segment(partition, event_name, bucket, table)
+                    for path in paths:
+                        shutil.rmtree(path)
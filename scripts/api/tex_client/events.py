@@ -0,0 +1,234 @@
+"""
+TEX events: definitions, precomputed topics and a decoder for raw eth_getLogs entries
+
+The definitions are copied from MoCExchangeLib.sol, OrderListing.sol, TickState.sol and
+TokenPairListing.sol. Decoded events are returned as Event tuples:
+
+    decoder = EventDecoder()
+    for log in rpc.call('eth_getLogs', [{'address': dex_address, 'topics': [decoder.topics()]}]):
+        event = decoder.decode(log)
+        print(event.name, event.args)
+"""
+
+from collections import namedtuple
+
+from .abi import decode_word, encode_word, signature, to_bytes
+
+Event = namedtuple('Event', 'name args block_number log_index transaction_hash block_hash address')
+
+
+class EventDefinition(object):
+
+    def __init__(self, name, topic, inputs):
+        self.name = name
+        self.topic = topic
+        self.inputs = inputs
+        self.indexed = [(arg_type, arg_name) for arg_type, arg_name, indexed in inputs if indexed]
+        self.not_indexed = [(arg_type, arg_name) for arg_type, arg_name, indexed in inputs if not indexed]
+
+    @property
+    def signature(self):
+        return signature(self.name, [arg_type for arg_type, _, _ in self.inputs])
+
+    def decode_args(self, topics, data):
+        args = dict()
+        for (arg_type, arg_name), topic in zip(self.indexed, topics[1:]):
+            args[arg_name] = decode_word(arg_type, to_bytes(topic))
+        data = to_bytes(data)
+        for i, (arg_type, arg_name) in enumerate(self.not_indexed):
+            args[arg_name] = decode_word(arg_type, data[i * 32:(i + 1) * 32])
+        return args
+
+    def encode_args(self, args):
+        """ Inverse of decode_args, returns (topics, data) as hex strings """
+        topics = [self.topic]
+        for arg_type, arg_name in self.indexed:
+            topics.append('0x' + encode_word(arg_type, args[arg_name]).hex())
+        data = b''.join(encode_word(arg_type, args[arg_name]) for arg_type, arg_name in self.not_indexed)
+        return topics, '0x' + data.hex()
+
+
+EVENT_DEFINITIONS = [
+    EventDefinition(
+        'NewOrderInserted',
+        '0x21fa44f85b5f9a70042f003c7b845bdcf692df1e4359b995f95ebecf05ba48e7',
+        [('uint256', 'id', True),
+         ('address', 'sender', True),
+         ('address', 'baseTokenAddress', False),
+         ('address', 'secondaryTokenAddress', False),
+         ('uint256', 'exchangeableAmount', False),
+         ('uint256', 'reservedCommission', False),
+         ('uint256', 'price', False),
+         ('uint256', 'multiplyFactor', False),
+         ('uint64', 'expiresInTick', False),
+         ('bool', 'isBuy', False),
+         ('uint8', 'orderType', False)]),
+    EventDefinition(
+        'NewOrderAddedToPendingQueue',
+        '0xc74df9a166181f1bd5d8a749d06b749b580e9a56e8b68530dc79d79eef0ca55b',
+        [('uint256', 'id', True),
+         ('uint256', 'notIndexedArgumentSoTheThingDoesntBreak', False)]),
+    EventDefinition(
+        'OrderCancelled',
+        '0xd975b60b6329c797ae584f3af10b37331736bff9e1e5c69342394824d8c19b81',
+        [('uint256', 'id', True),
+         ('address', 'sender', True),
+         ('uint256', 'returnedAmount', False),
+         ('uint256', 'commission', False),
+         ('uint256', 'returnedCommission', False),
+         ('bool', 'isBuy', False)]),
+    EventDefinition(
+        'ExpiredOrderProcessed',
+        '0xabcec6b064992cec629a2717ab4ac28152285b1641499154f6fd08eac55df3ca',
+        [('uint256', 'orderId', True),
+         ('address', 'owner', True),
+         ('uint256', 'returnedAmount', False),
+         ('uint256', 'commission', False),
+         ('uint256', 'returnedCommission', False)]),
+    EventDefinition(
+        'BuyerMatch',
+        '0x498bb9197f7c8d2c1e7a94047a70d27c0557ec3a9dbbc21395fddc14ba1da5e1',
+        [('uint256', 'orderId', True),
+         ('uint256', 'amountSent', False),
+         ('uint256', 'commission', False),
+         ('uint256', 'change', False),
+         ('uint256', 'received', False),
+         ('uint256', 'remainingAmount', False),
+         ('uint256', 'matchPrice', False),
+         ('uint64', 'tickNumber', False)]),
+    EventDefinition(
+        'SellerMatch',
+        '0x3177584a10eadb753ce5fb71f236a7ff8fafe5df8f885e1aaf42b57c0f214cd3',
+        [('uint256', 'orderId', True),
+         ('uint256', 'amountSent', False),
+         ('uint256', 'commission', False),
+         ('uint256', 'received', False),
+         ('uint256', 'surplus', False),
+         ('uint256', 'remainingAmount', False),
+         ('uint256', 'matchPrice', False),
+         ('uint64', 'tickNumber', False)]),
+    EventDefinition(
+        'TickStart',
+        '0xa87d06f354e4eb6a0b84a1931ddf2227694fff0707633220127d3e307bd5341c',
+        [('address', 'baseTokenAddress', True),
+         ('address', 'secondaryTokenAddress', True),
+         ('uint64', 'number', False)]),
+    EventDefinition(
+        'TickEnd',
+        '0x23842ef287c228d5716d3763dbe31967fde900e7f446d625d51f6579f4d18a87',
+        [('address', 'baseTokenAddress', True),
+         ('address', 'secondaryTokenAddress', True),
+         ('uint64', 'number', True),
+         ('uint256', 'nextTickBlock', False),
+         ('uint256', 'closingPrice', False)]),
+    EventDefinition(
+        'CommissionWithdrawn',
+        '0xda3da7ef213249c303e6466cfa54d115ebc17e8a517bb9f0ee1ba2e72a1e4cb3',
+        [('address', 'token', False),
+         ('address', 'commissionBeneficiary', False),
+         ('uint256', 'withdrawnAmount', False)]),
+    EventDefinition(
+        'TokenPairDisabled',
+        '0x71a055a513c927530cb6f44f826ef705d11b6b00e0912135c1f73796663138ed',
+        [('address', 'baseToken', False),
+         ('address', 'secondaryToken', False)]),
+    EventDefinition(
+        'TokenPairEnabled',
+        '0x53affae818baf7c49a51b11722048f56b718a0eb3ea1e4e494915a852ead79b0',
+        [('address', 'baseToken', False),
+         ('address', 'secondaryToken', False)]),
+    EventDefinition(
+        'TransferFailed',
+        '0x8bbddc8cb50f31d5dc8adaec627c2da3941128931d3d8834fb6eba0d40f89baa',
+        [('address', '_tokenAddress', True),
+         ('address', '_to', True),
+         ('uint256', '_amount', False),
+         ('bool', '_isRevert', False)]),
+    # Stoppable, the DEX is paused / unpaused by its stopper
+    EventDefinition(
+        'Paused',
+        '0x62e78cea01bee320cd4e420270b5ea74000d11b0c9f74754ebdbfc544b05a258',
+        [('address', 'account', False)]),
+    EventDefinition(
+        'Unpaused',
+        '0x5db9ee0a495bf2e6ff9c91a7834c1ba4fdd244a5e8aa4e537bd38aeae4b073aa',
+        [('address', 'account', False)]),
+]
+
+EVENTS = dict((definition.name, definition) for definition in EVENT_DEFINITIONS)
+
+# ERC20 events, and the Deposit / Withdrawal of WRBTC (contracts/token/WRBTC.sol)
+TOKEN_EVENT_DEFINITIONS = [
+    EventDefinition(
+        'Approval',
+        '0x8c5be1e5ebec7d5bd14f71427d1e84f3dd0314c0f7b2291e5b200ac8c7c3b925',
+        [('address', 'owner', True),
+         ('address', 'spender', True),
+         ('uint256', 'value', False)]),
+    EventDefinition(
+        'Transfer',
+        '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef',
+        [('address', 'from', True),
+         ('address', 'to', True),
+         ('uint256', 'value', False)]),
+    EventDefinition(
+        'Deposit',
+        '0xe1fffcc4923d04b559f4d29a8bfc6cda04eb5b0d3c460751c2402c5c5cc9109c',
+        [('address', 'dst', True),
+         ('uint256', 'wad', False)]),
+    EventDefinition(
+        'Withdrawal',
+        '0x7fcf532c15f0a6db0bd6d0e038bea71d30d808c7d98cb3bf7268a95bf5081b65',
+        [('address', 'src', True),
+         ('uint256', 'wad', False)]),
+]
+
+TOKEN_EVENTS = dict((definition.name, definition) for definition in TOKEN_EVENT_DEFINITIONS)
+
+# events that change the orderbook
+ORDERBOOK_EVENTS = [
+    'NewOrderInserted',
+    'NewOrderAddedToPendingQueue',
+    'OrderCancelled',
+    'ExpiredOrderProcessed',
+    'BuyerMatch',
+    'SellerMatch',
+    'TickStart',
+    'TickEnd',
+]
+
+
+def _hex_to_int(value):
+    if isinstance(value, int):
+        return value
+    return int(value, 16)
+
+
+class EventDecoder(object):
+    """ Decodes raw logs of the given events (of the DEX or TOKEN_EVENTS), indexed by their topic """
+
+    def __init__(self, names=None):
+        names = names or list(EVENTS)
+        definitions = dict(EVENTS, **TOKEN_EVENTS)
+        self.by_topic = dict((definitions[name].topic, definitions[name]) for name in names)
+
+    def topics(self):
+        return list(self.by_topic)
+
+    def decode(self, log):
+        """ Returns an Event for a raw log (as returned by eth_getLogs), None if unknown """
+        topics = log['topics']
+        if not topics:
+            return None
+        topic = topics[0] if isinstance(topics[0], str) else '0x' + bytes(topics[0]).hex()
+        definition = self.by_topic.get(topic.lower())
+        if definition is None:
+            return None
+        return Event(
+            name=definition.name,
+            args=definition.decode_args(topics, log['data']),
+            block_number=_hex_to_int(log['blockNumber']),
+            log_index=_hex_to_int(log['logIndex']),
+            transaction_hash=log.get('transactionHash'),
+            block_hash=log.get('blockHash'),
+            address=log.get('address'))
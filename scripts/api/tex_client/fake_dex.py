@@ -0,0 +1,534 @@
+"""
+In-process fake of the TEX, to run the client tooling and bots offline
+
+FakeExchange keeps the orderbooks of the listed pairs and answers the calls the scripts
+make on the MoCDecentralizedExchange wrapper (insert_* / cancel_*, token_pairs_status,
+tick_stage, tick_is_running, paused), with amounts and prices in token units like the
+wrapper, plus the *_after variants of TexClient. No node is needed, so a bot can be
+load tested with 100k orders in seconds:
+
+    dex = FakeExchange()
+    dex.list_pair(base_token, secondary_token, price=to_wad(10000))
+    dex.insert_buy_limit_order(base_token, secondary_token, amount=100, price=9990, lifespan=5)
+    dex.insert_sell_limit_order(base_token, secondary_token, amount=0.01, price=9980, lifespan=5)
+    dex.mine(10)   # the tick of the pair runs when its nextTickBlock is reached
+    print(dex.token_pairs_status(base_token, secondary_token)['lastClosingPrice'])
+
+The requires of the insertions are the ones of validator.OrderValidator (the fake is its
+reader), the hints are checked like MoCExchangeLib does, the reserved commissions and
+penalties come from commissions.CommissionEngine and a tick runs at once, when mined,
+with the matching of simulator.match_tick, the EMA update and nextTickBlock of the
+contract. Every change is logged as an events.Event (get_events, or raw logs through
+serve() on a FakeRPCServer, so OrderbookMirror.sync and BatchReader work against it).
+
+Blocks only advance with mine() (a scheduler.SimulatedBlockClock), the transactions are
+in the current block. Token balances and allowances are not modelled and the ticks
+never leave orders in the pending queues.
+"""
+
+import itertools
+from collections import namedtuple
+from dataclasses import dataclass
+
+from .abi import FUNCTIONS_BY_SELECTOR
+from .commissions import CommissionEngine, CommissionRates
+from .constants import DEFAULT_PRICE_PRECISION, NO_HINT, RATE_PRECISION, OrderType, TickStage
+from .events import EVENTS, Event
+from .orderbook import OrderbookMirror, pair_key
+from .scheduler import SimulatedBlockClock, TickConfig, next_tick_block
+from .session import RPCError
+from .simulator import OrderArrays, match_tick
+from .validator import PAIR_DOES_NOT_EXIST, PAUSED, ListingRules, OrderRequest, OrderValidator
+from .wad import calculate_new_ema, to_wad
+
+# the defaults of the contract tests (test/testHelpers/constants.js)
+DEFAULT_TICK_CONFIG = TickConfig(expected_orders_for_tick=8, max_blocks_for_tick=12, min_blocks_for_tick=4)
+DEFAULT_MAX_ORDER_LIFESPAN = 10
+DEFAULT_MIN_MULTIPLY_FACTOR = RATE_PRECISION // 100
+DEFAULT_MAX_MULTIPLY_FACTOR = 199 * RATE_PRECISION
+# smoothingFactor of the DOC / WRBTC pair of the testnet
+DEFAULT_SMOOTHING_FACTOR = 16530000000000000
+
+FakeReceipt = namedtuple('FakeReceipt', 'transaction_hash block_number events')
+
+
+class ContractRevert(Exception):
+    """ The transaction would revert with reason """
+
+    def __init__(self, reason):
+        super(ContractRevert, self).__init__(reason)
+        self.reason = reason
+
+
+@dataclass
+class FakePair(object):
+    """ State of a listed pair that is not in its PairOrderbook """
+    base_token: str
+    secondary_token: str
+    ema_price: int
+    market_price: int
+    smoothing_factor: int
+    price_precision: int
+    last_tick_block: int = 0
+
+
+def default_rules():
+    return ListingRules(paused=False, min_order_amount=0, min_multiply_factor=DEFAULT_MIN_MULTIPLY_FACTOR,
+                        max_multiply_factor=DEFAULT_MAX_MULTIPLY_FACTOR,
+                        max_order_lifespan=DEFAULT_MAX_ORDER_LIFESPAN)
+
+
+def _goes_before(value, existing_value, is_buy):
+    """ priceGoesBefore / multiplyFactorGoesBefore """
+    return value > existing_value if is_buy else value < existing_value
+
+
+class FakeExchange(object):
+    """ The TEX contract simulated in memory """
+
+    def __init__(self, address='0x' + '44' * 20, account='0x' + '33' * 20, clock=None, rules=None, rates=None,
+                 tick_config=DEFAULT_TICK_CONFIG, auto_tick=True, process_expired=True):
+        self.address = address
+        self.account = account
+        self.clock = clock or SimulatedBlockClock()
+        self.rules = rules or default_rules()
+        self.commissions = CommissionEngine(None, None, rates=rates or CommissionRates(0, 0, 0, 0))
+        self.tick_config = tick_config
+        self.auto_tick = auto_tick
+        self.process_expired = process_expired
+        self.book = OrderbookMirror()
+        self.listed = dict()
+        self.validator = OrderValidator(self, self.commissions)
+        self.events = []
+        self._order_ids = itertools.count(1)
+        self._transaction_ids = itertools.count(1)
+        self._transaction_hash = None
+        self._log_block = None
+        self._log_indexes = itertools.count()
+
+    # Reader of the validator (and anything using a batch.BatchReader)
+
+    @property
+    def pairs(self):
+        return [(pair.base_token, pair.secondary_token) for pair in self.listed.values()]
+
+    def refresh_pairs(self):
+        return self.pairs
+
+    def call(self, function_name, *args, **kwargs):
+        """ The getter of the contract, decoded like BatchReader.call """
+        getter = getattr(self, '_get_' + function_name, None)
+        if getter is None:
+            raise RPCError({'message': 'Not supported by the fake: {0}'.format(function_name)}, 'eth_call')
+        return getter(*args)
+
+    def batch_call(self, calls, block='latest'):
+        results = []
+        for function_name, args in calls:
+            try:
+                results.append(self.call(function_name, *args))
+            except (RPCError, ContractRevert) as e:
+                results.append(e if isinstance(e, RPCError) else RPCError({'message': e.reason}, 'eth_call'))
+        return results
+
+    def _get_paused(self):
+        return self.rules.paused
+
+    def _get_minOrderAmount(self):
+        return self.rules.min_order_amount
+
+    def _get_minMultiplyFactor(self):
+        return self.rules.min_multiply_factor
+
+    def _get_maxMultiplyFactor(self):
+        return self.rules.max_multiply_factor
+
+    def _get_maxOrderLifespan(self):
+        return self.rules.max_order_lifespan
+
+    def _get_tickConfig(self):
+        config = self.tick_config
+        return {'expectedOrdersForTick': config.expected_orders_for_tick,
+                'maxBlocksForTick': config.max_blocks_for_tick, 'minBlocksForTick': config.min_blocks_for_tick}
+
+    def _get_getTokenPairs(self):
+        return [list(pair) for pair in self.pairs]
+
+    def _get_getTokenPairStatus(self, base_token, secondary_token):
+        pair, book = self.pair(base_token, secondary_token), self.book.pair(base_token, secondary_token)
+        # the page memory of the tick is deleted when it ends, and ticks end right away here
+        return {
+            'emergentPrice': 0, 'lastBuyMatchId': 0, 'lastBuyMatchAmount': 0, 'lastSellMatchId': 0,
+            'tickNumber': book.tick_number, 'nextTickBlock': book.next_tick_block,
+            'lastTickBlock': pair.last_tick_block, 'lastClosingPrice': book.last_closing_price,
+            'disabled': self.rules.disabled[pair_key(base_token, secondary_token)], 'emaPrice': pair.ema_price,
+            'smoothingFactor': pair.smoothing_factor, 'marketPrice': pair.market_price}
+
+    def _get_getTickStage(self, base_token, secondary_token):
+        self.pair(base_token, secondary_token)
+        return TickStage.RECEIVING_ORDERS
+
+    def _get_tickIsRunning(self, base_token, secondary_token):
+        self.pair(base_token, secondary_token)
+        return False
+
+    def _get_getMarketPrice(self, base_token, secondary_token):
+        return self.pair(base_token, secondary_token).market_price
+
+    def _get_getLastClosingPrice(self, base_token, secondary_token):
+        return self.book.pair(*self._key_of(base_token, secondary_token)).last_closing_price
+
+    def _get_buyOrdersLength(self, base_token, secondary_token):
+        return len(self.book.pair(*self._key_of(base_token, secondary_token)).buy)
+
+    def _get_sellOrdersLength(self, base_token, secondary_token):
+        return len(self.book.pair(*self._key_of(base_token, secondary_token)).sell)
+
+    def _get_pendingBuyOrdersLength(self, base_token, secondary_token):
+        self.pair(base_token, secondary_token)
+        return 0
+
+    def _get_pendingSellOrdersLength(self, base_token, secondary_token):
+        self.pair(base_token, secondary_token)
+        return 0
+
+    def _get_pendingMarketOrdersLength(self, base_token, secondary_token, is_buy):
+        self.pair(base_token, secondary_token)
+        return 0
+
+    # Pairs and governance
+
+    def pair(self, base_token, secondary_token):
+        pair = self.listed.get(pair_key(base_token, secondary_token))
+        if pair is None:
+            raise ContractRevert(PAIR_DOES_NOT_EXIST)
+        return pair
+
+    def _key_of(self, base_token, secondary_token):
+        self.pair(base_token, secondary_token)
+        return pair_key(base_token, secondary_token)
+
+    def list_pair(self, base_token, secondary_token, price, price_precision=DEFAULT_PRICE_PRECISION,
+                  smoothing_factor=DEFAULT_SMOOTHING_FACTOR, market_price=None):
+        """ addTokenPair with the initial price (wad) as emaPrice and, by default, as market price """
+        key = pair_key(base_token, secondary_token)
+        if key in self.listed:
+            raise ContractRevert('Pair already listed')
+        self.listed[key] = FakePair(base_token, secondary_token, price, market_price or price, smoothing_factor,
+                                    price_precision)
+        book = self.book.pair(base_token, secondary_token)
+        book.tick_number = 1
+        book.next_tick_block = self.clock.block_number() + self.tick_config.min_blocks_for_tick
+        self.rules.disabled[key] = False
+        self.validator.invalidate()
+        return self.listed[key]
+
+    def set_market_price(self, base_token, secondary_token, market_price):
+        """ The price of the price provider of the pair (wad) """
+        self.pair(base_token, secondary_token).market_price = market_price
+
+    def set_rules(self, **values):
+        """ Changes governance parameters, e.g. set_rules(max_order_lifespan=20) """
+        for name, value in values.items():
+            setattr(self.rules, name, value)
+        self.validator.invalidate()
+
+    def set_rates(self, rates):
+        self.commissions = self.validator.commissions = CommissionEngine(None, None, rates=rates)
+
+    def pause(self, sender=None):
+        self.rules.paused = True
+        return self._receipt([self._emit('Paused', account=sender or self.account)])
+
+    def unpause(self, sender=None):
+        self.rules.paused = False
+        return self._receipt([self._emit('Unpaused', account=sender or self.account)])
+
+    def disable_pair(self, base_token, secondary_token):
+        key = self._key_of(base_token, secondary_token)
+        if self.rules.disabled[key]:
+            raise ContractRevert('Pair already disabled')
+        self.rules.disabled[key] = True
+        return self._receipt([self._emit('TokenPairDisabled', baseToken=base_token, secondaryToken=secondary_token)])
+
+    def enable_pair(self, base_token, secondary_token):
+        key = self._key_of(base_token, secondary_token)
+        if not self.rules.disabled[key]:
+            raise ContractRevert('Pair already enabled')
+        self.rules.disabled[key] = False
+        return self._receipt([self._emit('TokenPairEnabled', baseToken=base_token, secondaryToken=secondary_token)])
+
+    # Events
+
+    def _emit(self, name, **args):
+        block_number = self.clock.block_number()
+        if block_number != self._log_block:
+            self._log_block, self._log_indexes = block_number, itertools.count()
+        if self._transaction_hash is None:
+            self._transaction_hash = '0x{0:064x}'.format(next(self._transaction_ids))
+        event = Event(name, args, block_number, next(self._log_indexes), self._transaction_hash, None,
+                      self.address)
+        self.events.append(event)
+        self.book.apply(event)
+        self.validator.observe(event)
+        return event
+
+    def _receipt(self, events):
+        """ Ends the transaction that logged the events """
+        receipt = FakeReceipt(self._transaction_hash, self.clock.block_number(), events)
+        self._transaction_hash = None
+        return receipt
+
+    def get_events(self, from_block=0, to_block=None, names=None):
+        """ The events logged between the blocks (inclusive), of the given names if any """
+        return [event for event in self.events
+                if event.block_number >= from_block and (to_block is None or event.block_number <= to_block) and
+                (names is None or event.name in names)]
+
+    def logs(self, from_block=0, to_block=None, topics=None):
+        """ The events as raw logs, like eth_getLogs """
+        logs = []
+        for event in self.get_events(from_block, to_block):
+            definition = EVENTS[event.name]
+            if topics and definition.topic not in topics:
+                continue
+            event_topics, data = definition.encode_args(event.args)
+            logs.append({'address': self.address, 'topics': event_topics, 'data': data,
+                         'blockNumber': hex(event.block_number), 'logIndex': hex(event.log_index),
+                         'transactionHash': event.transaction_hash})
+        return logs
+
+    def serve(self, server):
+        """ Answers eth_call (the getters), eth_getLogs and eth_blockNumber of a FakeRPCServer """
+
+        def eth_call(params):
+            data = params[0]['data']
+            function = FUNCTIONS_BY_SELECTOR[data[2:10]]
+            value = self.call(function.name, *function.decode_input(data).values())
+            if isinstance(value, dict):
+                return function.encode_output(*[value[name] for name in function.output_names])
+            return function.encode_output(value)
+
+        def get_logs(params):
+            query = params[0]
+            to_block = query.get('toBlock', 'latest')
+            topics = query.get('topics') or [None]
+            return self.logs(int(query.get('fromBlock', '0x0'), 16),
+                             None if to_block == 'latest' else int(to_block, 16), topics[0])
+
+        server.register('eth_call', eth_call)
+        server.register('eth_getLogs', get_logs)
+        server.register('eth_blockNumber', lambda params: hex(self.clock.block_number()))
+        return server
+
+    # Orders, in wad
+
+    def _check_hint(self, index, value, hint, is_buy, is_market):
+        """ validatePreviousOrder / validatePreviousMarketOrder """
+        if hint == NO_HINT or hint == index.previous_id_for(value):
+            return
+        if hint == 0:
+            raise ContractRevert('Multiply factor doesnt belong to start' if is_market else
+                                 'Price doesnt belong to start')
+        previous = self.book.pair_of(hint)
+        previous = None if previous is None else previous.side(is_buy).orders.get(hint)
+        if previous is None:
+            raise ContractRevert('PreviousOrder doesnt exist')
+        if previous.is_market_order != is_market:
+            raise ContractRevert('Hint is not market order' if is_market else 'Hint is not limit order')
+        prefix = 'Market Order' if is_market else 'Order'
+        if _goes_before(value, previous.sort_value, is_buy):
+            raise ContractRevert(prefix + ' should go before')
+        raise ContractRevert(prefix + ' should go after')
+
+    def insert_order(self, order, hint=NO_HINT, sender=None):
+        """ Inserts a validator.OrderRequest, returns the FakeReceipt with its NewOrderInserted """
+        reason = self.validator.check(order)
+        if reason is not None:
+            raise ContractRevert(reason)
+        is_buy, is_market = bool(order.is_buy), order.order_type == OrderType.MARKET_ORDER
+        pair = self.pair(order.base_token, order.secondary_token)
+        side = self.book.pair(order.base_token, order.secondary_token).side(is_buy)
+        value = order.multiply_factor if is_market else order.price
+        self._check_hint(side.market if is_market else side.limit, value, hint, is_buy, is_market)
+        fee = self.commissions.initial_fee(
+            order.amount, self.validator.converter.order_price(order.base_token, order.secondary_token, is_buy))
+        tick_number = self.book.pair(order.base_token, order.secondary_token).tick_number
+        event = self._emit(
+            'NewOrderInserted', id=next(self._order_ids), sender=sender or self.account,
+            baseTokenAddress=pair.base_token, secondaryTokenAddress=pair.secondary_token,
+            exchangeableAmount=order.amount - fee, reservedCommission=fee, price=order.price,
+            multiplyFactor=order.multiply_factor, expiresInTick=tick_number + order.lifespan, isBuy=is_buy,
+            orderType=order.order_type)
+        return self._receipt([event])
+
+    def cancel_order(self, base_token, secondary_token, order_id, is_buy, previous_order_id=0, sender=None):
+        """ cancelBuyOrder / cancelSellOrder, returns the FakeReceipt with its OrderCancelled """
+        if self.rules.paused:
+            raise ContractRevert(PAUSED)
+        side = self.book.pair(*self._key_of(base_token, secondary_token)).side(is_buy)
+        order = side.orders.get(order_id)
+        if order is None:
+            raise ContractRevert('Order not found')
+        index = side.index_for(order)
+        if previous_order_id and not self._is_before(index, previous_order_id, order):
+            raise ContractRevert('Previous order not found')
+        sender = sender or self.account
+        if order.owner.lower() != sender.lower():
+            raise ContractRevert('Not order owner')
+        penalty = self.commissions.cancelation_penalty(order.reserved_commission)
+        event = self._emit(
+            'OrderCancelled', id=order_id, sender=sender, returnedAmount=order.exchangeable_amount,
+            commission=penalty, returnedCommission=order.reserved_commission - penalty, isBuy=bool(is_buy))
+        return self._receipt([event])
+
+    @staticmethod
+    def _is_before(index, order_id, order):
+        """ If order_id is an order before order in the index, where findPreviousOrder starts from """
+        for other in index:
+            if other is order:
+                return False
+            if other.id == order_id:
+                return True
+        return False
+
+    # Ticks
+
+    def due_pairs(self):
+        block_number = self.clock.block_number()
+        return [(pair.base_token, pair.secondary_token) for key, pair in self.listed.items()
+                if self.book.pairs[key].next_tick_block <= block_number]
+
+    def mine(self, blocks=1):
+        """ Advances the clock block by block, running the ticks that are due; returns their receipts """
+        receipts = []
+        for _ in range(blocks):
+            self.clock.advance(1)
+            if self.auto_tick:
+                receipts += [self.run_tick(*pair) for pair in self.due_pairs()]
+        return receipts
+
+    def run_tick(self, base_token, secondary_token):
+        """ Every stage of the tick of a pair at once: matching, expired orders and the EMA """
+        pair = self.pair(base_token, secondary_token)
+        book = self.book.pair(base_token, secondary_token)
+        start_block = self.clock.block_number()
+        if start_block < book.next_tick_block:
+            raise ContractRevert('Next tick not reached')
+        tick_number = book.tick_number
+        pair_args = dict(baseTokenAddress=pair.base_token, secondaryTokenAddress=pair.secondary_token)
+        events = [self._emit('TickStart', number=tick_number, **pair_args)]
+
+        buys = OrderArrays.from_orders(list(book.buy.limit) + list(book.buy.market))
+        sells = OrderArrays.from_orders(list(book.sell.limit) + list(book.sell.market))
+        tick = match_tick(buys, sells, pair.market_price, tick_number, pair.price_precision)
+        price = tick.simulation.emergent_price
+        for row in range(len(tick.buy)):
+            events.append(self._emit(
+                'BuyerMatch', orderId=int(buys.ids[tick.buy[row]]), amountSent=tick.buyer_sent[row],
+                commission=tick.buyer_commission[row], change=tick.change[row], received=tick.limiting_amount[row],
+                remainingAmount=tick.buyer_remaining[row], matchPrice=price, tickNumber=tick_number))
+            events.append(self._emit(
+                'SellerMatch', orderId=int(sells.ids[tick.sell[row]]), amountSent=tick.limiting_amount[row],
+                commission=tick.seller_commission[row], received=tick.buyer_sent[row], surplus=tick.surplus[row],
+                remainingAmount=tick.seller_remaining[row], matchPrice=price, tickNumber=tick_number))
+        if self.process_expired:
+            events += self._expire(book, tick_number)
+
+        matches_amount = tick.simulation.matches_amount
+        if matches_amount:
+            book.last_closing_price = price
+            pair.ema_price = calculate_new_ema(pair.ema_price, price, pair.smoothing_factor)
+        next_block = next_tick_block(self.tick_config, pair.last_tick_block, start_block, matches_amount)
+        pair.last_tick_block = start_block
+        events.append(self._emit('TickEnd', number=tick_number, nextTickBlock=next_block, closingPrice=price,
+                                 **pair_args))
+        return self._receipt(events)
+
+    def _expire(self, book, tick_number):
+        """ processExpired of every order that expired at tick_number """
+        events = []
+        for side in (book.buy, book.sell):
+            expired = [order for order in side.orders.values() if order.expires_in_tick <= tick_number]
+            for order in expired:
+                penalty = self.commissions.expiration_penalty(order.reserved_commission)
+                events.append(self._emit(
+                    'ExpiredOrderProcessed', orderId=order.id, owner=order.owner,
+                    returnedAmount=order.exchangeable_amount, commission=penalty,
+                    returnedCommission=order.reserved_commission - penalty))
+        return events
+
+    # The moneyonchain MoCDecentralizedExchange wrapper and TexClient, in token units
+
+    @staticmethod
+    def _sender(tx_arguments):
+        sender = tx_arguments.get('from')
+        return getattr(sender, 'address', sender)
+
+    def paused(self):
+        return self.rules.paused
+
+    def token_pairs(self):
+        return self._get_getTokenPairs()
+
+    def token_pairs_status(self, base_token, secondary_token):
+        status = self._get_getTokenPairStatus(base_token, secondary_token)
+        status['EMAPrice'] = status.pop('emaPrice')
+        return status
+
+    def tick_stage(self, pair):
+        return self._get_getTickStage(*pair)
+
+    def tick_is_running(self, pair):
+        return self._get_tickIsRunning(*pair)
+
+    def block_number(self):
+        return self.clock.block_number()
+
+    def _insert(self, base_token, secondary_token, amount, is_buy, lifespan, order_type, price=0,
+                multiply_factor=0, hint=NO_HINT, **tx_arguments):
+        order = OrderRequest(base_token, secondary_token, to_wad(amount), is_buy, lifespan, order_type,
+                             to_wad(price), to_wad(multiply_factor))
+        return self.insert_order(order, hint, self._sender(tx_arguments))
+
+    def insert_buy_limit_order(self, base_token, secondary_token, amount, price, lifespan, **tx_arguments):
+        return self._insert(base_token, secondary_token, amount, True, lifespan, OrderType.LIMIT_ORDER, price=price,
+                            **tx_arguments)
+
+    def insert_sell_limit_order(self, base_token, secondary_token, amount, price, lifespan, **tx_arguments):
+        return self._insert(base_token, secondary_token, amount, False, lifespan, OrderType.LIMIT_ORDER,
+                            price=price, **tx_arguments)
+
+    def insert_buy_market_order(self, base_token, secondary_token, amount, multiply_factor, lifespan,
+                                **tx_arguments):
+        return self._insert(base_token, secondary_token, amount, True, lifespan, OrderType.MARKET_ORDER,
+                            multiply_factor=multiply_factor, **tx_arguments)
+
+    def insert_sell_market_order(self, base_token, secondary_token, amount, multiply_factor, lifespan,
+                                 **tx_arguments):
+        return self._insert(base_token, secondary_token, amount, False, lifespan, OrderType.MARKET_ORDER,
+                            multiply_factor=multiply_factor, **tx_arguments)
+
+    def insert_buy_limit_order_after(self, base_token, secondary_token, amount, price, lifespan,
+                                     previous_order_id, **tx_arguments):
+        return self._insert(base_token, secondary_token, amount, True, lifespan, OrderType.LIMIT_ORDER, price=price,
+                            hint=previous_order_id, **tx_arguments)
+
+    def insert_sell_limit_order_after(self, base_token, secondary_token, amount, price, lifespan,
+                                      previous_order_id, **tx_arguments):
+        return self._insert(base_token, secondary_token, amount, False, lifespan, OrderType.LIMIT_ORDER,
+                            price=price, hint=previous_order_id, **tx_arguments)
+
+    def insert_market_order_after(self, base_token, secondary_token, amount, multiply_factor, previous_order_id,
+                                  lifespan, is_buy, **tx_arguments):
+        return self._insert(base_token, secondary_token, amount, is_buy, lifespan, OrderType.MARKET_ORDER,
+                            multiply_factor=multiply_factor, hint=previous_order_id, **tx_arguments)
+
+    def cancel_buy_order(self, base_token, secondary_token, order_id, previous_order_id=0, **tx_arguments):
+        return self.cancel_order(base_token, secondary_token, order_id, True, previous_order_id,
+                                 self._sender(tx_arguments))
+
+    def cancel_sell_order(self, base_token, secondary_token, order_id, previous_order_id=0, **tx_arguments):
+        return self.cancel_order(base_token, secondary_token, order_id, False, previous_order_id,
+                                 self._sender(tx_arguments))
+
@@ -0,0 +1,238 @@
+"""
+In-process fake JSON-RPC node, used by the benchmarks and tests that need an HTTP
+endpoint but not a real chain.
+
+    server = FakeRPCServer()
+    server.register('eth_call', lambda params: '0x' + '00' * 32)
+    server.start()
+    ... RPCSession(server.url) ...
+    server.stop()
+
+Single and batch requests are supported. Unknown methods answer with the standard
+-32601 error.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length))
+        self.server.fake.on_request()
+        if isinstance(request, list):
+            answer = [self.server.fake.dispatch(item) for item in request]
+        else:
+            answer = self.server.fake.dispatch(request)
+        body = json.dumps(answer).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeRPCServer(object):
+    """ Minimal JSON-RPC node running in a background thread """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        # http requests (round trips), json-rpc calls inside them and tcp connections
+        self.requests_count = 0
+        self.calls_count = 0
+        self.connections_count = 0
+        self.handlers = {
+            'eth_blockNumber': lambda params: hex(self.block_number),
+            'eth_chainId': lambda params: hex(31),
+            'net_version': lambda params: '31',
+        }
+        self.block_number = 1
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}'.format(self.host, self.port)
+
+    def register(self, method, handler):
+        """ handler receives the params list and returns the result """
+        self.handlers[method] = handler
+
+    def on_request(self):
+        with self._lock:
+            self.requests_count += 1
+        if self.latency:
+            # simulated network round trip
+            time.sleep(self.latency)
+
+    def dispatch(self, request):
+        with self._lock:
+            self.calls_count += 1
+        handler = self.handlers.get(request.get('method'))
+        answer = {'jsonrpc': '2.0', 'id': request.get('id')}
+        if handler is None:
+            answer['error'] = {'code': -32601, 'message': 'Method not found'}
+            return answer
+        try:
+            answer['result'] = handler(request.get('params', []))
+        except Exception as e:
+            answer['error'] = {'code': -32000, 'message': str(e)}
+        return answer
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self.port = self._httpd.server_address[1]
+        original_handle = self._httpd.process_request
+
+        def process_request(request, client_address):
+            with self._lock:
+                self.connections_count += 1
+            original_handle(request, client_address)
+
+        self._httpd.process_request = process_request
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class FakeTransactions(object):
+    """
+    Transaction pool of the fake node for unlocked accounts (eth_sendTransaction):
+    nonces are checked like a node does, the ready transactions are mined by mine(),
+    or every block_time seconds after start_mining(). revert(transaction) -> bool
+    marks the transactions mined with status 0, the ones below min_gas_price stay in
+    the pool (stuck) and drop(hash) removes one like a node evicting it. gas_estimate is
+    the gas of every transaction or a function of the transaction, on_mined(transaction)
+    is called for every mined one that did not revert and receipt_logs(transaction) gives
+    the logs of its receipt.
+    """
+
+    def __init__(self, server, gas_price=10 ** 9, gas_estimate=100000, revert=None, block_gas_limit=6800000):
+        self.server = server
+        self.gas_price = gas_price
+        self.min_gas_price = 0
+        self.gas_estimate = gas_estimate
+        self.block_gas_limit = block_gas_limit
+        self.revert = revert or (lambda transaction: False)
+        self.on_mined = None
+        self.receipt_logs = None
+        self.nonces = dict()
+        self.pool = dict()
+        self.receipts = dict()
+        self.mined = []
+        self._lock = threading.Lock()
+        self._mining = None
+        server.register('eth_gasPrice', lambda params: hex(self.gas_price))
+        server.register('eth_estimateGas', lambda params: hex(self.gas(params[0])))
+        server.register('eth_getBlockByNumber', lambda params: {
+            'number': hex(server.block_number), 'gasLimit': hex(self.block_gas_limit)})
+        server.register('eth_getTransactionCount', self.transaction_count)
+        server.register('eth_sendTransaction', self.send_transaction)
+        server.register('eth_getTransactionReceipt', lambda params: self.receipts.get(params[0]))
+        server.register('eth_getTransactionByHash', self.transaction_by_hash)
+
+    def gas(self, transaction):
+        return self.gas_estimate(transaction) if callable(self.gas_estimate) else self.gas_estimate
+
+    def transaction_count(self, params):
+        address, block = params[0].lower(), params[1] if len(params) > 1 else 'latest'
+        with self._lock:
+            nonce = self.nonces.get(address, 0)
+            if block == 'pending':
+                while (address, nonce) in self.pool:
+                    nonce += 1
+            return hex(nonce)
+
+    def send_transaction(self, params):
+        transaction = params[0]
+        address, nonce = transaction['from'].lower(), int(transaction['nonce'], 16)
+        with self._lock:
+            if nonce < self.nonces.get(address, 0):
+                raise ValueError('nonce too low')
+            replaced = self.pool.get((address, nonce))
+            if replaced is not None and dict(replaced, hash=None) == dict(transaction, hash=None):
+                return replaced['hash']
+            if replaced is not None and int(transaction['gasPrice'], 16) <= int(replaced['gasPrice'], 16):
+                raise ValueError('replacement transaction underpriced')
+            transaction = dict(transaction, hash='0x{0:064x}'.format(self.server.calls_count * 2 ** 32 + nonce))
+            self.pool[(address, nonce)] = transaction
+            return transaction['hash']
+
+    def transaction_by_hash(self, params):
+        with self._lock:
+            for transaction in list(self.pool.values()) + self.mined:
+                if transaction['hash'] == params[0]:
+                    return transaction
+            return None
+
+    def drop(self, transaction_hash):
+        with self._lock:
+            for key, transaction in list(self.pool.items()):
+                if transaction['hash'] == transaction_hash:
+                    del self.pool[key]
+
+    def mine(self):
+        """ Mines the transactions with consecutive nonces in one block """
+        with self._lock:
+            self.server.block_number += 1
+            for (address, nonce) in sorted(self.pool):
+                if nonce != self.nonces.get(address, 0):
+                    continue
+                if int(self.pool[(address, nonce)]['gasPrice'], 16) < self.min_gas_price:
+                    continue
+                transaction = self.pool.pop((address, nonce))
+                self.nonces[address] = nonce + 1
+                self.mined.append(transaction)
+                reverted = self.revert(transaction)
+                self.receipts[transaction['hash']] = {
+                    'transactionHash': transaction['hash'],
+                    'blockNumber': hex(self.server.block_number),
+                    'gasUsed': hex(self.gas(transaction)),
+                    'status': '0x0' if reverted else '0x1',
+                    'logs': [] if reverted or self.receipt_logs is None else self.receipt_logs(transaction),
+                }
+                if not reverted and self.on_mined is not None:
+                    self.on_mined(transaction)
+
+    def start_mining(self, block_time):
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(block_time):
+                self.mine()
+
+        self._mining = stop
+        threading.Thread(target=run, daemon=True).start()
+        return self
+
+    def stop_mining(self):
+        if self._mining is not None:
+            self._mining.set()
+            self._mining = None
@@ -0,0 +1,405 @@
+"""
+Real-time feed of the TEX events: one reader of the node, many local consumers
+
+Every strategy polling the node on its own multiplies the load for the same data. A
+Feed follows the new blocks once (eth_subscribe('newHeads') when a ws_url is given and
+the websockets package is installed, else one eth_blockNumber per poll), reads the
+logs of the DEX once per block, decodes them once into the orderbook mirror and fans
+out typed Messages to the subscribers:
+
+    feed = Feed(AsyncRPCSession(rpc_url), dex_address, ws_url=ws_url)
+    matches = feed.subscribe(kinds=[ORDER_MATCHED], pairs=[(base_token, secondary_token)])
+    asyncio.ensure_future(feed.run())
+    async for message in matches:
+        print(message.order_id, message.is_buy, message.args['matchPrice'])
+
+The blocks only trigger the reads, the logs are always read by block range from the
+last block of the mirror, so no block is skipped when a poll is late or the websocket
+falls back to polling. The mirror is synced up to the head without messages when the
+feed starts (load a saved one to skip the history), after that it is the orderbook as
+of the last published message.
+
+Every subscription has a bounded buffer and a policy for when it is full: WAIT makes
+the feed wait for the consumer (backpressure: the next read covers the blocks it
+missed, in one request), DROP_OLDEST drops the oldest message (counted in dropped) and
+DISCONNECT closes the subscription (overflowed), for consumers that resync.
+
+Other processes subscribe over a local socket (a unix socket path, or a localhost
+port), with one line of JSON as the subscription and the messages as JSON lines:
+
+    server = await feed.serve(path='/tmp/tex-feed.sock')
+    # in the consumer process
+    async for message in socket_messages(path='/tmp/tex-feed.sock', kinds=[TICK_END]):
+        print(message.base_token, message.args['closingPrice'])
+"""
+
+import asyncio
+import json
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from typing import Optional
+
+from .batch import BatchReader
+from .constants import TickStage
+from .orderbook import OrderbookMirror, pair_key
+from .session import RPCError
+
+# message kinds
+ORDER_ADDED = 'order_added'
+ORDER_MATCHED = 'order_matched'
+ORDER_CANCELLED = 'order_cancelled'
+ORDER_EXPIRED = 'order_expired'
+TICK_START = 'tick_start'
+TICK_END = 'tick_end'
+STAGE_CHANGED = 'stage_changed'
+# the messages of the block (and the ones before it) were published
+NEW_BLOCK = 'new_block'
+# last message of a socket subscription closed for being full
+OVERFLOW = 'overflow'
+
+EVENT_KINDS = {
+    'NewOrderInserted': ORDER_ADDED,
+    # the order goes to the orderbook when the tick ends, with a NewOrderInserted
+    'NewOrderAddedToPendingQueue': ORDER_ADDED,
+    'BuyerMatch': ORDER_MATCHED,
+    'SellerMatch': ORDER_MATCHED,
+    'OrderCancelled': ORDER_CANCELLED,
+    'ExpiredOrderProcessed': ORDER_EXPIRED,
+    'TickStart': TICK_START,
+    'TickEnd': TICK_END,
+}
+
+# policies of a full subscription
+WAIT = 'wait'
+DROP_OLDEST = 'drop_oldest'
+DISCONNECT = 'disconnect'
+
+
+@dataclass
+class Message(object):
+    """ One fact of the feed; args are the decoded arguments of the event """
+    kind: str
+    block_number: int
+    base_token: Optional[str] = None
+    secondary_token: Optional[str] = None
+    order_id: Optional[int] = None
+    # None for the expired orders, and the pending ones whose insertion could not be read
+    is_buy: Optional[bool] = None
+    event: Optional[str] = None
+    args: dict = field(default_factory=dict)
+    log_index: Optional[int] = None
+    transaction_hash: Optional[str] = None
+
+    def to_json(self):
+        return json.dumps(asdict(self), separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, line):
+        return cls(**json.loads(line))
+
+
+class Subscription(object):
+    """ Bounded buffer of the messages of one consumer, iterated with async for """
+
+    def __init__(self, kinds=None, pairs=None, maxsize=1000, policy=WAIT):
+        if policy not in (WAIT, DROP_OLDEST, DISCONNECT):
+            raise ValueError('Unknown policy {0}'.format(policy))
+        self.kinds = set(kinds) if kinds else None
+        self.pairs = set(pair_key(*pair) for pair in pairs) if pairs else None
+        self.maxsize = maxsize
+        self.policy = policy
+        self.closed = False
+        self.overflowed = False
+        self.dropped = 0
+        # times the feed waited for this consumer
+        self.waits = 0
+        self._messages = deque()
+        self._waiters = []
+
+    def __len__(self):
+        return len(self._messages)
+
+    def wants(self, message):
+        if self.kinds is not None and message.kind not in self.kinds:
+            return False
+        return self.pairs is None or message.kind == NEW_BLOCK or (
+            message.base_token is not None and pair_key(message.base_token, message.secondary_token) in self.pairs)
+
+    def _notify(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters = []
+
+    async def _wait(self):
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        await waiter
+
+    def offer(self, message):
+        """ Buffers the message unless the consumer has to be waited for (WAIT and full) """
+        if self.closed:
+            return True
+        if len(self._messages) >= self.maxsize:
+            if self.policy == WAIT:
+                return False
+            if self.policy == DISCONNECT:
+                self.overflowed = True
+                self.close()
+                return True
+            self._messages.popleft()
+            self.dropped += 1
+        self._messages.append(message)
+        self._notify()
+        return True
+
+    async def put(self, message):
+        if not self.offer(message):
+            self.waits += 1
+            while len(self._messages) >= self.maxsize and not self.closed:
+                await self._wait()
+            self.offer(message)
+
+    async def get(self):
+        """ Next message, None once the subscription is closed and its buffer is empty """
+        while not self._messages and not self.closed:
+            await self._wait()
+        if not self._messages:
+            return None
+        message = self._messages.popleft()
+        self._notify()
+        return message
+
+    def close(self):
+        """ No more messages are buffered, the buffered ones can still be read """
+        self.closed = True
+        self._notify()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+
+class Feed(object):
+    """ Reads the DEX once per block and publishes its messages to the subscribers """
+
+    def __init__(self, rpc, dex_address, mirror=None, ws_url=None, poll_interval=1, confirmations=0,
+                 poll_stages=True, blocks_per_request=2000):
+        # aio.AsyncRPCSession, its synchronous session is used from its thread pool
+        self.rpc = rpc
+        self.reader = BatchReader(rpc.session, dex_address)
+        self.mirror = mirror if mirror is not None else OrderbookMirror()
+        self.ws_url = ws_url
+        self.poll_interval = poll_interval
+        self.confirmations = confirmations
+        # getTickStage of the pairs with a running tick once per block, for the stages between TickStart and TickEnd
+        self.poll_stages = poll_stages
+        self.blocks_per_request = blocks_per_request
+        self.subscriptions = []
+        # last stage of every pair key
+        self.stages = dict()
+        # 'websocket' or 'polling'
+        self.source = None
+        self.published_count = 0
+        self.errors = 0
+        self.last_error = None
+
+    async def _in_thread(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.rpc.executor, fn, *args)
+
+    # Subscribers
+
+    def subscribe(self, kinds=None, pairs=None, maxsize=1000, policy=WAIT):
+        """ Subscription to the messages of the given kinds and pairs (all by default) """
+        subscription = Subscription(kinds, pairs, maxsize, policy)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    async def publish(self, message):
+        """ Gives the message to every subscriber that wants it, waiting for the full WAIT ones """
+        self.subscriptions = [subscription for subscription in self.subscriptions if not subscription.closed]
+        waiting = [subscription for subscription in self.subscriptions
+                   if subscription.wants(message) and not subscription.offer(message)]
+        if waiting:
+            await asyncio.gather(*[subscription.put(message) for subscription in waiting])
+        self.published_count += 1
+
+    def close(self):
+        for subscription in self.subscriptions:
+            subscription.close()
+        self.subscriptions = []
+
+    # Messages
+
+    def _stage_message(self, book, stage, block_number):
+        previous = self.stages.get(book.key, TickStage.RECEIVING_ORDERS)
+        self.stages[book.key] = stage
+        if stage == previous:
+            return []
+        return [Message(STAGE_CHANGED, block_number, book.base_token, book.secondary_token,
+                        args=dict(stage=int(stage), previousStage=int(previous)))]
+
+    def messages(self, event, book):
+        """ Messages of an event applied to the mirror, book being the PairOrderbook of its order """
+        kind = EVENT_KINDS.get(event.name)
+        if kind is None:
+            return []
+        order_id = event.args.get('id', event.args.get('orderId'))
+        is_buy = event.args.get('isBuy')
+        if event.name in ('BuyerMatch', 'SellerMatch'):
+            is_buy = event.name == 'BuyerMatch'
+        elif is_buy is None and order_id is not None:
+            order = self.mirror.find(order_id)[2]
+            is_buy = None if order is None else order.is_buy
+        message = Message(kind, event.block_number, book and book.base_token, book and book.secondary_token,
+                          order_id=order_id, is_buy=is_buy, event=event.name, args=event.args,
+                          log_index=event.log_index, transaction_hash=event.transaction_hash)
+        if event.name == 'TickStart':
+            return [message] + self._stage_message(book, TickStage.RUNNING_SIMULATION, event.block_number)
+        if event.name == 'TickEnd':
+            return [message] + self._stage_message(book, TickStage.RECEIVING_ORDERS, event.block_number)
+        return [message]
+
+    def _poll_stages(self, block_number):
+        running = [book for book in self.mirror.pairs.values() if book.tick_running]
+        if not running:
+            return []
+        stages = self.reader.batch_call([('getTickStage', (book.base_token, book.secondary_token))
+                                         for book in running])
+        messages = []
+        for book, stage in zip(running, stages):
+            if not isinstance(stage, RPCError):
+                messages += self._stage_message(book, TickStage(stage), block_number)
+        return messages
+
+    async def catch_up(self):
+        """ Syncs the mirror up to the head without messages, returns the block """
+        head = int(await self.rpc.call('eth_blockNumber'), 16) - self.confirmations
+        await self._in_thread(partial(self.mirror.sync, self.reader, head, self.blocks_per_request))
+        for book in self.mirror.pairs.values():
+            self.stages[book.key] = TickStage.RUNNING_SIMULATION if book.tick_running else \
+                TickStage.RECEIVING_ORDERS
+        return head
+
+    async def process(self, block_number):
+        """ Reads the blocks after the last one of the mirror up to block_number, publishes their messages """
+        if block_number <= self.mirror.last_block:
+            return 0
+        messages = []
+        try:
+            await self._in_thread(partial(self.mirror.sync, self.reader, block_number, self.blocks_per_request,
+                                          lambda event, book: messages.extend(self.messages(event, book))))
+            if self.poll_stages:
+                messages += await self._in_thread(self._poll_stages, block_number)
+            messages.append(Message(NEW_BLOCK, block_number))
+        finally:
+            # the events of the ranges read before a failure are in the mirror already
+            for message in messages:
+                await self.publish(message)
+        return len(messages)
+
+    # Blocks
+
+    async def _websocket_heads(self, stop):
+        import websockets
+
+        async with websockets.connect(self.ws_url, max_size=None) as connection:
+            await connection.send(json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': 'eth_subscribe',
+                                              'params': ['newHeads']}))
+            reply = json.loads(await connection.recv())
+            if 'error' in reply:
+                raise RPCError(reply['error'], 'eth_subscribe')
+            self.source = 'websocket'
+            async for raw in connection:
+                if stop is not None and stop.is_set():
+                    return
+                notification = json.loads(raw)
+                if notification.get('method') == 'eth_subscription':
+                    yield int(notification['params']['result']['number'], 16)
+
+    async def _polled_heads(self, stop):
+        self.source = 'polling'
+        last = None
+        while stop is None or not stop.is_set():
+            try:
+                head = int(await self.rpc.call('eth_blockNumber'), 16)
+            except Exception as e:
+                self.errors, self.last_error = self.errors + 1, e
+            else:
+                if head != last:
+                    last = head
+                    yield head
+            await asyncio.sleep(self.poll_interval)
+
+    async def heads(self, stop=None):
+        """ Numbers of the new blocks: from the websocket subscription while it works, then polled """
+        if self.ws_url is not None:
+            try:
+                async for head in self._websocket_heads(stop):
+                    yield head
+                if stop is not None and stop.is_set():
+                    return
+            # no websockets package, no eth_subscribe or a dropped connection
+            except Exception as e:
+                self.errors, self.last_error = self.errors + 1, e
+        async for head in self._polled_heads(stop):
+            yield head
+
+    async def run(self, stop=None):
+        """ Publishes the messages of every new block until the stop event (if any) is set """
+        await self.catch_up()
+        async for head in self.heads(stop):
+            try:
+                await self.process(head - self.confirmations)
+            except Exception as e:
+                self.errors, self.last_error = self.errors + 1, e
+
+    # Local socket
+
+    async def _handle_connection(self, reader, writer, maxsize):
+        subscription = None
+        try:
+            request = json.loads(await reader.readline() or '{}')
+            subscription = self.subscribe(request.get('kinds'), request.get('pairs'), maxsize, DISCONNECT)
+            async for message in subscription:
+                writer.write(message.to_json().encode() + b'\n')
+                await writer.drain()
+            if subscription.overflowed:
+                writer.write(Message(OVERFLOW, self.mirror.last_block).to_json().encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            if subscription is not None:
+                subscription.close()
+            writer.close()
+
+    async def serve(self, path=None, host='127.0.0.1', port=0, maxsize=10000):
+        """
+        asyncio server of the messages on the unix socket path, or on host:port. The
+        first line of a connection is its subscription, {"kinds": [...], "pairs": [[base, secondary]]}
+        """
+        handler = partial(self._handle_connection, maxsize=maxsize)
+        if path is not None:
+            return await asyncio.start_unix_server(handler, path)
+        return await asyncio.start_server(handler, host, port)
+
+
+async def socket_messages(path=None, host='127.0.0.1', port=None, kinds=None, pairs=None):
+    """ Messages of a Feed served on a local socket, ending with OVERFLOW if the consumer was too slow """
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    writer.write(json.dumps(dict(kinds=kinds, pairs=pairs)).encode() + b'\n')
+    try:
+        async for line in reader:
+            yield Message.from_json(line)
+    finally:
+        writer.close()
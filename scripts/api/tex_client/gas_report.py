@@ -0,0 +1,130 @@
+"""
+Gas and wall time of the TEX operations, written so runs can be compared between commits
+
+A GasReport collects one sample per transaction, labelled with the operation (e.g.
+insertBuyLimitOrderAfter, matchOrders:RUNNING_MATCHING) and the scenario it ran in
+(e.g. depth=100). The summary groups them and is written as JSON (with the commit and
+the parameters of the run) or CSV:
+
+    report = GasReport(commit=current_commit(), parameters={'depths': [10, 100]})
+    report.add('cancelBuyOrder', 'depth=100', receipt.gas_used, seconds)
+    report.write_json('gas-results.json')
+
+    for row in compare(GasReport.load('before.json'), GasReport.load('after.json')):
+        print(row['operation'], row['scenario'], row['gas_change'])
+"""
+
+import csv
+import json
+import os
+import subprocess
+from collections import OrderedDict, namedtuple
+
+GasSample = namedtuple('GasSample', 'operation scenario gas_used seconds')
+
+SUMMARY_COLUMNS = ['operation', 'scenario', 'count', 'gas_mean', 'gas_min', 'gas_max', 'seconds_mean']
+COMPARE_COLUMNS = ['operation', 'scenario', 'gas_before', 'gas_after', 'gas_change', 'seconds_before',
+                   'seconds_after']
+
+
+def current_commit(path=None):
+    """ Commit of the checkout the run is made from, None outside a git repo """
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=path, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode().strip()
+
+
+class GasReport(object):
+    """ Samples of a benchmark run and their summary """
+
+    def __init__(self, commit=None, parameters=None, samples=None, summary=None):
+        self.commit = commit
+        self.parameters = parameters or dict()
+        self.samples = list(samples or [])
+        # summary of a loaded report, whose samples were not written
+        self._summary = summary
+
+    def add(self, operation, scenario, gas_used, seconds):
+        self.samples.append(GasSample(operation, scenario, gas_used, seconds))
+        self._summary = None
+
+    def summary(self):
+        """ One row per (operation, scenario), in the order they were first measured """
+        if self._summary is not None:
+            return self._summary
+        groups = OrderedDict()
+        for sample in self.samples:
+            groups.setdefault((sample.operation, sample.scenario), []).append(sample)
+        rows = []
+        for (operation, scenario), samples in groups.items():
+            gas = [sample.gas_used for sample in samples]
+            rows.append(OrderedDict([
+                ('operation', operation),
+                ('scenario', scenario),
+                ('count', len(samples)),
+                ('gas_mean', sum(gas) / len(gas)),
+                ('gas_min', min(gas)),
+                ('gas_max', max(gas)),
+                ('seconds_mean', sum(sample.seconds for sample in samples) / len(samples))]))
+        return rows
+
+    # Files
+
+    def to_dict(self):
+        return {
+            'commit': self.commit,
+            'parameters': self.parameters,
+            'summary': self.summary(),
+            'samples': [sample._asdict() for sample in self.samples]}
+
+    @classmethod
+    def from_dict(cls, data):
+        samples = [GasSample(**sample) for sample in data.get('samples', [])]
+        return cls(data.get('commit'), data.get('parameters'), samples,
+                   None if samples else data.get('summary'))
+
+    def write_json(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def write_csv(self, path):
+        """ The summary, one row per (operation, scenario) """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, SUMMARY_COLUMNS)
+            writer.writeheader()
+            writer.writerows(self.summary())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def compare(before, after):
+    """
+    One row per (operation, scenario) of either report with the relative change of the mean
+    gas (0.1 is 10% more gas after), None if it was only measured in one of them
+    """
+    before_rows = OrderedDict(((row['operation'], row['scenario']), row) for row in before.summary())
+    after_rows = OrderedDict(((row['operation'], row['scenario']), row) for row in after.summary())
+    rows = []
+    for key in list(before_rows) + [key for key in after_rows if key not in before_rows]:
+        old, new = before_rows.get(key), after_rows.get(key)
+        change = None
+        if old is not None and new is not None and old['gas_mean']:
+            change = (new['gas_mean'] - old['gas_mean']) / old['gas_mean']
+        rows.append(OrderedDict([
+            ('operation', key[0]),
+            ('scenario', key[1]),
+            ('gas_before', old and old['gas_mean']),
+            ('gas_after', new and new['gas_mean']),
+            ('gas_change', change),
+            ('seconds_before', old and old['seconds_mean']),
+            ('seconds_after', new and new['seconds_mean'])]))
+    return rows
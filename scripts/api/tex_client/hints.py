@@ -0,0 +1,159 @@
+"""
+Previous order hints computed from the local orderbook mirror
+
+Without a hint the contract walks the orderbook to position a new order
+(findPreviousOrderToPrice / findPreviousMarketOrderToMultiplyFactor) or to find the
+order before the one being cancelled (findPreviousOrder), so the gas grows with the
+size of the book. With the id of the previous order it only checks the two neighbours.
+
+HintedOrders computes the hint from an OrderbookMirror and sends the *After / cancel
+calls with it. If the book changed between the sync and the transaction the contract
+rejects the hint; the mirror is synced again and the call retried with a fresh hint,
+and as a last resort sent without hint:
+
+    orders = HintedOrders(client, mirror)
+    orders.insert_buy_limit_order(base_token, secondary_token, amount, price, lifespan)
+    orders.cancel_buy_order(base_token, secondary_token, order_id)
+"""
+
+from .constants import NO_HINT
+from .orderbook import OrderbookMirror
+from .wad import to_wad
+
+# revert reasons of MoCExchangeLib when the hint is not the right one
+STALE_HINT_ERRORS = (
+    'Price doesnt belong to start',
+    'PreviousOrder doesnt exist',
+    'Hint is not limit order',
+    'Order should go before',
+    'Order should go after',
+    'Multiply factor doesnt belong to start',
+    'Hint is not market order',
+    'Market Order should go before',
+    'Market Order should go after',
+    'Previous order not found',
+)
+
+
+def is_stale_hint_error(error):
+    message = str(error)
+    return any(reason in message for reason in STALE_HINT_ERRORS)
+
+
+def limit_order_hint(book, is_buy, price):
+    """ Id of the order after which a limit order with price (wad) goes, 0 for the start """
+    return book.side(is_buy).limit.previous_id_for(price)
+
+
+def market_order_hint(book, is_buy, multiply_factor):
+    """ Id of the order after which a market order with multiply_factor (wad) goes, 0 for the start """
+    return book.side(is_buy).market.previous_id_for(multiply_factor)
+
+
+def cancel_hint(book, is_buy, order_id):
+    """ Id of the order before order_id, 0 if it is the first one or it is not known """
+    side = book.side(is_buy)
+    order = side.orders.get(order_id)
+    if order is None:
+        return 0
+    return side.index_for(order).previous_id_of(order)
+
+
+def pending_move_hints(book, count=None):
+    """
+    hintIds of matchOrdersWithHints for the moving of the pending orders: the previous
+    order of each pending order, in the order the contract moves them (buy limit queue,
+    sell limit queue, buy market queue, sell market queue). Only valid once the matching
+    of the tick is done and the mirror is synced.
+    """
+    hints = []
+    for side, is_market in ((book.buy, False), (book.sell, False), (book.buy, True), (book.sell, True)):
+        queue = side.pending_market if is_market else side.pending_limit
+        if not queue:
+            continue
+        index = (side.market if is_market else side.limit).copy()
+        for order in queue.values():
+            if count is not None and len(hints) >= count:
+                return hints
+            hints.append(index.previous_id_for(order.sort_value))
+            index.add(order)
+    return hints
+
+
+class HintedOrders(object):
+    """ Inserts and cancels with hints from a mirror kept in sync before every call """
+
+    def __init__(self, client, mirror=None, max_retries=2, sync=True):
+        self.client = client
+        self.mirror = mirror if mirror is not None else OrderbookMirror()
+        self.max_retries = max_retries
+        self.sync = sync
+        self.retries_count = 0
+
+    def refresh(self):
+        self.mirror.sync(self.client)
+
+    def _send(self, base_token, secondary_token, compute_hint, send, fallback_hint):
+        """ Sends with a fresh hint, retrying while the contract rejects it as stale """
+        for attempt in range(self.max_retries + 1):
+            if self.sync or attempt:
+                self.refresh()
+            hint = compute_hint(self.mirror.pair(base_token, secondary_token))
+            try:
+                return send(hint)
+            except Exception as e:
+                if not is_stale_hint_error(e):
+                    raise
+                self.retries_count += 1
+        return send(fallback_hint)
+
+    def insert_buy_limit_order(self, base_token, secondary_token, amount, price, lifespan, **tx_arguments):
+        return self._send(
+            base_token, secondary_token,
+            lambda book: limit_order_hint(book, True, to_wad(price)),
+            lambda hint: self.client.insert_buy_limit_order_after(
+                base_token, secondary_token, amount, price, lifespan, hint, **tx_arguments),
+            NO_HINT)
+
+    def insert_sell_limit_order(self, base_token, secondary_token, amount, price, lifespan, **tx_arguments):
+        return self._send(
+            base_token, secondary_token,
+            lambda book: limit_order_hint(book, False, to_wad(price)),
+            lambda hint: self.client.insert_sell_limit_order_after(
+                base_token, secondary_token, amount, price, lifespan, hint, **tx_arguments),
+            NO_HINT)
+
+    def insert_market_order(self, base_token, secondary_token, amount, multiply_factor, lifespan, is_buy,
+                            **tx_arguments):
+        return self._send(
+            base_token, secondary_token,
+            lambda book: market_order_hint(book, is_buy, to_wad(multiply_factor)),
+            lambda hint: self.client.insert_market_order_after(
+                base_token, secondary_token, amount, multiply_factor, hint, lifespan, is_buy, **tx_arguments),
+            NO_HINT)
+
+    def insert_buy_market_order(self, base_token, secondary_token, amount, multiply_factor, lifespan,
+                                **tx_arguments):
+        return self.insert_market_order(
+            base_token, secondary_token, amount, multiply_factor, lifespan, True, **tx_arguments)
+
+    def insert_sell_market_order(self, base_token, secondary_token, amount, multiply_factor, lifespan,
+                                 **tx_arguments):
+        return self.insert_market_order(
+            base_token, secondary_token, amount, multiply_factor, lifespan, False, **tx_arguments)
+
+    def cancel_buy_order(self, base_token, secondary_token, order_id, **tx_arguments):
+        return self._send(
+            base_token, secondary_token,
+            lambda book: cancel_hint(book, True, order_id),
+            lambda hint: self.client.cancel_buy_order(
+                base_token, secondary_token, order_id, hint, **tx_arguments),
+            0)
+
+    def cancel_sell_order(self, base_token, secondary_token, order_id, **tx_arguments):
+        return self._send(
+            base_token, secondary_token,
+            lambda book: cancel_hint(book, False, order_id),
+            lambda hint: self.client.cancel_sell_order(
+                base_token, secondary_token, order_id, hint, **tx_arguments),
+            0)
@@ -0,0 +1,314 @@
+"""
+Price history of the pairs: per tick rows and OHLCV candles from the indexed events
+
+PriceHistory aggregates the TickEnd, BuyerMatch and SellerMatch events of an EventStore
+(see indexer.py) into one row per tick and pair (closing price, high and low of the
+match prices, volumes, EMA) and into candles of fixed time intervals. The aggregates are
+kept on disk as NumPy arrays and only the ticks closed since the last update are
+aggregated, so range queries are a binary search over precomputed arrays. An update
+appends the new rows as segments (like the EventStore flushes) and recomputes only the
+last candle, the open one, which is kept in the state:
+
+    <root>/<pair>/<ticks | candles-<interval>>/<first row>-<last row>/<column>.npy
+    <root>/state.json
+
+Built and queried from the indexed events:
+
+    history = PriceHistory(store, 'history', timestamps=BlockTimestamps(client.rpc))
+    history.configure(base_token, secondary_token, smoothing_factor=..., initial_ema=...)
+    history.update()
+    candles = history.candles(base_token, secondary_token, 3600, start=time.time() - 86400)
+
+The EMA is recomputed like MoCExchangeLib.onSimulationFinish: only the ticks with
+matches change it, with calculateNewEMA and the smoothingFactor of the pair. The
+contract does not log the EMA nor its smoothing factor, so they are given to configure()
+(e.g. the emaPrice and smoothingFactor of the pair at the block before the first
+indexed tick); without an initial EMA the series starts at the first closing price.
+
+Prices and volumes are floats in token units (wad / 10 ** 18), a tick without matches
+has no price (NaN). The volume is in base tokens sent by the buyers and secondary tokens
+they received. Without a timestamps source the candles are bucketed by block number.
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+from .constants import RATE_PRECISION
+from .event_store import limbs_to_float, limbs_to_ints, load_segment, pair_partition, write_segment
+from .wad import calculate_new_ema
+
+TICK_COLUMNS = ['tick', 'block_number', 'timestamp', 'open', 'high', 'low', 'close', 'volume_base',
+                'volume_secondary', 'matches', 'ema']
+CANDLE_COLUMNS = ['start', 'open', 'high', 'low', 'close', 'volume_base', 'volume_secondary', 'ticks',
+                  'matches', 'ema']
+# the other columns are float64
+INTEGER_COLUMNS = {'tick', 'block_number', 'timestamp', 'matches', 'start', 'ticks'}
+DEFAULT_INTERVALS = (60, 3600, 86400)
+
+
+class BlockTimestamps(object):
+    """ Timestamps of blocks from the node, in batches, cached """
+
+    def __init__(self, rpc, batch_size=100):
+        self.rpc = rpc
+        self.batch_size = batch_size
+        self.cache = dict()
+
+    def __call__(self, block_numbers):
+        missing = sorted(set(int(number) for number in block_numbers) - set(self.cache))
+        for i in range(0, len(missing), self.batch_size):
+            chunk = missing[i:i + self.batch_size]
+            blocks = self.rpc.batch([('eth_getBlockByNumber', [hex(number), False]) for number in chunk])
+            for number, block in zip(chunk, blocks):
+                self.cache[number] = int(block['timestamp'], 16)
+        return np.array([self.cache[int(number)] for number in block_numbers], dtype=np.int64)
+
+
+def _column(name, values=()):
+    return np.asarray(values, dtype=np.int64 if name in INTEGER_COLUMNS else np.float64)
+
+
+def _columns_of(name):
+    return TICK_COLUMNS if name == 'ticks' else CANDLE_COLUMNS
+
+
+def _key_of(name):
+    return 'tick' if name == 'ticks' else 'start'
+
+
+def _first_row(segment):
+    return int(segment.split('-')[0])
+
+
+def _group_matches(table, ticks):
+    """ (volume sent, volume received, count, min price, max price) of the matches of every tick """
+    sent, received = np.zeros(len(ticks)), np.zeros(len(ticks))
+    count = np.zeros(len(ticks), dtype=np.int64)
+    low, high = np.full(len(ticks), np.nan), np.full(len(ticks), np.nan)
+    if not len(table['tick']):
+        return sent, received, count, low, high
+    positions = np.searchsorted(ticks, table['tick'])
+    known = (positions < len(ticks)) & (ticks[np.minimum(positions, len(ticks) - 1)] == table['tick'])
+    positions = positions[known]
+    prices = limbs_to_float(table['matchPrice'][known], RATE_PRECISION)
+    np.add.at(sent, positions, limbs_to_float(table['amountSent'][known], RATE_PRECISION))
+    np.add.at(received, positions, limbs_to_float(table['received'][known], RATE_PRECISION))
+    np.add.at(count, positions, 1)
+    np.fmin.at(low, positions, prices)
+    np.fmax.at(high, positions, prices)
+    return sent, received, count, low, high
+
+
+class PriceHistory(object):
+    """ Per tick rows and candles of every pair, updated incrementally from an EventStore """
+
+    def __init__(self, store, root, intervals=DEFAULT_INTERVALS, timestamps=None):
+        self.store = store
+        self.root = root
+        self.intervals = tuple(intervals)
+        self.timestamps = timestamps
+        os.makedirs(root, exist_ok=True)
+        self.state = self._load_state()
+        # pair partition -> table name -> segments (columns), as written
+        self.segments = dict()
+        # (pair partition, table name) -> the segments and the open candle in one table, for the queries
+        self.views = dict()
+
+    # Files
+
+    @property
+    def state_path(self):
+        return os.path.join(self.root, 'state.json')
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return dict()
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def _save_state(self):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def _segments(self, partition, name):
+        """ The segments of a table, <first row>-<last row> folders appended by the updates """
+        tables = self.segments.setdefault(partition, dict())
+        if name not in tables:
+            path = os.path.join(self.root, partition, name)
+            rows = self.state.get(partition, {}).get('rows', {}).get(name, 0)
+            tables[name] = []
+            for segment in sorted(os.listdir(path) if os.path.isdir(path) else [], key=_first_row):
+                if segment.endswith('.tmp') or _first_row(segment) >= rows:
+                    # from an update that did not finish
+                    shutil.rmtree(os.path.join(path, segment))
+                else:
+                    tables[name].append(load_segment(os.path.join(path, segment), _columns_of(name)))
+        return tables[name]
+
+    def _append(self, partition, name, rows):
+        """ Writes the rows as a new segment of the table """
+        key = _key_of(name)
+        if not len(rows[key]):
+            return
+        segments = self._segments(partition, name)
+        rows_state = self.state.setdefault(partition, dict()).setdefault('rows', dict())
+        first = rows_state.get(name, 0)
+        path = os.path.join(self.root, partition, name)
+        os.makedirs(path, exist_ok=True)
+        write_segment(os.path.join(path, '{0}-{1}'.format(first, first + len(rows[key]) - 1)), rows)
+        segments.append(rows)
+        rows_state[name] = first + len(rows[key])
+
+    def _tail(self, partition, name, first_row):
+        """ The rows of a table from first_row on, from its last segments only """
+        segments = self._segments(partition, name)
+        row = sum(len(segment[_key_of(name)]) for segment in segments)
+        tail = []
+        for segment in reversed(segments):
+            if row <= first_row:
+                break
+            row -= len(segment[_key_of(name)])
+            tail.insert(0, dict((column, values[max(first_row - row, 0):]) for column, values in segment.items()))
+        return dict((column, np.concatenate([segment[column] for segment in tail] + [_column(column)]))
+                    for column in _columns_of(name))
+
+    def _table(self, partition, name):
+        if (partition, name) not in self.views:
+            segments = self._segments(partition, name)
+            if len(segments) > 1:
+                # merged once in memory, the next updates append to it
+                segments[:] = [self._tail(partition, name, 0)]
+            table = segments[0] if segments else dict((column, _column(column)) for column in _columns_of(name))
+            candle = self.state.get(partition, {}).get('open', {}).get(name)
+            if candle is not None:
+                table = dict((column, np.concatenate([table[column], _column(column, [candle[column]])]))
+                             for column in CANDLE_COLUMNS)
+            self.views[(partition, name)] = table
+        return self.views[(partition, name)]
+
+    # Updates
+
+    def configure(self, base_token, secondary_token, smoothing_factor, initial_ema=None):
+        """ smoothingFactor (wad) of the pair and its emaPrice before the first indexed tick """
+        pair_state = self.state.setdefault(pair_partition(base_token, secondary_token), dict())
+        pair_state['smoothing_factor'] = str(smoothing_factor)
+        if initial_ema is not None and 'ema' not in pair_state:
+            pair_state['ema'] = str(initial_ema)
+        self._save_state()
+
+    def pairs(self):
+        return [partition for partition in self.store.partitions() if '-' in partition]
+
+    def update(self):
+        """ Aggregates the ticks closed since the last update of every pair, returns how many """
+        updated = sum(self._update_pair(partition) for partition in self.pairs())
+        self._save_state()
+        return updated
+
+    def _update_pair(self, partition):
+        base_token, secondary_token = partition.split('-')
+        pair_state = self.state.setdefault(partition, dict())
+        last_tick = pair_state.get('last_tick')
+        from_tick = None if last_tick is None else last_tick + 1
+        ends = self.store.read('TickEnd', base_token, secondary_token, from_tick=from_tick)
+        if not len(ends['tick']):
+            return 0
+        ticks = np.asarray(ends['tick'], dtype=np.int64)
+        closing = limbs_to_ints(ends['closingPrice'])
+        buys = self.store.read('BuyerMatch', base_token, secondary_token, from_tick=from_tick, to_tick=ticks[-1])
+        sells = self.store.read('SellerMatch', base_token, secondary_token, from_tick=from_tick, to_tick=ticks[-1])
+        volume_base, volume_secondary, matches, buy_low, buy_high = _group_matches(buys, ticks)
+        _, _, _, sell_low, sell_high = _group_matches(sells, ticks)
+
+        # the EMA only moves in the ticks with matches (emergent price > 0)
+        smoothing_factor = int(pair_state.get('smoothing_factor', 0))
+        ema = int(pair_state['ema']) if 'ema' in pair_state else None
+        emas = np.empty(len(ticks))
+        for i, price in enumerate(closing):
+            if price:
+                ema = price if ema is None else calculate_new_ema(ema, price, smoothing_factor)
+            emas[i] = np.nan if ema is None else ema / RATE_PRECISION
+        close = _column('close', [price / RATE_PRECISION if price else np.nan for price in closing])
+
+        blocks = np.asarray(ends['block_number'], dtype=np.int64)
+        new_rows = {
+            'tick': ticks,
+            'block_number': blocks,
+            'timestamp': blocks if self.timestamps is None else self.timestamps(blocks),
+            'open': close,
+            'high': np.fmax(np.fmax(buy_high, sell_high), close),
+            'low': np.fmin(np.fmin(buy_low, sell_low), close),
+            'close': close,
+            'volume_base': volume_base,
+            'volume_secondary': volume_secondary,
+            'matches': matches,
+            'ema': emas}
+        first_row = pair_state.get('rows', {}).get('ticks', 0)
+        new_rows = dict((column, _column(column, new_rows[column])) for column in TICK_COLUMNS)
+        self._append(partition, 'ticks', new_rows)
+        for interval in self.intervals:
+            self._update_candles(partition, interval, first_row)
+        for key in [key for key in self.views if key[0] == partition]:
+            del self.views[key]
+
+        pair_state['last_tick'] = int(ticks[-1])
+        if ema is not None:
+            pair_state['ema'] = str(ema)
+        return len(ticks)
+
+    def _update_candles(self, partition, interval, first_row):
+        """
+        Appends the candles closed by the ticks from first_row on and recomputes the open one
+        (the last), from its first tick: the open candle is kept in the state, not in a segment
+        """
+        name = 'candles-{0}'.format(interval)
+        open_candles = self.state[partition].setdefault('open', dict())
+        begin = open_candles[name]['row'] if name in open_candles else first_row
+        ticks = self._tail(partition, 'ticks', begin)
+        starts = ticks['timestamp'] - ticks['timestamp'] % interval
+        bucket_starts, first_rows = np.unique(starts, return_index=True)
+        bounds = list(first_rows) + [len(starts)]
+        rows = dict((column, []) for column in CANDLE_COLUMNS)
+        for start, (low, high) in zip(bucket_starts, zip(bounds[:-1], bounds[1:])):
+            close = ticks['close'][low:high]
+            priced = close[~np.isnan(close)]
+            rows['start'].append(start)
+            rows['open'].append(priced[0] if len(priced) else np.nan)
+            rows['close'].append(priced[-1] if len(priced) else np.nan)
+            rows['high'].append(np.nanmax(ticks['high'][low:high]) if len(priced) else np.nan)
+            rows['low'].append(np.nanmin(ticks['low'][low:high]) if len(priced) else np.nan)
+            rows['volume_base'].append(ticks['volume_base'][low:high].sum())
+            rows['volume_secondary'].append(ticks['volume_secondary'][low:high].sum())
+            rows['ticks'].append(high - low)
+            rows['matches'].append(ticks['matches'][low:high].sum())
+            rows['ema'].append(ticks['ema'][high - 1])
+        rows = dict((column, _column(column, values)) for column, values in rows.items())
+        self._append(partition, name, dict((column, values[:-1]) for column, values in rows.items()))
+        open_candles[name] = dict((column, values[-1].item()) for column, values in rows.items())
+        open_candles[name]['row'] = begin + int(first_rows[-1])
+
+    # Queries
+
+    def ticks(self, base_token, secondary_token, from_tick=None, to_tick=None):
+        """ Per tick rows of the pair in [from_tick, to_tick] """
+        table = self._table(pair_partition(base_token, secondary_token), 'ticks')
+        return self._slice(table, 'tick', from_tick, to_tick)
+
+    def candles(self, base_token, secondary_token, interval, start=None, end=None):
+        """ Candles of interval seconds (blocks without timestamps) starting in [start, end] """
+        if interval not in self.intervals:
+            raise ValueError('Candles of {0} are not aggregated, intervals: {1}'.format(interval, self.intervals))
+        table = self._table(pair_partition(base_token, secondary_token), 'candles-{0}'.format(interval))
+        return self._slice(table, 'start', start, end)
+
+    @staticmethod
+    def _slice(table, key, low, high):
+        keys = table[key]
+        first = 0 if low is None else int(np.searchsorted(keys, low, side='left'))
+        last = len(keys) if high is None else int(np.searchsorted(keys, high, side='right'))
+        return dict((column, values[first:last]) for column, values in table.items())
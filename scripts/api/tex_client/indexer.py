@@ -0,0 +1,281 @@
+"""
+Streaming indexer of the TEX events into an EventStore
+
+Fetches the logs of the DEX with eth_getLogs in block ranges, several ranges at a time
+from a pool of workers, decodes them with decoders compiled once per event (topic and
+data offsets of every argument) and appends them to the columnar EventStore:
+
+    indexer = EventIndexer(RPCSession(rpc_url), dex_address, EventStore('events'), from_block=deploy_block)
+    indexer.run()                    # up to the head, resumes from the last indexed block
+    indexer.follow(poll_interval=5)  # and keeps up with the new blocks
+
+The size of the ranges adapts to the density of the logs: halved when a range has more
+than target_logs logs (or the node refuses it as too big, splitting the failed range),
+doubled when the ranges come back almost empty.
+
+BuyerMatch, SellerMatch, ExpiredOrderProcessed, OrderCancelled and
+NewOrderAddedToPendingQueue do not carry the pair: it is taken from the input of the
+transaction that emitted them (matchOrders, processExpired, ...), fetched in batches.
+The events without a tick number are stored with the current tick of their pair.
+
+Progress is saved with every flush of the store (state.json) together with the hashes
+of the last reorg_depth blocks. When the indexer starts or resumes, those hashes are
+checked against the node; on a reorg the rows from the first changed block on are
+dropped and indexed again.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .abi import decode_function_input, to_bytes
+from .event_store import GLOBAL_PARTITION, pair_partition
+from .events import EVENTS
+from .session import RPCError
+
+DEFAULT_EVENTS = ['BuyerMatch', 'SellerMatch', 'TickStart', 'TickEnd', 'ExpiredOrderProcessed', 'CommissionWithdrawn']
+
+# events whose pair is only known from the input of their transaction
+PAIR_FROM_TRANSACTION = {'BuyerMatch', 'SellerMatch', 'ExpiredOrderProcessed', 'OrderCancelled',
+                         'NewOrderAddedToPendingQueue'}
+PAIR_ARGS = {
+    'NewOrderInserted': ('baseTokenAddress', 'secondaryTokenAddress'),
+    'TickStart': ('baseTokenAddress', 'secondaryTokenAddress'),
+    'TickEnd': ('baseTokenAddress', 'secondaryTokenAddress'),
+    'TokenPairDisabled': ('baseToken', 'secondaryToken'),
+    'TokenPairEnabled': ('baseToken', 'secondaryToken'),
+}
+TICK_ARGS = {'BuyerMatch': 'tickNumber', 'SellerMatch': 'tickNumber', 'TickStart': 'number', 'TickEnd': 'number'}
+
+# messages of the nodes refusing an eth_getLogs range with too many results
+RANGE_ERRORS = ('more than', 'too many', 'too large', 'limit exceeded', 'range', 'response size', 'timeout')
+
+
+def is_range_error(error):
+    message = str(error).lower()
+    return any(reason in message for reason in RANGE_ERRORS)
+
+
+def _word_decoder(abi_type):
+    """ Word -> stored value: int, bool, or the 20 bytes of an address """
+    if abi_type == 'address':
+        return lambda word: word[12:]
+    if abi_type == 'bool':
+        return lambda word: word[-1] == 1
+    return lambda word: int.from_bytes(word, 'big')
+
+
+class CompiledEvent(object):
+    """ Decoder of one event with the position of every argument computed once """
+
+    def __init__(self, definition):
+        self.name = definition.name
+        self.topic_args = [(arg_name, _word_decoder(arg_type)) for arg_type, arg_name in definition.indexed]
+        self.data_args = [(arg_name, _word_decoder(arg_type), i * 32)
+                          for i, (arg_type, arg_name) in enumerate(definition.not_indexed)]
+
+    def decode(self, topics, data):
+        args = dict()
+        for (arg_name, decode), topic in zip(self.topic_args, topics[1:]):
+            args[arg_name] = decode(to_bytes(topic))
+        data = to_bytes(data)
+        for arg_name, decode, offset in self.data_args:
+            args[arg_name] = decode(data[offset:offset + 32])
+        return args
+
+
+class EventIndexer(object):
+    """ Indexes the events of the DEX into an EventStore, resumable """
+
+    def __init__(self, rpc, dex_address, store, from_block=0, events=None, workers=4, blocks_per_request=2000,
+                 max_blocks_per_request=100000, target_logs=5000, flush_rows=50000, confirmations=0,
+                 reorg_depth=12, transactions_per_batch=100):
+        self.rpc = rpc
+        self.dex_address = dex_address
+        self.store = store
+        self.from_block = from_block
+        self.events = dict((name, CompiledEvent(EVENTS[name])) for name in (events or DEFAULT_EVENTS))
+        self.by_topic = dict((EVENTS[name].topic, compiled) for name, compiled in self.events.items())
+        self.workers = workers
+        self.blocks_per_request = blocks_per_request
+        self.max_blocks_per_request = max_blocks_per_request
+        self.target_logs = target_logs
+        self.flush_rows = flush_rows
+        self.confirmations = confirmations
+        self.reorg_depth = reorg_depth
+        self.transactions_per_batch = transactions_per_batch
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.last_block = None
+        # current tick number of every pair partition
+        self.ticks = dict()
+        self.requests_count = 0
+        self.splits_count = 0
+        self.reorgs_count = 0
+        self.indexed_count = 0
+
+    def close(self):
+        self.executor.shutdown()
+
+    # State
+
+    def resume(self):
+        """ Loads the saved progress, drops what was written after it and checks for reorgs """
+        state = self.store.load_state()
+        if state is None:
+            self.last_block, self.ticks = self.from_block - 1, dict()
+            return self.last_block
+        self.last_block, self.ticks = state['last_block'], state['ticks']
+        # segments of a flush whose state was not saved
+        self.store.truncate(self.last_block + 1)
+        blocks = [(number, block_hash) for number, block_hash in state['blocks'] if number <= self.last_block]
+        current = self._block_hashes([number for number, _ in blocks])
+        changed = [number for (number, block_hash), node_hash in zip(blocks, current) if block_hash != node_hash]
+        if changed:
+            self.rollback(changed[0])
+        return self.last_block
+
+    def rollback(self, from_block):
+        """ Drops the events from from_block on, to index them again """
+        self.reorgs_count += 1
+        self.store.truncate(from_block)
+        self.last_block = from_block - 1
+        self.ticks = dict()
+        for partition in self.store.partitions():
+            if partition == GLOBAL_PARTITION:
+                continue
+            base_token, secondary_token = partition.split('-')
+            for event_name, offset in (('TickStart', 0), ('TickEnd', 1)):
+                if event_name not in self.events:
+                    continue
+                ticks = self.store.read(event_name, base_token, secondary_token)['tick']
+                if len(ticks):
+                    self.ticks[partition] = max(self.ticks.get(partition, 0), int(ticks.max()) + offset)
+        self._save_state()
+
+    def _block_hashes(self, numbers):
+        blocks = self.rpc.batch([('eth_getBlockByNumber', [hex(number), False]) for number in numbers],
+                                raise_on_error=False)
+        return [block['hash'] if isinstance(block, dict) else None for block in blocks]
+
+    def _save_state(self):
+        first = max(self.last_block - self.reorg_depth + 1, self.from_block)
+        numbers = list(range(first, self.last_block + 1))
+        self.store.save_state({
+            'last_block': self.last_block,
+            'ticks': self.ticks,
+            'blocks': [[number, block_hash] for number, block_hash in zip(numbers, self._block_hashes(numbers))]})
+
+    def flush(self):
+        self.store.flush()
+        self._save_state()
+
+    # Fetching
+
+    def get_logs(self, from_block, to_block):
+        """ Logs of the range, splitting it while the node refuses it as too big """
+        self.requests_count += 1
+        try:
+            return self.rpc.call('eth_getLogs', [{
+                'address': self.dex_address,
+                'fromBlock': hex(from_block),
+                'toBlock': hex(to_block),
+                'topics': [list(self.by_topic)]}])
+        except RPCError as e:
+            if from_block == to_block or not is_range_error(e):
+                raise
+        self.splits_count += 1
+        middle = (from_block + to_block) // 2
+        return self.get_logs(from_block, middle) + self.get_logs(middle + 1, to_block)
+
+    def _adapt(self, counts):
+        """ New range size from the logs per range of the last round """
+        most = max(counts)
+        if most > self.target_logs:
+            self.blocks_per_request = max(self.blocks_per_request // 2, 1)
+        elif most < self.target_logs // 4:
+            self.blocks_per_request = min(self.blocks_per_request * 2, self.max_blocks_per_request)
+
+    def _transaction_pairs(self, logs):
+        """ Transaction hash -> pair partition, for the logs whose event does not carry the pair """
+        hashes = []
+        for log in logs:
+            compiled = self.by_topic.get(log['topics'][0].lower())
+            if compiled is not None and compiled.name in PAIR_FROM_TRANSACTION and log['transactionHash'] not in hashes:
+                hashes.append(log['transactionHash'])
+        chunks = [hashes[i:i + self.transactions_per_batch] for i in range(0, len(hashes), self.transactions_per_batch)]
+        pairs = dict()
+        for chunk, transactions in zip(chunks, self.executor.map(
+                lambda chunk: self.rpc.batch([('eth_getTransactionByHash', [tx_hash]) for tx_hash in chunk]),
+                chunks)):
+            for tx_hash, transaction in zip(chunk, transactions):
+                _, args = decode_function_input(transaction['input']) if transaction else (None, None)
+                if args and '_baseToken' in args:
+                    pairs[tx_hash] = pair_partition(args['_baseToken'], args['_secondaryToken'])
+        return pairs
+
+    # Indexing
+
+    def _row(self, compiled, log, args, partition):
+        tick_arg = TICK_ARGS.get(compiled.name)
+        if tick_arg is not None:
+            tick = args[tick_arg]
+            # after TickEnd(n) the pair is in tick n + 1
+            self.ticks[partition] = tick + 1 if compiled.name == 'TickEnd' else tick
+        else:
+            tick = self.ticks.get(partition, 0)
+        row = dict(args)
+        row.update(block_number=int(log['blockNumber'], 16), log_index=int(log['logIndex'], 16), tick=tick,
+                   transaction_hash=to_bytes(log['transactionHash']))
+        return row
+
+    def index_logs(self, logs):
+        """ Decodes logs (in chain order) into the store, returns how many were indexed """
+        pairs = self._transaction_pairs(logs)
+        indexed = 0
+        for log in logs:
+            compiled = self.by_topic.get(log['topics'][0].lower())
+            if compiled is None:
+                continue
+            args = compiled.decode(log['topics'], log['data'])
+            pair_args = PAIR_ARGS.get(compiled.name)
+            if pair_args is not None:
+                partition = pair_partition(*['0x' + args[name].hex() for name in pair_args])
+            else:
+                partition = pairs.get(log['transactionHash'], GLOBAL_PARTITION)
+            self.store.append(compiled.name, partition, self._row(compiled, log, args, partition))
+            indexed += 1
+        self.indexed_count += indexed
+        return indexed
+
+    def head(self):
+        return int(self.rpc.call('eth_blockNumber'), 16) - self.confirmations
+
+    def run(self, to_block=None):
+        """ Indexes up to to_block (the head by default), returns the amount of events indexed """
+        if self.last_block is None:
+            self.resume()
+        to_block = self.head() if to_block is None else to_block
+        indexed = 0
+        while self.last_block < to_block:
+            ranges = []
+            start = self.last_block + 1
+            while len(ranges) < self.workers and start <= to_block:
+                end = min(start + self.blocks_per_request - 1, to_block)
+                ranges.append((start, end))
+                start = end + 1
+            results = list(self.executor.map(lambda block_range: self.get_logs(*block_range), ranges))
+            self._adapt([len(logs) for logs in results])
+            indexed += self.index_logs([log for logs in results for log in logs])
+            self.last_block = ranges[-1][1]
+            if self.store.buffered >= self.flush_rows:
+                self.flush()
+        self.flush()
+        return indexed
+
+    def follow(self, poll_interval=5, stop=None):
+        """ Keeps indexing the new blocks until the stop event (if any) is set """
+        while stop is None or not stop.is_set():
+            if self.last_block is not None:
+                # small reorgs of the last indexed blocks
+                self.resume()
+            self.run()
+            time.sleep(poll_interval)
@@ -0,0 +1,291 @@
+"""
+Keeper: runs the ticks of every pair and processes the expired orders
+
+A tick only moves forward when someone calls matchOrders(base, secondary, steps). The
+Keeper watches all the pairs of getTokenPairs() and, for each pair whose nextTickBlock
+was reached or whose tick is running, sends matchOrders until the tick ends. The pairs
+are run concurrently from one AsyncTexClient:
+
+    async with AsyncTexClient(rpc_url, dex_address, signer) as client:
+        keeper = Keeper(client)
+        await keeper.run(poll_interval=5)
+
+The steps of every call are chosen from the size of the book and the gas per step seen
+so far so the transaction fits in gas_fraction of the block gas limit (checked with
+eth_estimateGas). While the pending orders are being moved the hints are computed from
+the orderbook mirror and sent with matchOrdersWithHints. Between ticks the pairs with
+areOrdersToExpire are cleaned with processExpired, starting at the first expired order
+of the mirror.
+
+keeper.metrics has the tick duration, gas and gas per step of every pair, also
+written as JSON by write_metrics(path).
+"""
+
+import asyncio
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from .abi import FUNCTIONS
+from .aio import _to_int
+from .batch import BatchReader
+from .constants import OrderType, TickStage
+from .hints import is_stale_hint_error, pending_move_hints
+from .orderbook import OrderbookMirror, pair_key
+from .session import RPCError
+
+# starting guess of the gas of one step, replaced by the measured one
+DEFAULT_GAS_PER_STEP = 150000
+# gas of a matchOrders transaction besides its steps
+TRANSACTION_GAS = 60000
+
+
+@dataclass
+class PairMetrics(object):
+    """ Counters of the keeper for one pair """
+    base_token: str
+    secondary_token: str
+    ticks: int = 0
+    transactions: int = 0
+    steps: int = 0
+    gas_used: int = 0
+    # exponential moving average of the gas of one step
+    gas_per_step: Optional[float] = None
+    last_tick_seconds: Optional[float] = None
+    last_tick_blocks: Optional[int] = None
+    last_tick_transactions: Optional[int] = None
+    expired_transactions: int = 0
+    errors: int = 0
+    last_error: Optional[str] = None
+
+
+def estimate_tick_steps(row):
+    """ Steps left in the tick of a pair from its status row, MoCExchangeLib stage by stage """
+    buys = (row.buy_orders_length or 0)
+    sells = (row.sell_orders_length or 0)
+    pending = sum(length or 0 for length in (
+        row.pending_buy_orders_length, row.pending_sell_orders_length,
+        row.pending_buy_market_orders_length, row.pending_sell_market_orders_length))
+    # simulation walks the matching orders, matching fills them, the last stage moves the pending ones
+    simulation, matching, moving = buys + sells + 1, min(buys, sells) + 1, pending + 1
+    if row.tick_stage == TickStage.RUNNING_MATCHING:
+        return matching + moving
+    if row.tick_stage == TickStage.MOVING_PENDING_ORDERS:
+        return moving
+    return simulation + matching + moving
+
+
+def first_expired(index, tick_number):
+    """ (first expired order, id of the order before it) of a PriceIndex, (None, 0) if none """
+    previous_id = 0
+    for order in index:
+        if order.is_expired(tick_number):
+            return order, previous_id
+        previous_id = order.id
+    return None, 0
+
+
+class Keeper(object):
+    """ Drives the ticks of all the pairs of the TEX """
+
+    def __init__(self, client, pairs=None, mirror=None, gas_fraction=0.8, max_steps=1000, use_hints=True,
+                 process_expired=True, expire_steps=50, smoothing=0.3):
+        self.client = client
+        # the synchronous pooled session of the client, used from its thread pool
+        self.reader = BatchReader(client.rpc.session, client.dex_address, pairs)
+        self.mirror = mirror if mirror is not None else OrderbookMirror()
+        self.gas_fraction = gas_fraction
+        self.max_steps = max_steps
+        self.use_hints = use_hints
+        self.process_expired = process_expired
+        self.expire_steps = expire_steps
+        self.smoothing = smoothing
+        self.block_gas_limit = None
+        self.metrics = dict()
+        self._sync_lock = None
+
+    async def _in_thread(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.client.rpc.executor, fn, *args)
+
+    async def sync_mirror(self):
+        """ One sync at a time, the pairs running concurrently share the mirror """
+        if self._sync_lock is None:
+            self._sync_lock = asyncio.Lock()
+        async with self._sync_lock:
+            await self._in_thread(self.mirror.sync, self.reader)
+
+    def pair_metrics(self, base_token, secondary_token):
+        key = pair_key(base_token, secondary_token)
+        metrics = self.metrics.get(key)
+        if metrics is None:
+            metrics = self.metrics[key] = PairMetrics(base_token, secondary_token)
+        return metrics
+
+    @property
+    def gas_budget(self):
+        return int(self.block_gas_limit * self.gas_fraction)
+
+    # Loop
+
+    async def run(self, poll_interval=5, stop=None):
+        """ Steps every poll_interval seconds until the stop event (if any) is set """
+        while stop is None or not stop.is_set():
+            await self.step()
+            await asyncio.sleep(poll_interval)
+
+    async def step(self):
+        """ Runs the due ticks of all the pairs and processes the expired orders of the others """
+        if self.block_gas_limit is None:
+            block = await self.client.rpc.call('eth_getBlockByNumber', ['latest', False])
+            self.block_gas_limit = _to_int(block['gasLimit'])
+        block_number = _to_int(await self.client.rpc.call('eth_blockNumber'))
+        table = await self._in_thread(self.reader.pairs_status)
+        await self.sync_mirror()
+
+        due, idle = [], []
+        for row in table:
+            if row.tick_stage is None or row.disabled:
+                continue
+            running = row.tick_stage != TickStage.RECEIVING_ORDERS
+            (due if running or block_number >= row.next_tick_block else idle).append(row)
+        tasks = [self.run_tick(row) for row in due]
+        if self.process_expired and idle:
+            tasks.append(self.expire_orders(idle))
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for row, result in zip(due, results):
+            if isinstance(result, Exception):
+                self._error(row.base_token, row.secondary_token, result)
+        return due
+
+    def _error(self, base_token, secondary_token, error):
+        metrics = self.pair_metrics(base_token, secondary_token)
+        metrics.errors += 1
+        metrics.last_error = str(error)
+
+    # Ticks
+
+    def _steps_for(self, row):
+        metrics = self.pair_metrics(row.base_token, row.secondary_token)
+        gas_per_step = metrics.gas_per_step or DEFAULT_GAS_PER_STEP
+        by_gas = int((self.gas_budget - TRANSACTION_GAS) // gas_per_step)
+        return max(1, min(by_gas, estimate_tick_steps(row), self.max_steps))
+
+    async def _bounded_gas(self, data, steps, encode):
+        """ Halves the steps until the estimated gas fits in the budget, returns (steps, data, gas) """
+        while True:
+            gas = await self.client.estimate_gas(self.client.dex_address, data)
+            if gas <= self.gas_budget or steps == 1:
+                return steps, data, gas
+            steps = max(1, steps // 2)
+            data = encode(steps)
+
+    def _hints_for(self, row, steps):
+        if not self.use_hints or row.tick_stage != TickStage.MOVING_PENDING_ORDERS or self.mirror.unresolved_pending:
+            return []
+        # a step can move a limit and a market order
+        return pending_move_hints(self.mirror.pair(row.base_token, row.secondary_token), count=2 * steps)
+
+    async def match(self, row, steps, hints=()):
+        """ One matchOrders(WithHints) transaction, returns (receipt, steps sent) """
+        base_token, secondary_token = row.base_token, row.secondary_token
+
+        def encode(count):
+            if hints:
+                return FUNCTIONS['matchOrdersWithHints'].encode(base_token, secondary_token, count, list(hints))
+            return FUNCTIONS['matchOrders'].encode(base_token, secondary_token, count)
+
+        steps, data, gas = await self._bounded_gas(encode(steps), steps, encode)
+        receipt = await self.client.transact(self.client.dex_address, data, gas=gas)
+        return receipt, steps
+
+    async def run_tick(self, row):
+        """ Sends matchOrders for the pair of the row until its tick ends """
+        metrics = self.pair_metrics(row.base_token, row.secondary_token)
+        pair = (row.base_token, row.secondary_token)
+        tick_number = row.tick_number
+        started, first_block, transactions = time.monotonic(), None, 0
+        while True:
+            steps = self._steps_for(row)
+            if row.tick_stage == TickStage.MOVING_PENDING_ORDERS:
+                await self.sync_mirror()
+            hints = self._hints_for(row, steps)
+            try:
+                receipt, steps = await self.match(row, steps, hints)
+            except Exception as e:
+                if not hints or not is_stale_hint_error(e):
+                    raise
+                receipt, steps = await self.match(row, steps)
+
+            transactions += 1
+            first_block = receipt.block_number if first_block is None else first_block
+            metrics.transactions += 1
+            metrics.steps += steps
+            metrics.gas_used += receipt.gas_used
+            gas_per_step = max(receipt.gas_used - TRANSACTION_GAS, 0) / steps
+            metrics.gas_per_step = gas_per_step if metrics.gas_per_step is None else \
+                self.smoothing * gas_per_step + (1 - self.smoothing) * metrics.gas_per_step
+
+            row = (await self._in_thread(self.reader.pairs_status, [pair]))[0]
+            if row.tick_stage == TickStage.RECEIVING_ORDERS and row.tick_number != tick_number:
+                break
+        metrics.ticks += 1
+        metrics.last_tick_seconds = time.monotonic() - started
+        metrics.last_tick_blocks = receipt.block_number - first_block + 1
+        metrics.last_tick_transactions = transactions
+        return metrics
+
+    # Expired orders
+
+    async def expire_orders(self, rows):
+        """ Checks every side of the rows with areOrdersToExpire in one batch and processes them """
+        sides = [(row, is_buy) for row in rows for is_buy in (True, False)]
+        flags = await self._in_thread(self.reader.batch_call, [
+            ('areOrdersToExpire', (row.base_token, row.secondary_token, is_buy)) for row, is_buy in sides])
+        targets = [side for side, flag in zip(sides, flags) if flag is True]
+        results = await asyncio.gather(*[self._expire_side(row, is_buy) for row, is_buy in targets],
+                                       return_exceptions=True)
+        for (row, _), result in zip(targets, results):
+            if isinstance(result, Exception):
+                self._error(row.base_token, row.secondary_token, result)
+
+    async def _expire_side(self, row, is_buy):
+        side = self.mirror.pair(row.base_token, row.secondary_token).side(is_buy)
+        sent = 0
+        for order_type, index in ((OrderType.LIMIT_ORDER, side.limit), (OrderType.MARKET_ORDER, side.market)):
+            order, previous_id = first_expired(index, row.tick_number)
+            if order is None:
+                continue
+            steps = min(len(index), self.expire_steps)
+            await self._process_expired(row, is_buy, order.id, previous_id, steps, order_type)
+            sent += 1
+        if sent:
+            return sent
+        # the mirror does not know them: from the top of the book, limit orders first
+        for order_type in (OrderType.LIMIT_ORDER, OrderType.MARKET_ORDER):
+            try:
+                await self._process_expired(row, is_buy, 0, 0, self.expire_steps, order_type)
+                return 1
+            except (RPCError, ValueError) as e:
+                if 'No expired order found' not in str(e):
+                    raise
+        return 0
+
+    async def _process_expired(self, row, is_buy, order_id, previous_id, steps, order_type):
+        data = FUNCTIONS['processExpired'].encode(
+            row.base_token, row.secondary_token, is_buy, order_id, previous_id, steps, order_type)
+        receipt = await self.client.transact(self.client.dex_address, data)
+        self.pair_metrics(row.base_token, row.secondary_token).expired_transactions += 1
+        return receipt
+
+    # Metrics
+
+    def metrics_records(self):
+        return [asdict(metrics) for metrics in self.metrics.values()]
+
+    def write_metrics(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.metrics_records(), f, indent=2)
+        os.replace(tmp_path, path)
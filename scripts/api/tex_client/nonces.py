@@ -0,0 +1,81 @@
+"""
+Local nonce allocation for an account sending many transactions at once
+
+Asking the node for the transaction count before every send is one round trip per
+transaction and two concurrent sends get the same nonce. The allocator reads the
+pending count once and then hands out consecutive nonces locally.
+
+A transaction that is lost after later nonces were sent (a crash, a node dropping it)
+leaves a gap: the later ones are never mined until the gap nonce is used again. The
+nonce of a broadcast that failed is given back (release) and allocated again first, the
+allocator never goes below a nonce it handed out. missing_nonces finds the gaps from the
+nonces known to be sent.
+"""
+
+import threading
+
+
+class NonceAllocator(object):
+    """ Consecutive nonces of one account, synced from the node on demand """
+
+    def __init__(self, next_nonce=None):
+        self._next = next_nonce
+        # nonces given back while later ones were in use, allocated first
+        self._released = set()
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self):
+        return self._next is not None
+
+    @property
+    def next_nonce(self):
+        return self._next
+
+    def reset(self, next_nonce):
+        """ Sets the next nonce, e.g. with eth_getTransactionCount(account, 'pending') """
+        with self._lock:
+            self._next = next_nonce
+            self._released = set()
+
+    def allocate(self):
+        with self._lock:
+            if self._next is None:
+                raise RuntimeError('Nonce allocator not synced with the node')
+            if self._released:
+                nonce = min(self._released)
+                self._released.remove(nonce)
+                return nonce
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def release(self, nonce):
+        """
+        Gives back a nonce whose transaction was never broadcast, it is allocated again
+        first. Returns False when later nonces were already allocated: until it is used
+        again it is a gap (see reclaim).
+        """
+        with self._lock:
+            if self._next == nonce + 1:
+                self._next = nonce
+                while self._next - 1 in self._released:
+                    self._next -= 1
+                    self._released.remove(self._next)
+                return True
+            self._released.add(nonce)
+            return False
+
+    def reclaim(self, nonce):
+        """ Takes back a released nonce to fill its gap, False if it was allocated again already """
+        with self._lock:
+            if nonce not in self._released:
+                return False
+            self._released.remove(nonce)
+            return True
+
+
+def missing_nonces(first, end, sent_nonces):
+    """ Nonces in [first, end) without a known transaction """
+    sent_nonces = set(sent_nonces)
+    return [nonce for nonce in range(first, end) if nonce not in sent_nonces]
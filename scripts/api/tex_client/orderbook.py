@@ -0,0 +1,580 @@
+"""
+Off-chain replica of the TEX orderbooks, rebuilt from the contract events
+
+The mirror is built once from the historical logs and then updated incrementally
+from the new blocks:
+
+    mirror = OrderbookMirror.load('orderbook.json')  # or OrderbookMirror() the first time
+    mirror.sync(client)  # fetches the logs since the last synced block
+    book = mirror.pair(base_token, secondary_token)
+    print(book.best_bid(), book.best_ask(), book.buy.limit.depth(10))
+    mirror.save('orderbook.json')
+
+Orders are kept exactly as the contract sorts them: each orderbook side has a limit
+order index (by price) and a market order index (by multiplyFactor), buy sides are
+descending and sell sides ascending, and orders with the same price keep their
+insertion order. Each index is a sorted list of price levels (bisect) with the orders
+of every level in FIFO order, so the best level is O(1), locating a price is O(log n)
+and reading k levels of depth is O(log n + k).
+
+Orders that arrive while a tick is running go to the pending queues; the
+NewOrderAddedToPendingQueue event only has the id, so sync() decodes the insert
+transaction to know its pair, side and price. Until the order is moved to the
+orderbook its amount is the locked amount (fee included), as sent in the transaction.
+"""
+
+import bisect
+import json
+import os
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+
+from .abi import decode_function_input
+from .constants import RATE_PRECISION, OrderType
+from .events import EventDecoder, ORDERBOOK_EVENTS
+
+SNAPSHOT_VERSION = 1
+
+
+@dataclass
+class Order(object):
+    id: int
+    owner: str
+    is_buy: bool
+    order_type: int
+    exchangeable_amount: int
+    reserved_commission: int
+    price: int
+    multiply_factor: int
+    expires_in_tick: int
+
+    @property
+    def is_market_order(self):
+        return self.order_type == OrderType.MARKET_ORDER
+
+    @property
+    def sort_value(self):
+        """ Value used to sort the order in its index: price or multiplyFactor """
+        return self.multiply_factor if self.is_market_order else self.price
+
+    def spot_price(self, market_price):
+        """ Price of the order, MoCExchangeLib.getOrderPrice """
+        if self.is_market_order:
+            return self.multiply_factor * market_price // RATE_PRECISION
+        return self.price
+
+    def is_expired(self, tick_number):
+        return self.expires_in_tick <= tick_number
+
+
+class PriceIndex(object):
+    """
+    Orders of one type (limit or market) of one orderbook side, sorted like the
+    contract's linked list
+    """
+
+    def __init__(self, descending):
+        self.descending = descending
+        # sorted keys of the levels; the value is negated on descending indexes
+        self._keys = []
+        # value -> OrderedDict(order id -> Order) in insertion order
+        self._levels = dict()
+        # value -> sum of the exchangeable amounts of the level
+        self._amounts = dict()
+        self._count = 0
+
+    def _key(self, value):
+        return -value if self.descending else value
+
+    def _value(self, key):
+        return -key if self.descending else key
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        """ Orders in the orderbook order """
+        for key in self._keys:
+            for order in self._levels[self._value(key)].values():
+                yield order
+
+    def copy(self):
+        """ Index with the same orders that can be changed without changing this one """
+        index = PriceIndex(self.descending)
+        index._keys = list(self._keys)
+        index._levels = dict((value, OrderedDict(level)) for value, level in self._levels.items())
+        index._amounts = dict(self._amounts)
+        index._count = self._count
+        return index
+
+    def add(self, order):
+        value = order.sort_value
+        level = self._levels.get(value)
+        if level is None:
+            level = self._levels[value] = OrderedDict()
+            self._amounts[value] = 0
+            bisect.insort(self._keys, self._key(value))
+        level[order.id] = order
+        self._amounts[value] += order.exchangeable_amount
+        self._count += 1
+
+    def remove(self, order):
+        value = order.sort_value
+        level = self._levels[value]
+        del level[order.id]
+        self._amounts[value] -= order.exchangeable_amount
+        self._count -= 1
+        if not level:
+            del self._levels[value]
+            del self._amounts[value]
+            key = self._key(value)
+            del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def update_amount(self, order, exchangeable_amount):
+        self._amounts[order.sort_value] += exchangeable_amount - order.exchangeable_amount
+        order.exchangeable_amount = exchangeable_amount
+
+    def first(self):
+        """ Most competitive order, None if empty """
+        if not self._keys:
+            return None
+        level = self._levels[self._value(self._keys[0])]
+        return next(iter(level.values()))
+
+    def best(self):
+        """ Most competitive price (or multiplyFactor), None if empty """
+        if not self._keys:
+            return None
+        return self._value(self._keys[0])
+
+    def depth(self, levels=None):
+        """ [(value, amount, orders count)] of the first levels, most competitive first """
+        keys = self._keys if levels is None else self._keys[:levels]
+        result = []
+        for key in keys:
+            value = self._value(key)
+            result.append((value, self._amounts[value], len(self._levels[value])))
+        return result
+
+    def level(self, value):
+        """ Orders with the given value, in insertion order """
+        return list(self._levels.get(value, dict()).values())
+
+    def previous_id_for(self, value):
+        """
+        Id of the order that would be immediately before a new order with the given value,
+        0 if it goes at the start; the hint expected by the insert*After functions
+        """
+        position = bisect.bisect_right(self._keys, self._key(value))
+        if position == 0:
+            return 0
+        level = self._levels[self._value(self._keys[position - 1])]
+        return next(reversed(level))
+
+    def previous_id_of(self, order):
+        """ Id of the order immediately before the given one, 0 if it is the first """
+        value = order.sort_value
+        level = self._levels[value]
+        previous_id = 0
+        for order_id in level:
+            if order_id == order.id:
+                if previous_id:
+                    return previous_id
+                break
+            previous_id = order_id
+        position = bisect.bisect_left(self._keys, self._key(value))
+        if position == 0:
+            return 0
+        return next(reversed(self._levels[self._value(self._keys[position - 1])]))
+
+    def levels_between(self, value, other_value):
+        """ Number of levels with a value strictly between the two """
+        low, high = sorted((self._key(value), self._key(other_value)))
+        return max(0, bisect.bisect_left(self._keys, high) - bisect.bisect_right(self._keys, low))
+
+    def amount_before(self, value):
+        """ Sum of the amounts of the levels strictly more competitive than value """
+        position = bisect.bisect_left(self._keys, self._key(value))
+        return sum(self._amounts[self._value(key)] for key in self._keys[:position])
+
+
+class BookSide(object):
+    """ One orderbook of a pair (buy or sell): limit and market indexes plus pending queues """
+
+    def __init__(self, is_buy):
+        self.is_buy = is_buy
+        self.orders = dict()
+        self.limit = PriceIndex(descending=is_buy)
+        self.market = PriceIndex(descending=is_buy)
+        # pending queues, FIFO like the contract
+        self.pending_limit = OrderedDict()
+        self.pending_market = OrderedDict()
+
+    def index_for(self, order):
+        return self.market if order.is_market_order else self.limit
+
+    def pending_queue_for(self, order):
+        return self.pending_market if order.is_market_order else self.pending_limit
+
+    def __len__(self):
+        return len(self.orders)
+
+    def insert(self, order):
+        self.orders[order.id] = order
+        self.index_for(order).add(order)
+
+    def insert_pending(self, order):
+        self.pending_queue_for(order)[order.id] = order
+
+    def remove(self, order_id):
+        order = self.orders.pop(order_id, None)
+        if order is not None:
+            self.index_for(order).remove(order)
+            return order
+        order = self.pending_limit.pop(order_id, None) or self.pending_market.pop(order_id, None)
+        return order
+
+    def fill(self, order_id, remaining_amount, sent_amount):
+        """
+        Applies a match to an order: reduces its amount and its reserved commission
+        proportionally like MoCExchangeLib.subtractAmount. Removes it when filled.
+        """
+        order = self.orders.get(order_id)
+        if order is None:
+            return None
+        if remaining_amount == 0:
+            return self.remove(order_id)
+        if order.exchangeable_amount:
+            order.reserved_commission -= sent_amount * order.reserved_commission // order.exchangeable_amount
+        self.index_for(order).update_amount(order, remaining_amount)
+        return order
+
+    def best_order(self, market_price=None):
+        """
+        Most competitive order, comparing limit and market orders like
+        MoCExchangeLib.mostCompetitiveOrder. Without market_price only limit orders count.
+        """
+        limit = self.limit.first()
+        market = self.market.first() if market_price is not None else None
+        if market is None:
+            return limit
+        if limit is None:
+            return market
+        market_order_price = market.spot_price(market_price)
+        if limit.price == market_order_price or (limit.price > market_order_price) == self.is_buy:
+            return limit
+        return market
+
+
+class PairOrderbook(object):
+    """ Buy and sell orderbooks of a pair plus its tick state """
+
+    def __init__(self, base_token, secondary_token):
+        self.base_token = base_token
+        self.secondary_token = secondary_token
+        self.buy = BookSide(is_buy=True)
+        self.sell = BookSide(is_buy=False)
+        self.tick_number = 0
+        self.tick_running = False
+        self.next_tick_block = 0
+        self.last_closing_price = 0
+
+    @property
+    def key(self):
+        return pair_key(self.base_token, self.secondary_token)
+
+    def side(self, is_buy):
+        return self.buy if is_buy else self.sell
+
+    def best_bid(self, market_price=None):
+        order = self.buy.best_order(market_price)
+        return None if order is None else order.spot_price(market_price)
+
+    def best_ask(self, market_price=None):
+        order = self.sell.best_order(market_price)
+        return None if order is None else order.spot_price(market_price)
+
+    def spread(self, market_price=None):
+        bid, ask = self.best_bid(market_price), self.best_ask(market_price)
+        if bid is None or ask is None:
+            return None
+        return ask - bid
+
+
+def pair_key(base_token, secondary_token):
+    return base_token.lower(), secondary_token.lower()
+
+
+class OrderbookMirror(object):
+    """ Orderbooks of every pair of the TEX, kept up to date from the events """
+
+    def __init__(self):
+        self.pairs = dict()
+        # order id -> pair key, for the events that only carry the order id
+        self.order_pairs = dict()
+        # pending order ids whose pair is not known yet: id -> Event
+        self.unresolved_pending = dict()
+        self.last_block = -1
+        self.decoder = EventDecoder(ORDERBOOK_EVENTS)
+
+    def pair(self, base_token, secondary_token):
+        key = pair_key(base_token, secondary_token)
+        book = self.pairs.get(key)
+        if book is None:
+            book = self.pairs[key] = PairOrderbook(base_token, secondary_token)
+        return book
+
+    def pair_of(self, order_id):
+        key = self.order_pairs.get(order_id)
+        return None if key is None else self.pairs.get(key)
+
+    def find(self, order_id):
+        """ Returns (pair orderbook, side, order) of an order, Nones if unknown """
+        book = self.pair_of(order_id)
+        if book is None:
+            return None, None, None
+        for side in (book.buy, book.sell):
+            order = side.orders.get(order_id) or side.pending_limit.get(order_id) or \
+                side.pending_market.get(order_id)
+            if order is not None:
+                return book, side, order
+        return book, None, None
+
+    # Events
+
+    def apply(self, event):
+        """ Applies a decoded Event to the orderbooks """
+        handler = getattr(self, '_on_' + event.name, None)
+        if handler is not None:
+            handler(event.args)
+        if event.block_number is not None and event.block_number > self.last_block:
+            self.last_block = event.block_number
+
+    def _on_NewOrderInserted(self, args):
+        book = self.pair(args['baseTokenAddress'], args['secondaryTokenAddress'])
+        side = book.side(args['isBuy'])
+        order_id = args['id']
+        # moved from the pending queue
+        side.remove(order_id)
+        self.unresolved_pending.pop(order_id, None)
+        side.insert(Order(
+            id=order_id,
+            owner=args['sender'],
+            is_buy=args['isBuy'],
+            order_type=args['orderType'],
+            exchangeable_amount=args['exchangeableAmount'],
+            reserved_commission=args['reservedCommission'],
+            price=args['price'],
+            multiply_factor=args['multiplyFactor'],
+            expires_in_tick=args['expiresInTick']))
+        self.order_pairs[order_id] = book.key
+
+    def _on_NewOrderAddedToPendingQueue(self, args):
+        self.unresolved_pending[args['id']] = args
+
+    def add_pending(self, order_id, base_token, secondary_token, is_buy, order_type, amount,
+                    price=0, multiply_factor=0, lifespan=0, owner=None):
+        """ Puts an order in the pending queue of its pair once its pair is known """
+        self.unresolved_pending.pop(order_id, None)
+        book = self.pair(base_token, secondary_token)
+        book.side(is_buy).insert_pending(Order(
+            id=order_id,
+            owner=owner,
+            is_buy=is_buy,
+            order_type=order_type,
+            exchangeable_amount=amount,
+            reserved_commission=0,
+            price=price,
+            multiply_factor=multiply_factor,
+            expires_in_tick=book.tick_number + lifespan))
+        self.order_pairs[order_id] = book.key
+
+    def _remove(self, order_id):
+        book = self.pair_of(order_id)
+        self.unresolved_pending.pop(order_id, None)
+        if book is None:
+            return None
+        order = book.buy.remove(order_id) or book.sell.remove(order_id)
+        self.order_pairs.pop(order_id, None)
+        return order
+
+    def _on_OrderCancelled(self, args):
+        self._remove(args['id'])
+
+    def _on_ExpiredOrderProcessed(self, args):
+        self._remove(args['orderId'])
+
+    def _on_match(self, order_id, remaining_amount, is_buy):
+        book = self.pair_of(order_id)
+        if book is None:
+            return
+        side = book.side(is_buy)
+        order = side.orders.get(order_id)
+        if order is None:
+            return
+        sent = order.exchangeable_amount - remaining_amount
+        side.fill(order_id, remaining_amount, sent)
+        if remaining_amount == 0:
+            self.order_pairs.pop(order_id, None)
+
+    def _on_BuyerMatch(self, args):
+        self._on_match(args['orderId'], args['remainingAmount'], True)
+
+    def _on_SellerMatch(self, args):
+        self._on_match(args['orderId'], args['remainingAmount'], False)
+
+    def _on_TickStart(self, args):
+        book = self.pair(args['baseTokenAddress'], args['secondaryTokenAddress'])
+        book.tick_running = True
+        book.tick_number = args['number']
+
+    def _on_TickEnd(self, args):
+        book = self.pair(args['baseTokenAddress'], args['secondaryTokenAddress'])
+        book.tick_running = False
+        book.tick_number = args['number'] + 1
+        book.next_tick_block = args['nextTickBlock']
+        if args['closingPrice']:
+            book.last_closing_price = args['closingPrice']
+
+    # Pending orders resolution
+
+    def resolve_pending_from_transaction(self, order_id, transaction):
+        """ Resolves a pending order from the insert transaction that created it """
+        function_name, args = decode_function_input(transaction['input'])
+        if function_name is None:
+            return False
+        if function_name.startswith('insertMarketOrder'):
+            self.add_pending(
+                order_id, args['_baseToken'], args['_secondaryToken'], args['_isBuy'],
+                OrderType.MARKET_ORDER, args['_amount'],
+                multiply_factor=args['_multiplyFactor'], lifespan=args['_lifespan'],
+                owner=transaction.get('from'))
+        else:
+            self.add_pending(
+                order_id, args['_baseToken'], args['_secondaryToken'],
+                function_name.startswith('insertBuy'), OrderType.LIMIT_ORDER, args['_amount'],
+                price=args['_price'], lifespan=args['_lifespan'], owner=transaction.get('from'))
+        return True
+
+    # Sync
+
+    def sync(self, client, to_block=None, blocks_per_request=2000, on_event=None):
+        """
+        Fetches and applies the orderbook events from the last synced block to to_block
+        (the latest block by default). Returns the amount of events applied.
+        on_event is passed to apply_logs
+        """
+        rpc = client.rpc
+        if to_block is None:
+            to_block = int(rpc.call('eth_blockNumber'), 16)
+        applied = 0
+        from_block = self.last_block + 1
+        while from_block <= to_block:
+            until = min(from_block + blocks_per_request - 1, to_block)
+            logs = rpc.call('eth_getLogs', [{
+                'address': client.dex_address,
+                'fromBlock': hex(from_block),
+                'toBlock': hex(until),
+                'topics': [self.decoder.topics()]}])
+            applied += self.apply_logs(logs, rpc, on_event)
+            self.last_block = until
+            from_block = until + 1
+        return applied
+
+    def book_of(self, event):
+        """ PairOrderbook of an event: from its pair, or from its order id (None if unknown) """
+        if 'baseTokenAddress' in event.args:
+            return self.pair(event.args['baseTokenAddress'], event.args['secondaryTokenAddress'])
+        order_id = event.args.get('id', event.args.get('orderId'))
+        return None if order_id is None else self.pair_of(order_id)
+
+    def apply_logs(self, logs, rpc=None, on_event=None):
+        """
+        Decodes and applies raw logs; resolves the pending orders through rpc if given.
+        on_event(event, book) is called after every event with the PairOrderbook of its
+        order (looked up before the event, as a filled or cancelled order leaves the book)
+        """
+        events = [self.decoder.decode(log) for log in logs]
+        events = sorted((event for event in events if event is not None),
+                        key=lambda event: (event.block_number, event.log_index))
+        pending = [event for event in events if event.name == 'NewOrderAddedToPendingQueue']
+        transactions = dict()
+        if pending and rpc is not None:
+            hashes = list(OrderedDict((event.transaction_hash, None) for event in pending))
+            results = rpc.batch([('eth_getTransactionByHash', [tx_hash]) for tx_hash in hashes])
+            transactions = dict(zip(hashes, results))
+        for event in events:
+            book = self.book_of(event) if on_event is not None else None
+            self.apply(event)
+            transaction = transactions.get(event.transaction_hash)
+            if event.name == 'NewOrderAddedToPendingQueue' and transaction:
+                self.resolve_pending_from_transaction(event.args['id'], transaction)
+            if on_event is not None:
+                on_event(event, book or self.book_of(event))
+        return len(events)
+
+    # Snapshot
+
+    def snapshot(self):
+        pairs = []
+        for book in self.pairs.values():
+            sides = dict()
+            for name, side in (('buy', book.buy), ('sell', book.sell)):
+                sides[name] = {
+                    'limit': [asdict(order) for order in side.limit],
+                    'market': [asdict(order) for order in side.market],
+                    'pending_limit': [asdict(order) for order in side.pending_limit.values()],
+                    'pending_market': [asdict(order) for order in side.pending_market.values()],
+                }
+            pairs.append({
+                'base_token': book.base_token,
+                'secondary_token': book.secondary_token,
+                'tick_number': book.tick_number,
+                'tick_running': book.tick_running,
+                'next_tick_block': book.next_tick_block,
+                'last_closing_price': book.last_closing_price,
+                'sides': sides})
+        return {
+            'version': SNAPSHOT_VERSION,
+            'last_block': self.last_block,
+            'pairs': pairs,
+            'unresolved_pending': [dict(args) for args in self.unresolved_pending.values()]}
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            raise ValueError('Unknown snapshot version {0}'.format(snapshot.get('version')))
+        mirror = cls()
+        mirror.last_block = snapshot['last_block']
+        for data in snapshot['pairs']:
+            book = mirror.pair(data['base_token'], data['secondary_token'])
+            book.tick_number = data['tick_number']
+            book.tick_running = data['tick_running']
+            book.next_tick_block = data['next_tick_block']
+            book.last_closing_price = data['last_closing_price']
+            for name, side in (('buy', book.buy), ('sell', book.sell)):
+                orders = data['sides'][name]
+                for order in orders['limit'] + orders['market']:
+                    side.insert(Order(**order))
+                    mirror.order_pairs[order['id']] = book.key
+                for order in orders['pending_limit'] + orders['pending_market']:
+                    side.insert_pending(Order(**order))
+                    mirror.order_pairs[order['id']] = book.key
+        for args in snapshot['unresolved_pending']:
+            mirror.unresolved_pending[args['id']] = args
+        return mirror
+
+    def save(self, path):
+        """ Writes a checkpoint, atomically, so a restart can resume from last_block """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """ Loads a checkpoint, or returns an empty mirror if it does not exist """
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            return cls.from_snapshot(json.load(f))
@@ -0,0 +1,338 @@
+"""
+Transaction pipeline: one queue for all the writes of an account
+
+Every write of an AsyncTexClient started with a pipeline (orders, cancels, approvals,
+wrap / unwrap) is queued and broadcast in order with locally allocated nonces, with at
+most window transactions in flight. A transaction without receipt after stall_timeout
+seconds is broadcast again if the node lost it, or replaced with the same nonce and a
+gas price bumped by gas_bump otherwise:
+
+    async with AsyncTexClient(rpc_url, dex_address, signer) as client:
+        async with TransactionPipeline(client, window=32, rate=10, journal='nonces.json'):
+            await asyncio.gather(*[
+                client.insert_buy_limit_order(base_token, secondary_token, 10, price, 5)
+                for price in prices])
+
+With a journal the in-flight transactions are saved to a file. After a crash start()
+broadcasts them again and fills the nonces lost in between with empty transactions,
+otherwise the transactions after a gap would never be mined.
+"""
+
+import asyncio
+import json
+import os
+import time
+
+from .aio import TRANSFER_GAS, TransactionFailed, _to_int, _to_receipt
+from .nonces import missing_nonces
+
+
+class TransactionDropped(Exception):
+    """ The nonce of the transaction was used by another transaction """
+
+
+def _unawaited_future():
+    """ Future of a transaction nobody may wait for (recovered or filling a gap): its exception is retrieved """
+    future = asyncio.get_running_loop().create_future()
+    future.add_done_callback(lambda done: done.cancelled() or done.exception())
+    return future
+
+
+class PendingTransaction(object):
+    """ A queued transaction and every hash it was broadcast with """
+
+    def __init__(self, to, data, value=0, gas=None, nonce=None, gas_price=None, hashes=None):
+        self.to = to
+        self.data = data
+        self.value = value
+        self.gas = gas
+        self.nonce = nonce
+        self.gas_price = gas_price
+        self.hashes = hashes or []
+        self.replacements = 0
+        self.future = None
+
+    def to_dict(self):
+        return {'to': self.to, 'data': self.data, 'value': self.value, 'gas': self.gas, 'nonce': self.nonce,
+                'gasPrice': self.gas_price, 'hashes': self.hashes}
+
+    @classmethod
+    def from_dict(cls, entry):
+        return cls(entry['to'], entry['data'], entry['value'], entry['gas'], entry['nonce'], entry['gasPrice'],
+                   entry['hashes'])
+
+
+class TransactionJournal(object):
+    """ The in-flight transactions by nonce, saved to a JSON file on every change """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = dict()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = dict((int(nonce), entry) for nonce, entry in json.load(f).items())
+
+    def record(self, transaction):
+        self.entries[transaction.nonce] = transaction.to_dict()
+        self.save()
+
+    def remove(self, nonce):
+        if self.entries.pop(nonce, None) is not None:
+            self.save()
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+
+class TransactionPipeline(object):
+    """ Queues the writes of an AsyncTexClient with a bounded in-flight window """
+
+    def __init__(self, client, window=16, stall_timeout=30, gas_bump=1.125, max_gas_price=None,
+                 max_replacements=5, rate=None, journal=None):
+        self.client = client
+        self.window = window
+        self.stall_timeout = stall_timeout
+        self.gas_bump = gas_bump
+        self.max_gas_price = max_gas_price
+        self.max_replacements = max_replacements
+        # transactions per second broadcast at most, None for as fast as the window allows
+        self.rate = rate
+        self.journal = TransactionJournal(journal) if journal else None
+        self.in_flight = dict()
+        self.sent_count = 0
+        self.rebroadcasts_count = 0
+        self.replacements_count = 0
+        self.gaps_filled_count = 0
+        self._queue = None
+        self._slots = None
+        self._worker = None
+        self._tracking = set()
+        self._last_send = 0
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.stop()
+
+    async def start(self):
+        """ Recovers the journal transactions and routes the client writes to the queue """
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.window)
+        await self.recover()
+        self.client.pipeline = self
+        self._worker = asyncio.ensure_future(self._work())
+        return self
+
+    async def stop(self, drain=True):
+        """ Waits for the queued and in-flight transactions unless drain is False """
+        if self.client.pipeline is self:
+            self.client.pipeline = None
+        if drain:
+            await self._queue.join()
+            if self._tracking:
+                await asyncio.gather(*self._tracking, return_exceptions=True)
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        for task in list(self._tracking):
+            task.cancel()
+
+    @property
+    def queued(self):
+        return self._queue.qsize()
+
+    def submit(self, to, data, value=0, gas=None):
+        """ Queues a transaction, returns the future of its receipt """
+        transaction = PendingTransaction(to, data, value, gas)
+        transaction.future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(transaction)
+        return transaction.future
+
+    async def transact(self, to, data, value=0, gas=None):
+        return await self.submit(to, data, value, gas)
+
+    # Broadcast
+
+    async def _work(self):
+        while True:
+            transaction = await self._queue.get()
+            try:
+                await self._slots.acquire()
+                if transaction.future.cancelled():
+                    self._slots.release()
+                    continue
+                await self._throttle()
+                try:
+                    await self._broadcast_new(transaction)
+                except Exception as e:
+                    self._slots.release()
+                    transaction.future.set_exception(e)
+                    continue
+                self._track(transaction)
+            finally:
+                self._queue.task_done()
+
+    async def _throttle(self):
+        if not self.rate:
+            return
+        wait = self._last_send + 1.0 / self.rate - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self._last_send = time.monotonic()
+
+    async def _broadcast_new(self, transaction):
+        client = self.client
+        if transaction.gas is None:
+            transaction.gas = await client.estimate_gas(transaction.to, transaction.data, transaction.value)
+        transaction.gas_price = client.gas_price
+        transaction.nonce = client.nonces.allocate()
+        try:
+            await self._broadcast(transaction)
+        except Exception:
+            # the failed nonce is reused, or filled if direct sends of the client took later ones
+            if not client.nonces.release(transaction.nonce):
+                await client.fill_nonce_gap(transaction.nonce)
+            raise
+        self.sent_count += 1
+
+    async def _broadcast(self, transaction):
+        client = self.client
+        tx_hash = await client.signer.send(client.rpc, client.build_transaction(
+            transaction.to, transaction.data, transaction.value, transaction.gas, transaction.nonce,
+            transaction.gas_price))
+        if tx_hash not in transaction.hashes:
+            transaction.hashes.append(tx_hash)
+        self.in_flight[transaction.nonce] = transaction
+        if self.journal is not None:
+            self.journal.record(transaction)
+        return tx_hash
+
+    # Tracking
+
+    def _track(self, transaction, slot=True):
+        task = asyncio.ensure_future(self._wait_mined(transaction, slot))
+        self._tracking.add(task)
+        task.add_done_callback(self._tracking.discard)
+
+    async def _wait_mined(self, transaction, slot):
+        try:
+            receipt = await self._receipt(transaction)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._resolve(transaction, exception=e)
+        else:
+            if receipt.status != 1:
+                self._resolve(transaction, exception=TransactionFailed(receipt))
+            else:
+                self._resolve(transaction, receipt=receipt)
+        finally:
+            for tx_hash in transaction.hashes:
+                self.client.receipts.forget(tx_hash)
+            if slot:
+                self._slots.release()
+
+    async def _receipt(self, transaction):
+        """ Receipt of any of the hashes of the transaction, re-broadcasting or bumping it when it stalls """
+        deadline = time.monotonic() + self.client.receipt_timeout
+        while True:
+            watched = [self.client.receipts.watch(tx_hash) for tx_hash in transaction.hashes]
+            done, _ = await asyncio.wait(watched, timeout=self.stall_timeout, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if not future.cancelled():
+                    return future.result()
+            if time.monotonic() > deadline:
+                raise asyncio.TimeoutError('No receipt for nonce {0}'.format(transaction.nonce))
+            receipt = await self._on_stall(transaction)
+            if receipt is not None:
+                return receipt
+
+    async def _on_stall(self, transaction):
+        rpc = self.client.rpc
+        mined_count = _to_int(await rpc.call('eth_getTransactionCount', [self.client.address, 'latest']))
+        if mined_count > transaction.nonce:
+            # the nonce is used: either one of our hashes (receipt not polled yet) or someone else's
+            receipts = await rpc.batch([('eth_getTransactionReceipt', [tx_hash]) for tx_hash in transaction.hashes])
+            for receipt in receipts:
+                if receipt is not None:
+                    return _to_receipt(receipt)
+            raise TransactionDropped('Nonce {0} used by another transaction'.format(transaction.nonce))
+
+        known = await rpc.call('eth_getTransactionByHash', [transaction.hashes[-1]])
+        if known is not None:
+            if transaction.replacements >= self.max_replacements:
+                return None
+            gas_price = max(int(transaction.gas_price * self.gas_bump), transaction.gas_price + 1)
+            if self.max_gas_price is not None:
+                gas_price = min(gas_price, self.max_gas_price)
+            if gas_price <= transaction.gas_price:
+                return None
+            transaction.gas_price = gas_price
+            transaction.replacements += 1
+            self.replacements_count += 1
+        else:
+            self.rebroadcasts_count += 1
+        try:
+            await self._broadcast(transaction)
+        except Exception:
+            # e.g. mined meanwhile (nonce too low), the next stall check finds out
+            pass
+        return None
+
+    def _resolve(self, transaction, receipt=None, exception=None):
+        self.in_flight.pop(transaction.nonce, None)
+        if self.journal is not None:
+            self.journal.remove(transaction.nonce)
+        if transaction.future is None or transaction.future.done():
+            return
+        if exception is not None:
+            transaction.future.set_exception(exception)
+        else:
+            transaction.future.set_result(receipt)
+
+    # Crash recovery
+
+    async def recover(self):
+        """
+        Resumes the journal transactions of a previous run: re-broadcasts the ones not
+        mined, fills the nonce gaps and moves the allocator past all of them. Returns the
+        futures of the receipts of the re-broadcast transactions.
+        """
+        client = self.client
+        mined_count, pending_count = [_to_int(count) for count in await client.rpc.batch([
+            ('eth_getTransactionCount', [client.address, 'latest']),
+            ('eth_getTransactionCount', [client.address, 'pending'])])]
+        entries = self.journal.entries if self.journal is not None else dict()
+        for nonce in [nonce for nonce in entries if nonce < mined_count]:
+            self.journal.remove(nonce)
+        next_nonce = max([pending_count] + [nonce + 1 for nonce in entries])
+
+        futures = []
+        for nonce in sorted(entries):
+            transaction = PendingTransaction.from_dict(entries[nonce])
+            transaction.future = _unawaited_future()
+            try:
+                await self._broadcast(transaction)
+            except Exception:
+                # already in the pool of the node
+                self.in_flight[nonce] = transaction
+            self._track(transaction, slot=False)
+            futures.append(transaction.future)
+        for nonce in missing_nonces(pending_count, next_nonce, entries):
+            futures.append(await self.fill_gap(nonce))
+        client.nonces.reset(next_nonce)
+        return futures
+
+    async def fill_gap(self, nonce):
+        """ Sends an empty transaction to itself with nonce so the later ones can be mined """
+        transaction = PendingTransaction(self.client.address, '0x', 0, TRANSFER_GAS, nonce, self.client.gas_price)
+        transaction.future = _unawaited_future()
+        await self._broadcast(transaction)
+        self.gaps_filled_count += 1
+        self._track(transaction, slot=False)
+        return transaction.future
@@ -0,0 +1,228 @@
+"""
+Routing of the orders of many pairs and accounts
+
+OrderRouter sends orders (validator.OrderRequest) of any listed pair from several
+accounts. Every account has its own AsyncTexClient, so its own nonce stream, and a
+worker sending its orders as BulkOrders batches; all of them share one pooled
+AsyncRPCSession (the reads and the sends) and one ReceiptWatcher, so the receipts of all
+the accounts are polled in one batch:
+
+    signers = [LocalSigner(key) for key in private_keys]
+    async with OrderRouter(rpc_url, dex_address, signers, mirror=mirror, pool_size=20) as router:
+        async for result in router.route(orders, accounts=None):
+            print(result.index, result.account, result.order_id, result.error)
+
+An order goes to the account given for it, or to the account with the fewest orders in
+flight. The orders of a pair are held by a scheduler.TickScheduler while its tick runs
+(or is about to), so none lands in the pending queues: the tick state of the pairs with
+held orders and the block number are read every tick_poll_interval seconds, in one batch.
+The orders that are released together for an account go in one batch, with their hints
+from the mirror (synced by the caller, see bulk.BulkOrders).
+
+The sends are waits on the node: the workers are asyncio tasks of one event loop and the
+requests run in the thread pool of the shared session, as many as its connections. For
+more than one core of signing, run one router per process with disjoint accounts.
+benchmarks/bench_router.py measures the throughput as the pairs and accounts grow.
+"""
+
+import asyncio
+from collections import namedtuple
+from dataclasses import dataclass
+
+from .aio import AsyncRPCSession, AsyncTexClient, ReceiptWatcher
+from .batch import BatchReader
+from .bulk import BulkOrders
+from .orderbook import OrderbookMirror, pair_key
+from .pipeline import TransactionPipeline
+from .scheduler import PolledBlockClock, TickScheduler
+from .validator import OrderRequest
+
+# the result of a routed order: index in the routed orders, account that sent it and the BulkResult fields
+RouteResult = namedtuple('RouteResult', 'index account order hint receipt order_id error')
+
+# an order waiting in the queue of its account
+_Routed = namedtuple('_Routed', 'order future')
+
+
+@dataclass
+class AccountMetrics(object):
+    """ Counters of the router for one account """
+    account: str
+    orders: int = 0
+    batches: int = 0
+    errors: int = 0
+    in_flight: int = 0
+
+
+class OrderRouter(object):
+    """ Sends the orders of many pairs from many accounts, one worker and nonce stream per account """
+
+    def __init__(self, rpc_url, dex_address, signers, mirror=None, validator=None, planners=None, reader=None,
+                 pool_size=20, poll_interval=0.5, tick_poll_interval=1, safety_blocks=2, max_overdue_blocks=None,
+                 window=None, approve=True, **client_options):
+        self.rpc = AsyncRPCSession(rpc_url, pool_size=pool_size)
+        self.receipts = ReceiptWatcher(self.rpc, poll_interval)
+        self.clients = dict()
+        for signer in signers:
+            client = AsyncTexClient(rpc_url, dex_address, signer, rpc=self.rpc, receipts=self.receipts,
+                                    **client_options)
+            self.clients[client.address.lower()] = client
+        self.mirror = mirror if mirror is not None else OrderbookMirror()
+        # account (lowercase) -> allowances.AllowancePlanner of the account
+        planners = dict((account.lower(), planner) for account, planner in (planners or dict()).items())
+        self.bulk = dict((account, BulkOrders(client, self.mirror, validator, planners.get(account)))
+                         for account, client in self.clients.items())
+        # the synchronous pooled session, used from its thread pool
+        self.reader = reader if reader is not None else BatchReader(self.rpc.session, dex_address)
+        self.clock = PolledBlockClock(self.rpc.session)
+        self.scheduler = TickScheduler(self.reader, self.clock, safety_blocks, max_overdue_blocks)
+        self.tick_poll_interval = tick_poll_interval
+        self.window = window
+        self.approve = approve
+        self.metrics = dict((account, AccountMetrics(account)) for account in self.clients)
+        self.pipelines = []
+        self._queues = dict()
+        # future of a routed order -> metrics of its account
+        self._futures = dict()
+        self._tasks = []
+        self._wake = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.stop()
+
+    @property
+    def accounts(self):
+        return list(self.clients)
+
+    async def _in_thread(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.rpc.executor, fn, *args)
+
+    async def start(self):
+        """ Connects the clients (their pending nonces), starts the workers and the tick polling """
+        await asyncio.gather(*[client.connect() for client in self.clients.values()])
+        if self.window is not None:
+            self.pipelines = [await TransactionPipeline(client, window=self.window).start()
+                              for client in self.clients.values()]
+        self._wake = asyncio.Event()
+        for account in self.clients:
+            self._queues[account] = asyncio.Queue()
+            self._tasks.append(asyncio.ensure_future(self._work(account)))
+        self._tasks.append(asyncio.ensure_future(self._poll_ticks()))
+        return self
+
+    async def stop(self):
+        """ Waits for the pipelines, cancels the workers and the orders still held """
+        for pipeline in self.pipelines:
+            await pipeline.stop()
+        self.pipelines = []
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        for orders in self.scheduler.held.values():
+            orders.clear()
+        for future, metrics in list(self._futures.items()):
+            if future.cancel():
+                metrics.in_flight -= 1
+        for client in self.clients.values():
+            client.close()
+        self.receipts.close()
+        self.rpc.close()
+
+    # Routing
+
+    def least_loaded(self):
+        return min(self.metrics.values(), key=lambda metrics: metrics.in_flight).account
+
+    def submit(self, order, account=None):
+        """ Queues an order for the account (the least loaded by default), returns the future of its BulkResult """
+        order = OrderRequest(*order)
+        account = self.least_loaded() if account is None else account.lower()
+        routed = _Routed(order, asyncio.get_running_loop().create_future())
+        self._futures[routed.future] = self.metrics[account]
+        routed.future.add_done_callback(lambda future: self._futures.pop(future, None))
+        self.metrics[account].in_flight += 1
+        self.scheduler.schedule(order.base_token, order.secondary_token,
+                                lambda: self._queues[account].put_nowait(routed))
+        if self.scheduler.state(order.base_token, order.secondary_token) is None:
+            # a pair not polled yet: its tick state is read right away
+            self._wake.set()
+        return account, routed.future
+
+    async def route(self, orders, accounts=None):
+        """ Routes the orders (accounts: the account of every order, None for any), yields a RouteResult each """
+        orders = [OrderRequest(*order) for order in orders]
+        accounts = accounts if accounts is not None else [None] * len(orders)
+        waits = []
+        for index, (order, account) in enumerate(zip(orders, accounts)):
+            account, future = self.submit(order, account)
+            waits.append(self._wait(index, account, order, future))
+        for wait in asyncio.as_completed(waits):
+            yield await wait
+
+    @staticmethod
+    async def _wait(index, account, order, future):
+        try:
+            result = await future
+        except Exception as e:
+            return RouteResult(index, account, order, None, None, None, e)
+        return RouteResult(index, account, order, result.hint, result.receipt, result.order_id, result.error)
+
+    @property
+    def active(self):
+        return self.scheduler.held_count or any(metrics.in_flight for metrics in self.metrics.values())
+
+    async def _poll_ticks(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.tick_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not self.active:
+                continue
+            # submit changes the scheduler on the loop: only the reads go to the thread pool
+            held = [orders[0][0] for orders in self.scheduler.held.values() if orders]
+            pairs = sorted(set(self.scheduler.states) | set(pair_key(*pair) for pair in held))
+            try:
+                table = await self._in_thread(self._read_ticks, pairs)
+            except Exception:
+                # the orders stay held until a poll succeeds
+                continue
+            self.scheduler.update_from_table(table)
+            self.scheduler.release()
+
+    def _read_ticks(self, pairs):
+        """ The block number and the status table of the pairs routed so far """
+        self.clock.poll()
+        return self.reader.pairs_status(pairs) if pairs else []
+
+    async def _work(self, account):
+        queue, bulk, metrics = self._queues[account], self.bulk[account], self.metrics[account]
+        while True:
+            # the orders queued while the last batch was sent go together
+            batch = [await queue.get()]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            metrics.batches += 1
+            try:
+                async for result in bulk.place([routed.order for routed in batch], approve=self.approve):
+                    self._done(metrics, batch[result.index].future, result)
+            except Exception as e:
+                for routed in batch:
+                    if not routed.future.done():
+                        metrics.in_flight -= 1
+                        metrics.errors += 1
+                        routed.future.set_exception(e)
+
+    @staticmethod
+    def _done(metrics, future, result):
+        metrics.in_flight -= 1
+        metrics.orders += 1
+        if result.error is not None:
+            metrics.errors += 1
+        if not future.done():
+            future.set_result(result)
@@ -0,0 +1,202 @@
+"""
+Tick-aware scheduling of orders
+
+An order sent while the tick of its pair is running goes to the pending queue and only
+reaches the orderbook when the pending orders are moved at the end of the tick, one
+tick later than it could. The tick can start as soon as the block nextTickBlock is
+reached, so an order is only safe to send if it is mined before that block.
+
+TickScheduler keeps the tick state of every pair (tick stage, nextTickBlock and
+lastTickBlock of getTokenPairStatus) and holds the orders scheduled while the window of
+their pair is closed, releasing them when the tick finished:
+
+    scheduler = TickScheduler(BatchReader.from_client(client), RPCBlockClock(client.rpc))
+    scheduler.schedule(base_token, secondary_token, lambda: client.insert_buy_limit_order(...))
+    while scheduler.held_count:
+        scheduler.step()
+        time.sleep(block_time)
+
+The next tick block after a tick is predicted like TickState.calculateBlocks does, with
+the tickConfig of the contract and the amount of matches of the tick (e.g. from the
+simulator). PolledBlockClock reads the block once per poll instead of once per order and
+SimulatedBlockClock replaces the node to run the scheduler offline.
+"""
+
+from collections import deque, namedtuple
+
+from .constants import TickStage
+
+TickConfig = namedtuple('TickConfig', 'expected_orders_for_tick max_blocks_for_tick min_blocks_for_tick')
+
+# tick state of a pair as read from getTokenPairStatus / getTickStage
+PairTickState = namedtuple('PairTickState', 'tick_stage tick_number next_tick_block last_tick_block')
+
+
+def calculate_blocks(expected_orders_for_tick, last_tick_block, max_blocks_for_tick, min_blocks_for_tick,
+                     actual_orders, current_block_number):
+    """ TickState.calculateBlocks: blocks from the start of a tick until the next one can run """
+    blocks_for_last_tick = current_block_number - last_tick_block
+    tentative_blocks = expected_orders_for_tick * blocks_for_last_tick // actual_orders
+    tentative_blocks = min(tentative_blocks, max_blocks_for_tick)
+    return max(tentative_blocks, min_blocks_for_tick)
+
+
+def next_tick_block(config, last_tick_block, tick_start_block, matches_amount):
+    """ nextTickBlock set by TickState.nextTick for a tick started at tick_start_block """
+    return tick_start_block + calculate_blocks(
+        config.expected_orders_for_tick, last_tick_block, config.max_blocks_for_tick,
+        config.min_blocks_for_tick, max(matches_amount, 1), tick_start_block)
+
+
+class RPCBlockClock(object):
+    """ Block number of the node """
+
+    def __init__(self, rpc):
+        self.rpc = rpc
+
+    def block_number(self):
+        return int(self.rpc.call('eth_blockNumber'), 16)
+
+
+class PolledBlockClock(object):
+    """ Block number of the node read by poll(), e.g. once per loop instead of once per order """
+
+    def __init__(self, rpc):
+        self.rpc = rpc
+        self._block_number = None
+
+    def poll(self):
+        self._block_number = int(self.rpc.call('eth_blockNumber'), 16)
+        return self._block_number
+
+    def block_number(self):
+        return self.poll() if self._block_number is None else self._block_number
+
+
+class SimulatedBlockClock(object):
+    """ Block number advanced by hand, to run the scheduler without a node """
+
+    def __init__(self, block_number=1):
+        self._block_number = block_number
+
+    def block_number(self):
+        return self._block_number
+
+    def advance(self, blocks=1):
+        self._block_number += blocks
+        return self._block_number
+
+
+class TickScheduler(object):
+    """
+    Holds the orders of a pair while its tick is running or about to run. safety_blocks
+    is how many blocks before nextTickBlock an order is no longer sent (the blocks it
+    may take to be mined). If the tick is not started max_overdue_blocks after
+    nextTickBlock (nobody running it) the orders are sent anyway.
+    """
+
+    def __init__(self, reader, clock, safety_blocks=2, max_overdue_blocks=None, config=None):
+        self.reader = reader
+        self.clock = clock
+        self.safety_blocks = safety_blocks
+        self.max_overdue_blocks = max_overdue_blocks
+        self._config = config
+        self.states = dict()
+        self.held = dict()
+
+    @property
+    def config(self):
+        """ tickConfig of the contract, read the first time """
+        if self._config is None:
+            value = self.reader.call('tickConfig')
+            self._config = TickConfig(
+                value['expectedOrdersForTick'], value['maxBlocksForTick'], value['minBlocksForTick'])
+        return self._config
+
+    @staticmethod
+    def _key(base_token, secondary_token):
+        return base_token.lower(), secondary_token.lower()
+
+    # Tick state
+
+    def update(self, base_token, secondary_token, tick_stage, tick_number, next_tick_block, last_tick_block):
+        self.states[self._key(base_token, secondary_token)] = PairTickState(
+            TickStage(tick_stage), tick_number, next_tick_block, last_tick_block)
+
+    def update_from_table(self, table):
+        """ Takes the tick state of the rows of a BatchReader status table """
+        for row in table:
+            if row.tick_stage is None or row.next_tick_block is None:
+                continue
+            self.update(row.base_token, row.secondary_token, row.tick_stage, row.tick_number,
+                        row.next_tick_block, row.last_tick_block)
+
+    def refresh(self, pairs=None):
+        """ Reads the tick state of the pairs with scheduled orders (or the given ones) in one batch """
+        if pairs is None:
+            pairs = [orders[0][0] for orders in self.held.values() if orders]
+        if pairs:
+            self.update_from_table(self.reader.pairs_status(pairs))
+
+    def state(self, base_token, secondary_token):
+        return self.states.get(self._key(base_token, secondary_token))
+
+    def is_open(self, base_token, secondary_token, block_number=None):
+        """ True if an order sent now reaches the orderbook, not the pending queue """
+        state = self.state(base_token, secondary_token)
+        if state is None or state.tick_stage != TickStage.RECEIVING_ORDERS:
+            return False
+        block_number = self.clock.block_number() if block_number is None else block_number
+        if block_number + self.safety_blocks < state.next_tick_block:
+            return True
+        # the tick can start any time; unless it looks like nobody is running it
+        return (self.max_overdue_blocks is not None
+                and block_number > state.next_tick_block + self.max_overdue_blocks)
+
+    def blocks_until_closed(self, base_token, secondary_token, block_number=None):
+        """ Blocks left to send orders before the tick can start, 0 if closed """
+        state = self.state(base_token, secondary_token)
+        if state is None or state.tick_stage != TickStage.RECEIVING_ORDERS:
+            return 0
+        block_number = self.clock.block_number() if block_number is None else block_number
+        return max(state.next_tick_block - self.safety_blocks - block_number, 0)
+
+    def predict_next_tick_block(self, base_token, secondary_token, matches_amount, tick_start_block=None):
+        """
+        nextTickBlock after the next tick, started at tick_start_block (by default the
+        current nextTickBlock, or now if it is already running) with matches_amount matches
+        """
+        state = self.state(base_token, secondary_token)
+        if tick_start_block is None:
+            tick_start_block = max(state.next_tick_block, self.clock.block_number())
+        return next_tick_block(self.config, state.last_tick_block, tick_start_block, matches_amount)
+
+    # Orders
+
+    def schedule(self, base_token, secondary_token, send):
+        """ Sends now if the window is open and nothing is held for the pair, otherwise holds send """
+        key = self._key(base_token, secondary_token)
+        orders = self.held.setdefault(key, deque())
+        if not orders and self.is_open(base_token, secondary_token):
+            return send()
+        orders.append(((base_token, secondary_token), send))
+        return None
+
+    @property
+    def held_count(self):
+        return sum(len(orders) for orders in self.held.values())
+
+    def release(self):
+        """ Sends the held orders of the pairs with the window open, returns their results """
+        results = []
+        block_number = self.clock.block_number()
+        for orders in self.held.values():
+            while orders and self.is_open(*orders[0][0], block_number=block_number):
+                _, send = orders.popleft()
+                results.append(send())
+        return results
+
+    def step(self):
+        """ Reads the tick state and releases what can be sent, to call once per block """
+        self.refresh()
+        return self.release()
@@ -0,0 +1,335 @@
+"""
+Long lived client session for the TEX
+
+The scripts in this folder build a NetworkManager, connect, load the contract from its
+ABI, run a single call and disconnect. TexClient does that setup once and keeps it warm:
+
+    client = TexClient()
+    client.connect()
+    client.token_pairs_status(base_token, secondary_token)
+    client.insert_buy_limit_order(base_token, secondary_token, amount, price, lifespan)
+    client.disconnect()
+
+or as a context manager:
+
+    with TexClient() as client:
+        print(client.paused())
+
+It holds:
+
+  * one connected NetworkManager (brownie connection)
+  * one MoCDecentralizedExchange wrapper loaded from the ABI, and a cache of token wrappers
+  * one pooled requests.Session used to send raw JSON-RPC calls and batches to the node
+
+brownie / moneyonchain are only imported on connect(), so the offline modules of
+this package can be used without them. requests and the wad math (numpy) are imported
+on first use too, so importing the package (e.g. to start the tex CLI) stays cheap.
+"""
+
+import itertools
+import threading
+
+from .constants import DEFAULT_CONNECTION_NETWORK, DEFAULT_CONFIG_NETWORK
+
+
+def to_wad(value):
+    """ wad.to_wad, imported on first use """
+    from .wad import to_wad
+    return to_wad(value)
+
+
+class RPCError(Exception):
+    """ The node answered a JSON-RPC request with an error """
+
+    def __init__(self, error, method=None):
+        self.error = error
+        self.method = method
+        message = error.get('message') if isinstance(error, dict) else str(error)
+        super().__init__('{0}: {1}'.format(method, message) if method else message)
+
+
+class RPCSession(object):
+    """ Pooled HTTP session to send JSON-RPC requests to a node """
+
+    def __init__(self, rpc_url, pool_size=10, timeout=30):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.rpc_url = rpc_url
+        self.timeout = timeout
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+        self.http.headers.update({'Content-Type': 'application/json'})
+        self._ids = itertools.count(1)
+        self._ids_lock = threading.Lock()
+
+    def _next_id(self):
+        with self._ids_lock:
+            return next(self._ids)
+
+    def _post(self, payload):
+        response = self.http.post(self.rpc_url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def call(self, method, params=None):
+        """ Sends a single JSON-RPC request and returns its result """
+        answer = self._post({
+            'jsonrpc': '2.0',
+            'id': self._next_id(),
+            'method': method,
+            'params': params or []})
+        if 'error' in answer:
+            raise RPCError(answer['error'], method)
+        return answer['result']
+
+    def batch(self, calls, raise_on_error=True):
+        """
+        Sends a list of (method, params) as one JSON-RPC batch request, one round trip.
+        Returns the results in the same order of the calls. When raise_on_error is False
+        failed calls are returned as RPCError instances instead of raising.
+        """
+        calls = list(calls)
+        if not calls:
+            return []
+        payload = []
+        for method, params in calls:
+            payload.append({
+                'jsonrpc': '2.0',
+                'id': self._next_id(),
+                'method': method,
+                'params': params or []})
+        answer = self._post(payload)
+        by_id = {item['id']: item for item in answer}
+        results = []
+        for request in payload:
+            item = by_id.get(request['id'])
+            if item is None:
+                error = RPCError({'message': 'missing response'}, request['method'])
+            elif 'error' in item:
+                error = RPCError(item['error'], request['method'])
+            else:
+                results.append(item['result'])
+                continue
+            if raise_on_error:
+                raise error
+            results.append(error)
+        return results
+
+    def close(self):
+        self.http.close()
+
+
+class TexClient(object):
+    """
+    Warm client to operate with the TEX. Any operation the scripts do is one method call.
+    Amounts and prices follow the moneyonchain wrapper, i.e. in token units (not wei)
+    """
+
+    def __init__(self,
+                 connection_network=DEFAULT_CONNECTION_NETWORK,
+                 config_network=DEFAULT_CONFIG_NETWORK,
+                 rpc_url=None,
+                 pool_size=10,
+                 network_manager=None,
+                 account=None):
+        self.connection_network = connection_network
+        self.config_network = config_network
+        self.pool_size = pool_size
+        self._rpc_url = rpc_url
+        self.network_manager = network_manager
+        self._account = account
+        self._dex = None
+        self._tokens = dict()
+        self._rpc = None
+        self._connected = False
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disconnect()
+
+    @property
+    def connected(self):
+        return self._connected
+
+    def connect(self):
+        """ Connects to the network and loads the DEX contract, only the first time """
+        with self._lock:
+            if self._connected:
+                return self
+            from moneyonchain.networks import NetworkManager
+
+            if self.network_manager is None:
+                # connection network is the brownie connection network
+                # config network is our enviroment we want to connect
+                self.network_manager = NetworkManager(
+                    connection_network=self.connection_network,
+                    config_network=self.config_network)
+            self.network_manager.connect()
+            self._connected = True
+            return self
+
+    def disconnect(self):
+        """ Disconnects from the network and closes the pooled session """
+        with self._lock:
+            if self._rpc is not None:
+                self._rpc.close()
+                self._rpc = None
+            if self._connected:
+                self.network_manager.disconnect()
+                self._connected = False
+            self._dex = None
+            self._tokens = dict()
+
+    @property
+    def web3(self):
+        self.connect()
+        from brownie import web3
+        return web3
+
+    @property
+    def rpc_url(self):
+        if self._rpc_url is None:
+            self._rpc_url = self.web3.provider.endpoint_uri
+        return self._rpc_url
+
+    @property
+    def rpc(self):
+        """ Pooled JSON-RPC session, created on first use """
+        with self._lock:
+            if self._rpc is None:
+                self._rpc = RPCSession(self.rpc_url, pool_size=self.pool_size)
+            return self._rpc
+
+    @property
+    def dex(self):
+        """ MoCDecentralizedExchange wrapper, loaded from the ABI only once """
+        with self._lock:
+            if self._dex is None:
+                self.connect()
+                from moneyonchain.tex import MoCDecentralizedExchange
+                self._dex = MoCDecentralizedExchange(self.network_manager).from_abi()
+            return self._dex
+
+    @property
+    def dex_address(self):
+        return self.dex.sc.address
+
+    @property
+    def account(self):
+        """ Account that sends the transactions, the first brownie account by default """
+        if self._account is None:
+            self.connect()
+            from brownie import accounts
+            self._account = accounts[0]
+        return self._account
+
+    def token(self, token_address, wrapped=False):
+        """ Token wrapper for the given address, cached per address """
+        key = (token_address.lower(), wrapped)
+        with self._lock:
+            if key not in self._tokens:
+                self.connect()
+                from moneyonchain.tokens import ERC20Token, WRBTCToken
+                token_class = WRBTCToken if wrapped else ERC20Token
+                self._tokens[key] = token_class(
+                    self.network_manager,
+                    contract_address=token_address).from_abi()
+            return self._tokens[key]
+
+    # Read operations
+
+    def paused(self):
+        return self.dex.paused()
+
+    def token_pairs(self):
+        return self.dex.sc.getTokenPairs()
+
+    def token_pairs_status(self, base_token, secondary_token):
+        return self.dex.token_pairs_status(base_token, secondary_token)
+
+    def tick_stage(self, base_token, secondary_token):
+        return self.dex.tick_stage((base_token, secondary_token))
+
+    def tick_is_running(self, base_token, secondary_token):
+        return self.dex.tick_is_running((base_token, secondary_token))
+
+    def allowance(self, token_address, account, spender=None):
+        spender = spender or self.dex_address
+        return self.token(token_address).allowance(account, spender)
+
+    def balance_of(self, token_address, account):
+        return self.token(token_address).balance_of(account)
+
+    def block_number(self):
+        return int(self.rpc.call('eth_blockNumber'), 16)
+
+    # Write operations
+
+    def approve(self, token_address, amount, spender=None, **tx_arguments):
+        spender = spender or self.dex_address
+        return self.token(token_address).approve(spender, amount, **tx_arguments)
+
+    def wrap(self, token_address, amount, **tx_arguments):
+        return self.token(token_address, wrapped=True).deposit(amount, **tx_arguments)
+
+    def unwrap(self, token_address, amount, **tx_arguments):
+        return self.token(token_address, wrapped=True).withdraw(amount, **tx_arguments)
+
+    def insert_buy_limit_order(self, base_token, secondary_token, amount, price, lifespan, **tx_arguments):
+        return self.dex.insert_buy_limit_order(
+            base_token, secondary_token, amount, price, lifespan, **tx_arguments)
+
+    def insert_sell_limit_order(self, base_token, secondary_token, amount, price, lifespan, **tx_arguments):
+        return self.dex.insert_sell_limit_order(
+            base_token, secondary_token, amount, price, lifespan, **tx_arguments)
+
+    def insert_buy_market_order(self, base_token, secondary_token, amount, multiply_factor, lifespan,
+                                **tx_arguments):
+        return self.dex.insert_buy_market_order(
+            base_token, secondary_token, amount, multiply_factor, lifespan, **tx_arguments)
+
+    def insert_sell_market_order(self, base_token, secondary_token, amount, multiply_factor, lifespan,
+                                 **tx_arguments):
+        return self.dex.insert_sell_market_order(
+            base_token, secondary_token, amount, multiply_factor, lifespan, **tx_arguments)
+
+    def cancel_buy_order(self, base_token, secondary_token, order_id, previous_order_id=0, **tx_arguments):
+        return self.dex.cancel_buy_order(
+            base_token, secondary_token, order_id, previous_order_id, **tx_arguments)
+
+    def cancel_sell_order(self, base_token, secondary_token, order_id, previous_order_id=0, **tx_arguments):
+        return self.dex.cancel_sell_order(
+            base_token, secondary_token, order_id, previous_order_id, **tx_arguments)
+
+    # Write operations with hints, sent straight to the contract; amounts and prices in
+    # token units like the rest of the client
+
+    def transact(self, function_name, *args, **tx_arguments):
+        """ Sends a DEX transaction with the arguments as the contract expects them (wei) """
+        tx_arguments.setdefault('from', self.account)
+        return getattr(self.dex.sc, function_name)(*args, tx_arguments)
+
+    def insert_buy_limit_order_after(self, base_token, secondary_token, amount, price, lifespan,
+                                     previous_order_id, **tx_arguments):
+        return self.transact(
+            'insertBuyLimitOrderAfter', base_token, secondary_token, to_wad(amount), to_wad(price), lifespan,
+            previous_order_id, **tx_arguments)
+
+    def insert_sell_limit_order_after(self, base_token, secondary_token, amount, price, lifespan,
+                                      previous_order_id, **tx_arguments):
+        return self.transact(
+            'insertSellLimitOrderAfter', base_token, secondary_token, to_wad(amount), to_wad(price), lifespan,
+            previous_order_id, **tx_arguments)
+
+    def insert_market_order_after(self, base_token, secondary_token, amount, multiply_factor, previous_order_id,
+                                  lifespan, is_buy, **tx_arguments):
+        return self.transact(
+            'insertMarketOrderAfter', base_token, secondary_token, to_wad(amount), to_wad(multiply_factor),
+            previous_order_id, lifespan, is_buy, **tx_arguments)
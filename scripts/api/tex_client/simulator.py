@@ -0,0 +1,303 @@
+"""
+Local port of the TEX tick matching: emergent price simulation and order matching
+
+It follows MoCExchangeLib.getLastMatchingOrders / simulateMatchingStep (the emergent
+price) and MoCExchangeLib.matchOrders (the matches of the tick) step by step, with the
+same integer operations in the same order, so the results are the ones the contract
+would get, to the last wei:
+
+    buys = OrderArrays(prices=[...], amounts=[...], reserved_commissions=[...])
+    sells = OrderArrays(prices=[...], amounts=[...], reserved_commissions=[...])
+    simulation = simulate(buys, sells, market_price=market_price, tick_number=tick_number)
+    print(simulation.emergent_price, simulation.matches_amount)
+    tick = match_tick(buys, sells, market_price=market_price, tick_number=tick_number)
+    print(tick.buyer_sent, tick.buys.amounts)
+
+Amounts and prices are numpy object arrays of python ints, so the wad math is exact and
+never overflows. The orders of a side are given in the orderbook order of each type
+(the order of OrderbookMirror, or the contract's linked list); the priority order
+(limit and market orders merged, expired ones dropped) is computed with one exact
+numpy lexsort over 64 bit limbs of the prices, and the walk only visits the orders
+that cross, so a 10k orders book is simulated in a few milliseconds.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from .constants import RATE_PRECISION, OrderType
+from .wad import as_int_array, market_order_spot_price
+
+LIMB_BITS = 64
+LIMB_MASK = (1 << LIMB_BITS) - 1
+
+# 'never expires', bigger than any uint64 tick number
+NEVER_EXPIRES = np.iinfo(np.int64).max
+
+
+class OrderArrays(object):
+    """ Orders of one orderbook side as parallel arrays, in orderbook order of each type """
+
+    def __init__(self, prices, amounts, ids=None, reserved_commissions=None, order_types=None,
+                 multiply_factors=None, expires_in_tick=None):
+        size = len(amounts)
+        self.prices = as_int_array(prices)
+        self.amounts = as_int_array(amounts)
+        self.ids = np.arange(1, size + 1, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+        self.reserved_commissions = as_int_array(
+            [0] * size if reserved_commissions is None else reserved_commissions)
+        self.order_types = np.zeros(size, dtype=np.int8) if order_types is None else \
+            np.asarray(order_types, dtype=np.int8)
+        self.multiply_factors = as_int_array([0] * size if multiply_factors is None else multiply_factors)
+        self.expires_in_tick = np.full(size, NEVER_EXPIRES, dtype=np.int64) if expires_in_tick is None else \
+            np.asarray(expires_in_tick, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.amounts)
+
+    @classmethod
+    def from_orders(cls, orders):
+        """ From orderbook.Order objects, e.g. list(side.limit) + list(side.market) """
+        orders = list(orders)
+        return cls(
+            prices=[order.price for order in orders],
+            amounts=[order.exchangeable_amount for order in orders],
+            ids=[order.id for order in orders],
+            reserved_commissions=[order.reserved_commission for order in orders],
+            order_types=[order.order_type for order in orders],
+            multiply_factors=[order.multiply_factor for order in orders],
+            expires_in_tick=[order.expires_in_tick for order in orders])
+
+    def copy(self):
+        copy = OrderArrays.__new__(OrderArrays)
+        copy.__dict__.update((name, value.copy()) for name, value in self.__dict__.items())
+        return copy
+
+    def take(self, positions):
+        """ The orders at positions (indexes or a boolean mask), in that order """
+        taken = OrderArrays.__new__(OrderArrays)
+        taken.__dict__.update((name, value[positions]) for name, value in self.__dict__.items())
+        return taken
+
+    @staticmethod
+    def concatenate(arrays):
+        """ The orders of every OrderArrays one after the other """
+        joined = OrderArrays.__new__(OrderArrays)
+        joined.__dict__.update((name, np.concatenate([orders.__dict__[name] for orders in arrays]))
+                               for name in arrays[0].__dict__)
+        return joined
+
+    def spot_prices(self, market_price):
+        """ getOrderPrice of every order: the price, or multiplyFactor * marketPrice for market orders """
+        is_market = self.order_types == OrderType.MARKET_ORDER
+        if not is_market.any():
+            return self.prices
+        prices = self.prices.copy()
+        prices[is_market] = market_order_spot_price(int(market_price), self.multiply_factors[is_market])
+        return prices
+
+
+def _limbs(values):
+    """ 64 bit limbs of non negative ints, least significant first """
+    limbs = []
+    remaining = values
+    while True:
+        limbs.append((remaining & LIMB_MASK).astype(np.uint64))
+        remaining = remaining >> LIMB_BITS
+        if not remaining.any():
+            return limbs
+
+
+def priority(orders, is_buy, market_price=0, tick_number=0):
+    """
+    Positions of the not expired orders in matching order: most competitive price first,
+    limit orders before market orders with the same price (mostCompetitiveOrder), and
+    the orderbook order between orders with the same price and type
+    """
+    valid = np.flatnonzero(orders.expires_in_tick > tick_number)
+    if not len(valid):
+        return valid
+    prices = orders.spot_prices(market_price)[valid]
+    limbs = _limbs(prices)
+    if is_buy:
+        limbs = [~limb for limb in limbs]
+    # lexsort is stable and sorts by the last key first
+    keys = [orders.order_types[valid]] + limbs
+    return valid[np.lexsort(keys)]
+
+
+def average(left, right):
+    """ OpenZeppelin Math.average """
+    return left // 2 + right // 2 + ((left % 2 + right % 2) // 2)
+
+
+def compare_intents(buy_amount, buy_price, sell_amount, price_precision=RATE_PRECISION):
+    """ MoCExchangeLib.compareIntents: (limiting amount, fills buy, fills sell) """
+    buyer_intent = buy_amount * price_precision // buy_price
+    if sell_amount > buyer_intent:
+        return buyer_intent, True, False
+    if sell_amount < buyer_intent:
+        return sell_amount, False, True
+    return sell_amount, True, True
+
+
+Simulation = namedtuple('Simulation', [
+    'emergent_price',
+    'matches_amount',
+    # positions in the input arrays of the last orders to match, -1 if there is no match
+    'last_buy_match',
+    'last_sell_match',
+    # amount of matching steps, the amount of matchOrders calls of the tick
+    'steps',
+    'buy_priority',
+    'sell_priority',
+    'buy_prices',
+    'sell_prices',
+])
+
+
+def simulate(buys, sells, market_price=0, tick_number=0, price_precision=RATE_PRECISION):
+    """ Emergent price of a tick, like getEmergentPrice / the RUNNING_SIMULATION stage """
+    buy_priority = priority(buys, True, market_price, tick_number)
+    sell_priority = priority(sells, False, market_price, tick_number)
+    buy_prices = buys.spot_prices(market_price)
+    sell_prices = sells.spot_prices(market_price)
+
+    # the walk only visits crossing orders; take them as python ints once
+    buy_count, sell_count = len(buy_priority), len(sell_priority)
+    if not buy_count or not sell_count or buy_prices[buy_priority[0]] < sell_prices[sell_priority[0]]:
+        return Simulation(0, 0, -1, -1, 0, buy_priority, sell_priority, buy_prices, sell_prices)
+    buy_price_list = buy_prices[buy_priority].tolist()
+    sell_price_list = sell_prices[sell_priority].tolist()
+    buy_amount_list = buys.amounts[buy_priority].tolist()
+    sell_amount_list = sells.amounts[sell_priority].tolist()
+
+    i = j = 0
+    buy_amount, sell_amount = buy_amount_list[0], sell_amount_list[0]
+    matches_amount = steps = 0
+    last_i = last_j = -1
+    while i < buy_count and j < sell_count and buy_price_list[i] >= sell_price_list[j]:
+        last_i, last_j = i, j
+        buy_price = buy_price_list[i]
+        limiting_amount, fills_buy, fills_sell = compare_intents(buy_amount, buy_price, sell_amount, price_precision)
+        steps += 1
+        matches_amount += 2 if fills_buy and fills_sell else 1
+        if fills_buy and fills_sell:
+            i += 1
+            j += 1
+            buy_amount = buy_amount_list[i] if i < buy_count else 0
+            sell_amount = sell_amount_list[j] if j < sell_count else 0
+        elif fills_buy:
+            i += 1
+            buy_amount = buy_amount_list[i] if i < buy_count else 0
+            sell_amount -= limiting_amount
+        else:
+            j += 1
+            sell_amount = sell_amount_list[j] if j < sell_count else 0
+            buy_amount -= limiting_amount * buy_price // price_precision
+
+    emergent_price = average(buy_price_list[last_i], sell_price_list[last_j])
+    return Simulation(
+        emergent_price, matches_amount, int(buy_priority[last_i]), int(sell_priority[last_j]), steps,
+        buy_priority, sell_priority, buy_prices, sell_prices)
+
+
+TickMatch = namedtuple('TickMatch', [
+    'simulation',
+    # one entry per match (BuyerMatch / SellerMatch pair), object arrays
+    'buy',
+    'sell',
+    'limiting_amount',
+    'buyer_sent',
+    'buyer_commission',
+    'change',
+    'buyer_remaining',
+    'seller_commission',
+    'surplus',
+    'seller_remaining',
+    # the orders after the tick; amounts are 0 for filled orders
+    'buys',
+    'sells',
+])
+
+
+def match_tick(buys, sells, market_price=0, tick_number=0, price_precision=RATE_PRECISION):
+    """
+    Simulation plus the matches of the tick (matchOrders until the last matching orders),
+    with the amounts of the BuyerMatch and SellerMatch events
+    """
+    simulation = simulate(buys, sells, market_price, tick_number, price_precision)
+    buys, sells = buys.copy(), sells.copy()
+    price = simulation.emergent_price
+    rows = []
+    if simulation.steps:
+        buy_priority = simulation.buy_priority.tolist()
+        sell_priority = simulation.sell_priority.tolist()
+        buy_prices, sell_prices = simulation.buy_prices.tolist(), simulation.sell_prices.tolist()
+        # python lists while walking, element access on object arrays is much slower
+        buy_amounts, buy_reserved_commissions = buys.amounts.tolist(), buys.reserved_commissions.tolist()
+        sell_amounts, sell_reserved_commissions = sells.amounts.tolist(), sells.reserved_commissions.tolist()
+        i = j = 0
+        for _ in range(simulation.steps):
+            buy, sell = buy_priority[i], sell_priority[j]
+            buy_amount, buy_reserved = buy_amounts[buy], buy_reserved_commissions[buy]
+            sell_amount, sell_reserved = sell_amounts[sell], sell_reserved_commissions[sell]
+            buy_price = buy_prices[buy]
+            limiting_amount, fills_buy, fills_sell = compare_intents(
+                buy_amount, buy_price, sell_amount, price_precision)
+
+            # executeBuyerMatch
+            buyer_sent = limiting_amount * price // price_precision
+            expected_send = buy_amount if fills_buy else limiting_amount * buy_price // price_precision
+            buyer_commission = buyer_sent * buy_reserved // buy_amount
+            expected_commission = expected_send * buy_reserved // buy_amount
+            change = expected_send - buyer_sent + (expected_commission - buyer_commission)
+            buy_reserved_commissions[buy] = buy_reserved - expected_commission
+            buy_amounts[buy] = buy_amount - expected_send
+
+            # executeSellerMatch
+            seller_commission = limiting_amount * sell_reserved // sell_amount
+            surplus = buyer_sent - limiting_amount * sell_prices[sell] // price_precision
+            sell_reserved_commissions[sell] = sell_reserved - seller_commission
+            sell_amounts[sell] = sell_amount - limiting_amount
+
+            rows.append((buy, sell, limiting_amount, buyer_sent, buyer_commission, change, buy_amounts[buy],
+                         seller_commission, surplus, sell_amounts[sell]))
+            i += fills_buy
+            j += fills_sell
+        buys.amounts[:], buys.reserved_commissions[:] = buy_amounts, buy_reserved_commissions
+        sells.amounts[:], sells.reserved_commissions[:] = sell_amounts, sell_reserved_commissions
+
+    columns = [as_int_array(column) for column in zip(*rows)] if rows else [as_int_array([])] * 10
+    return TickMatch(simulation, *columns, buys=buys, sells=sells)
+
+
+def match_amounts(buy_prices, buy_amounts, sell_prices, sell_amounts, match_prices=None,
+                  price_precision=RATE_PRECISION):
+    """
+    Vectorized single match of many buy / sell pairs, without commissions, like
+    helpers/exchangesCalculator.js match(). The match price defaults to the average.
+    Returns a dict of object arrays.
+    """
+    buy_prices, buy_amounts = as_int_array(buy_prices), as_int_array(buy_amounts)
+    sell_prices, sell_amounts = as_int_array(sell_prices), as_int_array(sell_amounts)
+    if match_prices is None:
+        match_prices = buy_prices // 2 + sell_prices // 2 + ((buy_prices % 2 + sell_prices % 2) // 2)
+    else:
+        match_prices = as_int_array(match_prices)
+    buyer_intent = buy_amounts * price_precision // buy_prices
+    limiting_amount = np.minimum(sell_amounts, buyer_intent)
+    sent = limiting_amount * match_prices // price_precision
+    expected_send = limiting_amount * buy_prices // price_precision
+    expected_return = limiting_amount * sell_prices // price_precision
+    return {
+        'match_price': match_prices,
+        'limiting_amount': limiting_amount,
+        'sent': sent,
+        'expected_send': expected_send,
+        'change': expected_send - sent,
+        'expected_return': expected_return,
+        'surplus': sent - expected_return,
+        'buy_remaining': buy_amounts - expected_send,
+        'sell_remaining': sell_amounts - limiting_amount,
+    }
@@ -0,0 +1,240 @@
+"""
+Pre-flight validation of the orders, before they are signed
+
+Every require of the order insertions that only depends on governance parameters and
+the state of the pair is checked locally, in the order the contract checks them, so a
+rejected order costs nothing instead of the gas of a reverted transaction:
+
+    validator = OrderValidator(BatchReader.from_client(client), CommissionEngine(client.rpc, client.dex_address))
+    order = limit_order(base_token, secondary_token, amount, price, lifespan, is_buy=True)
+    reason = validator.check(order)   # None, or the revert reason, e.g. 'Amount too low'
+    validator.validate(order)         # raises OrderRejected
+
+The parameters (paused, minOrderAmount, the multiply factor range, maxOrderLifespan,
+the disabled flag and emaPrice of every pair and the commission rates) are read in one
+batch and cached. observe() keeps them current from the events and transactions the
+process sees: TokenPairDisabled / TokenPairEnabled and Paused / Unpaused update them,
+TickEnd (a new emaPrice) and a Governor.executeChange (the changers do not log) make
+the next check read them again. A pair whose getTokenPairStatus fails (e.g. its price
+provider reverts) is recorded in pair_errors: only the orders of that pair, or converted
+through it, are rejected, with the error as the reason. disabled and emaPrice are only
+public through getTokenPairStatus (getStatus is internal), so that is the call read.
+
+Balances and allowances are not checked here (see the transfers of the insertion).
+"""
+
+from collections import namedtuple
+from dataclasses import dataclass, field
+
+from .abi import GOVERNOR_FUNCTIONS
+from .commissions import CommonBaseConverter, PriceUnavailable, common_base_token
+from .constants import OrderType
+from .session import RPCError
+from .wad import SafeMathError
+
+RULE_CALLS = [
+    ('paused', 'paused'),
+    ('min_order_amount', 'minOrderAmount'),
+    ('min_multiply_factor', 'minMultiplyFactor'),
+    ('max_multiply_factor', 'maxMultiplyFactor'),
+    ('max_order_lifespan', 'maxOrderLifespan'),
+]
+
+# revert reasons of the contracts
+AMOUNT_TOO_LOW = 'Amount too low'
+LIFESPAN_TOO_HIGH = 'Lifespan too high'
+PRICE_IS_ZERO = 'Price cannot be zero'
+MULTIPLY_FACTOR_IS_ZERO = 'MultiplyFactor is zero'
+LOW_MULTIPLY_FACTOR = 'Low MultiplyFactor'
+HIGH_MULTIPLY_FACTOR = 'High MultiplyFactor'
+PAUSED = 'paused'
+PAIR_DOES_NOT_EXIST = 'Token pair does not exist'
+FEE_TOO_HIGH = 'Amount is greater than Fee'
+PAIR_DISABLED = 'Pair has been disabled'
+EXCHANGEABLE_AMOUNT_IS_ZERO = 'Exchangeable amount cannot be zero'
+# not a revert reason: the status of the pair could not be read
+PAIR_STATUS_UNAVAILABLE = 'Pair status unavailable: {0}'
+
+OrderRequest = namedtuple('OrderRequest', 'base_token secondary_token amount is_buy lifespan order_type price '
+                                          'multiply_factor')
+
+
+def limit_order(base_token, secondary_token, amount, price, lifespan, is_buy):
+    return OrderRequest(base_token, secondary_token, amount, is_buy, lifespan, OrderType.LIMIT_ORDER, price, 0)
+
+
+def market_order(base_token, secondary_token, amount, multiply_factor, lifespan, is_buy):
+    return OrderRequest(base_token, secondary_token, amount, is_buy, lifespan, OrderType.MARKET_ORDER, 0,
+                        multiply_factor)
+
+
+class OrderRejected(Exception):
+    """ The order would revert with reason """
+
+    def __init__(self, order, reason):
+        super(OrderRejected, self).__init__(reason)
+        self.order = order
+        self.reason = reason
+
+
+@dataclass
+class ListingRules(object):
+    """ The RestrictiveOrderListing parameters and the state of the pairs """
+    paused: bool
+    min_order_amount: int
+    min_multiply_factor: int
+    max_multiply_factor: int
+    max_order_lifespan: int
+    # (base token, secondary token) in lowercase -> disabled
+    disabled: dict = field(default_factory=dict)
+
+
+class OrderValidator(object):
+    """ Checks orders against cached copies of the insertion requires """
+
+    def __init__(self, reader, commissions, common_base=None):
+        self.reader = reader
+        self.commissions = commissions
+        self.common_base = common_base
+        self._rules = None
+        self._converter = None
+        # (base token, secondary token, is buy) -> _priceCommonBase of the fee
+        self._order_prices = dict()
+        # (base token, secondary token) in lowercase -> error of its getTokenPairStatus
+        self.pair_errors = dict()
+        self.loads_count = 0
+
+    # Cache
+
+    def load(self, block='latest'):
+        """ Reads the rules and the status of every pair in one batch """
+        pairs = self.reader.pairs
+        calls = [(function_name, ()) for _, function_name in RULE_CALLS]
+        calls += [('getTokenPairStatus', (base_token, secondary_token)) for base_token, secondary_token in pairs]
+        results = self.reader.batch_call(calls, block)
+        errors = [result for result in results[:len(RULE_CALLS)] if isinstance(result, RPCError)]
+        if errors:
+            raise errors[0]
+        rules = dict((name, value) for (name, _), value in zip(RULE_CALLS, results))
+        statuses = dict(((base_token.lower(), secondary_token.lower()), status)
+                        for (base_token, secondary_token), status in zip(pairs, results[len(RULE_CALLS):]))
+        self.pair_errors = dict((key, str(status)) for key, status in statuses.items()
+                                if isinstance(status, RPCError))
+        statuses = dict((key, status) for key, status in statuses.items() if key not in self.pair_errors)
+        rules['disabled'] = dict((key, status['disabled']) for key, status in statuses.items())
+        self._rules = ListingRules(**rules)
+        self._converter = CommonBaseConverter(
+            self.common_base or common_base_token(pairs),
+            dict((key, status['emaPrice']) for key, status in statuses.items()), unavailable=self.pair_errors)
+        self._order_prices = dict()
+        self.loads_count += 1
+        return self._rules
+
+    @property
+    def rules(self):
+        if self._rules is None:
+            self.load()
+        return self._rules
+
+    @property
+    def converter(self):
+        if self._converter is None:
+            self.load()
+        return self._converter
+
+    def invalidate(self):
+        self._rules = None
+        self._converter = None
+
+    def observe(self, event):
+        """ Updates the cache with an events.Event of the DEX """
+        if self._rules is None:
+            return
+        if event.name in ('TokenPairDisabled', 'TokenPairEnabled'):
+            key = (event.args['baseToken'].lower(), event.args['secondaryToken'].lower())
+            self._rules.disabled[key] = event.name == 'TokenPairDisabled'
+        elif event.name in ('Paused', 'Unpaused'):
+            self._rules.paused = event.name == 'Paused'
+        elif event.name == 'TickEnd':
+            self._converter = None
+
+    def observe_transaction(self, transaction):
+        """ Reads everything again (the pairs too) after a transaction executing a governance change """
+        if not transaction or (transaction.get('input') or '')[2:10] != GOVERNOR_FUNCTIONS['executeChange'].selector:
+            return False
+        self.commissions.invalidate()
+        self.invalidate()
+        self.reader.refresh_pairs()
+        return True
+
+    # Checks
+
+    def _order_price(self, base_token, secondary_token, is_buy):
+        key = (base_token, secondary_token, is_buy)
+        if key not in self._order_prices:
+            self._order_prices[key] = self.converter.order_price(base_token, secondary_token, is_buy)
+        return self._order_prices[key]
+
+    def check(self, order):
+        """ The revert reason of the insertion of the order, None if it would be accepted """
+        rules = self.rules
+        key = (order.base_token.lower(), order.secondary_token.lower())
+        if key in self.pair_errors:
+            return PAIR_STATUS_UNAVAILABLE.format(self.pair_errors[key])
+        try:
+            return self._check(order, rules, self.converter, key)
+        except PriceUnavailable as e:
+            return PAIR_STATUS_UNAVAILABLE.format(e)
+
+    def _check(self, order, rules, converter, key):
+        is_buy, is_market = bool(order.is_buy), order.order_type == OrderType.MARKET_ORDER
+        if is_market:
+            if order.lifespan > rules.max_order_lifespan:
+                return LIFESPAN_TOO_HIGH
+            reason = self._check_multiply_factor(order.multiply_factor, rules)
+            if reason is not None:
+                return reason
+        # validateAmount converts the locked token through the pair of the base token
+        token = order.base_token if is_buy else order.secondary_token
+        if converter.convert(token, order.amount, order.base_token) < rules.min_order_amount:
+            return AMOUNT_TOO_LOW
+        if not is_market:
+            if order.lifespan > rules.max_order_lifespan:
+                return LIFESPAN_TOO_HIGH
+            if order.price == 0:
+                return PRICE_IS_ZERO
+        if rules.paused:
+            return PAUSED
+        if key not in rules.disabled:
+            return PAIR_DOES_NOT_EXIST
+        try:
+            fee = self.commissions.initial_fee(order.amount, self._order_price(*key, is_buy))
+        except SafeMathError as e:
+            return str(e)
+        if fee > order.amount:
+            return FEE_TOO_HIGH
+        if rules.disabled[key]:
+            return PAIR_DISABLED
+        if is_market and order.amount == fee:
+            return EXCHANGEABLE_AMOUNT_IS_ZERO
+        return None
+
+    @staticmethod
+    def _check_multiply_factor(multiply_factor, rules):
+        if multiply_factor == 0:
+            return MULTIPLY_FACTOR_IS_ZERO
+        if multiply_factor < rules.min_multiply_factor:
+            return LOW_MULTIPLY_FACTOR
+        if multiply_factor > rules.max_multiply_factor:
+            return HIGH_MULTIPLY_FACTOR
+        return None
+
+    def check_many(self, orders):
+        return [self.check(order) for order in orders]
+
+    def validate(self, order):
+        """ Raises OrderRejected if the order would revert """
+        reason = self.check(order)
+        if reason is not None:
+            raise OrderRejected(order, reason)
+        return order
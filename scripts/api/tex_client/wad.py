@@ -0,0 +1,171 @@
+"""
+Fixed point helpers for the wad (18 decimals) amounts and prices of the TEX
+
+Conversions from and to token units are exact for decimal strings (to_wad('1.1') is
+1100000000000000000, not the 1100000000000000128 of int(1.1 * 10 ** 18)). The contract
+operations (convertToBase, marketOrderSpotPrice, calculateInitialFee, the commission of
+a match and the cancelation/expiration penalties) are copied with the same SafeMath
+mul / div order and truncation, and take a python int or a whole array of values:
+
+    fees = calculate_initial_fee(amounts, prices, commission_rate, minimum_commission)
+
+Arrays are computed with int64 numpy operations when every intermediate product fits
+in 63 bits, and with object arrays of python ints (exact for any uint256) otherwise.
+Like SafeMath, a result over 2 ** 256 - 1 or a division by zero raises SafeMathError.
+"""
+
+from decimal import Decimal
+
+import numpy as np
+
+from .constants import DEFAULT_PRICE_PRECISION, RATE_PRECISION
+
+UINT256_MAX = 2 ** 256 - 1
+INT64_MAX = np.iinfo(np.int64).max
+
+
+class SafeMathError(ArithmeticError):
+    """ The operation reverts in the contract: overflow, underflow or division by zero """
+
+
+def to_wad(value):
+    """ Token units (int, float, str or Decimal) to wad, exact for decimal strings """
+    if isinstance(value, int):
+        return value * RATE_PRECISION
+    return int(Decimal(str(value)) * RATE_PRECISION)
+
+
+def from_wad(value):
+    """ Wad to a Decimal in token units """
+    return Decimal(value) / RATE_PRECISION
+
+
+def as_int_array(values):
+    """ Object array of python ints, exact for uint256 values """
+    array = np.empty(len(values), dtype=object)
+    array[:] = [int(value) for value in values]
+    return array
+
+
+def to_wad_array(values):
+    """ to_wad of every value, as an object array """
+    return as_int_array([to_wad(value) for value in values])
+
+
+def _is_scalar(value):
+    return isinstance(value, (int, np.integer))
+
+
+def _bounds(value):
+    """ (min, max) of an int or an int array as python ints """
+    if _is_scalar(value):
+        return int(value), int(value)
+    if not len(value):
+        return 0, 0
+    return int(value.min()), int(value.max())
+
+
+def _as_array(value):
+    if _is_scalar(value):
+        return value
+    value = np.asarray(value)
+    if value.dtype.kind in 'iu' or value.dtype == object:
+        return value
+    return as_int_array(value)
+
+
+def mul_div(a, b, c):
+    """
+    SafeMath a.mul(b).div(c) on uint256 values; ints give an int, arrays (or any of the
+    arguments an array) an array
+    """
+    a, b, c = _as_array(a), _as_array(b), _as_array(c)
+    (a_min, a_max), (b_min, b_max), (c_min, c_max) = _bounds(a), _bounds(b), _bounds(c)
+    if min(a_min, b_min, c_min) < 0:
+        raise SafeMathError('uint256 values cannot be negative')
+    if a_max * b_max > UINT256_MAX:
+        # only the rows that overflow revert, a zero in the other factor is fine
+        if np.any(np.asarray(a, dtype=object) * np.asarray(b, dtype=object) > UINT256_MAX):
+            raise SafeMathError('SafeMath: multiplication overflow')
+    if c_min == 0 and (_is_scalar(c) or len(c)):
+        raise SafeMathError('SafeMath: division by zero')
+    if all(_is_scalar(value) for value in (a, b, c)):
+        return int(a) * int(b) // int(c)
+    if a_max * b_max <= INT64_MAX and c_max <= INT64_MAX:
+        return np.asarray(a, dtype=np.int64) * np.asarray(b, dtype=np.int64) // np.asarray(c, dtype=np.int64)
+    return _objects(a) * _objects(b) // _objects(c)
+
+
+def _objects(value):
+    if _is_scalar(value):
+        return int(value)
+    if value.dtype == object:
+        return value
+    return as_int_array(value)
+
+
+def safe_add(a, b):
+    """ SafeMath a.add(b) """
+    result = _objects(_as_array(a)) + _objects(_as_array(b))
+    if _bounds(result)[1] > UINT256_MAX:
+        raise SafeMathError('SafeMath: addition overflow')
+    return result
+
+
+def safe_sub(a, b):
+    """ SafeMath a.sub(b) """
+    result = _objects(_as_array(a)) - _objects(_as_array(b))
+    if _bounds(result)[0] < 0:
+        raise SafeMathError('SafeMath: subtraction overflow')
+    return result
+
+
+def wad_mul(a, b):
+    return mul_div(a, b, RATE_PRECISION)
+
+
+def wad_div(a, b):
+    return mul_div(a, RATE_PRECISION, b)
+
+
+# MoCExchangeLib
+
+def convert_to_base(secondary, price, price_precision=DEFAULT_PRICE_PRECISION):
+    """ MoCExchangeLib.convertToBase: secondary.mul(price).div(priceComparisonPrecision) """
+    return mul_div(secondary, price, price_precision)
+
+
+def market_order_spot_price(market_price, multiply_factor):
+    """ MoCExchangeLib.marketOrderSpotPrice: multiplyFactor.mul(marketPrice).div(RATE_PRECISION) """
+    return mul_div(multiply_factor, market_price, RATE_PRECISION)
+
+
+# CommissionManager
+
+def calculate_initial_fee(amount, price, commission_rate, minimum_commission):
+    """
+    CommissionManager.calculateInitialFee: minimumCommission (in common base token) at
+    the price of the order token, plus commissionRate of the amount
+    """
+    minimum_fixed = mul_div(minimum_commission, RATE_PRECISION, price)
+    initial_fee = mul_div(amount, commission_rate, RATE_PRECISION)
+    return safe_add(minimum_fixed, initial_fee)
+
+
+def commission_for_match(order_amount, matched_amount, commission):
+    """ CommissionManager.chargeCommissionForMatch: the share of the reserved commission matched """
+    # assert(_orderAmount >= _matchedAmount): raises SafeMathError otherwise
+    safe_sub(order_amount, matched_amount)
+    return mul_div(matched_amount, commission, order_amount)
+
+
+def exceptional_commission(commission, penalty_rate):
+    """ CommissionManager.chargeCommission of a cancelation or an expiration penalty """
+    return mul_div(commission, penalty_rate, RATE_PRECISION)
+
+
+def calculate_new_ema(old_ema, new_value, smoothing_factor, factor_precision=RATE_PRECISION):
+    """ MoCExchangeLib.calculateNewEMA: the emaPrice after a tick closing at new_value """
+    weighted_new_value = mul_div(new_value, smoothing_factor, factor_precision)
+    old_ema_weighted = mul_div(old_ema, safe_sub(factor_precision, smoothing_factor), factor_precision)
+    return safe_add(old_ema_weighted, weighted_new_value)